@@ -7,11 +7,26 @@ from datetime import datetime
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required, login_user, logout_user, current_user
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
 
 from app import db, get_logger
-from models import Produto, Aplicacao, ImagemProduto, User, Contato
-from core_utils import _build_search_query, _normalize_for_search, allowed_file
+from models import Produto, ProdutoConversao, Aplicacao, ImagemProduto, User, Contato
+from core_utils import (
+    CursorInvalido,
+    _aplicacao_ano_filter,
+    _build_search_query,
+    _colunas_ordenacao_busca,
+    _filtrar_busca,
+    _filtros_aplicacao_busca,
+    _normalize_code_for_search,
+    _normalize_for_search,
+    allowed_file,
+    executar_com_fallback_fts,
+    paginate_busca,
+    paginate_grupos_busca,
+    paginate_keyset,
+)
+from utils.fuzzy_codigos import sugerir_codigos
 from utils.image_utils import download_image_from_url
 from werkzeug.utils import secure_filename
 
@@ -57,6 +72,40 @@ def api_response(data=None, message=None, status_code=200, error=None):
     
     return jsonify(response), status_code
 
+def _parametros_cursor():
+    """
+    Parâmetros do modo de paginação por cursor (opcional): ativado por
+    `?cursor=` (vazio na primeira página) ou `?limit=N`.
+
+    Returns:
+        (cursor, limit, include_total), ou None no modo por página.
+    """
+    if 'cursor' not in request.args and 'limit' not in request.args:
+        return None
+    limit = request.args.get('limit', DEFAULT_RESULTS_PER_PAGE, type=int)
+    limit = max(1, min(limit, MAX_RESULTS_PER_PAGE))
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'sim')
+    return request.args.get('cursor') or None, limit, include_total
+
+def _paginacao_cursor(limit, next_cursor, total=None):
+    """Bloco `pagination` das respostas no modo cursor."""
+    pagination = {
+        'mode': 'cursor',
+        'limit': limit,
+        'next_cursor': next_cursor,
+        'has_next': next_cursor is not None
+    }
+    if total is not None:
+        pagination['total'] = total
+    return pagination
+
+def _sugestoes_codigo(texto):
+    """Candidatos "você quis dizer" para buscas de código sem resultado."""
+    texto = (texto or '').strip()
+    if not texto:
+        return []
+    return sugerir_codigos(texto)
+
 def serialize_produto(produto):
     """Serializa um objeto Produto para JSON"""
     return {
@@ -70,7 +119,8 @@ def serialize_produto(produto):
         'observacoes': produto.observacoes,
         'aplicacoes': [serialize_aplicacao(app) for app in produto.aplicacoes],
         'imagens': [serialize_imagem(img) for img in produto.imagens],
-        'similares_ids': [similar.id for similar in produto.similares]
+        'similares_ids': [similar.id for similar in produto.similares],
+        'classe_equivalencia': produto.classe_equivalencia,
     }
 
 def serialize_aplicacao(aplicacao):
@@ -81,7 +131,9 @@ def serialize_aplicacao(aplicacao):
         'ano': aplicacao.ano,
         'motor': aplicacao.motor,
         'conf_mtr': aplicacao.conf_mtr,
-        'montadora': aplicacao.montadora
+        'montadora': aplicacao.montadora,
+        'ano_inicio': aplicacao.ano_inicio,
+        'ano_fim': aplicacao.ano_fim
     }
 
 def serialize_imagem(imagem):
@@ -137,12 +189,19 @@ def api_info():
             'aplicacoes': '/api/v1/aplicacoes',
             'contatos': '/api/v1/contatos',
             'buscar': '/api/v1/buscar',
+            'conversoes': '/api/v1/conversoes/<codigo>',
+            'equivalentes': '/api/v1/produtos/<id>/equivalentes',
+            'resolver': '/api/v1/resolver (POST, lista de códigos)',
             'health': '/api/v1/health'
         },
         'auth': 'Required for write operations',
         'pagination': {
             'max_per_page': MAX_RESULTS_PER_PAGE,
-            'default_per_page': DEFAULT_RESULTS_PER_PAGE
+            'default_per_page': DEFAULT_RESULTS_PER_PAGE,
+            'cursor': 'Opcional em produtos, buscar e aplicacoes: ?cursor=&limit=N '
+                      '(use next_cursor nas páginas seguintes; total só com include_total=1)',
+            'grupos': 'Em buscar com montadora/aplicacao/ano: ?agrupar=1 pagina por '
+                      'grupo (montadora, veículo, ano)'
         }
     })
 
@@ -188,6 +247,30 @@ def list_produtos():
         order_by = request.args.get('order_by', 'codigo')
         order_dir = request.args.get('order_dir', 'asc')
         
+        parametros_cursor = _parametros_cursor()
+        if parametros_cursor:
+            # Modo cursor: ordena por coluna não nula + id e busca após o cursor
+            if order_by not in ('codigo', 'nome', 'id'):
+                return api_response(
+                    error="No modo cursor, order_by deve ser codigo, nome ou id",
+                    status_code=400
+                )
+            cursor, limit, include_total = parametros_cursor
+            colunas = [Produto.id] if order_by == 'id' else [getattr(Produto, order_by), Produto.id]
+            total = query.order_by(None).count() if include_total else None
+            try:
+                produtos, next_cursor = paginate_keyset(
+                    query, colunas, limit, cursor=cursor,
+                    descendente=order_dir.lower() == 'desc',
+                    chave=f"produtos:{order_by}:{order_dir.lower()}"
+                )
+            except CursorInvalido as e:
+                return api_response(error=str(e), status_code=400)
+            return api_response(data={
+                'produtos': [serialize_produto(produto) for produto in produtos],
+                'pagination': _paginacao_cursor(limit, next_cursor, total)
+            })
+        
         if hasattr(Produto, order_by):
             column = getattr(Produto, order_by)
             if order_dir.lower() == 'desc':
@@ -247,6 +330,39 @@ def get_produto(produto_id):
             status_code=404
         )
 
+@api_bp.route('/produtos/<int:produto_id>/equivalentes', methods=['GET'])
+def get_produto_equivalentes(produto_id):
+    """
+    Lista as peças intercambiáveis com o produto: mesma classe de
+    equivalência (similares e conversões, diretos ou indiretos).
+    """
+    from utils.equivalencias import produtos_equivalentes
+
+    produto = db.session.get(Produto, produto_id)
+    if produto is None:
+        return api_response(error="Produto não encontrado", status_code=404)
+
+    try:
+        equivalentes = (
+            produtos_equivalentes(produto)
+            .options(
+                selectinload(Produto.aplicacoes),
+                selectinload(Produto.imagens),
+                selectinload(Produto.similares),
+            )
+            .order_by(Produto.codigo)
+            .all()
+        )
+        return api_response(data={
+            'produto_id': produto.id,
+            'classe_equivalencia': produto.classe_equivalencia,
+            'total': len(equivalentes),
+            'equivalentes': [serialize_produto(p) for p in equivalentes],
+        })
+    except Exception as e:
+        logger.error(f"Erro ao buscar equivalentes do produto {produto_id}: {str(e)}")
+        return api_response(error="Erro interno do servidor", status_code=500)
+
 @api_bp.route('/produtos', methods=['POST'])
 @login_required
 def create_produto():
@@ -401,6 +517,7 @@ def search_produtos():
         aplicacao_termo = request.args.get('aplicacao')
         grupo = request.args.get('grupo')
         medidas = request.args.get('medidas')
+        ano = request.args.get('ano', type=int)
         
         # Paginação
         page = request.args.get('page', 1, type=int)
@@ -409,36 +526,129 @@ def search_produtos():
             MAX_RESULTS_PER_PAGE
         )
         
-        # Usa a função de busca existente do sistema
-        query = _build_search_query(
-            termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas
-        )
+        # Ordenação: relevancia (padrão com termo), codigo ou nome
+        sort_by = request.args.get('sort_by') or ('relevancia' if termo else 'codigo')
+        sort_dir = request.args.get('sort_dir', 'asc')
+
+        search_params = {
+            'termo': termo,
+            'codigo': codigo_produto,
+            'montadora': montadora,
+            'aplicacao': aplicacao_termo,
+            'grupo': grupo,
+            'medidas': medidas,
+            'ano': ano,
+            'sort_by': sort_by,
+            'sort_dir': sort_dir
+        }
         
-        query = query.options(
-            selectinload(Produto.aplicacoes),
-            selectinload(Produto.imagens)
-        )
+        parametros_cursor = _parametros_cursor()
+        if parametros_cursor:
+            # Modo cursor: mesma busca, paginada pelos valores de ordenação
+            cursor, limit, include_total = parametros_cursor
+
+            def pagina_cursor(usar_fts=True):
+                query, fts_rank = _filtrar_busca(
+                    termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+                    ano=ano, usar_fts=usar_fts
+                )
+                query = query.options(
+                    selectinload(Produto.aplicacoes),
+                    selectinload(Produto.imagens)
+                )
+                colunas, descendente = _colunas_ordenacao_busca(sort_by, sort_dir, fts_rank)
+                produtos, next_cursor = paginate_keyset(
+                    query, colunas, limit, cursor=cursor, descendente=descendente,
+                    chave=f"buscar:{sort_by}:{sort_dir}:{fts_rank is not None}"
+                )
+                total = query.order_by(None).count() if include_total else None
+                return produtos, next_cursor, total
+
+            try:
+                # Refeita pelo SQL se o FTS5 falhar (cursores gerados com o
+                # FTS5 deixam de valer: a ordenação muda)
+                produtos, next_cursor, total = executar_com_fallback_fts(
+                    pagina_cursor, lambda: pagina_cursor(usar_fts=False)
+                )
+            except CursorInvalido:
+                # Cursor gerado pela busca SQL, depois de uma falha do FTS5:
+                # as páginas seguintes continuam nela, na mesma ordenação
+                try:
+                    produtos, next_cursor, total = pagina_cursor(usar_fts=False)
+                except CursorInvalido as e:
+                    return api_response(error=str(e), status_code=400)
+            data = {
+                'produtos': [serialize_produto(produto) for produto in produtos],
+                'search_params': search_params,
+                'pagination': _paginacao_cursor(limit, next_cursor, total)
+            }
+            if not produtos and not cursor:
+                data['did_you_mean'] = _sugestoes_codigo(codigo_produto or termo)
+            return api_response(data=data)
         
-        # Paginação
-        resultados_paginados = query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
+        if request.args.get('agrupar', '').lower() in ('1', 'true', 'sim'):
+            # Paginação sobre os grupos (montadora, veículo, ano) das aplicações
+            filtros_aplicacao = _filtros_aplicacao_busca(montadora, aplicacao_termo, ano)
+            if not filtros_aplicacao:
+                return api_response(
+                    error="agrupar requer montadora, aplicacao ou ano",
+                    status_code=400
+                )
+
+            def pagina_grupos(usar_fts=True):
+                query, _ = _filtrar_busca(
+                    termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+                    ano=ano, usar_fts=usar_fts
+                )
+                return paginate_grupos_busca(query, filtros_aplicacao, page, per_page)
+
+            grupos, total = executar_com_fallback_fts(
+                pagina_grupos, lambda: pagina_grupos(usar_fts=False)
+            )
+            pages = (total + per_page - 1) // per_page
+            return api_response(data={
+                'grupos': [
+                    {
+                        **{k: v for k, v in grupo_resultado.items() if k != 'produtos'},
+                        'produtos': [serialize_produto(p) for p in grupo_resultado['produtos']]
+                    }
+                    for grupo_resultado in grupos
+                ],
+                'search_params': search_params,
+                'pagination': {
+                    'mode': 'grupos',
+                    'page': page,
+                    'pages': pages,
+                    'per_page': per_page,
+                    'total': total,
+                    'has_next': page < pages,
+                    'has_prev': page > 1
+                }
+            })
+        
+        # Usa a função de busca existente do sistema
+        def montar_query(usar_fts=True):
+            query = _build_search_query(
+                termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+                sort_by=sort_by, sort_dir=sort_dir, ano=ano, usar_fts=usar_fts
+            )
+            return query.options(
+                selectinload(Produto.aplicacoes),
+                selectinload(Produto.imagens)
+            )
+        
+        # Paginação (itens e total na mesma instrução); refeita pelo SQL se o
+        # FTS5 falhar
+        resultados_paginados = paginate_busca(
+            montar_query(), page, per_page, sem_fts=lambda: montar_query(usar_fts=False)
         )
         
         # Serialização
         produtos_data = [serialize_produto(produto) for produto in resultados_paginados.items]
         
-        return api_response(data={
+        data = {
             'produtos': produtos_data,
-            'search_params': {
-                'termo': termo,
-                'codigo': codigo_produto,
-                'montadora': montadora,
-                'aplicacao': aplicacao_termo,
-                'grupo': grupo,
-                'medidas': medidas
-            },
+            'search_params': search_params,
             'pagination': {
                 'page': resultados_paginados.page,
                 'pages': resultados_paginados.pages,
@@ -447,7 +657,10 @@ def search_produtos():
                 'has_next': resultados_paginados.has_next,
                 'has_prev': resultados_paginados.has_prev
             }
-        })
+        }
+        if resultados_paginados.total == 0:
+            data['did_you_mean'] = _sugestoes_codigo(codigo_produto or termo)
+        return api_response(data=data)
         
     except Exception as e:
         logger.error(f"Erro na busca via API: {str(e)}")
@@ -456,6 +669,214 @@ def search_produtos():
             status_code=500
         )
 
+# ===== CONVERSÕES =====
+
+@api_bp.route('/conversoes/<path:codigo>', methods=['GET'])
+def get_conversoes(codigo):
+    """
+    Resolve referências cruzadas de um código pelo índice produto_conversao:
+    produtos com esse código, produtos que o citam nas conversões e produtos
+    cujos códigos aparecem nas conversões dos primeiros.
+    """
+    try:
+        codigo_norm = _normalize_code_for_search(codigo)
+        if not codigo_norm:
+            return api_response(error="Código inválido", status_code=400)
+
+        opcoes = (selectinload(Produto.aplicacoes), selectinload(Produto.imagens))
+
+        produtos = Produto.query.options(*opcoes).filter(
+            Produto.codigo_norm == codigo_norm
+        ).all()
+        ids_produtos = [p.id for p in produtos]
+
+        citado_por = Produto.query.options(*opcoes).filter(
+            Produto.id.in_(
+                select(ProdutoConversao.produto_id).where(
+                    ProdutoConversao.codigo_norm == codigo_norm
+                )
+            )
+        ).all()
+
+        conversoes = []
+        if ids_produtos:
+            conversoes = Produto.query.options(*opcoes).filter(
+                Produto.codigo_norm.in_(
+                    select(ProdutoConversao.codigo_norm).where(
+                        ProdutoConversao.produto_id.in_(ids_produtos)
+                    )
+                ),
+                Produto.id.notin_(ids_produtos),
+            ).all()
+
+        return api_response(data={
+            'codigo': codigo,
+            'codigo_normalizado': codigo_norm,
+            'produtos': [serialize_produto(p) for p in produtos],
+            'citado_por': [serialize_produto(p) for p in citado_por],
+            'conversoes': [serialize_produto(p) for p in conversoes],
+        })
+
+    except Exception as e:
+        logger.error(f"Erro ao resolver conversões de {codigo}: {str(e)}")
+        return api_response(
+            error="Erro interno do servidor",
+            status_code=500
+        )
+
+MAX_CODIGOS_RESOLVER = 500
+
+def _resumo_produto(produto):
+    """Campos básicos do produto (sem aplicações/imagens) para respostas em lote."""
+    return {
+        'id': produto.id,
+        'codigo': produto.codigo,
+        'nome': produto.nome,
+        'grupo': produto.grupo,
+        'fornecedor': produto.fornecedor,
+        'classe_equivalencia': produto.classe_equivalencia,
+    }
+
+def _entradas_resolver(data):
+    """
+    Normaliza o corpo de /resolver em [(entrada, fornecedor, valida)]. Aceita
+    em `codigos` textos ou objetos {"codigo": texto, "fornecedor": texto ou
+    null}; `fornecedor` no corpo vale para as linhas sem fornecedor próprio.
+    Qualquer outro item vira uma linha inválida, com o item recebido em
+    `entrada`.
+    """
+    fornecedor_padrao = data.get('fornecedor')
+    entradas = []
+    for item in data.get('codigos') or []:
+        if isinstance(item, str):
+            entradas.append((item, fornecedor_padrao, True))
+        elif (
+            isinstance(item, dict)
+            and isinstance(item.get('codigo'), str)
+            and isinstance(item.get('fornecedor'), (str, type(None)))
+        ):
+            entradas.append((item['codigo'], item.get('fornecedor') or fornecedor_padrao, True))
+        else:
+            entradas.append((item, None, False))
+    return entradas
+
+@api_bp.route('/resolver', methods=['POST'])
+def resolver_codigos():
+    """
+    Resolve uma lista de códigos (orçamento, lista de compras) de uma vez:
+    normaliza todos e os procura em uma única consulta por `codigo_norm` e
+    pelo índice de conversões; as peças intercambiáveis vêm da classe de
+    equivalência em mais uma consulta. O fornecedor informado ordena os
+    produtos encontrados (os do fornecedor primeiro), sem excluir os demais.
+
+    Corpo: {"codigos": ["AL-1084", {"codigo": "WO 120", "fornecedor": "TECFIL"}],
+            "fornecedor": opcional, "equivalentes": true, "sugestoes": false}
+    """
+    from utils.equivalencias import equivalentes_por_produto
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('codigos'), list):
+        return api_response(error="Informe 'codigos' como uma lista", status_code=400)
+    if not isinstance(data.get('fornecedor'), (str, type(None))):
+        return api_response(error="'fornecedor' deve ser um texto", status_code=400)
+    entradas = _entradas_resolver(data)
+    if len(entradas) > MAX_CODIGOS_RESOLVER:
+        return api_response(
+            error=f"Máximo de {MAX_CODIGOS_RESOLVER} códigos por requisição",
+            status_code=400
+        )
+    incluir_equivalentes = data.get('equivalentes', True) is not False
+    incluir_sugestoes = bool(data.get('sugestoes', False))
+
+    try:
+        normalizados = [
+            _normalize_code_for_search(entrada) if valida else ''
+            for entrada, _, valida in entradas
+        ]
+        codigos = sorted({c for c in normalizados if c})
+
+        # Uma passada: código próprio e códigos de conversão
+        encontrados = {}  # codigo_norm -> {produto_id: via}
+        if codigos:
+            consulta = (
+                select(Produto.codigo_norm, Produto.id, db.literal('codigo'))
+                .where(Produto.codigo_norm.in_(codigos))
+                .union_all(
+                    select(ProdutoConversao.codigo_norm, ProdutoConversao.produto_id, db.literal('conversao'))
+                    .where(ProdutoConversao.codigo_norm.in_(codigos))
+                )
+            )
+            for codigo_norm, produto_id, via in db.session.execute(consulta):
+                vias = encontrados.setdefault(codigo_norm, {})
+                if vias.get(produto_id) != 'codigo':
+                    vias[produto_id] = via
+
+        ids = {produto_id for vias in encontrados.values() for produto_id in vias}
+        produtos = {p.id: p for p in Produto.query.filter(Produto.id.in_(ids))} if ids else {}
+        equivalentes = (
+            equivalentes_por_produto(list(produtos.values()))
+            if incluir_equivalentes and produtos else {}
+        )
+
+        resultados = []
+        for indice, ((entrada, fornecedor, _), codigo_norm) in enumerate(zip(entradas, normalizados)):
+            item = {
+                'indice': indice,
+                'entrada': entrada,
+                'codigo_normalizado': codigo_norm,
+                'fornecedor': fornecedor,
+            }
+            if not codigo_norm:
+                item.update(status='invalido', produtos=[])
+                if incluir_equivalentes:
+                    item['equivalentes'] = []
+                resultados.append(item)
+                continue
+
+            fornecedor_norm = _normalize_for_search(fornecedor) if fornecedor else None
+            encontrados_linha = []
+            for produto_id, via in encontrados.get(codigo_norm, {}).items():
+                produto = produtos.get(produto_id)
+                if produto is None:
+                    continue
+                confere = (
+                    _normalize_for_search(produto.fornecedor) == fornecedor_norm
+                    if fornecedor_norm else None
+                )
+                encontrados_linha.append(dict(_resumo_produto(produto), via=via, fornecedor_confere=confere))
+            encontrados_linha.sort(key=lambda p: (
+                p['via'] != 'codigo', p['fornecedor_confere'] is False, p['codigo']
+            ))
+            item['status'] = 'encontrado' if encontrados_linha else 'nao_encontrado'
+            item['produtos'] = encontrados_linha
+
+            if incluir_equivalentes:
+                ids_linha = {p['id'] for p in encontrados_linha}
+                vistos = set(ids_linha)
+                item['equivalentes'] = []
+                for produto_id in ids_linha:
+                    for equivalente in equivalentes.get(produto_id, []):
+                        if equivalente.id not in vistos:
+                            vistos.add(equivalente.id)
+                            item['equivalentes'].append(_resumo_produto(equivalente))
+                item['equivalentes'].sort(key=lambda p: p['codigo'])
+            if incluir_sugestoes and not encontrados_linha:
+                item['did_you_mean'] = _sugestoes_codigo(entrada)
+            resultados.append(item)
+
+        return api_response(data={
+            'total': len(resultados),
+            'encontrados': sum(1 for r in resultados if r['status'] == 'encontrado'),
+            'resultados': resultados,
+        })
+
+    except Exception as e:
+        logger.error(f"Erro ao resolver lista de códigos: {str(e)}")
+        return api_response(
+            error="Erro interno do servidor",
+            status_code=500
+        )
+
 # ===== APLICAÇÕES =====
 
 @api_bp.route('/aplicacoes', methods=['GET'])
@@ -472,6 +893,7 @@ def list_aplicacoes():
         montadora = request.args.get('montadora')
         veiculo = request.args.get('veiculo')
         produto_id = request.args.get('produto_id', type=int)
+        ano = request.args.get('ano', type=int)
         
         query = Aplicacao.query
         
@@ -481,6 +903,24 @@ def list_aplicacoes():
             query = query.filter(Aplicacao.veiculo.ilike(f'%{veiculo}%'))
         if produto_id:
             query = query.filter(Aplicacao.produto_id == produto_id)
+        if ano:
+            query = query.filter(_aplicacao_ano_filter(ano))
+        
+        parametros_cursor = _parametros_cursor()
+        if parametros_cursor:
+            # Modo cursor: ordem por id, busca após o último id recebido
+            cursor, limit, include_total = parametros_cursor
+            total = query.count() if include_total else None
+            try:
+                aplicacoes, next_cursor = paginate_keyset(
+                    query, [Aplicacao.id], limit, cursor=cursor, chave="aplicacoes:id"
+                )
+            except CursorInvalido as e:
+                return api_response(error=str(e), status_code=400)
+            return api_response(data={
+                'aplicacoes': [serialize_aplicacao(app) for app in aplicacoes],
+                'pagination': _paginacao_cursor(limit, next_cursor, total)
+            })
         
         aplicacoes_paginadas = query.paginate(
             page=page,
@@ -15,9 +15,10 @@ from packaging import version as pkg_version
 
 # Importa o sistema de logging estruturado
 from utils.logging_config import setup_logging, get_logger
+from utils.sqlite_perfis import SessaoRoteada
 
 # Inicializa extensões sem associá-las a um app ainda
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": SessaoRoteada})
 login_manager = LoginManager()
 login_manager.login_view = "auth.login"  # Aponta para o blueprint de autenticação
 
@@ -199,13 +200,11 @@ def create_app():
         app.config["SECRET_KEY"] = config_aparencia["secret_key"]
 
     # Define valores dependentes de APP_DATA_PATH
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(
-        APP_DATA_PATH, "catalogo.db"
-    )
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "connect_args": {"timeout": 15},
-        "pool_pre_ping": True,
-    }
+    caminho_banco = os.path.join(APP_DATA_PATH, "catalogo.db")
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + caminho_banco
+    # Perfil de conexão (PRAGMAs) e pool somente leitura: utils/sqlite_perfis.py
+    from utils.sqlite_perfis import opcoes_engine
+    opcoes_engine(app, caminho_banco)
     app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
     # Limita o tamanho máximo das requisições para proteger a aplicação.
     # Pode ser sobrescrito pela variável de ambiente `MAX_CONTENT_LENGTH` (bytes).
@@ -254,6 +253,8 @@ def create_app():
     # --- Inicialização das Extensões ---
     db.init_app(app)
     login_manager.init_app(app)
+    from utils.sqlite_perfis import init_perfis_sqlite
+    init_perfis_sqlite(app, db)
 
     # --- Inicialização do Sistema FTS5 ---
     try:
@@ -275,6 +276,34 @@ def create_app():
     except Exception as e:
         app_logger.error(f"Erro ao inicializar sistema de cache: {str(e)}")
 
+    # --- Inicialização do Autocompletar (índice em memória) ---
+    try:
+        from utils.autocomplete import init_autocomplete
+        init_autocomplete(app)
+    except Exception as e:
+        app_logger.error(f"Erro ao inicializar autocompletar: {str(e)}")
+
+    # --- Índice aproximado de códigos ("você quis dizer") ---
+    try:
+        from utils.fuzzy_codigos import init_fuzzy_codigos
+        init_fuzzy_codigos(app)
+    except Exception as e:
+        app_logger.error(f"Erro ao inicializar índice aproximado de códigos: {str(e)}")
+
+    # --- Sugestões de similares pré-calculadas ---
+    try:
+        from utils.sugestoes_produto import init_sugestoes_produto
+        init_sugestoes_produto(app)
+    except Exception as e:
+        app_logger.error(f"Erro ao inicializar sugestões de produtos: {str(e)}")
+
+    # --- Atividade do servidor para a manutenção do banco ---
+    try:
+        from utils.manutencao import init_manutencao
+        init_manutencao(app)
+    except Exception as e:
+        app_logger.error(f"Erro ao inicializar manutenção do banco: {str(e)}")
+
     # --- Registro de Blueprints (Rotas) ---
     from routes import admin_bp, auth_bp, main_bp
     from api_routes import api_bp
@@ -495,6 +524,10 @@ def inicializar_banco(app, reset=False):
 
         db.create_all()
 
+        # Colunas/índices novos em bancos já existentes (create_all não altera tabelas).
+        from utils.db_migrations import aplicar_migracoes
+        aplicar_migracoes()
+
         # Índices adicionais para manter performance de busca/joins em bases grandes.
         try:
             with db.engine.begin() as connection:
@@ -0,0 +1,16 @@
+"""
+Ferramentas de medição de desempenho da busca.
+
+- `benchmarks.gerar_catalogo`: gera um `catalogo.db` sintético (montadoras e
+  veículos brasileiros, textos acentuados, códigos com separadores) no tamanho
+  desejado.
+- `benchmarks.bench_busca`: mede latências (p50/p95/p99) e consultas por
+  requisição da busca sobre um catálogo gerado e grava o resultado em JSON,
+  para comparar execuções.
+
+Uso típico (a partir da raiz do projeto):
+
+    python -m benchmarks.gerar_catalogo --produtos 10000 --destino /tmp/bench_10k
+    python -m benchmarks.bench_busca --dados /tmp/bench_10k --saida bench_10k.json
+    python -m benchmarks.bench_busca --dados /tmp/bench_10k --comparar bench_10k.json
+"""
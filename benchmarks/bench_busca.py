@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca sobre um catálogo gerado por `benchmarks.gerar_catalogo`.
+
+Mede, para cada caso do espaço de parâmetros (termos FTS, termos com cara de
+código, montadora + aplicação, medidas estruturadas e ano), as latências
+p50/p95/p99 e a quantidade de consultas SQL por requisição de:
+
+- `_build_search_query` (primeira página via `paginate_busca`);
+- `FullTextSearch.search`;
+- `GET /buscar`, `GET /peca/<id>` e `GET /api/v1/buscar`.
+
+O resultado é gravado em JSON; com `--comparar` as medianas são comparadas
+com as de uma execução anterior.
+
+Exemplo:
+    python -m benchmarks.bench_busca --dados /tmp/bench_100k --saida bench_100k.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+# Permite executar como script (python benchmarks/bench_busca.py)
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_PROJETO)
+
+TERMOS_FTS = [
+    "filtro oleo", "pastilha freio", "amortecedor dianteiro", "bomba dagua",
+    "junta homocinetica", "correia dentada", "kit embreagem", "rolamento roda",
+    "vela ignicao", "disco", "válvula termostática", "pivô",
+]
+
+
+def _percentil(valores_ordenados: list, percentil: float) -> float:
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not valores_ordenados:
+        return 0.0
+    posto = max(0, min(len(valores_ordenados) - 1, round(percentil / 100 * len(valores_ordenados) + 0.5) - 1))
+    return valores_ordenados[posto]
+
+
+def _resumo(valores: list) -> dict:
+    ordenados = sorted(valores)
+    return {
+        "n": len(ordenados),
+        "min": round(ordenados[0], 3) if ordenados else 0.0,
+        "p50": round(_percentil(ordenados, 50), 3),
+        "p95": round(_percentil(ordenados, 95), 3),
+        "p99": round(_percentil(ordenados, 99), 3),
+        "max": round(ordenados[-1], 3) if ordenados else 0.0,
+        "media": round(sum(ordenados) / len(ordenados), 3) if ordenados else 0.0,
+    }
+
+
+class ContadorConsultas:
+    """
+    Conta as instruções SQL executadas pelo engine do SQLAlchemy e pela
+    conexão persistente do FTS5 da thread atual.
+    """
+
+    def __init__(self, engine, fts_manager):
+        from sqlalchemy import event
+
+        self.total = 0
+        event.listen(engine, "before_cursor_execute", self._contar)
+        try:
+            fts_manager._get_connection().set_trace_callback(self._contar_fts)
+        except Exception:
+            pass
+
+    def _contar(self, *args, **kwargs):
+        self.total += 1
+
+    def _contar_fts(self, sql):
+        # PRAGMAs de abertura de conexão não são consultas da busca.
+        if not sql.lstrip().upper().startswith("PRAGMA"):
+            self.total += 1
+
+
+def _amostrar_parametros(db, rng: random.Random, casos_por_categoria: int) -> dict:
+    """Monta os casos de cada categoria a partir de dados reais do catálogo."""
+
+    def amostra(sql):
+        linhas = db.session.execute(db.text(sql)).fetchall()
+        return rng.sample(linhas, min(casos_por_categoria, len(linhas))) if linhas else []
+
+    codigos = [r[0] for r in amostra("SELECT codigo FROM produto ORDER BY random() LIMIT 500")]
+    casos = {
+        "fts": [{"termo": t} for t in rng.sample(TERMOS_FTS, min(casos_por_categoria, len(TERMOS_FTS)))],
+        "codigo": [],
+        "montadora_aplicacao": [
+            {"montadora": m, "aplicacao": v}
+            for m, v in amostra(
+                "SELECT DISTINCT montadora, veiculo FROM aplicacao "
+                "WHERE veiculo <> '' ORDER BY random() LIMIT 200"
+            )
+        ],
+        "medidas": [],
+        "ano": [
+            {"aplicacao": v, "ano": a}
+            for v, a in amostra(
+                "SELECT veiculo, ano_inicio FROM aplicacao "
+                "WHERE ano_inicio BETWEEN 1990 AND 2030 ORDER BY random() LIMIT 200"
+            )
+        ],
+    }
+    # Código completo, sem separadores e parcial (substring).
+    for codigo in codigos:
+        variante = rng.randrange(3)
+        if variante == 0:
+            casos["codigo"].append({"termo": codigo})
+        elif variante == 1:
+            casos["codigo"].append({"termo": codigo.replace(" ", "").replace("-", "").replace("/", "")})
+        else:
+            compacto = codigo.replace(" ", "").replace("-", "").replace("/", "")
+            casos["codigo"].append({"codigo_produto": compacto[1:6]})
+
+    from core_utils import _extrair_medidas_numericas
+
+    for (medidas,) in amostra("SELECT medidas FROM produto WHERE medidas <> '' ORDER BY random() LIMIT 500"):
+        valores = _extrair_medidas_numericas(medidas)
+        if valores:
+            tipo, valor = rng.choice(sorted(valores.items()))
+            casos["medidas"].append({tipo: f"{valor:g}"})
+    return casos
+
+
+def _executores(cliente):
+    """Funções (params -> None) de cada alvo medido."""
+    from core_utils import _build_search_query, paginate_busca
+    from utils.fts_search import get_fts_manager
+
+    campos_medidas = (
+        "largura", "altura", "comprimento", "diametro_externo", "diametro_interno",
+        "elo", "estrias_internas", "estrias_externas",
+    )
+
+    def build_search_query(params):
+        kwargs = {k: params[k] for k in campos_medidas if k in params}
+        if "ano" in params:
+            kwargs["ano"] = params["ano"]
+        termo = params.get("termo", "")
+        query = _build_search_query(
+            termo, params.get("codigo_produto", ""), params.get("montadora", ""),
+            params.get("aplicacao", ""), "", "",
+            sort_by="relevancia" if termo else "codigo", **kwargs,
+        )
+        pagination = paginate_busca(query, 1, 20)
+        return pagination.total
+
+    def fts_search(params):
+        return len(get_fts_manager().search(params["termo"], limit=20))
+
+    def http(caminho):
+        def executar(params):
+            resposta = cliente.get(f"{caminho}?{urlencode(params)}")
+            if resposta.status_code != 200:
+                raise RuntimeError(f"{caminho} retornou {resposta.status_code}")
+            return resposta.status_code
+        return executar
+
+    def api_buscar(params):
+        params = dict(params)
+        if "termo" in params:
+            params["q"] = params.pop("termo")
+        return http("/api/v1/buscar")(params)
+
+    return {
+        "build_search_query": build_search_query,
+        "fts_search": fts_search,
+        "/buscar": http("/buscar"),
+        "/api/v1/buscar": api_buscar,
+    }
+
+
+def _medir(funcao, params, repeticoes: int, aquecimento: int, contador: ContadorConsultas) -> dict:
+    for _ in range(aquecimento):
+        funcao(params)
+    latencias, consultas = [], []
+    for _ in range(repeticoes):
+        antes = contador.total
+        inicio = time.perf_counter()
+        funcao(params)
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(contador.total - antes)
+    return {"latencias": latencias, "consultas": consultas}
+
+
+def _versao_git() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ_PROJETO, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def executar_benchmark(dados: str, repeticoes: int = 20, aquecimento: int = 2,
+                       casos_por_categoria: int = 10, semente: int = 42, alvos=None) -> dict:
+    """Executa o benchmark sobre o catálogo em `<dados>/CatalogoDePecas`."""
+    caminho_db = os.path.join(os.path.abspath(dados), "CatalogoDePecas", "catalogo.db")
+    if not os.path.exists(caminho_db):
+        raise FileNotFoundError(f"Catálogo não encontrado: {caminho_db}")
+
+    # APP_DATA_PATH é resolvido na importação de `app`.
+    os.environ["APPDATA"] = os.path.abspath(dados)
+    from app import create_app, db, inicializar_banco
+    from models import Aplicacao, Produto
+    from utils.fts_search import get_fts_manager
+
+    app = create_app()
+    inicializar_banco(app)
+    rng = random.Random(semente)
+
+    resultados = []
+    with app.app_context():
+        total_produtos = Produto.query.count()
+        total_aplicacoes = Aplicacao.query.count()
+        casos = _amostrar_parametros(db, rng, casos_por_categoria)
+        ids_detalhe = [
+            r[0] for r in db.session.execute(
+                db.text("SELECT id FROM produto ORDER BY random() LIMIT :n"), {"n": casos_por_categoria}
+            )
+        ]
+
+    cliente = app.test_client()
+    with app.app_context():
+        contador = ContadorConsultas(db.engine, get_fts_manager())
+        executores = _executores(cliente)
+        executores["/peca/<id>"] = lambda params: cliente.get(f"/peca/{params['id']}").status_code
+        casos["detalhe"] = [{"id": i} for i in ids_detalhe]
+
+        plano = []
+        for categoria, lista in casos.items():
+            for params in lista:
+                if categoria == "detalhe":
+                    nomes_alvos = ["/peca/<id>"]
+                elif categoria == "fts":
+                    nomes_alvos = ["build_search_query", "fts_search", "/buscar", "/api/v1/buscar"]
+                else:
+                    nomes_alvos = ["build_search_query", "/buscar", "/api/v1/buscar"]
+                for alvo in nomes_alvos:
+                    if alvos and alvo not in alvos:
+                        continue
+                    plano.append((alvo, categoria, params))
+
+        for alvo, categoria, params in plano:
+            medicao = _medir(executores[alvo], params, repeticoes, aquecimento, contador)
+            resultados.append({
+                "alvo": alvo,
+                "categoria": categoria,
+                "params": params,
+                "latencia_ms": _resumo(medicao["latencias"]),
+                "consultas_por_requisicao": _resumo(medicao["consultas"]),
+                "_latencias": medicao["latencias"],
+                "_consultas": medicao["consultas"],
+            })
+            db.session.remove()
+
+    # Agregado por alvo e categoria (todas as amostras de todos os casos).
+    agregados = {}
+    for r in resultados:
+        chave = f"{r['alvo']}|{r['categoria']}"
+        grupo = agregados.setdefault(chave, {"alvo": r["alvo"], "categoria": r["categoria"], "latencias": [], "consultas": []})
+        grupo["latencias"].extend(r.pop("_latencias"))
+        grupo["consultas"].extend(r.pop("_consultas"))
+
+    return {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "commit": _versao_git(),
+            "catalogo": caminho_db,
+            "produtos": total_produtos,
+            "aplicacoes": total_aplicacoes,
+            "repeticoes": repeticoes,
+            "aquecimento": aquecimento,
+            "casos_por_categoria": casos_por_categoria,
+            "semente": semente,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+        },
+        "resumo": {
+            chave: {
+                "alvo": g["alvo"],
+                "categoria": g["categoria"],
+                "latencia_ms": _resumo(g["latencias"]),
+                "consultas_por_requisicao": _resumo(g["consultas"]),
+            }
+            for chave, g in sorted(agregados.items())
+        },
+        "casos": resultados,
+    }
+
+
+def comparar(atual: dict, anterior: dict) -> list:
+    """Linhas de texto comparando p50/p95 e consultas do resumo de duas execuções."""
+    linhas = [f"{'alvo|categoria':45} {'p50 antes':>10} {'p50 agora':>10} {'Δ%':>7} {'p95 agora':>10} {'cons.':>6}"]
+    for chave, r in atual["resumo"].items():
+        base = anterior.get("resumo", {}).get(chave)
+        p50 = r["latencia_ms"]["p50"]
+        if base:
+            p50_antes = base["latencia_ms"]["p50"]
+            delta = ((p50 - p50_antes) / p50_antes * 100) if p50_antes else 0.0
+            linhas.append(
+                f"{chave:45} {p50_antes:10.2f} {p50:10.2f} {delta:+7.1f} "
+                f"{r['latencia_ms']['p95']:10.2f} {r['consultas_por_requisicao']['p50']:6g}"
+            )
+        else:
+            linhas.append(f"{chave:45} {'-':>10} {p50:10.2f} {'-':>7} {r['latencia_ms']['p95']:10.2f} "
+                          f"{r['consultas_por_requisicao']['p50']:6g}")
+    return linhas
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark da busca do catálogo")
+    parser.add_argument("--dados", required=True, help="Pasta (APPDATA) do catálogo gerado")
+    parser.add_argument("--saida", help="Arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument("--repeticoes", type=int, default=20, help="Execuções medidas por caso")
+    parser.add_argument("--aquecimento", type=int, default=2, help="Execuções descartadas por caso")
+    parser.add_argument("--casos", type=int, default=10, help="Casos amostrados por categoria")
+    parser.add_argument("--semente", type=int, default=42, help="Semente da amostragem")
+    parser.add_argument("--alvo", action="append", help="Mede só este alvo (pode repetir)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    args = parser.parse_args(argv)
+
+    try:
+        resultado = executar_benchmark(
+            args.dados, repeticoes=args.repeticoes, aquecimento=args.aquecimento,
+            casos_por_categoria=args.casos, semente=args.semente, alvos=args.alvo,
+        )
+    except FileNotFoundError as e:
+        print(f"Erro: {e}")
+        return 1
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+        print(f"Resultado gravado em {args.saida}")
+    elif not args.comparar:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print("\n".join(comparar(resultado, anterior)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
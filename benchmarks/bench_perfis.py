@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmark de vazão por perfil de conexão SQLite (utils/sqlite_perfis.py).
+
+Para cada combinação de perfil (`SQLITE_PERFIL`) e pool somente leitura
+(`SQLITE_POOL_LEITURA`), sobe a aplicação em um processo separado, sobre uma
+cópia do catálogo, e dispara por `--duracao` segundos requisições GET
+misturadas (`/buscar`, `/peca/<id>`, `/api/v1/buscar`) de `--threads`
+clientes simultâneos, com uma thread gravando edições de produtos em
+paralelo. Mede requisições por segundo, latências p50/p95 e erros.
+
+Exemplo:
+    python -m benchmarks.bench_perfis --dados /tmp/bench_100k --saida perfis.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ_PROJETO)
+
+from benchmarks.bench_busca import TERMOS_FTS, _resumo, _versao_git  # noqa: E402
+
+PERFIS = ("padrao", "otimizado", "baixa_memoria")
+
+
+def _amostrar_urls(caminho_db: str, rng: random.Random, quantidade: int = 50) -> list:
+    """URLs GET da carga: buscas por termo e por código e páginas de detalhe."""
+    conexao = sqlite3.connect(caminho_db)
+    try:
+        codigos = [r[0] for r in conexao.execute(
+            "SELECT codigo FROM produto ORDER BY random() LIMIT ?", (quantidade,)
+        )]
+        ids = [r[0] for r in conexao.execute(
+            "SELECT id FROM produto ORDER BY random() LIMIT ?", (quantidade,)
+        )]
+    finally:
+        conexao.close()
+    urls = []
+    for termo in TERMOS_FTS:
+        urls.append("/buscar?" + urlencode({"termo": termo}))
+        urls.append("/api/v1/buscar?" + urlencode({"q": termo}))
+    for codigo in codigos:
+        urls.append("/buscar?" + urlencode({"termo": codigo}))
+        urls.append("/api/v1/buscar?" + urlencode({"q": codigo}))
+    urls.extend(f"/peca/{i}" for i in ids)
+    rng.shuffle(urls)
+    return urls
+
+
+def _executar_configuracao(dados: str, duracao: float, threads: int, escritas_por_segundo: float,
+                           semente: int) -> dict:
+    """Mede uma configuração (já definida nas variáveis de ambiente)."""
+    os.environ["APPDATA"] = os.path.abspath(dados)
+    from app import create_app, db, inicializar_banco
+    from models import Produto
+
+    app = create_app()
+    inicializar_banco(app)
+    caminho_db = os.path.join(os.path.abspath(dados), "CatalogoDePecas", "catalogo.db")
+    urls = _amostrar_urls(caminho_db, random.Random(semente))
+    with app.app_context():
+        ids_produtos = [r[0] for r in db.session.execute(db.text("SELECT id FROM produto LIMIT 500"))]
+
+    # Aquecimento: cada URL uma vez
+    cliente = app.test_client()
+    for url in urls:
+        cliente.get(url)
+
+    parar = threading.Event()
+    latencias, erros, escritas = [], [], [0]
+    trava = threading.Lock()
+
+    def leitor(indice):
+        cliente_local = app.test_client()
+        locais, erros_locais = [], 0
+        posicao = indice
+        while not parar.is_set():
+            url = urls[posicao % len(urls)]
+            posicao += threads
+            inicio = time.perf_counter()
+            try:
+                if cliente_local.get(url).status_code != 200:
+                    erros_locais += 1
+            except Exception:
+                erros_locais += 1
+            locais.append((time.perf_counter() - inicio) * 1000)
+        with trava:
+            latencias.extend(locais)
+            erros.append(erros_locais)
+
+    def escritor():
+        rng = random.Random(semente)
+        intervalo = 1 / escritas_por_segundo
+        while not parar.wait(intervalo):
+            with app.app_context():
+                try:
+                    produto = db.session.get(Produto, rng.choice(ids_produtos))
+                    produto.observacoes = f"benchmark {time.time()}"
+                    db.session.commit()
+                    escritas[0] += 1
+                except Exception:
+                    db.session.rollback()
+
+    trabalhadores = [threading.Thread(target=leitor, args=(i,)) for i in range(threads)]
+    if escritas_por_segundo > 0:
+        trabalhadores.append(threading.Thread(target=escritor))
+    inicio = time.perf_counter()
+    for t in trabalhadores:
+        t.start()
+    time.sleep(duracao)
+    parar.set()
+    for t in trabalhadores:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+
+    return {
+        "requisicoes": len(latencias),
+        "requisicoes_por_segundo": round(len(latencias) / decorrido, 1),
+        "latencia_ms": _resumo(latencias),
+        "erros": sum(erros),
+        "escritas": escritas[0],
+    }
+
+
+def executar_benchmark(dados: str, duracao: float = 20, threads: int = 4,
+                       escritas_por_segundo: float = 2, semente: int = 42, perfis=None) -> dict:
+    """Mede cada perfil, com e sem pool de leitura, em processos separados."""
+    caminho_db = os.path.join(os.path.abspath(dados), "CatalogoDePecas", "catalogo.db")
+    if not os.path.exists(caminho_db):
+        raise FileNotFoundError(f"Catálogo não encontrado: {caminho_db}")
+
+    resultados = {}
+    for perfil in perfis or PERFIS:
+        for pool_leitura in (False, True):
+            chave = f"{perfil}|{'pool_leitura' if pool_leitura else 'sem_pool'}"
+            # Cópia do catálogo por configuração: as escritas não se acumulam
+            with tempfile.TemporaryDirectory() as copia:
+                os.makedirs(os.path.join(copia, "CatalogoDePecas"))
+                shutil.copy2(caminho_db, os.path.join(copia, "CatalogoDePecas", "catalogo.db"))
+                ambiente = dict(
+                    os.environ,
+                    SQLITE_PERFIL=perfil,
+                    SQLITE_POOL_LEITURA="True" if pool_leitura else "False",
+                )
+                saida = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_perfis", "--dados", copia,
+                     "--uma-configuracao", "--duracao", str(duracao), "--threads", str(threads),
+                     "--escritas-por-segundo", str(escritas_por_segundo), "--semente", str(semente)],
+                    cwd=RAIZ_PROJETO, env=ambiente, capture_output=True, text=True,
+                )
+            linhas = [linha for linha in saida.stdout.splitlines() if linha.startswith("{")]
+            if saida.returncode != 0 or not linhas:
+                resultados[chave] = {"erro": saida.stderr[-2000:]}
+            else:
+                resultados[chave] = json.loads(linhas[-1])
+            print(f"{chave:30} {resultados[chave].get('requisicoes_por_segundo', '-'):>8} req/s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "commit": _versao_git(),
+            "catalogo": caminho_db,
+            "duracao_s": duracao,
+            "threads": threads,
+            "escritas_por_segundo": escritas_por_segundo,
+            "sqlite": sqlite3.sqlite_version,
+        },
+        "resultados": resultados,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de vazão por perfil de conexão SQLite")
+    parser.add_argument("--dados", required=True, help="Pasta (APPDATA) do catálogo gerado")
+    parser.add_argument("--saida", help="Arquivo JSON de resultado (padrão: stdout)")
+    parser.add_argument("--duracao", type=float, default=20, help="Segundos medidos por configuração")
+    parser.add_argument("--threads", type=int, default=4, help="Clientes de leitura simultâneos")
+    parser.add_argument("--escritas-por-segundo", type=float, default=2,
+                        help="Edições de produto por segundo em paralelo (0 desliga)")
+    parser.add_argument("--semente", type=int, default=42, help="Semente da amostragem")
+    parser.add_argument("--perfil", action="append", choices=PERFIS, help="Mede só este perfil (pode repetir)")
+    parser.add_argument("--uma-configuracao", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.uma_configuracao:
+        resultado = _executar_configuracao(
+            args.dados, args.duracao, args.threads, args.escritas_por_segundo, args.semente
+        )
+        print(json.dumps(resultado))
+        return 0
+
+    try:
+        resultado = executar_benchmark(
+            args.dados, duracao=args.duracao, threads=args.threads,
+            escritas_por_segundo=args.escritas_por_segundo, semente=args.semente, perfis=args.perfil,
+        )
+    except FileNotFoundError as e:
+        print(f"Erro: {e}")
+        return 1
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+        print(f"Resultado gravado em {args.saida}")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
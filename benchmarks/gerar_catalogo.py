@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Gera um catálogo sintético (`catalogo.db`) para medir o desempenho da busca.
+
+O banco é criado pelo próprio `inicializar_banco` (mesmo schema, índices e
+FTS5 da aplicação) dentro de `<destino>/CatalogoDePecas/`, que é onde a
+aplicação o procura quando `APPDATA=<destino>`. Produtos e aplicações são
+inseridos em lote, direto no SQL; as colunas e tabelas derivadas
+(`codigo_norm`, `produto_conversao`, `produto_medida`, `aplicacao_token`,
+intervalos de ano) são preenchidas pelos backfills de `utils.db_migrations`
+e o FTS5 é reconstruído ao final.
+
+Exemplo:
+    python -m benchmarks.gerar_catalogo --produtos 100000 --destino /tmp/bench_100k
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Permite executar como script (python benchmarks/gerar_catalogo.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Produtos inseridos por transação/lote.
+LOTE_PRODUTOS = 2000
+
+VEICULOS_POR_MONTADORA = {
+    "FIAT": ["PALIO", "UNO", "SIENA", "STRADA", "TORO", "ARGO", "MOBI", "CRONOS", "PUNTO", "DOBLÒ", "IDEA", "GRAND SIENA"],
+    "VOLKSWAGEN": ["GOL", "VOYAGE", "FOX", "CROSSFOX", "POLO", "GOLF", "JETTA", "SAVEIRO", "AMAROK", "T-CROSS", "NIVUS", "UP!"],
+    "CHEVROLET": ["CELTA", "CORSA", "ONIX", "PRISMA", "CRUZE", "S10", "SPIN", "COBALT", "TRACKER", "MONTANA", "AGILE", "CLASSIC"],
+    "FORD": ["KA", "FIESTA", "FOCUS", "ECOSPORT", "RANGER", "FUSION", "COURIER"],
+    "RENAULT": ["CLIO", "SANDERO", "LOGAN", "DUSTER", "KWID", "CAPTUR", "MASTER", "SYMBOL"],
+    "TOYOTA": ["COROLLA", "ETIOS", "HILUX", "YARIS", "SW4", "COROLLA CROSS"],
+    "HONDA": ["CIVIC", "FIT", "CITY", "HR-V", "WR-V"],
+    "HYUNDAI": ["HB20", "HB20S", "CRETA", "TUCSON", "I30", "IX35"],
+    "CITROËN": ["C3", "C4 CACTUS", "C4 LOUNGE", "AIRCROSS", "JUMPER"],
+    "PEUGEOT": ["208", "2008", "308", "3008", "207", "PARTNER"],
+    "JEEP": ["RENEGADE", "COMPASS", "COMMANDER"],
+    "NISSAN": ["MARCH", "VERSA", "KICKS", "FRONTIER", "SENTRA"],
+    "AUDI": ["A1", "A3", "A4", "Q3", "Q5"],
+    "MERCEDES-BENZ": ["CLASSE A", "CLASSE C", "SPRINTER", "ACCELO"],
+}
+MOTORES = [
+    "1.0 8V", "1.0 12V", "1.0 TSI", "1.0 FIRE", "1.3 16V", "1.4 8V FLEX", "1.4 EVO",
+    "1.5 16V", "1.6 8V", "1.6 16V", "1.6 MSI", "1.8 16V", "2.0 16V", "2.0 TURBO",
+    "2.2 DIESEL", "2.8 TDI", "3.0 V6",
+]
+CONFIGURACOES = ["FLEX", "GASOLINA", "ÁLCOOL", "DIESEL", "TURBO", "", ""]
+
+# Grupo -> nomes de peça (com acentos, como no cadastro real).
+NOMES_POR_GRUPO = {
+    "FILTROS": ["FILTRO DE ÓLEO", "FILTRO DE AR", "FILTRO DE COMBUSTÍVEL", "FILTRO DE CABINE"],
+    "FREIOS": ["PASTILHA DE FREIO DIANTEIRA", "PASTILHA DE FREIO TRASEIRA", "DISCO DE FREIO", "SAPATA DE FREIO", "CILINDRO MESTRE"],
+    "SUSPENSÃO": ["AMORTECEDOR DIANTEIRO", "AMORTECEDOR TRASEIRO", "BANDEJA DE SUSPENSÃO", "PIVÔ DE SUSPENSÃO", "BUCHA DA BANDEJA"],
+    "ARREFECIMENTO": ["BOMBA D'ÁGUA", "VÁLVULA TERMOSTÁTICA", "RADIADOR", "RESERVATÓRIO DE EXPANSÃO"],
+    "IGNIÇÃO": ["VELA DE IGNIÇÃO", "BOBINA DE IGNIÇÃO", "CABO DE VELA"],
+    "TRANSMISSÃO": ["JUNTA HOMOCINÉTICA", "COIFA DA HOMOCINÉTICA", "TRIZETA", "SEMIEIXO"],
+    "CORREIAS": ["CORREIA DENTADA", "CORREIA POLY-V", "TENSOR DA CORREIA", "KIT CORREIA DENTADA"],
+    "EMBREAGEM": ["KIT EMBREAGEM", "PLATÔ DE EMBREAGEM", "ROLAMENTO DE EMBREAGEM"],
+    "ROLAMENTOS": ["ROLAMENTO DE RODA", "CUBO DE RODA", "ROLAMENTO DO CÂMBIO"],
+    "ESCAPAMENTO": ["SILENCIOSO TRASEIRO", "CATALISADOR", "TUBO DO ESCAPAMENTO"],
+}
+# Fornecedor -> prefixo usado nos códigos.
+FORNECEDORES = {
+    "TECFIL": "PSL", "FRAM": "CA", "MANN": "W", "BOSCH": "0", "COBREQ": "N",
+    "SYL": "SK", "NAKATA": "NKF", "MONROE": "SP", "COFAP": "GB", "GATES": "K",
+    "CONTITECH": "CT", "SACHS": "SA", "LUK": "LK", "NGK": "BKR", "SKF": "VKBA",
+    "WEGA": "WO", "VETOR": "VT", "AUTOMOTIVE": "AI",
+}
+# Grupo -> fornecedores que fabricam as peças do grupo. Cada peça tem no
+# máximo um código por fornecedor, e as conversões citam os códigos dos outros
+# fornecedores da mesma peça: as classes de equivalência ficam pequenas.
+FORNECEDORES_POR_GRUPO = {
+    "FILTROS": ["TECFIL", "FRAM", "MANN", "WEGA", "BOSCH", "VETOR"],
+    "FREIOS": ["COBREQ", "SYL", "BOSCH", "NAKATA", "VETOR"],
+    "SUSPENSÃO": ["MONROE", "COFAP", "NAKATA", "AUTOMOTIVE"],
+    "ARREFECIMENTO": ["NAKATA", "VETOR", "AUTOMOTIVE", "GATES"],
+    "IGNIÇÃO": ["NGK", "BOSCH", "VETOR"],
+    "TRANSMISSÃO": ["NAKATA", "SKF", "AUTOMOTIVE", "VETOR"],
+    "CORREIAS": ["GATES", "CONTITECH", "SKF"],
+    "EMBREAGEM": ["SACHS", "LUK", "VETOR"],
+    "ROLAMENTOS": ["SKF", "NAKATA", "VETOR"],
+    "ESCAPAMENTO": ["AUTOMOTIVE", "VETOR", "COFAP"],
+}
+# Peças por grupo que ainda podem receber códigos de outros fornecedores.
+PECAS_ABERTAS_POR_GRUPO = 500
+MEDIDAS = [
+    ("LARGURA", "largura", 10.0, 250.0),
+    ("ALTURA", "altura", 10.0, 300.0),
+    ("COMPRIMENTO", "comprimento", 50.0, 1500.0),
+    ("DIÂMETRO EXTERNO", "diametro_externo", 15.0, 320.0),
+    ("DIÂMETRO INTERNO", "diametro_interno", 5.0, 120.0),
+    ("ELO", "elo", 80.0, 160.0),
+    ("ESTRIAS INTERNAS", "estrias_internas", 18.0, 36.0),
+    ("ESTRIAS EXTERNAS", "estrias_externas", 18.0, 36.0),
+]
+
+
+def _formatar_codigo(rng: random.Random, prefixo: str, numero: int) -> str:
+    """Código no estilo do fornecedor, com separadores variados."""
+    formato = rng.randrange(6)
+    if formato == 0:
+        return f"{prefixo}{numero}"
+    if formato == 1:
+        return f"{prefixo}-{numero}"
+    if formato == 2:
+        return f"{prefixo} {numero}"
+    if formato == 3:
+        return f"{prefixo}{numero}/{rng.randrange(1, 9)}"
+    if formato == 4:
+        # Padrão Bosch: "0 986 4B0 123"
+        texto = f"{numero:09d}"
+        return f"{prefixo} {texto[:3]} {texto[3:6]} {texto[6:]}"
+    return f"{prefixo}{numero}{rng.choice('ABCDEFGH')}"
+
+
+def _formatar_conversao(rng: random.Random, codigo: str) -> str:
+    """Referência cruzada como costuma ser digitada (com ou sem separadores)."""
+    if rng.random() < 0.5:
+        return codigo.replace(" ", "").replace("-", "").replace("/", "")
+    return codigo
+
+
+def _gerar_ano(rng: random.Random) -> str:
+    inicio = rng.randrange(1995, 2024)
+    formato = rng.random()
+    if formato < 0.55:
+        return f"{inicio}/{min(inicio + rng.randrange(1, 10), 2025)}"
+    if formato < 0.75:
+        return f"{inicio}/..."
+    if formato < 0.85:
+        return f".../{inicio}"
+    if formato < 0.95:
+        return str(inicio)
+    return ""
+
+
+def _gerar_medidas(rng: random.Random) -> str:
+    """Medidas no formato gravado por `_processar_medidas_estruturadas`."""
+    linhas = []
+    for rotulo, chave, minimo, maximo in rng.sample(MEDIDAS, rng.randrange(0, 4)):
+        if chave.startswith("estrias"):
+            linhas.append(f"{rotulo}: {int(rng.uniform(minimo, maximo))}")
+        else:
+            valor = round(rng.uniform(minimo, maximo) * 2) / 2  # passos de 0,5 mm
+            linhas.append(f"{rotulo}: {valor:g}MM")
+    return "\n".join(linhas)
+
+
+def gerar_linhas(rng: random.Random, inicio_id: int, quantidade: int, apps_min: int, apps_max: int,
+                 pecas_abertas: dict):
+    """
+    Gera as linhas de produto e de aplicação de um lote.
+
+    `pecas_abertas` (grupo -> [(nome, {fornecedor: código})]) guarda, entre
+    os lotes, as peças que ainda não têm código de todos os fornecedores do
+    grupo. A maior parte dos produtos é o código de outro fornecedor para uma
+    dessas peças, com conversões para os códigos já cadastrados dela.
+    """
+    montadoras = list(VEICULOS_POR_MONTADORA)
+    grupos = list(NOMES_POR_GRUPO)
+    produtos, aplicacoes = [], []
+    for produto_id in range(inicio_id, inicio_id + quantidade):
+        grupo = rng.choice(grupos)
+        fornecedores_grupo = FORNECEDORES_POR_GRUPO[grupo]
+        abertas = pecas_abertas.setdefault(grupo, [])
+        indice = rng.randrange(len(abertas)) if abertas and rng.random() < 0.6 else None
+        if indice is not None:
+            nome, codigos_peca = abertas[indice]
+            fornecedor = rng.choice([f for f in fornecedores_grupo if f not in codigos_peca])
+            referencias = rng.sample(list(codigos_peca.values()), min(len(codigos_peca), rng.randrange(1, 4)))
+            conversoes = ", ".join(_formatar_conversao(rng, c) for c in referencias)
+        else:
+            nome, codigos_peca = rng.choice(NOMES_POR_GRUPO[grupo]), {}
+            fornecedor = rng.choice(fornecedores_grupo)
+            conversoes = ""
+        # O id entra no número para garantir códigos únicos.
+        codigo = _formatar_codigo(rng, FORNECEDORES[fornecedor], produto_id * 10 + rng.randrange(10))
+        produtos.append({
+            "id": produto_id,
+            "nome": nome,
+            "codigo": codigo,
+            "grupo": grupo,
+            "fornecedor": fornecedor,
+            "conversoes": conversoes,
+            "medidas": _gerar_medidas(rng),
+            "observacoes": "",
+        })
+
+        codigos_peca[fornecedor] = codigo
+        if indice is None:
+            # Mantém um número limitado de peças abertas por grupo.
+            if len(abertas) < PECAS_ABERTAS_POR_GRUPO:
+                abertas.append((nome, codigos_peca))
+            else:
+                abertas[rng.randrange(len(abertas))] = (nome, codigos_peca)
+        elif len(codigos_peca) == len(fornecedores_grupo):
+            abertas[indice] = abertas[-1]
+            abertas.pop()
+
+        montadora = rng.choice(montadoras)
+        for _ in range(rng.randint(apps_min, apps_max)):
+            # A maior parte das aplicações é da mesma montadora, como no catálogo real.
+            if rng.random() < 0.3:
+                montadora = rng.choice(montadoras)
+            aplicacoes.append({
+                "produto_id": produto_id,
+                "veiculo": rng.choice(VEICULOS_POR_MONTADORA[montadora]),
+                "ano": _gerar_ano(rng),
+                "motor": rng.choice(MOTORES),
+                "conf_mtr": rng.choice(CONFIGURACOES),
+                "montadora": montadora,
+            })
+    return produtos, aplicacoes
+
+
+def gerar_catalogo(destino: str, produtos: int, apps_min: int = 5, apps_max: int = 50,
+                   semente: int = 42, forcar: bool = False) -> str:
+    """
+    Cria `<destino>/CatalogoDePecas/catalogo.db` com `produtos` produtos
+    sintéticos e retorna o caminho do banco.
+    """
+    pasta_dados = os.path.join(os.path.abspath(destino), "CatalogoDePecas")
+    caminho_db = os.path.join(pasta_dados, "catalogo.db")
+    if os.path.exists(caminho_db):
+        if not forcar:
+            raise FileExistsError(f"{caminho_db} já existe (use --forcar para recriar)")
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(caminho_db + sufixo):
+                os.remove(caminho_db + sufixo)
+    os.makedirs(pasta_dados, exist_ok=True)
+    # Arquivo vazio: impede que create_app copie o banco de desenvolvimento (data/).
+    open(caminho_db, "a").close()
+
+    # APP_DATA_PATH é resolvido na importação de `app`.
+    os.environ["APPDATA"] = os.path.abspath(destino)
+    from app import create_app, db, inicializar_banco
+    from utils.db_migrations import aplicar_migracoes
+    from utils.fts_search import modo_lote_fts
+
+    app = create_app()
+    inicializar_banco(app)
+
+    rng = random.Random(semente)
+    sql_produto = db.text(
+        "INSERT INTO produto (id, nome, codigo, grupo, fornecedor, conversoes, medidas, observacoes) "
+        "VALUES (:id, :nome, :codigo, :grupo, :fornecedor, :conversoes, :medidas, :observacoes);"
+    )
+    sql_aplicacao = db.text(
+        "INSERT INTO aplicacao (produto_id, veiculo, ano, motor, conf_mtr, montadora) "
+        "VALUES (:produto_id, :veiculo, :ano, :motor, :conf_mtr, :montadora);"
+    )
+
+    inicio = time.perf_counter()
+    total_aplicacoes = 0
+    pecas_abertas = {}
+    with app.app_context(), modo_lote_fts() as fts_manager:
+        for inicio_id in range(1, produtos + 1, LOTE_PRODUTOS):
+            quantidade = min(LOTE_PRODUTOS, produtos - inicio_id + 1)
+            linhas_produto, linhas_aplicacao = gerar_linhas(
+                rng, inicio_id, quantidade, apps_min, apps_max, pecas_abertas
+            )
+            with db.engine.begin() as connection:
+                connection.execute(sql_produto, linhas_produto)
+                connection.execute(sql_aplicacao, linhas_aplicacao)
+            total_aplicacoes += len(linhas_aplicacao)
+            print(f"  {inicio_id + quantidade - 1}/{produtos} produtos, {total_aplicacoes} aplicações")
+
+        print("Preenchendo colunas e tabelas derivadas...")
+        aplicar_migracoes(forcar_preenchimentos=True)
+        # O índice é reconstruído por inteiro abaixo: sem isso, sair do modo
+        # lote reindexaria cada produto enfileirado pelos triggers
+        with db.engine.begin() as connection:
+            connection.execute(db.text("DELETE FROM fts_pendente;"))
+
+    with app.app_context():
+        print("Reconstruindo índices FTS5...")
+        fts_manager.rebuild_index()
+        with db.engine.begin() as connection:
+            connection.execute(db.text("ANALYZE;"))
+
+    print(
+        f"Catálogo gerado em {caminho_db}: {produtos} produtos, {total_aplicacoes} aplicações "
+        f"({time.perf_counter() - inicio:.1f}s)"
+    )
+    return caminho_db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um catálogo sintético para benchmarks")
+    parser.add_argument("--destino", required=True, help="Pasta usada como APPDATA do catálogo gerado")
+    parser.add_argument("--produtos", type=int, default=10000, help="Quantidade de produtos")
+    parser.add_argument("--apps-min", type=int, default=5, help="Mínimo de aplicações por produto")
+    parser.add_argument("--apps-max", type=int, default=50, help="Máximo de aplicações por produto")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador aleatório")
+    parser.add_argument("--forcar", action="store_true", help="Recria o banco se já existir")
+    args = parser.parse_args(argv)
+
+    try:
+        gerar_catalogo(
+            args.destino, args.produtos, apps_min=args.apps_min, apps_max=args.apps_max,
+            semente=args.semente, forcar=args.forcar,
+        )
+    except FileExistsError as e:
+        print(f"Erro: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,12 +9,46 @@ class BaseConfig:
     # SQLAlchemy
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Perfil de conexão SQLite: "padrao", "otimizado" ou "baixa_memoria"
+    # (utils/sqlite_perfis.py), e pool `mode=ro` para as rotas GET de leitura
+    SQLITE_PERFIL = os.getenv("SQLITE_PERFIL", "otimizado")
+    SQLITE_POOL_LEITURA = os.getenv("SQLITE_POOL_LEITURA", "True").lower() not in ("false", "0", "no")
+
     # JSON responses in UTF-8
     JSON_AS_ASCII = os.getenv("JSON_AS_ASCII", "False").lower() not in ("false", "0", "no")
 
     # Uploads
     MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 16 * 1024 * 1024))
 
+    # Autocompletar em memória (utils/autocomplete.py)
+    AUTOCOMPLETE_MAX_ENTRADAS = int(os.getenv("AUTOCOMPLETE_MAX_ENTRADAS", 100000))
+    AUTOCOMPLETE_PRECARREGAR = os.getenv("AUTOCOMPLETE_PRECARREGAR", "True").lower() not in ("false", "0", "no")
+
+    # Índice aproximado de códigos ("você quis dizer", utils/fuzzy_codigos.py)
+    FUZZY_CODIGOS_PRECARREGAR = os.getenv("FUZZY_CODIGOS_PRECARREGAR", "True").lower() not in ("false", "0", "no")
+
+    # Sugestões de similares pré-calculadas (utils/sugestoes_produto.py)
+    SUGESTOES_EM_SEGUNDO_PLANO = os.getenv("SUGESTOES_EM_SEGUNDO_PLANO", "True").lower() not in ("false", "0", "no")
+
+    # Thread escritora única com commit em grupo (utils/fila_escrita.py)
+    FILA_ESCRITA_ATIVA = os.getenv("FILA_ESCRITA_ATIVA", "True").lower() not in ("false", "0", "no")
+    FILA_ESCRITA_TAMANHO = int(os.getenv("FILA_ESCRITA_TAMANHO", 1000))
+
+    # Histórico de visualizações gravado em lotes (utils/historico_visualizacoes.py)
+    HISTORICO_INTERVALO_GRAVACAO = float(os.getenv("HISTORICO_INTERVALO_GRAVACAO", 5))
+    HISTORICO_TAMANHO_LOTE = int(os.getenv("HISTORICO_TAMANHO_LOTE", 200))
+
+    # Recomendações por coocorrência, recalculadas a cada N segundos (0 desliga)
+    RECOMENDACOES_INTERVALO = float(os.getenv("RECOMENDACOES_INTERVALO", 3600))
+
+    # Manutenção do banco nas janelas ociosas (utils/manutencao.py);
+    # intervalos como "analyze=86400,wal_checkpoint=600" (0 desliga a tarefa)
+    MANUTENCAO_ATIVA = os.getenv("MANUTENCAO_ATIVA", "True").lower() not in ("false", "0", "no")
+    MANUTENCAO_INTERVALOS = os.getenv("MANUTENCAO_INTERVALOS", "")
+    MANUTENCAO_OCIOSO_SEGUNDOS = float(os.getenv("MANUTENCAO_OCIOSO_SEGUNDOS", 60))
+    MANUTENCAO_ORCAMENTO_SEGUNDOS = float(os.getenv("MANUTENCAO_ORCAMENTO_SEGUNDOS", 5))
+    MANUTENCAO_RETENCAO_DIAS = int(os.getenv("MANUTENCAO_RETENCAO_DIAS", 90))
+
 
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
@@ -2,11 +2,14 @@ import time
 import unicodedata
 from threading import Lock
 
-from sqlalchemy import func
+from flask_sqlalchemy.pagination import QueryPagination
+from sqlalchemy import column, func, literal_column, select, table
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
 
 # Importações relativas para evitar dependência circular
 from app import db
-from models import Aplicacao, Produto
+from models import Aplicacao, AplicacaoToken, Produto, ProdutoConversao, ProdutoMedida
 
 # Importação do sistema FTS5
 try:
@@ -17,6 +20,17 @@ except ImportError:
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 
+# Tamanho mínimo para busca de substring pelo índice trigram do FTS5.
+TRIGRAM_MIN_LEN = 3
+
+# Tolerância padrão (em mm, para mais e para menos) da busca por medida.
+# Estrias são contagens e são comparadas sem tolerância.
+TOLERANCIA_MEDIDA_MM = 0.5
+
+# Sintaxe do FTS5 digitada junto das palavras (aspas, prefixo*, grupos): a
+# busca SQL a descarta, para casar as mesmas palavras que o MATCH entre aspas.
+SINTAXE_FTS = '"*()+^'
+
 
 def _is_code_like_term(text: str) -> bool:
     """Detecta se o termo parece um código de peça (ex: AL1084, AL-1084)."""
@@ -72,111 +86,251 @@ def _normalize_code_for_search(text):
     return text
 
 
-def _apply_db_normalization(column):
-    """Aplica funções SQL para normalizar uma coluna para busca (case, acentos, pontuação)."""
-    normalized_column = func.lower(column)
-    # Mapa ampliado de caracteres acentuados para suportar vários idiomas
-    # Mapa reduzido aos caracteres portugueses/brasileiros essenciais
-    # para evitar `parser stack overflow` no SQLite com muitas chamadas replace() aninhadas
-    accent_map = {
-        "á": "a", "à": "a", "â": "a", "ã": "a",
-        "ç": "c",
-        "é": "e", "ê": "e",
-        "í": "i",
-        "ó": "o", "ô": "o", "õ": "o",
-        "ú": "u", "ü": "u",
-    }
-    for accented, unaccented in accent_map.items():
-        normalized_column = func.replace(normalized_column, accented, unaccented)
-    return func.replace(
-        func.replace(
-            func.replace(
-                func.replace(func.replace(normalized_column, ".", ""), "-", ""),
-                ",",
-                "",
-            ),
-            "/",
-            "",
-        ),
-        " ",
-        "",
+def _split_conversoes(texto):
+    """Separa o texto livre de conversões (separado por vírgulas) em códigos."""
+    if not texto:
+        return []
+    import re
+    return [c.strip() for c in re.split(r"[,;\n]", texto) if c.strip()]
+
+
+def _normalize_conversoes(texto):
+    """
+    Normaliza o campo de conversões para a coluna `conversoes_norm`.
+
+    Cada código é normalizado com `_normalize_code_for_search` e o resultado é
+    delimitado por vírgulas nas pontas (",cod1,cod2,") para permitir buscas
+    por código inteiro com LIKE '%,cod,%'.
+    """
+    codigos = [_normalize_code_for_search(c) for c in _split_conversoes(texto)]
+    codigos = [c for c in codigos if c]
+    if not codigos:
+        return ""
+    return "," + ",".join(codigos) + ","
+
+
+def _tokenizar_aplicacao(texto) -> list:
+    """
+    Quebra um texto de veículo/motor em palavras normalizadas, sem repetição.
+
+    As palavras são separadas por espaços e separadores comuns ("GOLF/JETTA") e
+    cada uma é normalizada com `_normalize_code_for_search` ("1.6" -> "16",
+    "CROSS-FOX" -> "crossfox"). É a mesma regra usada para indexar
+    `aplicacao_token` e para tokenizar o termo pesquisado.
+    """
+    if not texto:
+        return []
+    import re
+    tokens = (_normalize_code_for_search(p) for p in re.split(r"[\s/,;()]+", texto))
+    return list(dict.fromkeys(t for t in tokens if t))
+
+
+def _aplicacao_token_filter(aplicacao_termo):
+    """
+    Condição sobre `Aplicacao` para o filtro de aplicação (veículo/motor).
+
+    Casa as aplicações em que todas as palavras do termo aparecem, como palavras
+    inteiras, no mesmo campo — resolvido pelo índice de `aplicacao_token`.
+
+    Returns:
+        Expressão SQLAlchemy, ou None quando o termo não tem palavras.
+    """
+    tokens = _tokenizar_aplicacao(aplicacao_termo)
+    if not tokens:
+        return None
+    return Aplicacao.id.in_(
+        select(AplicacaoToken.aplicacao_id)
+        .where(AplicacaoToken.token.in_(tokens))
+        .group_by(AplicacaoToken.aplicacao_id, AplicacaoToken.campo)
+        .having(func.count() == len(tokens))
     )
 
 
-def _apply_code_normalization(column):
+def _is_code_word(palavra: str) -> bool:
+    """Uma palavra isolada com letras e números (ex: AL-1084, SK91005B)."""
+    normalized = _normalize_code_for_search(palavra)
+    return any(c.isalpha() for c in normalized) and any(c.isdigit() for c in normalized)
+
+
+def _codigo_prefix_filter(codigo_norm: str):
     """
-    Aplica normalização específica para códigos no banco de dados.
-    Versão simplificada para evitar stack overflow no SQLite.
+    Filtro por prefixo em `Produto.codigo_norm` escrito como intervalo, o que
+    permite ao SQLite usar o índice B-tree (LIKE 'x%' não usa o índice por
+    causa do case-insensitive padrão).
     """
-    normalized_column = func.lower(column)
-    
-    # Remove apenas os caracteres mais comuns em códigos
-    # Limitamos as operações para evitar stack overflow
-    normalized_column = func.replace(normalized_column, ".", "")
-    normalized_column = func.replace(normalized_column, "-", "")
-    normalized_column = func.replace(normalized_column, "_", "")
-    normalized_column = func.replace(normalized_column, " ", "")
-    
-    return normalized_column
+    # '~' é maior que qualquer caractere de [a-z0-9], fechando o intervalo.
+    return db.and_(
+        Produto.codigo_norm >= codigo_norm,
+        Produto.codigo_norm < codigo_norm + "~",
+    )
+
+
+def _conversao_prefix_filter(codigo_norm: str):
+    """
+    Produtos que listam, nas conversões, um código iniciado por `codigo_norm`.
+    Resolvido pelo índice (codigo_norm, produto_id) de `produto_conversao`.
+    """
+    return Produto.id.in_(
+        select(ProdutoConversao.produto_id).where(
+            ProdutoConversao.codigo_norm >= codigo_norm,
+            ProdutoConversao.codigo_norm < codigo_norm + "~",
+        )
+    )
+
+
+def _codigo_substring_filter(codigo_norm: str, apenas_codigo: bool = False):
+    """
+    Filtro de substring de código pelo índice FTS5 trigram
+    (`produtos_codigo_fts`, rowid = produto.id).
+
+    Returns:
+        Expressão SQLAlchemy, ou None quando o termo é curto demais para
+        trigramas ou o índice não está disponível (o chamador usa prefixo).
+    """
+    if len(codigo_norm) < TRIGRAM_MIN_LEN or not FTS_AVAILABLE:
+        return None
+    if not get_fts_manager().is_codigo_ready():
+        return None
+    # codigo_norm só tem [a-z0-9], então a frase entre aspas é segura.
+    match_query = f'"{codigo_norm}"'
+    if apenas_codigo:
+        match_query = f"codigo_norm : {match_query}"
+    return Produto.id.in_(
+        select(_CODIGO_FTS_TABLE.c.rowid).where(
+            literal_column(_CODIGO_FTS_TABLE.name).op("MATCH")(match_query)
+        )
+    )
+
+
+def _code_match_filter(codigo_norm: str):
+    """
+    Filtro para um código normalizado: substring do código ou de alguma
+    conversão (índice trigram) ou, para termos curtos, prefixo (B-tree).
+    """
+    filtro_substring = _codigo_substring_filter(codigo_norm)
+    if filtro_substring is not None:
+        return filtro_substring
+    return db.or_(
+        _codigo_prefix_filter(codigo_norm),
+        _conversao_prefix_filter(codigo_norm),
+    )
 
 
 def _build_search_query(
     termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
     largura=None, altura=None, comprimento=None, diametro_externo=None, 
-    diametro_interno=None, elo=None, estrias_internas=None, estrias_externas=None
+    diametro_interno=None, elo=None, estrias_internas=None, estrias_externas=None,
+    sort_by=None, sort_dir="asc", tolerancia=None, ano=None, usar_fts=True
 ):
     """
     Constrói a query de busca de produtos com base nos filtros fornecidos.
+
+    Todos os filtros (inclusive o MATCH do FTS5 e os de aplicação, via
+    subconsulta) ficam na mesma instrução SQL, sem JOIN que duplique produtos;
+    por isso a query pode ser paginada com `paginate_busca` (total via
+    COUNT(*) OVER ()). `sort_by` aceita "relevancia", "codigo" ou "nome"; sem
+    ele não há ORDER BY. Com `usar_fts=False` o termo é buscado só pelo SQL.
+    Os filtros estão em `_filtrar_busca`.
+    """
+    query, fts_rank = _filtrar_busca(
+        termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+        largura=largura, altura=altura, comprimento=comprimento,
+        diametro_externo=diametro_externo, diametro_interno=diametro_interno,
+        elo=elo, estrias_internas=estrias_internas, estrias_externas=estrias_externas,
+        tolerancia=tolerancia, ano=ano, usar_fts=usar_fts,
+    )
+    if sort_by:
+        query = _aplicar_ordenacao_busca(query, sort_by, sort_dir, fts_rank)
+    return query
+
+
+def _filtrar_busca(
+    termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+    largura=None, altura=None, comprimento=None, diametro_externo=None,
+    diametro_interno=None, elo=None, estrias_internas=None, estrias_externas=None,
+    tolerancia=None, ano=None, usar_fts=True
+):
+    """
+    Aplica os filtros da busca, sem ordenação.
+
+    As medidas estruturadas são comparadas numericamente em `produto_medida`,
+    com `tolerancia` mm para mais e para menos (padrão `TOLERANCIA_MEDIDA_MM`).
+    `ano` (inteiro) restringe às aplicações cujo intervalo de anos o contém.
+
+    Returns:
+        (query, fts_rank): `fts_rank` é a coluna BM25 quando a busca usou o
+        FTS5, ou None.
     """
     
     # Busca tradicional
     query = Produto.query
+    fts_rank = None
 
     if termo:
         # Força busca SQL para códigos (FTS5 pode falhar em códigos com/sem separadores).
-        use_sql_search = "-" in termo or "/" in termo or _is_code_like_term(termo)
+        # Números soltos (ex: "1084") também, para casar como parte de código via trigram.
+        use_sql_search = not usar_fts or (
+            "-" in termo or "/" in termo or _is_code_like_term(termo)
+            or termo.strip().isdigit()
+        )
         
-        fts_query = _build_fts_query(termo) if not use_sql_search else None
-        if fts_query is not None:
-            query = fts_query
+        fts_match = _build_fts_match(termo) if not use_sql_search else None
+        if fts_match is not None:
+            query = query.join(_FTS_TABLE, _FTS_TABLE.c.produto_id == Produto.id).filter(fts_match)
+            fts_rank = _FTS_TABLE.c.rank
         else:
-            query = query.join(
-                Aplicacao, Produto.id == Aplicacao.produto_id, isouter=True
-            ).distinct()
-            for palavra in termo.strip().split():
-                # Usa busca com ilike que é case-insensitive e funciona bem com acentos no SQLite
-                palavra_normalizada = _normalize_for_search(palavra)
+            palavras = [p for p in (palavra.strip(SINTAXE_FTS) for palavra in termo.split()) if p]
+
+            filtros_palavras = []
+            for palavra in palavras:
                 palavra_codigo_normalizada = _normalize_code_for_search(palavra)
-                query = query.filter(
+                if _is_code_word(palavra):
+                    # Palavra com cara de código (ex: AL-1084, mas também HB20,
+                    # S10): código/conversões pelas colunas normalizadas, além
+                    # de nome e aplicação como as demais palavras
+                    filtro_codigo = _code_match_filter(palavra_codigo_normalizada)
+                else:
+                    filtro_codigo = _codigo_substring_filter(palavra_codigo_normalizada)
+                    if filtro_codigo is None:
+                        filtro_codigo = db.or_(
+                            Produto.codigo_norm.contains(palavra_codigo_normalizada),
+                            Produto.conversoes_norm.contains(palavra_codigo_normalizada),
+                        )
+                # Usa busca com ilike que é case-insensitive e funciona bem com acentos no SQLite
+                filtros_palavras.append(
                     db.or_(
                         Produto.nome.ilike(f"%{palavra}%"),
                         Produto.codigo.ilike(f"%{palavra}%"),
-                        _apply_code_normalization(Produto.codigo).contains(
-                            palavra_codigo_normalizada
-                        ),
+                        filtro_codigo,
                         Produto.fornecedor.ilike(f"%{palavra}%"),
-                        Aplicacao.veiculo.ilike(f"%{palavra}%"),
-                        Aplicacao.motor.ilike(f"%{palavra}%"),
-                        Aplicacao.conf_mtr.ilike(f"%{palavra}%"),
-                        # Busca normal em conversões
+                        Produto.aplicacoes.any(
+                            db.or_(
+                                Aplicacao.veiculo.ilike(f"%{palavra}%"),
+                                Aplicacao.motor.ilike(f"%{palavra}%"),
+                                Aplicacao.conf_mtr.ilike(f"%{palavra}%"),
+                                Aplicacao.ano.ilike(f"%{palavra}%"),
+                            )
+                        ),
                         Produto.conversoes.ilike(f"%{palavra}%"),
-                        # Busca normalizada geral em conversões
-                        _apply_db_normalization(Produto.conversoes).contains(palavra_normalizada),
-                        # Busca normalizada específica para códigos em conversões
-                        _apply_code_normalization(Produto.conversoes).contains(palavra_codigo_normalizada),
                     )
                 )
 
+            if filtros_palavras:
+                filtro_termo = db.and_(*filtros_palavras)
+                if len(palavras) > 1:
+                    # Código digitado com espaços (ex: "AL 1084") também casa como código único.
+                    filtro_termo = db.or_(
+                        _code_match_filter(_normalize_code_for_search(termo)), filtro_termo
+                    )
+                query = query.filter(filtro_termo)
+
     if codigo_produto:
         codigo_produto_normalizado = _normalize_code_for_search(codigo_produto)
-        query = query.filter(
-            db.or_(
-                Produto.codigo.ilike(f"%{codigo_produto}%"),
-                _apply_code_normalization(Produto.codigo).contains(
-                    codigo_produto_normalizado
-                ),
-            )
-        )
+        filtro_codigo = _codigo_substring_filter(codigo_produto_normalizado, apenas_codigo=True)
+        if filtro_codigo is None:
+            # Sem trigram (termo curto ou índice indisponível): substring sem índice
+            filtro_codigo = Produto.codigo_norm.contains(codigo_produto_normalizado)
+        query = query.filter(filtro_codigo)
 
     if grupo:
         query = query.filter(Produto.grupo.ilike(f"%{grupo}%"))
@@ -185,84 +339,305 @@ def _build_search_query(
         query = query.filter(Produto.medidas.ilike(f"%{medidas}%"))
 
     # Filtros específicos de medidas estruturadas
-    if largura:
-        query = query.filter(Produto.medidas.ilike(f"%LARGURA%{largura}%"))
-    
-    if altura:
-        query = query.filter(Produto.medidas.ilike(f"%ALTURA%{altura}%"))
-    
-    if comprimento:
-        query = query.filter(Produto.medidas.ilike(f"%COMPRIMENTO%{comprimento}%"))
-    
-    if diametro_externo:
+    medidas_estruturadas = {
+        "largura": largura,
+        "altura": altura,
+        "comprimento": comprimento,
+        "diametro_externo": diametro_externo,
+        "diametro_interno": diametro_interno,
+        "elo": elo,
+        "estrias_internas": estrias_internas,
+        "estrias_externas": estrias_externas,
+    }
+    for tipo, valor in medidas_estruturadas.items():
+        if valor:
+            query = query.filter(_medida_filter(tipo, valor, tolerancia))
+
+    filtros_aplicacao = _filtros_aplicacao_busca(montadora, aplicacao_termo, ano)
+    if filtros_aplicacao:
+        # IN (subconsulta) em vez de JOIN: não duplica produtos e dispensa
+        # DISTINCT. A subconsulta é avaliada uma vez, partindo dos índices de
+        # `aplicacao_token`/`aplicacao`, em vez de um EXISTS por produto.
         query = query.filter(
-            db.or_(
-                Produto.medidas.ilike(f"%DIÂMETRO EXTERNO%{diametro_externo}%"),
-                Produto.medidas.ilike(f"%DIAMETRO EXTERNO%{diametro_externo}%")
-            )
+            Produto.id.in_(select(Aplicacao.produto_id).where(*filtros_aplicacao))
         )
-    
-    if diametro_interno:
-        query = query.filter(
-            db.or_(
-                Produto.medidas.ilike(f"%DIÂMETRO INTERNO%{diametro_interno}%"),
-                Produto.medidas.ilike(f"%DIAMETRO INTERNO%{diametro_interno}%")
-            )
+
+    return query, fts_rank
+
+
+def _filtros_aplicacao_busca(montadora, aplicacao_termo, ano) -> list:
+    """
+    Condições sobre `Aplicacao` da busca, todas na mesma aplicação: montadora
+    (igualdade normalizada), palavras inteiras do veículo/motor via
+    `aplicacao_token` (ex: "A1" não casa com "A10") e ano dentro do intervalo.
+    """
+    return [
+        filtro for filtro in (
+            _aplicacao_montadora_filter(montadora),
+            _aplicacao_token_filter(aplicacao_termo),
+            _aplicacao_ano_filter(ano),
         )
-    
-    if elo:
-        query = query.filter(Produto.medidas.ilike(f"%ELO%{elo}%"))
-    
-    if estrias_internas:
-        query = query.filter(Produto.medidas.ilike(f"%ESTRIAS INTERNAS%{estrias_internas}%"))
-    
-    if estrias_externas:
-        query = query.filter(Produto.medidas.ilike(f"%ESTRIAS EXTERNAS%{estrias_externas}%"))
-
-    needs_join = not termo and (montadora or aplicacao_termo)
-    if needs_join:
-        query = query.join(Aplicacao, Produto.id == Aplicacao.produto_id)
-
-    if montadora:
-        # Se o usuário passou também uma aplicação (veículo), preferimos
-        # filtrar por aplicação no SQL e aplicar a filtragem por montadora no
-        # nível da aplicação (Python). Isso contorna limitações de LIKE/NOCASE
-        # do SQLite com caracteres Unicode/diacríticos.
-        if aplicacao_termo:
-            # Não aplicar filtro de montadora no SQL, deixamos para o
-            # pós-processamento em `routes.buscar` onde faremos uma
-            # comparação normalizada (sem acentos).
-            pass
-        else:
-            # A busca com `ilike` é geralmente suficiente para a maioria dos casos
-            # e funciona bem com a normalização de caracteres do SQLite.
-            query = query.filter(Aplicacao.montadora.ilike(f"%{montadora}%"))
+        if filtro is not None
+    ]
 
-    if aplicacao_termo:
-        # Para evitar matches parciais (ex: A1 em A10), usamos uma busca mais específica
-        # Adicionamos espaços e delimitadores para garantir match de palavra completa
-        query = query.filter(
-            db.or_(
-                # Match exato (considerando case insensitive)
-                func.upper(Aplicacao.veiculo) == func.upper(aplicacao_termo),
-                func.upper(Aplicacao.motor) == func.upper(aplicacao_termo),
-                func.upper(Aplicacao.conf_mtr) == func.upper(aplicacao_termo),
-                # Match com espaço antes/depois (para casos como "A1 SEDAN")
-                Aplicacao.veiculo.ilike(f"% {aplicacao_termo} %"),
-                Aplicacao.motor.ilike(f"% {aplicacao_termo} %"),
-                Aplicacao.conf_mtr.ilike(f"% {aplicacao_termo} %"),
-                # Match no início com espaço depois (para casos como "A1 PREMIUM")
-                Aplicacao.veiculo.ilike(f"{aplicacao_termo} %"),
-                Aplicacao.motor.ilike(f"{aplicacao_termo} %"),
-                Aplicacao.conf_mtr.ilike(f"{aplicacao_termo} %"),
-                # Match no final com espaço antes (para casos como "GOLF A1")
-                Aplicacao.veiculo.ilike(f"% {aplicacao_termo}"),
-                Aplicacao.motor.ilike(f"% {aplicacao_termo}"),
-                Aplicacao.conf_mtr.ilike(f"% {aplicacao_termo}"),
-            )
+
+def _colunas_ordenacao_busca(sort_by, sort_dir, fts_rank=None):
+    """
+    Colunas de ordenação da busca (sempre terminando no id, para desempate) e
+    se a ordem é descendente: relevância (BM25 do FTS5), código ou nome.
+    """
+    if sort_by == "relevancia":
+        if fts_rank is None:
+            # Sem FTS (busca por código/filtros) a ordem natural é pelo código.
+            return [Produto.codigo, Produto.id], False
+        # BM25: menor valor = mais relevante.
+        return [fts_rank, Produto.codigo, Produto.id], False
+
+    order_column = Produto.nome if sort_by == "nome" else Produto.codigo
+    return [order_column, Produto.id], sort_dir == "desc"
+
+
+def _aplicar_ordenacao_busca(query, sort_by, sort_dir, fts_rank=None):
+    """Aplica a ordenação da busca: relevância (BM25 do FTS5), código ou nome."""
+    colunas, descendente = _colunas_ordenacao_busca(sort_by, sort_dir, fts_rank)
+    return query.order_by(*(c.desc() if descendente else c.asc() for c in colunas))
+
+
+class SearchPagination(QueryPagination):
+    """
+    Paginação que traz os itens da página e o total na mesma instrução,
+    usando COUNT(*) OVER () em vez de um segundo SELECT COUNT(*).
+
+    Se a instrução falhar no FTS5 (índice ausente ou corrompido), a página é
+    refeita com a query de `sem_fts()`, quando informada.
+    """
+
+    def _linhas_pagina(self):
+        return (
+            self._query_args["query"]
+            .add_columns(func.count().over().label("total_busca"))
+            .limit(self.per_page)
+            .offset(self._query_offset)
+            .all()
         )
 
-    return query
+    def _linhas_sem_fts(self):
+        self._query_args["query"] = self._query_args["sem_fts"]()
+        return self._linhas_pagina()
+
+    def _query_items(self):
+        rows = executar_com_fallback_fts(
+            self._linhas_pagina,
+            self._linhas_sem_fts if self._query_args.get("sem_fts") else None,
+        )
+        self._total_janela = rows[0][-1] if rows else None
+        return [row[0] for row in rows]
+
+    def _query_count(self):
+        if self._total_janela is not None:
+            return self._total_janela
+        if self.page == 1:
+            return 0
+        # Página além do fim: não há linhas para carregar o total da janela.
+        return super()._query_count()
+
+
+def executar_com_fallback_fts(consulta, sem_fts=None):
+    """
+    Executa `consulta()`; se a instrução falhar no FTS5 (índice ausente ou
+    corrompido, MATCH inválido), registra a falha e refaz com `sem_fts()`,
+    a mesma busca montada com `usar_fts=False`. Sem `sem_fts`, o erro sobe.
+    """
+    try:
+        return consulta()
+    except OperationalError as e:
+        if sem_fts is None or not FTS_AVAILABLE or not get_fts_manager().registrar_falha(e.orig):
+            raise
+        return sem_fts()
+
+
+def paginate_busca(query, page, per_page, error_out=False, sem_fts=None):
+    """
+    Pagina uma query de `_build_search_query` com total na mesma instrução.
+    `sem_fts` monta a mesma busca com `usar_fts=False`, para quando o FTS5
+    falhar na consulta.
+    """
+    return SearchPagination(
+        query=query, page=page, per_page=per_page, error_out=error_out, sem_fts=sem_fts
+    )
+
+
+def _chave_grupo_aplicacao(montadora, veiculo, ano) -> str:
+    """Rótulo de um grupo de resultados: "MONTADORA VEICULO ANO"."""
+    return " ".join(parte for parte in (montadora, veiculo, ano) if parte)
+
+
+def grupos_busca(produtos, filtros_aplicacao) -> dict:
+    """
+    Agrupa os produtos de uma página pelas aplicações que casam com
+    `filtros_aplicacao` (os mesmos da busca, então todo produto cai em ao
+    menos um grupo): {"MONTADORA VEICULO ANO": [produtos]}, grupos em ordem
+    alfabética e produtos na ordem da página. Uma consulta para a página toda.
+    """
+    if not produtos:
+        return {}
+    por_id = {produto.id: produto for produto in produtos}
+    posicao = {produto.id: i for i, produto in enumerate(produtos)}
+    linhas = db.session.execute(
+        select(Aplicacao.montadora, Aplicacao.veiculo, Aplicacao.ano, Aplicacao.produto_id)
+        .where(Aplicacao.produto_id.in_(list(por_id)), *filtros_aplicacao)
+        .distinct()
+    )
+    grupos = {}
+    for montadora, veiculo, ano, produto_id in linhas:
+        grupos.setdefault(_chave_grupo_aplicacao(montadora, veiculo, ano), set()).add(produto_id)
+    return {
+        chave: [por_id[produto_id] for produto_id in sorted(ids, key=posicao.get)]
+        for chave, ids in sorted(grupos.items())
+    }
+
+
+def paginate_grupos_busca(query, filtros_aplicacao, page, per_page, produtos_por_grupo=20):
+    """
+    Paginação sobre os grupos (montadora normalizada, veículo, ano) das
+    aplicações que casam com a busca, com o total de grupos na mesma
+    instrução (COUNT(*) OVER ()).
+
+    Returns:
+        (grupos, total): grupos da página como dicts com montadora, veiculo,
+        ano, total_produtos e até `produtos_por_grupo` produtos (por código).
+    """
+    ids_busca = query.order_by(None).with_entities(Produto.id)
+    filtros = [Aplicacao.produto_id.in_(ids_busca), *filtros_aplicacao]
+    chave = (Aplicacao.montadora_norm, Aplicacao.veiculo, Aplicacao.ano)
+
+    linhas_grupos = db.session.execute(
+        select(
+            *chave,
+            func.min(Aplicacao.montadora),
+            func.count(func.distinct(Aplicacao.produto_id)),
+            func.count().over(),
+        )
+        .where(*filtros)
+        .group_by(*chave)
+        .order_by(*chave)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    ).all()
+    if not linhas_grupos:
+        return [], 0
+    total = linhas_grupos[0][5]
+
+    # Produtos dos grupos da página (limitados por grupo), em uma consulta
+    do_grupo = db.or_(*[
+        db.and_(*[coluna.is_(valor) for coluna, valor in zip(chave, linha[:3])])
+        for linha in linhas_grupos
+    ])
+    ordem_no_grupo = func.row_number().over(partition_by=chave, order_by=(Produto.codigo, Produto.id))
+    membros = (
+        select(*chave, Aplicacao.produto_id, ordem_no_grupo.label("ordem"))
+        .join(Produto, Produto.id == Aplicacao.produto_id)
+        .where(*filtros, do_grupo)
+        .group_by(*chave, Aplicacao.produto_id)
+        .subquery()
+    )
+    linhas_membros = db.session.execute(
+        select(membros).where(membros.c.ordem <= produtos_por_grupo).order_by(membros.c.ordem)
+    ).all()
+    produtos = {
+        produto.id: produto
+        for produto in Produto.query.options(
+            selectinload(Produto.aplicacoes), selectinload(Produto.imagens)
+        ).filter(Produto.id.in_({linha[3] for linha in linhas_membros}))
+    }
+    membros_por_grupo = {}
+    for linha in linhas_membros:
+        membros_por_grupo.setdefault(tuple(linha[:3]), []).append(produtos[linha[3]])
+
+    grupos = [
+        {
+            "montadora": linha[3],
+            "veiculo": linha[1],
+            "ano": linha[2],
+            "chave": _chave_grupo_aplicacao(linha[3], linha[1], linha[2]),
+            "total_produtos": linha[4],
+            "produtos": membros_por_grupo.get(tuple(linha[:3]), []),
+        }
+        for linha in linhas_grupos
+    ]
+    return grupos, total
+
+
+class CursorInvalido(ValueError):
+    """Cursor de paginação malformado ou gerado para outra ordenação."""
+
+
+def _codificar_cursor(chave: str, valores: list) -> str:
+    """Cursor opaco (base64 de JSON) com os valores de ordenação do último item."""
+    import base64
+    import json
+
+    dados = json.dumps({"o": chave, "k": valores}, separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(dados.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decodificar_cursor(cursor: str, chave: str, quantidade: int) -> list:
+    """Valida e decodifica um cursor de `_codificar_cursor`."""
+    import base64
+    import json
+
+    try:
+        preenchimento = "=" * (-len(cursor) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(cursor + preenchimento).decode("utf-8"))
+        valores = dados["k"]
+        ordem = dados["o"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorInvalido("Cursor inválido") from e
+    if ordem != chave or not isinstance(valores, list) or len(valores) != quantidade:
+        raise CursorInvalido("Cursor não corresponde à ordenação solicitada")
+    return valores
+
+
+def paginate_keyset(query, colunas, limit, cursor=None, descendente=False, chave=""):
+    """
+    Paginação por cursor (keyset): em vez de OFFSET, busca os itens após os
+    valores de ordenação do último item da página anterior, e não conta o
+    total. O custo de cada página não depende da profundidade.
+
+    Args:
+        query: query de entidade, sem ORDER BY (a ordem é definida aqui)
+        colunas: colunas de ordenação, todas não nulas e terminando em uma
+            chave única (id), como as de `_colunas_ordenacao_busca`
+        limit: itens por página
+        cursor: `next_cursor` da página anterior (None/"" para a primeira)
+        descendente: ordem descendente em todas as colunas
+        chave: identifica a ordenação; cursores de outra ordenação são recusados
+
+    Returns:
+        (itens, next_cursor): `next_cursor` é None na última página.
+
+    Raises:
+        CursorInvalido: cursor malformado ou de outra ordenação.
+    """
+    from sqlalchemy import tuple_
+
+    if cursor:
+        valores = _decodificar_cursor(cursor, chave, len(colunas))
+        posicao = tuple_(*colunas)
+        limite = tuple_(*valores)
+        query = query.filter(posicao < limite if descendente else posicao > limite)
+
+    rows = (
+        query.order_by(*(c.desc() if descendente else c.asc() for c in colunas))
+        .add_columns(*(c.label(f"cursor_{i}") for i, c in enumerate(colunas)))
+        .limit(limit + 1)
+        .all()
+    )
+    itens = [row[0] for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _codificar_cursor(chave, list(rows[limit - 1][1:]))
+    return itens, next_cursor
 
 
 def _atualizar_similares_simetricamente(produto_principal, novos_similares):
@@ -366,6 +741,32 @@ def _parse_year_range(year_str: str | None) -> tuple[int, int]:
         return -1, -1
 
 
+def _intervalo_anos_aplicacao(year_str: str | None) -> tuple:
+    """
+    Intervalo de anos para as colunas `Aplicacao.ano_inicio`/`ano_fim`.
+    Igual a `_parse_year_range`, mas com (None, None) para anos não reconhecidos.
+    """
+    intervalo = _parse_year_range(year_str)
+    if intervalo == (-1, -1):
+        return None, None
+    return intervalo
+
+
+def _aplicacao_montadora_filter(montadora):
+    """Condição sobre `Aplicacao`: montadora igual, ignorando acentos, caixa e espaços."""
+    montadora_norm = _normalize_for_search(montadora)
+    if not montadora_norm:
+        return None
+    return Aplicacao.montadora_norm == montadora_norm
+
+
+def _aplicacao_ano_filter(ano):
+    """Condição sobre `Aplicacao`: aplicações cujo intervalo de anos contém `ano`."""
+    if not ano:
+        return None
+    return db.and_(Aplicacao.ano_inicio <= ano, Aplicacao.ano_fim >= ano)
+
+
 def _ranges_overlap(range1: tuple[int, int], range2: tuple[int, int]) -> bool:
     """Verifica se dois intervalos de anos se sobrepõem."""
     return range1[0] <= range2[1] and range2[0] <= range1[1]
@@ -494,90 +895,132 @@ def _parsear_medidas_para_dict(medidas_str: str | None) -> dict:
     return resultado
 
 
-def _build_fts_query(termo: str, _allow_repair: bool = True):
+# Rótulos usados em `Produto.medidas` por tipo de medida (com e sem acento).
+_ROTULOS_MEDIDA = {
+    "largura": ("LARGURA",),
+    "altura": ("ALTURA",),
+    "comprimento": ("COMPRIMENTO",),
+    "diametro_externo": ("DIÂMETRO EXTERNO", "DIAMETRO EXTERNO"),
+    "diametro_interno": ("DIÂMETRO INTERNO", "DIAMETRO INTERNO"),
+    "elo": ("ELO",),
+    "estrias_internas": ("ESTRIAS INTERNAS",),
+    "estrias_externas": ("ESTRIAS EXTERNAS",),
+}
+
+
+def _parse_valor_medida(valor: str | None) -> float | None:
+    """Extrai o número de um valor de medida ("50MM", "50,5", "Ø 25 mm")."""
+    if not valor:
+        return None
+    import re
+    match = re.search(r"\d+(?:[.,]\d+)?", valor)
+    if not match:
+        return None
+    return float(match.group().replace(",", "."))
+
+
+def _extrair_medidas_numericas(medidas_str: str | None) -> dict:
     """
-    Constrói uma query usando Full-Text Search (FTS5) para busca otimizada.
-    
-    Args:
-        termo: Termo de busca a ser usado no FTS5
-        
+    Valores numéricos das medidas estruturadas de um produto, no formato
+    gravado por `_processar_medidas_estruturadas` (ex: {"largura": 50.0}).
+    Medidas sem número são ignoradas.
+    """
+    medidas_dict = _parsear_medidas_para_dict(medidas_str)
+    resultado = {}
+    for tipo in _ROTULOS_MEDIDA:
+        valor = _parse_valor_medida(medidas_dict.get(tipo))
+        if valor is not None:
+            resultado[tipo] = valor
+    return resultado
+
+
+def _intervalo_medida(tipo: str, valor: str, tolerancia: float | None = None):
+    """
+    Converte o valor pesquisado em um intervalo (mínimo, máximo).
+
+    Aceita um valor único ("25", "25,4"), que vira valor ± tolerância, ou uma
+    faixa explícita ("24-26", "24 a 26"). Retorna None se não houver número.
+    """
+    import re
+    faixa = re.fullmatch(
+        r"\s*(\d+(?:[.,]\d+)?)\s*(?:-|a|até|ate)\s*(\d+(?:[.,]\d+)?)\s*(?:mm)?\s*",
+        valor,
+        re.IGNORECASE,
+    )
+    if faixa:
+        minimo, maximo = (float(v.replace(",", ".")) for v in faixa.groups())
+        return min(minimo, maximo), max(minimo, maximo)
+
+    numero = _parse_valor_medida(valor)
+    if numero is None:
+        return None
+    if tipo.startswith("estrias"):
+        return numero, numero
+    if tolerancia is None:
+        tolerancia = TOLERANCIA_MEDIDA_MM
+    return numero - tolerancia, numero + tolerancia
+
+
+def _medida_filter(tipo: str, valor: str, tolerancia: float | None = None):
+    """
+    Filtro por medida estruturada: faixa numérica sobre `produto_medida`
+    (índice tipo, valor_mm). Valores sem número caem no LIKE sobre o texto.
+    """
+    intervalo = _intervalo_medida(tipo, valor, tolerancia)
+    if intervalo is None:
+        return db.or_(
+            *(Produto.medidas.ilike(f"%{rotulo}%{valor}%") for rotulo in _ROTULOS_MEDIDA[tipo])
+        )
+    return Produto.id.in_(
+        select(ProdutoMedida.produto_id).where(
+            ProdutoMedida.tipo == tipo,
+            ProdutoMedida.valor_mm.between(*intervalo),
+        )
+    )
+
+
+# Tabelas virtuais FTS5 (fora do metadata do SQLAlchemy; criadas por utils.fts_search).
+# `rank` é a coluna oculta do FTS5 com o BM25 da linha para o MATCH corrente.
+_FTS_TABLE = table("produtos_fts", column("produto_id"), column("rank"))
+_CODIGO_FTS_TABLE = table("produtos_codigo_fts", column("rowid"))
+
+
+def _build_fts_match(termo: str):
+    """
+    Monta a condição `produtos_fts MATCH ?` para o termo informado, para ser
+    combinada com os demais filtros na mesma instrução SQL.
+
+    Na primeira busca (e de novo depois de `marcar_indisponivel` ou
+    `redefinir_estado`), confere na conexão da própria busca se a tabela
+    existe; se não, agenda a reconstrução do índice. Uma remoção posterior
+    aparece como erro da consulta, tratado por `executar_com_fallback_fts`.
+
     Returns:
-        Query SQLAlchemy com resultados ordenados por relevância
+        Expressão SQLAlchemy, ou None se o FTS5 não estiver disponível ou o
+        termo não gerar uma expressão válida (o chamador usa a busca SQL).
     """
     if not FTS_AVAILABLE or not termo:
         return None
-    
-    try:
-        from utils.cache_system import cache_key_for_search, search_cache
-        from app import get_logger
-
-        logger = get_logger('fts')
-
-        cache_key = cache_key_for_search({"fts_termo": termo.strip().lower()})
-        fts_results = search_cache.get(cache_key)
-        if fts_results is None:
-            # Busca usando FTS5
-            fts_results = get_fts_manager().search(termo, limit=1000)  # Busca ampla para filtros posteriores
-            search_cache.set(cache_key, fts_results, ttl=120)
-
-        valid_fts_results = [
-            result for result in (fts_results or []) if result.get('produto_id') is not None
-        ]
-
-        if fts_results and not valid_fts_results:
-            logger.warning(
-                "Cache/retorno FTS sem produto_id válido detectado; refazendo busca e caindo para SQL se necessário"
-            )
-            search_cache.delete(cache_key)
-            fts_results = get_fts_manager().search(termo, limit=1000)
-            search_cache.set(cache_key, fts_results, ttl=120)
-            valid_fts_results = [
-                result for result in (fts_results or []) if result.get('produto_id') is not None
-            ]
-
-            if not valid_fts_results:
-                return None
-        else:
-            fts_results = valid_fts_results if valid_fts_results else fts_results
-        
-        if not fts_results:
-            return Produto.query.filter(False)  # Query vazia se nenhum resultado
-        
-        # Extrai IDs dos produtos encontrados
-        produto_ids = [result['produto_id'] for result in fts_results]
-        
-        # Cria query SQLAlchemy com os IDs encontrados pelo FTS5
-        # Ordena pela ordem de relevância do FTS5
-        query = Produto.query.filter(Produto.id.in_(produto_ids))
-        
-        # Ordena baseado na relevância do FTS5 (menor score = mais relevante no BM25)
-        id_to_rank = {result['produto_id']: idx for idx, result in enumerate(fts_results)}
-        
-        # SQLAlchemy não aceita ORDER BY customizado facilmente, então fazemos ordenação em Python
-        # na função que chama esta query
-        query._fts_order = id_to_rank
-        
-        return query
-        
-    except Exception as e:
-        from app import get_logger
-        logger = get_logger('fts')
-        error_text = str(e)
-        logger.error(f"Erro na busca FTS5: {error_text}")
-
-        # Auto-reparo: se a tabela virtual ainda não existe, tenta inicializar FTS e refaz uma vez.
-        if _allow_repair and "no such table: produtos_fts" in error_text.lower():
-            try:
-                from flask import current_app
-                from utils.fts_search import init_fts
-
-                if init_fts(current_app):
-                    return _build_fts_query(termo, _allow_repair=False)
-            except Exception as repair_err:
-                logger.error(f"Falha no auto-reparo do FTS5: {repair_err}")
-
-        # Sinaliza para o chamador seguir com busca tradicional
+
+    fts_manager = get_fts_manager()
+    if not fts_manager.is_ready():
+        return None
+    if not fts_manager.tabela_conferida():
+        tabela_existe = db.session.execute(
+            select(literal_column("1"))
+            .select_from(table("sqlite_master", column("type"), column("name")))
+            .where(column("type") == "table", column("name") == _FTS_TABLE.name)
+        ).first()
+        if tabela_existe is None:
+            # Removida por fora: SQL até a reconstrução (agendada em segundo plano)
+            fts_manager.marcar_indisponivel()
+            return None
+        fts_manager.registrar_tabela_conferida()
+
+    match_query = fts_manager.build_match_query(termo)
+    if not match_query:
         return None
+    return literal_column(_FTS_TABLE.name).op("MATCH")(match_query)
 
 
 def get_fts_suggestions(query: str, limit: int = 5):
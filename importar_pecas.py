@@ -5,6 +5,7 @@ import re
 
 from app import create_app, db
 from models import Aplicacao, Produto
+from utils.fts_search import modo_lote_fts
 from validar_csv import validar_csv
 import logging
 
@@ -31,7 +32,9 @@ def importar_pecas_de_csv(app, csv_path: str):
             "\nValidação do CSV concluída. Iniciando a importação para o banco de dados..."
         )
 
-        with app.app_context():
+        # Modo lote do FTS: cada produto é reindexado uma única vez no final,
+        # em vez de a cada aplicação inserida/removida.
+        with app.app_context(), modo_lote_fts():
             # 2. Leitura do CSV
             try:
                 # Tenta abrir com UTF-8, que é o ideal
@@ -1,4 +1,6 @@
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app import db
@@ -8,6 +10,7 @@ similares_association = db.Table(
     "similares_association",
     db.Column("produto_id", db.Integer, db.ForeignKey("produto.id"), primary_key=True),
     db.Column("similar_id", db.Integer, db.ForeignKey("produto.id"), primary_key=True),
+    db.Index("ix_similares_association_similar_id", "similar_id", "produto_id"),
 )
 
 
@@ -21,6 +24,12 @@ class Produto(db.Model):
     conversoes = db.Column(db.Text, nullable=True)
     medidas = db.Column(db.String(255), nullable=True)
     observacoes = db.Column(db.Text, nullable=True)
+    # Formas normalizadas (minúsculas, só [a-z0-9]) mantidas pelos eventos abaixo,
+    # para que a busca por código use o índice em vez de replace() aninhados.
+    codigo_norm = db.Column(db.String(50), nullable=True, index=True)
+    conversoes_norm = db.Column(db.Text, nullable=True)  # ",cod1,cod2,"
+    # Menor id do grupo de peças intercambiáveis (utils/equivalencias.py)
+    classe_equivalencia = db.Column(db.Integer, nullable=True, index=True)
 
     similares = db.relationship(
         "Produto",
@@ -49,6 +58,178 @@ class Produto(db.Model):
         return f"<Produto {self.nome}>"
 
 
+@event.listens_for(Produto, "before_insert")
+@event.listens_for(Produto, "before_update")
+def _sincronizar_codigos_normalizados(mapper, connection, target):
+    """Mantém `codigo_norm` e `conversoes_norm` em sincronia com os campos originais."""
+    # Importação tardia para evitar import circular (core_utils importa models)
+    from core_utils import _normalize_code_for_search, _normalize_conversoes
+
+    target.codigo_norm = _normalize_code_for_search(target.codigo)
+    target.conversoes_norm = _normalize_conversoes(target.conversoes)
+
+
+class ProdutoConversao(db.Model):
+    """
+    Índice invertido das conversões: uma linha por (produto, código de conversão
+    normalizado). Permite resolver referências cruzadas com igualdade indexada
+    em vez de LIKE sobre o texto livre de `Produto.conversoes`.
+    """
+    __tablename__ = "produto_conversao"
+
+    produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), primary_key=True)
+    codigo_norm = db.Column(db.String(100), primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_produto_conversao_codigo", "codigo_norm", "produto_id"),
+    )
+
+
+def _linhas_conversao(produto_id, conversoes_norm):
+    """Converte ",cod1,cod2," nas linhas de `produto_conversao` (sem duplicatas)."""
+    return [
+        {"produto_id": produto_id, "codigo_norm": codigo}
+        for codigo in dict.fromkeys((conversoes_norm or "").split(","))
+        if codigo
+    ]
+
+
+@event.listens_for(Produto, "after_insert")
+def _inserir_conversoes(mapper, connection, target):
+    """Grava as conversões de um produto recém-inserido."""
+    linhas = _linhas_conversao(target.id, target.conversoes_norm)
+    if linhas:
+        connection.execute(ProdutoConversao.__table__.insert(), linhas)
+
+
+@event.listens_for(Produto, "after_update")
+def _atualizar_conversoes(mapper, connection, target):
+    """Regrava as conversões quando o campo `conversoes` foi alterado."""
+    if not inspect(target).attrs.conversoes.history.has_changes():
+        return
+    tabela = ProdutoConversao.__table__
+    connection.execute(tabela.delete().where(tabela.c.produto_id == target.id))
+    _inserir_conversoes(mapper, connection, target)
+
+
+@event.listens_for(Produto, "after_delete")
+def _remover_conversoes(mapper, connection, target):
+    """Remove as conversões do produto excluído."""
+    tabela = ProdutoConversao.__table__
+    connection.execute(tabela.delete().where(tabela.c.produto_id == target.id))
+
+
+class ProdutoSugestao(db.Model):
+    """
+    Sugestões de similares pré-calculadas para a página de detalhes: uma linha
+    por (produto, sugestão), com o motivo ("equivalencia" ou "aplicacao") e a
+    pontuação. Calculadas em segundo plano (utils/sugestoes_produto.py).
+    """
+    __tablename__ = "produto_sugestao"
+
+    produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), primary_key=True)
+    sugestao_id = db.Column(db.Integer, db.ForeignKey("produto.id"), primary_key=True)
+    motivo = db.Column(db.String(20), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_produto_sugestao_sugestao", "sugestao_id", "produto_id"),
+    )
+
+
+class ProdutoSugestaoPendente(db.Model):
+    """Produtos cujas sugestões precisam ser recalculadas (fila persistente)."""
+    __tablename__ = "produto_sugestao_pendente"
+
+    produto_id = db.Column(db.Integer, primary_key=True)
+
+
+@event.listens_for(Produto, "after_delete")
+def _remover_sugestoes(mapper, connection, target):
+    """
+    Remove as sugestões do produto excluído, marcando para recálculo os
+    produtos que o sugeriam.
+    """
+    connection.execute(
+        db.text(
+            "INSERT OR IGNORE INTO produto_sugestao_pendente (produto_id) "
+            "SELECT produto_id FROM produto_sugestao WHERE sugestao_id = :id"
+        ),
+        {"id": target.id},
+    )
+    tabela = ProdutoSugestao.__table__
+    connection.execute(
+        tabela.delete().where(db.or_(tabela.c.produto_id == target.id, tabela.c.sugestao_id == target.id))
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _atualizar_derivados_apos_flush(session, flush_context):
+    """
+    Recalcula `classe_equivalencia` dos componentes afetados depois que o flush
+    gravou similares e `produto_conversao` (ver utils/equivalencias.py) e marca
+    os produtos cujas sugestões precisam ser recalculadas.
+    """
+    from utils.equivalencias import atualizar_classes_apos_flush
+    from utils.sugestoes_produto import marcar_sugestoes_apos_flush
+
+    componentes = atualizar_classes_apos_flush(session)
+    marcar_sugestoes_apos_flush(session, componentes)
+
+
+class ProdutoMedida(db.Model):
+    """
+    Medidas estruturadas do produto em forma numérica: uma linha por
+    (produto, tipo de medida). Extraída de `Produto.medidas` para permitir
+    buscas por faixa (ex: diâmetro interno entre 24,5 e 25,5 mm) pelo índice.
+    """
+    __tablename__ = "produto_medida"
+
+    produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), primary_key=True)
+    tipo = db.Column(db.String(30), primary_key=True)
+    valor_mm = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_produto_medida_tipo_valor", "tipo", "valor_mm", "produto_id"),
+    )
+
+
+def _linhas_medida(produto_id, medidas):
+    """Converte o texto de medidas nas linhas de `produto_medida`."""
+    # Importação tardia para evitar import circular (core_utils importa models)
+    from core_utils import _extrair_medidas_numericas
+
+    return [
+        {"produto_id": produto_id, "tipo": tipo, "valor_mm": valor}
+        for tipo, valor in _extrair_medidas_numericas(medidas).items()
+    ]
+
+
+@event.listens_for(Produto, "after_insert")
+def _inserir_medidas(mapper, connection, target):
+    """Grava as medidas numéricas de um produto recém-inserido."""
+    linhas = _linhas_medida(target.id, target.medidas)
+    if linhas:
+        connection.execute(ProdutoMedida.__table__.insert(), linhas)
+
+
+@event.listens_for(Produto, "after_update")
+def _atualizar_medidas(mapper, connection, target):
+    """Regrava as medidas numéricas quando o campo `medidas` foi alterado."""
+    if not inspect(target).attrs.medidas.history.has_changes():
+        return
+    tabela = ProdutoMedida.__table__
+    connection.execute(tabela.delete().where(tabela.c.produto_id == target.id))
+    _inserir_medidas(mapper, connection, target)
+
+
+@event.listens_for(Produto, "after_delete")
+def _remover_medidas(mapper, connection, target):
+    """Remove as medidas numéricas do produto excluído."""
+    tabela = ProdutoMedida.__table__
+    connection.execute(tabela.delete().where(tabela.c.produto_id == target.id))
+
+
 class Aplicacao(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), nullable=False)
@@ -57,11 +238,91 @@ class Aplicacao(db.Model):
     motor = db.Column(db.String(100), nullable=True)
     conf_mtr = db.Column(db.String(100), nullable=True)
     montadora = db.Column(db.String(100), nullable=True)
+    # Intervalo de anos derivado de `ano` ("2010/2015", "2018/...", ".../2005");
+    # nulos quando `ano` está vazio ou não é reconhecido.
+    ano_inicio = db.Column(db.Integer, nullable=True)
+    ano_fim = db.Column(db.Integer, nullable=True)
+    # `montadora` normalizada (sem acentos, caixa, espaços e pontuação), para
+    # filtrar por igualdade indexada em vez de LIKE.
+    montadora_norm = db.Column(db.String(100), nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_aplicacao_veiculo_ano", "veiculo", "ano_inicio", "ano_fim"),
+        db.Index("ix_aplicacao_montadora_norm", "montadora_norm", "produto_id"),
+    )
 
     def __repr__(self):
         return f"<Aplicacao {self.montadora} {self.veiculo}>"
 
 
+@event.listens_for(Aplicacao, "before_insert")
+@event.listens_for(Aplicacao, "before_update")
+def _sincronizar_intervalo_anos(mapper, connection, target):
+    """Mantém `ano_inicio`/`ano_fim` e `montadora_norm` em sincronia com os textos."""
+    # Importação tardia para evitar import circular (core_utils importa models)
+    from core_utils import _intervalo_anos_aplicacao, _normalize_for_search
+
+    target.ano_inicio, target.ano_fim = _intervalo_anos_aplicacao(target.ano)
+    target.montadora_norm = _normalize_for_search(target.montadora) or None
+
+
+class AplicacaoToken(db.Model):
+    """
+    Índice de palavras das aplicações: uma linha por (palavra normalizada,
+    aplicação, campo). Permite filtrar por veículo/motor com igualdade indexada
+    de palavra inteira (ex: "A1" não casa com "A10") em vez de LIKE.
+    """
+    __tablename__ = "aplicacao_token"
+
+    token = db.Column(db.String(100), primary_key=True)
+    aplicacao_id = db.Column(db.Integer, db.ForeignKey("aplicacao.id"), primary_key=True)
+    campo = db.Column(db.String(20), primary_key=True)
+
+    __table_args__ = (
+        db.Index("ix_aplicacao_token_aplicacao", "aplicacao_id"),
+    )
+
+
+# Campos de `Aplicacao` indexados em `aplicacao_token`.
+CAMPOS_APLICACAO_TOKEN = ("veiculo", "motor", "conf_mtr")
+
+
+def _linhas_token_aplicacao(aplicacao):
+    """Gera as linhas de `aplicacao_token` para uma aplicação."""
+    # Importação tardia para evitar import circular (core_utils importa models)
+    from core_utils import _tokenizar_aplicacao
+
+    return [
+        {"token": token, "aplicacao_id": aplicacao.id, "campo": campo}
+        for campo in CAMPOS_APLICACAO_TOKEN
+        for token in _tokenizar_aplicacao(getattr(aplicacao, campo))
+    ]
+
+
+@event.listens_for(Aplicacao, "after_insert")
+def _inserir_tokens_aplicacao(mapper, connection, target):
+    """Indexa as palavras de uma aplicação recém-inserida."""
+    linhas = _linhas_token_aplicacao(target)
+    if linhas:
+        connection.execute(AplicacaoToken.__table__.insert(), linhas)
+
+
+@event.listens_for(Aplicacao, "after_update")
+def _atualizar_tokens_aplicacao(mapper, connection, target):
+    """Reindexa a aplicação quando veículo/motor/configuração mudaram."""
+    estado = inspect(target)
+    if not any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_APLICACAO_TOKEN):
+        return
+    tabela = AplicacaoToken.__table__
+    connection.execute(tabela.delete().where(tabela.c.aplicacao_id == target.id))
+    _inserir_tokens_aplicacao(mapper, connection, target)
+
+
+# A remoção dos tokens fica a cargo do gatilho SQL `aplicacao_token_ad`
+# (ver utils/db_migrations.py), que também cobre exclusões em massa feitas
+# com `Query.delete()`, que não disparam eventos do ORM.
+
+
 class ImagemProduto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     produto_id = db.Column(db.Integer, db.ForeignKey("produto.id"), nullable=False)
@@ -130,3 +391,23 @@ class Contato(db.Model):
         if not numero.startswith('55') and len(numero) >= 10:
             numero = '55' + numero
         return numero
+
+
+class ManutencaoExecucao(db.Model):
+    """
+    Registro de cada execução de uma tarefa de manutenção do banco
+    (utils/manutencao.py): duração, bytes liberados e resultado.
+    """
+    __tablename__ = "manutencao_execucao"
+
+    id = db.Column(db.Integer, primary_key=True)
+    tarefa = db.Column(db.String(40), nullable=False)
+    iniciado_em = db.Column(db.DateTime, nullable=False)
+    duracao_ms = db.Column(db.Integer, nullable=False, default=0)
+    bytes_recuperados = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False)  # ok, parcial, ignorada, erro
+    detalhes = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_manutencao_execucao_tarefa", "tarefa", "iniciado_em"),
+    )
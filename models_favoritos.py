@@ -59,9 +59,11 @@ class ItemListaFavoritos(db.Model):
     produto = db.relationship('Produto', backref='favoritos')
     produto = db.relationship('Produto', backref=db.backref('favoritos', cascade='all, delete-orphan'))
     
-    # Constraint para evitar duplicatas
+    # Constraint para evitar duplicatas. AUTOINCREMENT: ids não são
+    # reaproveitados (marca d'água do recomendador, utils/recomendacoes.py)
     __table_args__ = (
         db.UniqueConstraint('lista_id', 'produto_id', name='uq_lista_produto'),
+        {'sqlite_autoincrement': True},
     )
     
     def __repr__(self):
@@ -80,6 +82,16 @@ class HistoricoVisualizacao(db.Model):
     visualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
     origem = db.Column(db.String(50), default='web')  # web, api, search, etc.
     
+    # Poda "últimas N por usuário e produto" (utils/historico_visualizacoes.py)
+    # e janela de sessão das recomendações (utils/recomendacoes.py).
+    # AUTOINCREMENT: ids não são reaproveitados após a poda (marca d'água do
+    # recomendador)
+    __table_args__ = (
+        db.Index('ix_historico_visualizacao_usuario_produto', 'user_id', 'produto_id', 'visualizado_em'),
+        db.Index('ix_historico_visualizacao_usuario_data', 'user_id', 'visualizado_em', 'produto_id'),
+        {'sqlite_autoincrement': True},
+    )
+    
     # Relacionamentos
     user = db.relationship('User', backref='visualizacoes')
     produto = db.relationship('Produto', backref='visualizacoes')
@@ -118,6 +130,40 @@ class ProdutoRecomendado(db.Model):
         return f'<ProdutoRecomendado User:{self.user_id} Produto:{self.produto_id} Score:{self.score}>'
 
 
+class ProdutoCoocorrencia(db.Model):
+    """
+    Matriz esparsa de coocorrência entre produtos (vistos pelo mesmo usuário
+    em pouco tempo ou na mesma lista de favoritos), nos dois sentidos. A
+    diagonal (produto_id = vizinho_id) guarda o peso total do produto.
+    Mantida por utils/recomendacoes.py.
+    """
+    __tablename__ = 'produto_coocorrencia'
+    
+    produto_id = db.Column(db.Integer, primary_key=True)
+    vizinho_id = db.Column(db.Integer, primary_key=True)
+    peso = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class ProdutoVizinho(db.Model):
+    """
+    Os vizinhos mais próximos de cada produto na matriz de coocorrência
+    (similaridade de cosseno), lidos na hora de recomendar.
+    """
+    __tablename__ = 'produto_vizinho'
+    
+    produto_id = db.Column(db.Integer, primary_key=True)
+    vizinho_id = db.Column(db.Integer, primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class RecomendadorEstado(db.Model):
+    """Marcas d'água do recomendador (último id processado de cada fonte)."""
+    __tablename__ = 'recomendador_estado'
+    
+    chave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+
 class CompartilhamentoLista(db.Model):
     """
     Compartilhamento de listas entre usuários
@@ -172,8 +218,8 @@ def add_user_favorites_methods():
             user_id=self.id, expirado=False
         ).order_by(ProdutoRecomendado.score.desc()).limit(limit).all()
     
-    def add_to_lista(self, lista_id, produto_id, observacoes=None):
-        """Adiciona produto a uma lista de favoritos"""
+    def add_to_lista(self, lista_id, produto_id, observacoes=None, commit=True):
+        """Adiciona produto a uma lista de favoritos (commit=False: quem chama faz o commit)"""
         # Verifica se o item já existe
         existing = ItemListaFavoritos.query.filter_by(
             lista_id=lista_id, produto_id=produto_id
@@ -197,11 +243,12 @@ def add_user_favorites_methods():
         if lista:
             lista.atualizada_em = datetime.utcnow()
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True, item
     
-    def remove_from_lista(self, lista_id, produto_id):
-        """Remove produto de uma lista de favoritos"""
+    def remove_from_lista(self, lista_id, produto_id, commit=True):
+        """Remove produto de uma lista de favoritos (commit=False: quem chama faz o commit)"""
         item = ItemListaFavoritos.query.filter_by(
             lista_id=lista_id, produto_id=produto_id
         ).first()
@@ -216,7 +263,8 @@ def add_user_favorites_methods():
         if lista:
             lista.atualizada_em = datetime.utcnow()
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True, "Item removido da lista"
     
     def _get_next_order(self, lista_id):
@@ -227,8 +275,8 @@ def add_user_favorites_methods():
         
         return (last_item.ordem + 1) if last_item else 1
     
-    def register_view(self, produto_id, origem='web'):
-        """Registra visualização de produto"""
+    def register_view(self, produto_id, origem='web', commit=True):
+        """Registra visualização de produto (commit=False: quem chama faz o commit)"""
         # Remove visualizações muito antigas do mesmo produto (mantém só as 5 mais recentes)
         old_views = HistoricoVisualizacao.query.filter_by(
             user_id=self.id, produto_id=produto_id
@@ -245,7 +293,8 @@ def add_user_favorites_methods():
         )
         
         db.session.add(nova_view)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
         return nova_view
     
@@ -279,75 +328,16 @@ def criar_lista_default(user_id):
     return lista_default
 
 
-def gerar_recomendacoes_usuario(user_id, limit=10):
-    """
-    Gera recomendações automáticas para um usuário
-    Baseado em histórico de visualizações e produtos similares
-    """
-    from models import Produto, Aplicacao
-    from sqlalchemy import func, desc
-    
-    # Remove recomendações expiradas
-    ProdutoRecomendado.query.filter_by(user_id=user_id, expirado=True).delete()
-    
-    # Busca grupos mais visualizados pelo usuário
-    grupos_populares = db.session.query(
-        Produto.grupo,
-        func.count(HistoricoVisualizacao.id).label('count')
-    ).join(HistoricoVisualizacao).filter(
-        HistoricoVisualizacao.user_id == user_id
-    ).group_by(Produto.grupo).order_by(desc('count')).limit(3).all()
-    
-    recommendations = []
-    
-    for grupo, count in grupos_populares:
-        # Busca produtos similares no mesmo grupo que o usuário ainda não viu
-        produtos_recomendados = Produto.query.filter(
-            Produto.grupo == grupo,
-            ~Produto.id.in_(
-                db.session.query(HistoricoVisualizacao.produto_id).filter_by(user_id=user_id)
-            )
-        ).order_by(func.random()).limit(3).all()
-        
-        for produto in produtos_recomendados:
-            score = min(0.7 + (count * 0.1), 0.95)  # Score baseado na popularidade do grupo
-            
-            recomendacao = ProdutoRecomendado(
-                user_id=user_id,
-                produto_id=produto.id,
-                score=score,
-                algoritmo='content_based',
-                motivo=f'Baseado no seu interesse em {grupo}'
-            )
-            
-            recommendations.append(recomendacao)
-    
-    # Salva recomendações
-    for rec in recommendations:
-        existing = ProdutoRecomendado.query.filter_by(
-            user_id=user_id, produto_id=rec.produto_id
-        ).first()
-        if not existing:
-            db.session.add(rec)
-    
-    db.session.commit()
-    
-    return len(recommendations)
-
-
 def limpar_historico_antigo(dias=90):
-    """Remove histórico de visualizações muito antigo"""
+    """Remove histórico de visualizações muito antigo (um único DELETE)"""
     from datetime import datetime, timedelta
     
     cutoff_date = datetime.utcnow() - timedelta(days=dias)
     
-    old_views = HistoricoVisualizacao.query.filter(
+    removidas = HistoricoVisualizacao.query.filter(
         HistoricoVisualizacao.visualizado_em < cutoff_date
-    ).all()
-    
-    for view in old_views:
-        db.session.delete(view)
+    ).delete(synchronize_session=False)
     
     db.session.commit()
     
-    return len(old_views)
\ No newline at end of file
+    return removidas
\ No newline at end of file
@@ -35,15 +35,19 @@ from app import APP_DATA_PATH, carregar_config_aparencia, db, salvar_config_apar
 from core_utils import (
     _atualizar_similares_simetricamente,
     _build_search_query,
+    _filtros_aplicacao_busca,
     _get_form_datalists,
-    _parse_year_range,
-    _ranges_overlap,
     allowed_file,
+    executar_com_fallback_fts,
     _normalize_for_search,
     _processar_medidas_estruturadas,
     _parsear_medidas_para_dict,
+    grupos_busca,
+    paginate_busca,
 )
+from utils.autocomplete import get_autocomplete, sugerir_autocomplete
 from utils.cache_system import invalidate_search_cache
+from utils.fuzzy_codigos import get_indice_codigos, sugerir_codigos
 from utils.image_utils import download_image_from_url
 from utils.cart_utils import (
     add_to_cart,
@@ -54,7 +58,7 @@ from utils.cart_utils import (
     get_cart_count,
     get_cart_summary
 )
-from models import Aplicacao, ImagemProduto, Produto, User, SugestaoIgnorada, Contato, similares_association
+from models import Aplicacao, ImagemProduto, Produto, ProdutoSugestao, User, SugestaoIgnorada, Contato, similares_association
 
 # Importação da função de busca externa (importada separadamente para debugging)
 # Importações removidas - busca externa desabilitada
@@ -155,8 +159,12 @@ def index():
 
 @main_bp.route("/debug_busca")
 def debug_busca():
-    """Rota de debug para verificar se o sistema de busca está funcionando"""
-    if not current_user.is_authenticated or not (hasattr(current_user, 'eh_admin') and current_user.eh_admin):
+    """
+    Diagnóstico da busca: com os mesmos parâmetros de /buscar, mostra o caminho
+    escolhido, as instruções SQL com tempos e `EXPLAIN QUERY PLAN` e o tempo
+    por etapa (SQL, ORM, template). `formato=json` devolve o diagnóstico em JSON.
+    """
+    if not current_user.is_authenticated or not current_user.is_admin:
         flash("Acesso restrito a administradores", "danger")
         return redirect(url_for('main.index'))
     
@@ -178,30 +186,49 @@ def debug_busca():
             'status': 'Conectado'
         }
         
-        # Testa função de busca
-        query_teste = _build_search_query('', '', '', '', '', '')
-        resultado_teste = query_teste.limit(1).all()
-        debug_info['busca'] = {
-            'funcional': True,
-            'primeiro_produto': resultado_teste[0].nome if resultado_teste else 'N/A',
-            'function_loaded': '_build_search_query carregada'
-        }
+        parametros = {k: v for k, v in request.args.items() if k != 'formato' and v}
+        if parametros:
+            from utils.diagnostico_busca import diagnosticar_busca
+            debug_info['parametros'] = parametros
+            debug_info['busca'] = diagnosticar_busca(buscar, current_app._get_current_object())
+        else:
+            debug_info['uso'] = (
+                "Informe os parâmetros de /buscar, ex: "
+                "/debug_busca?termo=filtro&montadora=FIAT&aplicacao=PALIO (formato=json para JSON)"
+            )
         
     except Exception as e:
         debug_info['status'] = 'ERRO'
         debug_info['erro'] = str(e)
     
+    if request.args.get('formato') == 'json':
+        return jsonify(debug_info)
+    
+    from markupsafe import escape
     return f"""
     <html><head><title>Debug Sistema CGI</title></head><body>
     <h1>🔍 Debug Sistema de Busca CGI</h1>
-    <pre style="background:#f5f5f5;padding:20px;border-radius:5px;font-family:monospace;">
-{json.dumps(debug_info, indent=2, ensure_ascii=False)}
+    <pre style="background:#f5f5f5;padding:20px;border-radius:5px;font-family:monospace;white-space:pre-wrap;">
+{escape(json.dumps(debug_info, indent=2, ensure_ascii=False))}
     </pre>
     <p><a href="/">← Voltar à página inicial</a></p>
     </body></html>
     """
 
 
+@main_bp.route("/autocomplete")
+def autocomplete():
+    """Sugestões (JSON) para o campo de busca, a partir do índice em memória."""
+    consulta = request.args.get("q", "").strip()
+    limit = max(1, min(request.args.get("limit", 8, type=int), 20))
+    itens = sugerir_autocomplete(consulta, limit)
+    return jsonify({
+        "q": consulta,
+        "suggestions": [item["texto"] for item in itens],
+        "itens": itens,
+    })
+
+
 @main_bp.route("/buscar")
 def buscar():
     """Página de resultados da busca."""
@@ -222,74 +249,45 @@ def buscar():
     elo = request.args.get("elo", "")
     estrias_internas = request.args.get("estrias_internas", "")
     estrias_externas = request.args.get("estrias_externas", "")
+    # Tolerância (mm) das medidas; sem ela vale o padrão de `_build_search_query`.
+    tolerancia = request.args.get("tolerancia", type=float)
+    # Ano do veículo (ex: 2012): apenas aplicações cujo intervalo de anos o contém.
+    ano = request.args.get("ano", type=int)
     
-    sort_by = request.args.get("sort_by", "codigo")
+    # Com termo livre, a ordem padrão é a relevância (BM25) do FTS5.
+    sort_by = request.args.get("sort_by") or ("relevancia" if termo else "codigo")
     sort_dir = request.args.get("sort_dir", "asc")
 
     PER_PAGE = 20
-    query = _build_search_query(
-        termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
-        largura=largura, altura=altura, comprimento=comprimento,
-        diametro_externo=diametro_externo, diametro_interno=diametro_interno,
-        elo=elo, estrias_internas=estrias_internas, estrias_externas=estrias_externas
-    )
-    query = query.options(selectinload(Produto.aplicacoes), selectinload(Produto.imagens))
+    if termo and page == 1:
+        get_autocomplete().registrar_busca(termo)
+    def montar_query(usar_fts=True):
+        query = _build_search_query(
+            termo, codigo_produto, montadora, aplicacao_termo, grupo, medidas,
+            largura=largura, altura=altura, comprimento=comprimento,
+            diametro_externo=diametro_externo, diametro_interno=diametro_interno,
+            elo=elo, estrias_internas=estrias_internas, estrias_externas=estrias_externas,
+            sort_by=sort_by, sort_dir=sort_dir, tolerancia=tolerancia, ano=ano,
+            usar_fts=usar_fts,
+        )
+        return query.options(selectinload(Produto.aplicacoes), selectinload(Produto.imagens))
 
-    # Define a coluna de ordenação
-    order_column = Produto.codigo
-    if sort_by == "nome":
-        order_column = Produto.nome
+    # Paginação sobre os produtos (itens e total na mesma instrução). Com
+    # montadora/aplicação/ano, os produtos da página são agrupados por veículo
+    # pelas mesmas condições da busca, em SQL (uma consulta por página).
+    pagination = paginate_busca(
+        montar_query(), page, PER_PAGE, sem_fts=lambda: montar_query(usar_fts=False)
+    )
+    resultados_agrupados = {}
+    filtros_aplicacao = _filtros_aplicacao_busca(montadora, aplicacao_termo, ano)
+    if filtros_aplicacao:
+        resultados_agrupados = grupos_busca(pagination.items, filtros_aplicacao)
 
-    # Aplica a direção da ordenação
-    if sort_dir == "desc":
-        query = query.order_by(order_column.desc())
-    else:
-        query = query.order_by(order_column.asc())
-
-    # Se a busca for por montadora ou aplicação, agrupamos os resultados por veículo.
-    # Caso contrário, apenas paginamos a lista de produtos.
-    resultados_agrupados = collections.defaultdict(list)
-    if montadora or aplicacao_termo:
-        # Otimização: Em vez de carregar todos os produtos e depois agrupar na memória,
-        # fazemos uma consulta que já traz os dados de forma mais estruturada.
-        # A paginação aqui é feita sobre os produtos, não sobre os grupos.
-        pagination = query.distinct().paginate(
-            page=page, per_page=PER_PAGE, error_out=False
-        )
-        produtos_paginados = pagination.items
-
-        for produto in produtos_paginados:
-            # Filtra as aplicações do produto para mostrar apenas as que batem com a busca
-            aplicacoes_relevantes = []
-            for app in produto.aplicacoes:
-                # Normaliza comparações para ignorar acentos e diferenças de caixa
-                monta_ok = True
-                if montadora:
-                    # Usa comparação exata para evitar matches parciais
-                    monta_ok = _normalize_for_search(montadora) == _normalize_for_search(app.montadora or "")
-
-                aplic_ok = True
-                if aplicacao_termo:
-                    # Usa comparação exata para evitar matches parciais (ex: A1 em A10)
-                    aplicacao_normalizada = _normalize_for_search(aplicacao_termo)
-                    veiculo_normalizado = _normalize_for_search(app.veiculo or "")
-                    motor_normalizado = _normalize_for_search(app.motor or "")
-                    
-                    aplic_ok = (aplicacao_normalizada == veiculo_normalizado or 
-                               aplicacao_normalizada == motor_normalizado)
-
-                if monta_ok and aplic_ok:
-                    aplicacoes_relevantes.append(app)
-            for aplicacao in aplicacoes_relevantes:
-                chave_agrupamento = f"{aplicacao.montadora} {aplicacao.veiculo} {aplicacao.ano or ''}".strip()
-                if produto not in resultados_agrupados[chave_agrupamento]:
-                    resultados_agrupados[chave_agrupamento].append(produto)
-        resultados_agrupados = dict(sorted(resultados_agrupados.items()))
-    else:
-        # Busca padrão sem agrupamento
-        pagination = query.distinct().paginate(
-            page=page, per_page=PER_PAGE, error_out=False
-        )
+    # Sem resultados para um código: sugere códigos próximos (erros de digitação)
+    sugestoes_codigo = []
+    codigo_digitado = (codigo_produto or termo).strip()
+    if pagination.total == 0 and codigo_digitado:
+        sugestoes_codigo = sugerir_codigos(codigo_digitado)
 
     # Prepare search_args for template
     search_args = {
@@ -307,6 +305,8 @@ def buscar():
         'elo': elo,
         'estrias_internas': estrias_internas,
         'estrias_externas': estrias_externas,
+        'tolerancia': tolerancia,
+        'ano': ano,
         'sort_by': sort_by,
         'sort_dir': sort_dir
     }
@@ -323,7 +323,8 @@ def buscar():
         sort_dir=sort_dir,
         resultados_agrupados=resultados_agrupados,
         search_args=search_args,
-        is_admin=current_user.is_authenticated and hasattr(current_user, 'eh_admin') and current_user.eh_admin,
+        sugestoes_codigo=sugestoes_codigo,
+        is_admin=current_user.is_authenticated and current_user.is_admin,
         endpoint=request.endpoint,  # Passa o endpoint atual para o template
     )
 
@@ -367,6 +368,11 @@ def detalhe_peca(id):
             # Log error silently but don't break page
             current_app.logger.warning(f"Erro ao registrar visualização: {str(e)}")
 
+    # Produtos visualizados sobem no ranking do autocompletar
+    autocomplete = get_autocomplete()
+    autocomplete.registrar_uso("codigo", produto.codigo)
+    autocomplete.registrar_uso("nome", produto.nome, peso=0.2)
+
     aplicacoes_agrupadas = collections.defaultdict(list)
     
     # Função de ordenação que prioriza o veículo pesquisado
@@ -405,87 +411,27 @@ def detalhe_peca(id):
         montadora_chave = aplicacao.montadora or "Sem Montadora"
         aplicacoes_agrupadas[montadora_chave].append(aplicacao)
 
-    # Lógica para encontrar produtos sugeridos
-    sugestoes_similares_dict = {}
+    # Sugestões pré-calculadas em segundo plano (utils/sugestoes_produto.py),
+    # sem as já vinculadas como similares e as ignoradas para este produto.
     ids_ja_relacionados = (
         {p.id for p in produto.similares}
         | {p.id for p in produto.similar_to}
-        | {produto.id}
-    )
-
-    # Carrega sugestões ignoradas para este produto e evita listá-las
-    ignored_rows = (
-        db.session.query(SugestaoIgnorada.sugestao_id)
-        .filter(SugestaoIgnorada.produto_id == produto.id)
-        .all()
     )
-    ignored_ids = {r[0] for r in ignored_rows} if ignored_rows else set()
-
-    codigos_conversao = [
-        c.strip() for c in (produto.conversoes or "").split(",") if c.strip()
-    ]
-    if codigos_conversao:
-        sugestoes_por_conversao = (
-            Produto.query.filter(
-                Produto.id.notin_(ids_ja_relacionados),
-                Produto.codigo.in_(codigos_conversao),
-                Produto.id.notin_(ignored_ids) if ignored_ids else True,
-            )
-            .options(selectinload(Produto.aplicacoes), selectinload(Produto.imagens))
-            .all()
-        )
-        for p in sugestoes_por_conversao:
-            sugestoes_similares_dict[p.id] = p
-
-    sugestoes_por_codigo_produto = (
-        Produto.query.filter(
+    sugestoes_similares = (
+        Produto.query
+        .join(ProdutoSugestao, ProdutoSugestao.sugestao_id == Produto.id)
+        .filter(
+            ProdutoSugestao.produto_id == produto.id,
             Produto.id.notin_(ids_ja_relacionados),
-            Produto.conversoes.ilike(f"%{produto.codigo}%"),
-            Produto.id.notin_(ignored_ids) if ignored_ids else True,
+            ~db.exists().where(
+                SugestaoIgnorada.produto_id == produto.id,
+                SugestaoIgnorada.sugestao_id == Produto.id,
+            ),
         )
         .options(selectinload(Produto.aplicacoes), selectinload(Produto.imagens))
+        .order_by(ProdutoSugestao.score.desc(), Produto.codigo)
         .all()
     )
-    for p in sugestoes_por_codigo_produto:
-        sugestoes_similares_dict[p.id] = p
-
-    # Otimização: Em vez de fazer uma query por aplicação, fazemos uma única query
-    # para todos os veículos relevantes e depois filtramos em Python.
-    if produto.grupo and produto.aplicacoes:
-        # 1. Coleta todos os veículos e seus intervalos de ano do produto principal
-        veiculos_principais = {
-            app.veiculo: _parse_year_range(app.ano)
-            for app in produto.aplicacoes
-            if app.veiculo and _parse_year_range(app.ano) != (-1, -1)
-        }
-
-        if veiculos_principais:
-            # 2. Busca todos os candidatos de uma só vez
-            candidatos_gerais = (
-                Produto.query
-                .filter(
-                    Produto.id.notin_(ids_ja_relacionados | set(sugestoes_similares_dict.keys())),
-                    Produto.grupo == produto.grupo,
-                    Produto.aplicacoes.any(Aplicacao.veiculo.in_(veiculos_principais.keys())),
-                    Produto.id.notin_(ignored_ids) if ignored_ids else True
-                ).options(
-                    selectinload(Produto.aplicacoes),
-                    selectinload(Produto.imagens)
-                ).all()
-            )
-
-            # 3. Processa os candidatos em memória para verificar a sobreposição de anos
-            for candidato in candidatos_gerais:
-                for app_candidata in candidato.aplicacoes:
-                    # Verifica se o veículo do candidato está na lista de veículos do produto principal
-                    if app_candidata.veiculo in veiculos_principais:
-                        range_principal = veiculos_principais[app_candidata.veiculo]
-                        range_candidato = _parse_year_range(app_candidata.ano)
-                        if range_candidato != (-1, -1) and _ranges_overlap(range_principal, range_candidato):
-                            sugestoes_similares_dict[candidato.id] = candidato
-                            break  # Adiciona o candidato uma vez e vai para o próximo
-
-    sugestoes_similares = list(sugestoes_similares_dict.values())
 
     voltar_url = request.referrer or url_for("main.index")
     ignore_referrer = [
@@ -1475,7 +1421,16 @@ def pagina_tarefas():
 @admin_bp.route("/tarefas/status", methods=["GET"])
 def status_tarefa():
     """Endpoint AJAX para obter o status da tarefa atual."""
-    return jsonify(TASK_STATUS)
+    status = dict(TASK_STATUS)
+    # Durante a execução, mostra o que o subprocesso já escreveu no log
+    log_file_path = status.pop("log", None)
+    if log_file_path and status["status"].startswith("Executando"):
+        try:
+            with open(log_file_path, "rb") as log_file:
+                status["output"] = log_file.read()[-20000:].decode("utf-8", errors="replace")
+        except OSError:
+            pass
+    return jsonify(status)
 
 
 def _run_task_in_background(command_args, log_file_path):
@@ -1510,6 +1465,9 @@ def _run_task_in_background(command_args, log_file_path):
             TASK_STATUS["status"] = (
                 f"Concluído com sucesso às {datetime.now().strftime('%H:%M:%S')}"
             )
+            # A tarefa roda em outro processo: reconstrói os índices em memória
+            get_autocomplete().construir_em_segundo_plano()
+            get_indice_codigos().construir_em_segundo_plano()
         else:
             TASK_STATUS["status"] = f"Falhou às {datetime.now().strftime('%H:%M:%S')}"
 
@@ -1577,6 +1535,28 @@ def tarefa_vincular_imagens():
     return redirect(url_for("admin.pagina_tarefas"))
 
 
+@admin_bp.route("/tarefas/reconstruir_fts", methods=["POST"])
+def tarefa_reconstruir_fts():
+    global TASK_STATUS
+    if TASK_STATUS["status"].startswith("Executando"):
+        flash("Uma tarefa já está em execução. Aguarde a sua conclusão.", "warning")
+        return redirect(url_for("admin.pagina_tarefas"))
+
+    log_file = os.path.join(APP_DATA_PATH, "task_rebuild_fts.log")
+    TASK_STATUS = {
+        "status": "Executando: Reconstrução do Índice de Busca...",
+        "output": "Iniciando...",
+        "log": log_file,
+    }
+    thread = threading.Thread(
+        target=_run_task_in_background, args=(["rebuild-fts"], log_file)
+    )
+    thread.start()
+
+    flash("A reconstrução do índice de busca foi iniciada em segundo plano.", "info")
+    return redirect(url_for("admin.pagina_tarefas"))
+
+
 def _verificar_foreign_keys_banco(db_path):
     """Verifica integridade das foreign keys no banco de dados"""
     try:
@@ -1761,15 +1741,20 @@ def restaurar():
 def exportar_csv():
     # Reutiliza os mesmos parâmetros da busca
     args = request.args.copy()
-    query = _build_search_query(
-        args.get("termo", ""),
-        args.get("codigo_produto", ""),
-        args.get("montadora", ""),
-        args.get("aplicacao", ""),
-        args.get("grupo", ""),
-        args.get("medidas", ""),
-    )
-    resultados = query.options(db.joinedload(Produto.aplicacoes)).all()
+
+    def buscar(usar_fts=True):
+        query = _build_search_query(
+            args.get("termo", ""),
+            args.get("codigo_produto", ""),
+            args.get("montadora", ""),
+            args.get("aplicacao", ""),
+            args.get("grupo", ""),
+            args.get("medidas", ""),
+            usar_fts=usar_fts,
+        )
+        return query.options(db.joinedload(Produto.aplicacoes)).all()
+
+    resultados = executar_com_fallback_fts(buscar, lambda: buscar(usar_fts=False))
 
     def generate():
         yield "codigo,nome,grupo,fornecedor,conversoes,medidas,observacoes,aplicacoes_json\n"
@@ -2627,7 +2612,8 @@ def collect_dashboard_stats():
         fts_stats = fts_manager.get_stats()
         stats['fts'] = {
             'ativo': fts_stats['exists'],
-            'total_records': fts_stats['total_records']
+            'total_records': fts_stats['total_records'],
+            'conexoes': fts_stats.get('conexoes', {})
         }
     except (ImportError, Exception):
         stats['fts'] = {
@@ -2635,6 +2621,20 @@ def collect_dashboard_stats():
             'total_records': 0
         }
     
+    # Fila única de escrita (utils/fila_escrita.py)
+    try:
+        from utils.fila_escrita import get_fila_escrita_stats
+        stats['escrita'] = get_fila_escrita_stats()
+    except Exception:
+        stats['escrita'] = {'ativa': False}
+
+    # Manutenção do banco (utils/manutencao.py)
+    try:
+        from utils.manutencao import get_manutencao_stats
+        stats['manutencao'] = get_manutencao_stats()
+    except Exception:
+        stats['manutencao'] = {'ativa': False, 'ultimas': []}
+
     # Tamanho do banco de dados
     try:
         import os
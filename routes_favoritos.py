@@ -9,10 +9,12 @@ from datetime import datetime
 import secrets
 
 from app import db
+from utils.fila_escrita import executar_escrita
+from utils.historico_visualizacoes import registrar_visualizacao_produto
+from utils.recomendacoes import recomendar_para_usuario
 from models_favoritos import (
     ListaFavoritos, ItemListaFavoritos, HistoricoVisualizacao, 
-    ProdutoRecomendado, CompartilhamentoLista,
-    gerar_recomendacoes_usuario
+    ProdutoRecomendado, CompartilhamentoLista
 )
 from models import Produto, User
 from core_utils import _normalize_for_search
@@ -26,7 +28,7 @@ def index():
     """Dashboard de favoritos do usuário"""
     listas = current_user.get_listas_favoritos()
     historico = current_user.get_historico_recent(limit=10)
-    recomendacoes = current_user.get_recomendacoes_ativas(limit=6)
+    recomendacoes = _recomendacoes_usuario(limit=6)
     
     # Estatísticas
     total_favoritos = sum(lista.total_itens for lista in listas)
@@ -183,7 +185,10 @@ def adicionar_produto():
         # Verifica se o produto existe
         produto = Produto.query.get_or_404(produto_id)
         
-        success, result = current_user.add_to_lista(lista_id, produto_id, observacoes)
+        user_id = current_user.id
+        success, result = executar_escrita(
+            lambda: _adicionar_item(user_id, lista_id, produto_id, observacoes)
+        )
         
         if success:
             return jsonify({
@@ -211,7 +216,10 @@ def remover_produto():
         if lista.user_id != current_user.id:
             return jsonify({'success': False, 'message': 'Permissão negada'})
         
-        success, message = current_user.remove_from_lista(lista_id, produto_id)
+        user_id = current_user.id
+        success, message = executar_escrita(
+            lambda: db.session.get(User, user_id).remove_from_lista(lista_id, produto_id, commit=False)
+        )
         
         return jsonify({'success': success, 'message': message})
         
@@ -369,20 +377,27 @@ def lista_publica(token):
 @login_required
 def recomendacoes():
     """Página de recomendações personalizadas"""
-    recomendacoes = current_user.get_recomendacoes_ativas(limit=20)
-    
-    # Se não tem recomendações, gera algumas
-    if len(recomendacoes) < 5:
-        count = gerar_recomendacoes_usuario(current_user.id, limit=15)
-        recomendacoes = current_user.get_recomendacoes_ativas(limit=20)
-        
-        if count > 0:
-            flash(f'{count} novas recomendações geradas para você!', 'info')
+    recomendacoes = _recomendacoes_usuario(limit=20)
     
     return render_template('favoritos/recomendacoes.html', 
                          recomendacoes=recomendacoes)
 
 
+def _recomendacoes_usuario(limit):
+    """
+    Vizinhos pré-calculados (utils/recomendacoes.py) completados com as
+    recomendações gravadas do usuário. Nada é calculado na requisição.
+    """
+    recomendacoes = recomendar_para_usuario(current_user.id, limite=limit)
+    if len(recomendacoes) < limit:
+        ja_incluidos = {rec['produto'].id for rec in recomendacoes}
+        recomendacoes += [
+            rec for rec in current_user.get_recomendacoes_ativas(limit=limit)
+            if rec.produto_id not in ja_incluidos
+        ][:limit - len(recomendacoes)]
+    return recomendacoes
+
+
 @favorites_bp.route('/historico')
 @login_required
 def historico():
@@ -510,8 +525,17 @@ def api_lista_detalhes(lista_id):
     })
 
 
+def _adicionar_item(user_id, lista_id, produto_id, observacoes):
+    """Tarefa da fila de escrita: devolve (sucesso, mensagem) sem objetos do ORM."""
+    success, result = db.session.get(User, user_id).add_to_lista(
+        lista_id, produto_id, observacoes, commit=False
+    )
+    return success, (None if success else result)
+
+
 # Hook para registrar visualizações automaticamente
 def registrar_visualizacao(produto_id, origem='web'):
     """Função helper para registrar visualizações (chamada de outras rotas)"""
     if current_user.is_authenticated:
-        current_user.register_view(produto_id, origem)
\ No newline at end of file
+        # Buffer em memória: a requisição não escreve no banco
+        registrar_visualizacao_produto(current_user.id, produto_id, origem)
\ No newline at end of file
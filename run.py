@@ -29,6 +29,7 @@ def _fallback_serve(app, host, port, _max_request_body_size=None):
 from app import (
     APP_DATA_PATH,
     create_app,
+    db,
     inicializar_banco,    
     schedule_periodic_update_check,
 )
@@ -255,6 +256,20 @@ def iniciar_servidor(app_instance, host, port, abrir_navegador):
 
     print("Garantindo que o banco de dados esteja inicializado...")
     inicializar_banco(app_instance)
+    from utils.autocomplete import precarregar_autocomplete
+    precarregar_autocomplete(app_instance)
+    from utils.fuzzy_codigos import precarregar_fuzzy_codigos
+    precarregar_fuzzy_codigos(app_instance)
+    from utils.sugestoes_produto import iniciar_sugestoes_em_segundo_plano
+    iniciar_sugestoes_em_segundo_plano(app_instance)
+    from utils.fila_escrita import iniciar_fila_escrita
+    iniciar_fila_escrita(app_instance)
+    from utils.historico_visualizacoes import iniciar_historico_visualizacoes
+    iniciar_historico_visualizacoes(app_instance)
+    from utils.recomendacoes import iniciar_recomendacoes_em_segundo_plano
+    iniciar_recomendacoes_em_segundo_plano(app_instance)
+    from utils.manutencao import iniciar_manutencao
+    iniciar_manutencao(app_instance)
 
     # Inicia a verificação de atualizações e agenda verificações periódicas
     threading.Timer(5.0, schedule_periodic_update_check, args=[app_instance]).start()
@@ -344,7 +359,7 @@ def main():
 
     # Isso ajuda quando empacotadores ou atalhos injetam argumentos em posições
     # diferentes (ex: alguns wrappers podem colocar o comando após opções).
-    known_cmds = {"run", "reset-db", "link-images", "import-csv"}
+    known_cmds = {"run", "reset-db", "migrate-db", "rebuild-equivalencias", "rebuild-sugestoes", "rebuild-fts", "recomendacoes", "maintain", "link-images", "import-csv"}
     if len(sys.argv) > 1:
         for i, a in enumerate(sys.argv[1:], start=1):
             if a in known_cmds:
@@ -396,6 +411,64 @@ def main():
         "reset-db", help="Apaga todas as tabelas e recria o banco de dados do zero."
     )
 
+    # Comando 'migrate-db'
+    subparsers.add_parser(
+        "migrate-db",
+        help="Aplica migrações pendentes (colunas, índices e preenchimentos) ao banco existente.",
+    )
+
+    # Comando 'rebuild-equivalencias'
+    subparsers.add_parser(
+        "rebuild-equivalencias",
+        help="Recalcula do zero as classes de equivalência (peças intercambiáveis) de todos os produtos.",
+    )
+
+    # Comando 'rebuild-sugestoes'
+    subparsers.add_parser(
+        "rebuild-sugestoes",
+        help="Recalcula do zero as sugestões de similares exibidas na página de detalhes.",
+    )
+
+    # Comando 'rebuild-fts'
+    subparsers.add_parser(
+        "rebuild-fts",
+        help="Reconstrói o índice de busca (FTS5) em uma tabela sombra e troca sem tirar a busca do ar.",
+    )
+
+    # Comando 'recomendacoes'
+    recomendacoes_parser = subparsers.add_parser(
+        "recomendacoes",
+        help="Atualiza as recomendações por coocorrência com o histórico e as listas novos.",
+    )
+    recomendacoes_parser.add_argument(
+        "--completo",
+        action="store_true",
+        help="Recalcula do zero, a partir de todo o histórico.",
+    )
+
+    # Comando 'maintain'
+    maintain_parser = subparsers.add_parser(
+        "maintain",
+        help="Executa agora a manutenção do banco (retenção, FTS, ANALYZE, checkpoint do WAL...).",
+    )
+    maintain_parser.add_argument(
+        "--tarefa",
+        action="append",
+        help="Executa só esta tarefa (pode repetir): retencao, fts, analyze, optimize, "
+        "incremental_vacuum, wal_checkpoint.",
+    )
+    maintain_parser.add_argument(
+        "--orcamento",
+        type=float,
+        default=None,
+        help="Limite de tempo, em segundos, de cada tarefa (padrão: sem limite).",
+    )
+    maintain_parser.add_argument(
+        "--vacuum",
+        action="store_true",
+        help="Antes, liga auto_vacuum incremental e reescreve o banco com VACUUM (com o servidor parado).",
+    )
+
     # Comando 'link-images'
     subparsers.add_parser(
         "link-images", help="Varre a pasta de uploads e vincula imagens aos produtos."
@@ -432,6 +505,80 @@ def main():
 
     if args.command == "reset-db":
         reset_database()
+    elif args.command == "migrate-db":
+        print("Aplicando migrações do banco de dados...")
+        inicializar_banco(app)
+        # Refaz também os preenchimentos já concluídos (dados gravados por SQL direto)
+        from utils.db_migrations import aplicar_migracoes
+        with app.app_context():
+            aplicar_migracoes(forcar_preenchimentos=True)
+        print("Migrações concluídas.")
+    elif args.command == "rebuild-equivalencias":
+        from utils.equivalencias import reconstruir_classes_equivalencia
+
+        print("Recalculando classes de equivalência...")
+        with app.app_context():
+            inicializar_banco(app)
+            with db.engine.begin() as connection:
+                estatisticas = reconstruir_classes_equivalencia(connection)
+        print(
+            f"{estatisticas['produtos']} produtos, {estatisticas['classes_com_mais_de_um']} classes "
+            f"com mais de um produto (maior: {estatisticas['maior_classe']}), "
+            f"{estatisticas['alterados']} alterados."
+        )
+    elif args.command == "rebuild-sugestoes":
+        from utils.sugestoes_produto import reconstruir_sugestoes
+
+        print("Recalculando sugestões de similares...")
+        with app.app_context():
+            inicializar_banco(app)
+            with db.engine.begin() as connection:
+                total = reconstruir_sugestoes(connection)
+        print(f"{total} sugestões gravadas.")
+    elif args.command == "rebuild-fts":
+        from utils.fts_search import get_fts_manager
+
+        def _mostrar_progresso(etapa, feitos, total):
+            print(f"[{etapa}] {feitos}/{total}", flush=True)
+
+        print("Reconstruindo índice de busca...", flush=True)
+        with app.app_context():
+            inicializar_banco(app)
+            ok = get_fts_manager().rebuild_index(progresso=_mostrar_progresso)
+        print("Índice de busca reconstruído." if ok else "Falha ao reconstruir o índice de busca.")
+        if not ok:
+            sys.exit(1)
+    elif args.command == "recomendacoes":
+        from utils.recomendacoes import atualizar_recomendacoes, reconstruir_recomendacoes
+
+        print("Atualizando recomendações...")
+        with app.app_context():
+            inicializar_banco(app)
+            if args.completo:
+                resultado = reconstruir_recomendacoes()
+            else:
+                resultado = atualizar_recomendacoes()
+        print(f"{resultado['vizinhos']} vizinhos gravados para {resultado['produtos']} produtos.")
+    elif args.command == "maintain":
+        from utils.manutencao import converter_para_vacuum_incremental, executar_manutencao
+
+        print("Executando manutenção do banco...")
+        with app.app_context():
+            inicializar_banco(app)
+            resultados = []
+            if args.vacuum:
+                resultados.append(converter_para_vacuum_incremental())
+            try:
+                resultados += executar_manutencao(
+                    args.tarefa, args.orcamento, app.config.get("MANUTENCAO_RETENCAO_DIAS", 90)
+                )
+            except ValueError as e:
+                print(e)
+        for r in resultados:
+            print(
+                f"{r['tarefa']}: {r['status']} em {r['duracao_ms']} ms, "
+                f"{r['bytes_recuperados']} bytes liberados {r['detalhes'] or ''}"
+            )
     elif args.command == "link-images":
         from utils.image_utils import vincular_imagens_por_codigo
 
@@ -175,6 +175,20 @@ def iniciar_servidor_background(host="127.0.0.1", port=8000):
     try:
         inicializar_banco(app)
         print("[SERVIDOR] Banco de dados inicializado")
+        from utils.autocomplete import precarregar_autocomplete
+        precarregar_autocomplete(app)
+        from utils.fuzzy_codigos import precarregar_fuzzy_codigos
+        precarregar_fuzzy_codigos(app)
+        from utils.sugestoes_produto import iniciar_sugestoes_em_segundo_plano
+        iniciar_sugestoes_em_segundo_plano(app)
+        from utils.fila_escrita import iniciar_fila_escrita
+        iniciar_fila_escrita(app)
+        from utils.historico_visualizacoes import iniciar_historico_visualizacoes
+        iniciar_historico_visualizacoes(app)
+        from utils.recomendacoes import iniciar_recomendacoes_em_segundo_plano
+        iniciar_recomendacoes_em_segundo_plano(app)
+        from utils.manutencao import iniciar_manutencao
+        iniciar_manutencao(app)
         
         # Inicia verificação de atualizações
         threading.Timer(5.0, schedule_periodic_update_check, args=[app]).start()
@@ -0,0 +1,88 @@
+"""
+Fixtures dos testes: aplicação com um banco SQLite temporário.
+
+`APPDATA` precisa apontar para a pasta temporária antes da importação de
+`app` (o caminho do banco é resolvido na importação do módulo).
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAIZ not in sys.path:
+    sys.path.insert(0, RAIZ)
+
+_PASTA_DADOS = tempfile.mkdtemp(prefix="catalogo-testes-")
+os.environ["APPDATA"] = _PASTA_DADOS
+os.environ.setdefault("SECRET_KEY", "testes")
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app, inicializar_banco
+
+    aplicacao = create_app()
+    aplicacao.config["TESTING"] = True
+    inicializar_banco(aplicacao)
+    yield aplicacao
+
+    from utils.fts_search import get_fts_manager
+    get_fts_manager().close_connections()
+    shutil.rmtree(_PASTA_DADOS, ignore_errors=True)
+
+
+def _limpar_catalogo(db):
+    """Apaga as linhas de todas as tabelas, exceto os usuários."""
+    db.session.rollback()
+    with db.engine.begin() as connection:
+        for tabela in reversed(db.metadata.sorted_tables):
+            if tabela.name != "user":
+                connection.execute(tabela.delete())
+        connection.execute(db.text("DELETE FROM fts_pendente;"))
+
+
+@pytest.fixture
+def banco(app):
+    """Contexto de aplicação; o catálogo é esvaziado ao final do teste."""
+    from app import db
+
+    with app.app_context():
+        yield db
+        _limpar_catalogo(db)
+        db.session.remove()
+
+
+@pytest.fixture
+def criar_produto(banco):
+    """Cria e grava um produto (com aplicações opcionais) e o retorna."""
+    from models import Aplicacao, Produto
+
+    def _criar(codigo, nome="PRODUTO", aplicacoes=(), **campos):
+        produto = Produto(codigo=codigo, nome=nome, **campos)
+        banco.session.add(produto)
+        banco.session.flush()
+        for montadora, veiculo, ano in aplicacoes:
+            banco.session.add(Aplicacao(
+                produto_id=produto.id, montadora=montadora, veiculo=veiculo, ano=ano,
+            ))
+        banco.session.commit()
+        return produto
+
+    return _criar
+
+
+@pytest.fixture
+def cliente(app, banco):
+    """Cliente de teste autenticado como o administrador."""
+    from models import User
+
+    admin = User.query.filter_by(username="admin").one()
+    admin.set_password("testes")
+    banco.session.commit()
+    cliente = app.test_client()
+    cliente.post("/login", data={"username": "admin", "password": "testes"})
+    return cliente
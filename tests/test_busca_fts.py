@@ -0,0 +1,97 @@
+"""Busca por termo: aspas do FTS5 e fallback para o SQL (core_utils / utils/fts_search.py)."""
+
+import time
+
+import pytest
+
+from utils.fts_search import get_fts_manager
+
+
+@pytest.fixture
+def catalogo(criar_produto):
+    criar_produto("AL-1084", nome="FILTRO DE OLEO", fornecedor="TECFIL")
+    criar_produto("WO-350", nome="FILTRO DE OLEO", fornecedor="WEGA")
+    criar_produto("PSL-612", nome="FILTRO DE AR", fornecedor="ANDRADE")
+    criar_produto("KL-9900", nome="PASTILHA DE FREIO ORIGINAL", fornecedor="COBREQ")
+    criar_produto("SK-2000", nome="DISCO DE FREIO", fornecedor="SYL", conversoes="AL 1084")
+
+
+# Termo -> total esperado. Operadores e caracteres especiais do FTS5 são texto.
+TERMOS = {
+    "filtro": 3,
+    # AND vira termo: só o filtro do fornecedor ANDRADE tem as duas palavras
+    "filtro AND": 1,
+    # OR sozinho é prefixo de ORIGINAL
+    "OR": 1,
+    # Aspas desbalanceadas não quebram o MATCH
+    '"filtro': 3,
+    'filtro "de': 3,
+    # Nenhuma palavra: o termo não filtra
+    "*": 5,
+    "filtro*": 3,
+    # Código com hífen: busca pelo código normalizado (e pela conversão)
+    "AL-1084": 2,
+}
+
+
+def _total_api(cliente, termo):
+    resposta = cliente.get("/api/v1/buscar", query_string={"q": termo})
+    assert resposta.status_code == 200, (termo, resposta.get_json())
+    return resposta.get_json()["data"]["pagination"]["total"]
+
+
+def _total_cursor(cliente, termo):
+    resposta = cliente.get(
+        "/api/v1/buscar", query_string={"q": termo, "cursor": "", "include_total": "1"}
+    )
+    assert resposta.status_code == 200, (termo, resposta.get_json())
+    return resposta.get_json()["data"]["pagination"]["total"]
+
+
+@pytest.mark.parametrize("termo, esperado", TERMOS.items())
+def test_termos_com_operadores_e_aspas(cliente, catalogo, termo, esperado):
+    assert get_fts_manager().is_ready()
+    assert _total_api(cliente, termo) == esperado
+    assert _total_cursor(cliente, termo) == esperado
+    assert cliente.get("/buscar", query_string={"termo": termo}).status_code == 200
+
+
+@pytest.mark.parametrize("termo", ["filtro AND", "OR", '"filtro', "*", "AL-1084"])
+def test_match_entre_aspas(termo):
+    match = get_fts_manager().build_match_query(termo)
+    # Fora das strings entre aspas só há os conectores gerados aqui
+    fora_das_aspas = match.split('"')[::2]
+    assert all(parte.strip(" *()") in ("", "OR", "AND") for parte in fora_das_aspas), match
+
+
+@pytest.mark.parametrize("termo, esperado", TERMOS.items())
+def test_fallback_sql_com_match_invalido(cliente, catalogo, monkeypatch, termo, esperado):
+    """Se o MATCH falhar no SQLite, a mesma busca é refeita pelo SQL."""
+    monkeypatch.setattr(get_fts_manager(), "build_match_query", lambda texto: "filtro AND")
+    assert _total_api(cliente, termo) == esperado
+    assert _total_cursor(cliente, termo) == esperado
+    assert cliente.get("/buscar", query_string={"termo": termo}).status_code == 200
+
+
+def test_fallback_sql_com_tabela_removida(banco, cliente, catalogo):
+    fts_manager = get_fts_manager()
+    # Primeira busca: a tabela é conferida e fica registrada
+    assert _total_api(cliente, "filtro") == 3
+    assert fts_manager.tabela_conferida()
+
+    with banco.engine.begin() as connection:
+        connection.execute(banco.text(f"DROP TABLE {fts_manager.fts_table};"))
+    try:
+        # A consulta falha no FTS5, marca o índice como indisponível e usa o SQL
+        assert _total_api(cliente, "filtro") == 3
+        assert not fts_manager.tabela_conferida()
+        assert cliente.get("/buscar", query_string={"termo": "filtro"}).status_code == 200
+    finally:
+        # A reconstrução agendada em segundo plano recria a tabela
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite and not (
+            fts_manager.is_ready() and not fts_manager._reconstrucao_lock.locked()
+        ):
+            time.sleep(0.05)
+    assert fts_manager.is_ready()
+    assert _total_api(cliente, "filtro") == 3
@@ -0,0 +1,225 @@
+"""Cache em memória (utils/cache_system.py): TTL, roda de temporizadores e orçamentos."""
+
+import random
+import time
+
+import pytest
+
+from utils import cache_system
+from utils.cache_system import (
+    ATRASO_MAX_RODA,
+    SLOTS_RODA,
+    InMemoryCache,
+    _RodaTemporizadores,
+    tamanho_aproximado,
+)
+
+
+class _Relogio:
+    """Substitui o módulo `time` do cache: `monotonic` controlado pelo teste."""
+
+    def __init__(self, agora: float = 1000.0):
+        self.agora = agora
+
+    def monotonic(self):
+        return self.agora
+
+    def avancar(self, segundos: float):
+        self.agora += segundos
+
+    def __getattr__(self, nome):
+        return getattr(time, nome)
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = _Relogio()
+    monkeypatch.setattr(cache_system, "time", relogio)
+    return relogio
+
+
+def _chaves_da_particao(cache, indice, quantidade, prefixo="k"):
+    chaves = []
+    n = 0
+    while len(chaves) < quantidade:
+        chave = f"{prefixo}{n}"
+        if cache._particao(chave) is cache._particoes[indice]:
+            chaves.append(chave)
+        n += 1
+    return chaves
+
+
+# --- Comparação com um modelo simples ---
+
+@pytest.mark.parametrize("semente", range(5))
+def test_aleatorio_contra_modelo(relogio, semente):
+    """Sequência aleatória de operações contra um dict {chave: (valor, expira_em)}."""
+    rng = random.Random(semente)
+    cache = InMemoryCache(default_ttl=30, max_size=10_000)
+    modelo = {}
+    chaves = [f"c{i}" for i in range(200)]
+
+    for passo in range(20_000):
+        operacao = rng.random()
+        chave = rng.choice(chaves)
+        if operacao < 0.35:
+            ttl = rng.choice([None, -1, 0, 1, 5, 63, 64, 65, 500, 5000])
+            valor = (chave, passo)
+            cache.set(chave, valor, ttl=ttl)
+            ttl = 30 if ttl is None else ttl
+            modelo[chave] = (valor, None if ttl == -1 else relogio.agora + ttl)
+        elif operacao < 0.75:
+            valor, expira_em = modelo.get(chave, (None, None))
+            if expira_em is not None and relogio.agora > expira_em:
+                valor = None
+            assert cache.get(chave) == valor, (passo, chave)
+        elif operacao < 0.8:
+            cache.delete(chave)
+            modelo.pop(chave, None)
+        elif operacao < 0.82:
+            cache.cleanup()
+        else:
+            # Passos inteiros caem exatamente no vencimento; alguns saltos longos
+            relogio.avancar(rng.choice([0.25, 0.5, 1, 1, 2, 7, 60, 300, 4100]))
+
+    vivas = {
+        chave for chave, (_, expira_em) in modelo.items()
+        if expira_em is None or relogio.agora <= expira_em
+    }
+    for chave in chaves:
+        assert (cache.get(chave) is not None) == (chave in vivas)
+
+
+def test_roda_devolve_cada_chave_uma_vez_e_nunca_antes_do_vencimento():
+    rng = random.Random(7)
+    agora = 5000.3
+    roda = _RodaTemporizadores(agora)
+    vencimentos = {}
+    for i in range(3000):
+        vence = agora + rng.choice([0.5, 1, 63, 64, 65, 4095, 4096, 4097, 300_000]) + rng.random() * 10
+        vencimentos[f"t{i}"] = vence
+        roda.agendar(f"t{i}", vence)
+    # Reagendar e cancelar antes de avançar
+    roda.agendar("t0", agora + 70)
+    vencimentos["t0"] = agora + 70
+    roda.cancelar("t1")
+    del vencimentos["t1"]
+
+    devolvidas = {}
+    while roda:
+        agora += rng.choice([0.3, 1, 17, 64, 1000, ATRASO_MAX_RODA + 5])
+        for chave in roda.avancar(agora):
+            assert chave not in devolvidas
+            devolvidas[chave] = agora
+
+    assert devolvidas.keys() == vencimentos.keys()
+    for chave, quando in devolvidas.items():
+        assert quando > vencimentos[chave], chave
+
+
+# --- TTL ---
+
+def test_ttl_atravessando_a_volta_da_roda(relogio):
+    cache = InMemoryCache(default_ttl=10, max_size=10)
+    particao = cache._particoes[0]
+    ttls = {"curta": 3, "nivel1": SLOTS_RODA + 6, "nivel2": SLOTS_RODA ** 2 + 6, "permanente": -1}
+    for chave, ttl in ttls.items():
+        cache.set(chave, chave, ttl=ttl)
+
+    # Avança em passos de meio segundo, atravessando várias voltas do nível 0
+    inicio = relogio.agora
+    decorrido = 0.0
+    while decorrido < SLOTS_RODA ** 2 + 10:
+        relogio.avancar(0.5)
+        decorrido = relogio.agora - inicio
+        cache.cleanup()
+        for chave, ttl in ttls.items():
+            viva = ttl == -1 or decorrido <= ttl
+            if viva:
+                assert chave in particao.entradas, (chave, decorrido)
+            elif decorrido > ttl + 1:
+                # A roda remove no máximo um tick depois do vencimento
+                assert chave not in particao.entradas, (chave, decorrido)
+            assert (cache.get(chave) == chave) == viva, (chave, decorrido)
+
+    assert cache.get_stats()['remocoes']['expiradas'] >= 1
+    assert cache.get("permanente") == "permanente"
+    assert len(particao.roda) == 0
+
+
+def test_cache_parado_por_muito_tempo(relogio):
+    cache = InMemoryCache(default_ttl=10, max_size=10)
+    cache.set("a", 1, ttl=5)
+    cache.set("b", 2, ttl=ATRASO_MAX_RODA * 3)
+    relogio.avancar(ATRASO_MAX_RODA * 2)
+    cache.cleanup()
+
+    particao = cache._particoes[0]
+    assert "a" not in particao.entradas
+    assert cache.get("b") == 2
+    relogio.avancar(ATRASO_MAX_RODA * 2)
+    cache.cleanup()
+    assert "b" not in particao.entradas
+
+
+# --- Orçamentos ---
+
+def test_lru_por_particao(relogio):
+    cache = InMemoryCache(default_ttl=60, max_size=2 * 64)
+    assert len(cache._particoes) == 2
+    limite = cache._particoes[0].max_itens
+    primeira = _chaves_da_particao(cache, 0, limite + 1)
+    segunda = _chaves_da_particao(cache, 1, limite)
+
+    for chave in primeira[:limite] + segunda:
+        cache.set(chave, chave)
+    # Uso recente protege a mais antiga
+    assert cache.get(primeira[0]) == primeira[0]
+    cache.set(primeira[limite], primeira[limite])
+
+    assert cache.get(primeira[1]) is None
+    assert cache.get(primeira[0]) == primeira[0]
+    assert cache.get(primeira[limite]) == primeira[limite]
+    # A outra partição não perde nada
+    assert all(cache.get(chave) == chave for chave in segunda)
+    assert cache.get_stats()['remocoes']['capacidade'] == 1
+    assert cache.get_stats()['size'] == 2 * limite
+
+
+def test_limite_de_bytes(relogio):
+    cache = InMemoryCache(default_ttl=60, max_size=10, max_bytes=10_000)
+    valor = b"x" * 1000
+    tamanho = tamanho_aproximado(valor)
+
+    for i in range(20):
+        cache.set(f"v{i}", valor)
+        assert cache.get_stats()['bytes'] <= 10_000
+
+    stats = cache.get_stats()
+    cabem = 10_000 // tamanho
+    assert stats['size'] == cabem
+    assert stats['bytes'] == cabem * tamanho
+    assert stats['remocoes']['memoria'] == 20 - cabem
+    # As mais antigas saíram primeiro
+    assert cache.get("v19") == valor
+    assert cache.get(f"v{19 - cabem}") is None
+
+    # Valor maior que o orçamento inteiro não é armazenado nem expulsa ninguém
+    cache.set("grande", b"x" * 20_000)
+    assert cache.get("grande") is None
+    assert cache.get_stats()['remocoes']['tamanho'] == 1
+    assert cache.get_stats()['size'] == cabem
+
+    # Sobrescrever e remover mantêm a contagem de bytes exata
+    cache.set("v19", b"y")
+    cache.delete("v18")
+    esperado = (cabem - 2) * tamanho + tamanho_aproximado(b"y")
+    assert cache.get_stats()['bytes'] == esperado
+
+
+def test_bytes_liberados_na_expiracao(relogio):
+    cache = InMemoryCache(default_ttl=5, max_size=10, max_bytes=100_000)
+    cache.set("a", b"x" * 1000)
+    relogio.avancar(10)
+    cache.cleanup()
+    assert cache.get_stats()['bytes'] == 0
@@ -0,0 +1,121 @@
+"""Preenchimentos (backfills) de utils/db_migrations.py e o registro em schema_versao."""
+
+import pytest
+
+from utils import db_migrations
+from utils.db_migrations import aplicar_migracoes
+
+# Nome em schema_versao -> função de preenchimento
+PREENCHIMENTOS = {
+    "aplicacao_token": "preencher_aplicacao_token",
+    "produto_medida": "preencher_produto_medida",
+    "intervalo_anos": "preencher_intervalo_anos",
+    "montadora_norm": "preencher_montadora_norm",
+}
+
+
+def _inserir_aplicacao_por_sql(banco, produto_id, **campos):
+    valores = {"veiculo": "PALIO", "ano": "2010/2015", "motor": "1.0 8V", "conf_mtr": "", "montadora": "FIAT"}
+    valores.update(campos)
+    with banco.engine.begin() as connection:
+        return connection.execute(
+            banco.text(
+                "INSERT INTO aplicacao (produto_id, veiculo, ano, motor, conf_mtr, montadora) "
+                "VALUES (:produto_id, :veiculo, :ano, :motor, :conf_mtr, :montadora);"
+            ),
+            {"produto_id": produto_id, **valores},
+        ).lastrowid
+
+
+def _contar(banco, sql, **params):
+    return banco.session.execute(banco.text(sql), params).scalar()
+
+
+@pytest.fixture
+def preenchimentos_contados(monkeypatch):
+    """Conta as chamadas de cada função de preenchimento."""
+    chamadas = {}
+    for nome in PREENCHIMENTOS.values():
+        original = getattr(db_migrations, nome)
+
+        def contado(connection, _nome=nome, _original=original):
+            chamadas[_nome] = chamadas.get(_nome, 0) + 1
+            return _original(connection)
+
+        monkeypatch.setattr(db_migrations, nome, contado)
+    return chamadas
+
+
+def test_preenchimentos_registrados_nao_rodam_de_novo(banco, preenchimentos_contados):
+    # O banco dos testes já foi migrado uma vez (inicializar_banco)
+    registrados = {
+        linha[0] for linha in banco.session.execute(banco.text("SELECT nome FROM schema_versao"))
+    }
+    assert set(PREENCHIMENTOS) <= registrados
+
+    assert aplicar_migracoes()
+    assert preenchimentos_contados == {}
+
+
+def test_forcar_refaz_os_preenchimentos(banco, criar_produto, preenchimentos_contados):
+    produto = criar_produto("AL-1084")
+    aplicacao_id = _inserir_aplicacao_por_sql(banco, produto.id)
+
+    # Gravada por SQL direto: sem tokens, e a inicialização normal não varre
+    assert aplicar_migracoes()
+    assert _contar(banco, "SELECT COUNT(*) FROM aplicacao_token WHERE aplicacao_id = :id", id=aplicacao_id) == 0
+
+    assert aplicar_migracoes(forcar_preenchimentos=True)
+    assert preenchimentos_contados["preencher_aplicacao_token"] == 1
+    tokens = {
+        linha[0] for linha in banco.session.execute(
+            banco.text("SELECT token FROM aplicacao_token WHERE aplicacao_id = :id"), {"id": aplicacao_id}
+        )
+    }
+    assert {"palio", "8v"} <= tokens
+
+
+def test_forcar_preenche_medidas_gravadas_por_sql(banco, criar_produto):
+    produto = criar_produto("AL-1084")
+    with banco.engine.begin() as connection:
+        connection.execute(
+            banco.text("UPDATE produto SET medidas = :medidas WHERE id = :id"),
+            {"medidas": "DIÂMETRO INTERNO: 25MM\nALTURA: 80MM", "id": produto.id},
+        )
+
+    assert aplicar_migracoes()
+    assert _contar(banco, "SELECT COUNT(*) FROM produto_medida WHERE produto_id = :id", id=produto.id) == 0
+
+    assert aplicar_migracoes(forcar_preenchimentos=True)
+    medidas = dict(banco.session.execute(
+        banco.text("SELECT tipo, valor_mm FROM produto_medida WHERE produto_id = :id"), {"id": produto.id}
+    ).all())
+    assert medidas == {"diametro_interno": 25.0, "altura": 80.0}
+
+
+def test_forcar_preenche_anos_e_montadora_gravados_por_sql(banco, criar_produto):
+    produto = criar_produto("AL-1084")
+    aplicacao_id = _inserir_aplicacao_por_sql(banco, produto.id, ano="2010/2015", montadora="CITROËN")
+    sql = "SELECT ano_inicio, ano_fim, montadora_norm FROM aplicacao WHERE id = :id"
+
+    assert aplicar_migracoes()
+    assert tuple(banco.session.execute(banco.text(sql), {"id": aplicacao_id}).one()) == (None, None, None)
+
+    assert aplicar_migracoes(forcar_preenchimentos=True)
+    assert tuple(banco.session.execute(banco.text(sql), {"id": aplicacao_id}).one()) == (2010, 2015, "citroen")
+
+
+def test_preenchimento_que_falha_nao_e_registrado(banco, monkeypatch):
+    banco.session.execute(banco.text("DELETE FROM schema_versao WHERE nome = 'aplicacao_token'"))
+    banco.session.commit()
+
+    def falha(connection):
+        raise RuntimeError("interrompido")
+
+    monkeypatch.setattr(db_migrations, "preencher_aplicacao_token", falha)
+    assert not aplicar_migracoes()
+    assert _contar(banco, "SELECT COUNT(*) FROM schema_versao WHERE nome = 'aplicacao_token'") == 0
+
+    monkeypatch.undo()
+    assert aplicar_migracoes()
+    assert _contar(banco, "SELECT COUNT(*) FROM schema_versao WHERE nome = 'aplicacao_token'") == 1
@@ -0,0 +1,223 @@
+"""Classes de equivalência incrementais (utils/equivalencias.py)."""
+
+import random
+
+import pytest
+
+from utils.equivalencias import produtos_equivalentes, reconstruir_classes_equivalencia
+
+
+def _classes(banco):
+    return dict(banco.session.execute(banco.text("SELECT id, classe_equivalencia FROM produto")).all())
+
+
+def _particao(classes):
+    grupos = {}
+    for produto_id, classe in classes.items():
+        grupos.setdefault(classe, set()).add(produto_id)
+    return {frozenset(grupo) for grupo in grupos.values()}
+
+
+def _mesma_classe(banco, *produtos):
+    classes = _classes(banco)
+    return len({classes[p.id] for p in produtos}) == 1
+
+
+def _confere_reconstrucao(banco):
+    """A reconstrução completa não muda nada do que o incremental gravou."""
+    antes = _classes(banco)
+    estatisticas = reconstruir_classes_equivalencia(banco.session.connection())
+    banco.session.commit()
+    assert estatisticas['alterados'] == 0
+    assert _classes(banco) == antes
+
+
+@pytest.fixture
+def produtos(criar_produto):
+    return {
+        codigo: criar_produto(codigo)
+        for codigo in ("AL-1084", "PSL-100", "WO-350", "KL-9900", "SK-2000")
+    }
+
+
+def test_produto_sem_vinculos_e_sua_propria_classe(banco, produtos):
+    classes = _classes(banco)
+    assert all(classes[p.id] == p.id for p in produtos.values())
+    assert produtos_equivalentes(produtos["AL-1084"]).count() == 0
+
+
+def test_uniao_por_similar_e_por_conversao(banco, produtos):
+    al, psl, wo = produtos["AL-1084"], produtos["PSL-100"], produtos["WO-350"]
+
+    psl.similares.append(wo)
+    banco.session.commit()
+    assert _mesma_classe(banco, psl, wo)
+    assert _classes(banco)[wo.id] == min(psl.id, wo.id)
+
+    # Conversão que cita exatamente o código de outro produto (normalizado)
+    al.conversoes = "psl 100"
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl, wo)
+    assert _classes(banco)[wo.id] == min(al.id, psl.id, wo.id)
+    assert {p.id for p in produtos_equivalentes(wo)} == {al.id, psl.id}
+    assert not _mesma_classe(banco, al, produtos["KL-9900"])
+    _confere_reconstrucao(banco)
+
+
+def test_produto_novo_citado_por_conversao_existente(banco, produtos, criar_produto):
+    al = produtos["AL-1084"]
+    al.conversoes = "TECFIL 7788"
+    banco.session.commit()
+
+    novo = criar_produto("TECFIL-7788")
+    assert _mesma_classe(banco, al, novo)
+    _confere_reconstrucao(banco)
+
+
+def test_divisao_ao_remover_conversao(banco, produtos):
+    al, psl, wo = produtos["AL-1084"], produtos["PSL-100"], produtos["WO-350"]
+    # Cadeia AL -> PSL (conversão), PSL - WO (similar)
+    al.conversoes = "PSL-100"
+    psl.similares.append(wo)
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl, wo)
+
+    al.conversoes = ""
+    banco.session.commit()
+    classes = _classes(banco)
+    assert classes[al.id] == al.id
+    assert classes[psl.id] == classes[wo.id] == min(psl.id, wo.id)
+    _confere_reconstrucao(banco)
+
+
+def test_divisao_ao_remover_similar_do_meio(banco, produtos):
+    al, psl, wo = produtos["AL-1084"], produtos["PSL-100"], produtos["WO-350"]
+    al.similares.append(psl)
+    psl.similares.append(wo)
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl, wo)
+
+    psl.similares.remove(wo)
+    banco.session.commit()
+    classes = _classes(banco)
+    assert classes[al.id] == classes[psl.id] == al.id
+    assert classes[wo.id] == wo.id
+    _confere_reconstrucao(banco)
+
+
+def test_produto_movido_entre_classes(banco, produtos):
+    al, psl, wo, kl, sk = (produtos[c] for c in ("AL-1084", "PSL-100", "WO-350", "KL-9900", "SK-2000"))
+    al.similares.append(psl)
+    wo.similares.append(kl)
+    sk.conversoes = "AL-1084"
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl, sk)
+
+    # A conversão passa a citar a outra classe
+    sk.conversoes = "KL-9900"
+    banco.session.commit()
+    classes = _classes(banco)
+    assert classes[sk.id] == classes[wo.id] == classes[kl.id] == min(wo.id, kl.id)
+    assert classes[al.id] == classes[psl.id] == min(al.id, psl.id)
+    _confere_reconstrucao(banco)
+
+
+def test_renomear_codigo_desfaz_conversoes_que_o_citavam(banco, produtos):
+    al, psl = produtos["AL-1084"], produtos["PSL-100"]
+    al.conversoes = "PSL-100"
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl)
+
+    psl.codigo = "PSL-101"
+    banco.session.commit()
+    assert not _mesma_classe(banco, al, psl)
+    _confere_reconstrucao(banco)
+
+
+def test_excluir_produto_que_ligava_a_classe(banco, produtos):
+    al, psl, wo = produtos["AL-1084"], produtos["PSL-100"], produtos["WO-350"]
+    psl.similares.append(al)
+    psl.similares.append(wo)
+    banco.session.commit()
+    assert _mesma_classe(banco, al, psl, wo)
+
+    banco.session.delete(psl)
+    banco.session.commit()
+    classes = _classes(banco)
+    assert classes[al.id] == al.id
+    assert classes[wo.id] == wo.id
+    _confere_reconstrucao(banco)
+
+
+# --- Incremental x reconstrução ---
+
+def _particao_esperada(banco):
+    """Componentes conexos calculados do zero, direto das tabelas."""
+    from models import Produto
+
+    produtos = Produto.query.all()
+    por_codigo = {}
+    for produto in produtos:
+        por_codigo.setdefault(produto.codigo_norm, []).append(produto.id)
+    vizinhos = {produto.id: set() for produto in produtos}
+    for produto in produtos:
+        for similar in produto.similares:
+            vizinhos[produto.id].add(similar.id)
+            vizinhos[similar.id].add(produto.id)
+        for codigo in filter(None, (produto.conversoes_norm or "").split(",")):
+            for outro in por_codigo.get(codigo, []):
+                if outro != produto.id:
+                    vizinhos[produto.id].add(outro)
+                    vizinhos[outro].add(produto.id)
+
+    particao, vistos = set(), set()
+    for inicio in vizinhos:
+        if inicio in vistos:
+            continue
+        componente, pilha = set(), [inicio]
+        while pilha:
+            atual = pilha.pop()
+            if atual not in componente:
+                componente.add(atual)
+                pilha.extend(vizinhos[atual] - componente)
+        vistos |= componente
+        particao.add(frozenset(componente))
+    return particao
+
+
+@pytest.mark.parametrize("semente", range(4))
+def test_incremental_igual_a_reconstrucao(banco, criar_produto, semente):
+    from models import Produto
+
+    rng = random.Random(semente)
+    codigos = [f"EQ-{i:03d}" for i in range(25)]
+    for codigo in codigos[:18]:
+        criar_produto(codigo)
+
+    for passo in range(120):
+        produtos = Produto.query.order_by(Produto.id).all()
+        operacao = rng.random()
+        a, b = rng.sample(produtos, 2)
+        if operacao < 0.3:
+            if b not in a.similares:
+                a.similares.append(b)
+        elif operacao < 0.45:
+            if a.similares:
+                a.similares.remove(rng.choice(a.similares))
+        elif operacao < 0.7:
+            a.conversoes = ", ".join(rng.sample(codigos, rng.randint(0, 2)))
+        elif operacao < 0.8:
+            a.codigo = rng.choice(codigos)
+        elif operacao < 0.9 and len(produtos) > 5:
+            banco.session.delete(a)
+        else:
+            criar_produto(rng.choice(codigos), conversoes=rng.choice(["", rng.choice(codigos)]))
+        banco.session.commit()
+
+        classes = _classes(banco)
+        assert _particao(classes) == _particao_esperada(banco), passo
+        # A classe é sempre o menor id do componente
+        for grupo in _particao(classes):
+            assert {classes[produto_id] for produto_id in grupo} == {min(grupo)}
+
+    _confere_reconstrucao(banco)
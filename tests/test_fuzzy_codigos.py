@@ -0,0 +1,124 @@
+"""Índice aproximado de códigos (utils/fuzzy_codigos.py)."""
+
+import pytest
+
+from utils.fuzzy_codigos import (
+    IndiceCodigosAproximados,
+    _dobrar,
+    distancia_edicao,
+    get_indice_codigos,
+    sugerir_codigos,
+)
+
+
+@pytest.fixture
+def indice(app, criar_produto):
+    """Catálogo pequeno e o índice global reconstruído do zero sobre ele."""
+    criar_produto("AL-1084", nome="FILTRO DE OLEO")
+    criar_produto("WO-350", nome="FILTRO DE AR")
+    criar_produto("PSL-612", nome="FILTRO DE COMBUSTIVEL", conversoes="TECFIL 7788X")
+    criar_produto("KL-9900", nome="PASTILHA")
+    indice = get_indice_codigos()
+    assert indice.construir(app)
+    return indice
+
+
+def _produtos(indice, texto, limit=5):
+    return {(distancia, produto_id) for distancia, _, produto_id in indice.candidatos(texto, limit)}
+
+
+def _id(codigo):
+    from models import Produto
+    return Produto.query.filter_by(codigo=codigo).one().id
+
+
+def test_construcao_do_zero(app, indice):
+    novo = IndiceCodigosAproximados()
+    assert not novo.is_ready()
+    assert novo.candidatos("AL1084") == []
+
+    assert novo.construir(app)
+    assert novo.is_ready()
+    stats = novo.get_stats()
+    assert stats['produtos'] == 4
+    # 4 códigos próprios + 1 conversão
+    assert stats['codigos'] == 5
+    assert novo.candidatos("AL1084") == indice.candidatos("AL1084")
+
+
+def test_dobra_o_zero_e_i_um(indice):
+    assert _dobrar("ol1o8i") == "011081"
+    al1084 = _id("AL-1084")
+    # "AL1O84": letra O no lugar do zero
+    assert (0, al1084) in _produtos(indice, "AL1O84")
+    # "W0-35O" e "KI9900"/"Kl9900": dobras nos dois sentidos
+    assert (0, _id("WO-350")) in _produtos(indice, "W0-35O")
+    assert (0, _id("KL-9900")) in _produtos(indice, "KI9900")
+
+
+def test_distancia_um_e_dois(indice):
+    al1084 = _id("AL-1084")
+    # Substituição
+    assert (1, al1084) in _produtos(indice, "AL1085")
+    # Remoção e inserção
+    assert (1, al1084) in _produtos(indice, "AL184")
+    assert (1, al1084) in _produtos(indice, "AL10844")
+    # Duas edições (consulta com 5+ caracteres)
+    assert (2, al1084) in _produtos(indice, "AX1085")
+    # Três edições ficam de fora
+    assert al1084 not in {p for _, p in _produtos(indice, "AX1995")}
+
+
+def test_consulta_curta_so_aceita_distancia_um(indice):
+    wo350 = _id("WO-350")
+    assert (1, wo350) in _produtos(indice, "WO35")
+    # Consultas com menos de 5 caracteres não chegam a distância 2
+    assert wo350 not in {p for _, p in _produtos(indice, "WX35")}
+
+
+def test_troca_de_adjacentes_conta_uma_edicao(indice):
+    assert distancia_edicao("al1084", "al1048", 2) == 1
+    assert (1, _id("AL-1084")) in _produtos(indice, "AL1048")
+    assert (1, _id("PSL-612")) in _produtos(indice, "SPL612")
+
+
+def test_conversao_e_sugerida(indice):
+    sugestoes = sugerir_codigos("TECFIL7789X")
+    assert sugestoes[0]['produto_id'] == _id("PSL-612")
+    assert sugestoes[0]['via_conversao'] is True
+    assert sugestoes[0]['distancia'] == 1
+
+
+def test_produto_excluido_sai_do_indice(banco, indice):
+    from models import Produto
+
+    al1084 = _id("AL-1084")
+    banco.session.delete(banco.session.get(Produto, al1084))
+    banco.session.commit()
+
+    assert al1084 not in {p for _, p in _produtos(indice, "AL1084")}
+    assert indice.get_stats()['produtos'] == 3
+
+
+def test_produto_renomeado_troca_o_codigo(banco, indice):
+    from models import Produto
+
+    produto = Produto.query.filter_by(codigo="KL-9900").one()
+    produto.codigo = "MX-4321"
+    banco.session.commit()
+
+    assert produto.id not in {p for _, p in _produtos(indice, "KL9900")}
+    assert (0, produto.id) in _produtos(indice, "MX4321")
+    assert (1, produto.id) in _produtos(indice, "MX4312")
+
+
+def test_rollback_nao_altera_o_indice(banco, indice):
+    from models import Produto
+
+    produto = Produto.query.filter_by(codigo="WO-350").one()
+    produto.codigo = "ZZ-0001"
+    banco.session.flush()
+    banco.session.rollback()
+
+    assert (0, produto.id) in _produtos(indice, "WO350")
+    assert _produtos(indice, "ZZ0001") == set()
@@ -0,0 +1,152 @@
+"""Modo lote do FTS5 (utils/fts_search.modo_lote_fts) e a fila `fts_pendente`."""
+
+import threading
+
+import pytest
+
+from utils.fts_search import get_fts_manager, init_fts, modo_lote_fts
+
+
+def _documento(banco, produto_id):
+    """Linhas do FTS do produto: (nome, aplicacoes)."""
+    tabela = get_fts_manager().fts_table
+    return banco.session.execute(
+        banco.text(f"SELECT nome, aplicacoes FROM {tabela} WHERE rowid = :id"), {"id": produto_id}
+    ).all()
+
+
+def _pendentes(banco):
+    return {linha[0] for linha in banco.session.execute(banco.text("SELECT produto_id FROM fts_pendente"))}
+
+
+def _busca(termo):
+    return {resultado["produto_id"] for resultado in get_fts_manager().search(termo)}
+
+
+@pytest.fixture
+def processamentos(monkeypatch):
+    """Registra o retorno de cada chamada de `processar_pendentes`."""
+    fts_manager = get_fts_manager()
+    original = fts_manager.processar_pendentes
+    chamadas = []
+
+    def contado():
+        chamadas.append(original())
+        return chamadas[-1]
+
+    monkeypatch.setattr(fts_manager, "processar_pendentes", contado)
+    return chamadas
+
+
+@pytest.fixture
+def produtos(criar_produto):
+    return [
+        criar_produto("AL-1084", nome="FILTRO DE OLEO", aplicacoes=[("FIAT", "PALIO", "2010/2015")]),
+        criar_produto("WO-350", nome="FILTRO DE AR"),
+        criar_produto("KL-9900", nome="PASTILHA DE FREIO"),
+    ]
+
+
+def test_fora_do_lote_a_edicao_e_imediata(banco, produtos):
+    al = produtos[0]
+    al.nome = "FILTRO DE COMBUSTIVEL"
+    banco.session.commit()
+    assert _documento(banco, al.id)[0][0] == "FILTRO DE COMBUSTIVEL"
+    assert _pendentes(banco) == set()
+
+
+def test_lote_reindexa_cada_produto_uma_vez(banco, produtos, processamentos):
+    from models import Aplicacao
+
+    assert get_fts_manager().is_ready()
+    al, wo, kl = produtos
+    with modo_lote_fts():
+        # Várias alterações no mesmo produto, em commits separados
+        for nome in ("FILTRO SEDIMENTADOR", "FILTRO SEPARADOR", "FILTRO DECANTADOR"):
+            al.nome = nome
+            banco.session.commit()
+        banco.session.add(Aplicacao(produto_id=al.id, montadora="VW", veiculo="GOLF", ano="2000/2005"))
+        banco.session.add(Aplicacao(produto_id=wo.id, montadora="FORD", veiculo="KA", ano="2008/2012"))
+        banco.session.add(Aplicacao(produto_id=wo.id, montadora="FORD", veiculo="FIESTA", ano="2008/2012"))
+        banco.session.commit()
+
+        # Dentro do lote o FTS não é reescrito; só a fila recebe os produtos
+        assert _documento(banco, al.id)[0][0] == "FILTRO DE OLEO"
+        assert _pendentes(banco) == {al.id, wo.id}
+        assert processamentos == []
+
+    # Uma única passada, com um produto por linha da fila
+    assert processamentos == [2]
+    assert _pendentes(banco) == set()
+    for produto in produtos:
+        assert len(_documento(banco, produto.id)) == 1
+
+    nome, aplicacoes = _documento(banco, al.id)[0]
+    assert nome == "FILTRO DECANTADOR"
+    assert "PALIO" in aplicacoes and "GOLF" in aplicacoes
+    assert _busca("DECANTADOR") == {al.id}
+    assert _busca("SEDIMENTADOR") == set()
+    assert _busca("FIESTA") == {wo.id}
+    # O produto não alterado continua indexado
+    assert _busca("PASTILHA") == {kl.id}
+
+
+def test_lote_aninhado_processa_so_no_fim(banco, produtos, processamentos):
+    al = produtos[0]
+    with modo_lote_fts():
+        with modo_lote_fts():
+            al.nome = "FILTRO DECANTADOR"
+            banco.session.commit()
+        assert processamentos == []
+        assert _pendentes(banco) == {al.id}
+    assert processamentos == [1]
+    assert _busca("DECANTADOR") == {al.id}
+
+
+def test_lote_exclusao_remove_do_indice(banco, produtos):
+    al = produtos[0]
+    with modo_lote_fts():
+        banco.session.delete(al)
+        banco.session.commit()
+    assert _documento(banco, al.id) == []
+    assert _busca("OLEO") == set()
+
+
+def test_lote_interrompido_e_processado_na_proxima_inicializacao(app, banco, produtos):
+    fts_manager = get_fts_manager()
+    al, wo, kl = produtos
+    ids = {al.id, wo.id}
+    kl_id = kl.id
+    # A marca vale para conexões obtidas do pool depois de entrar no lote
+    banco.session.commit()
+
+    fts_manager.registrar_engine(banco.engine)
+    fts_manager.iniciar_modo_lote()
+    try:
+        al.nome = "FILTRO DECANTADOR"
+        wo.nome = "FILTRO DE CABINE"
+        banco.session.commit()
+    finally:
+        # Processo encerrado no meio da importação: o estado em memória se
+        # perde e `finalizar_modo_lote` nunca roda
+        fts_manager._threads_lote.pop(threading.get_ident(), None)
+        banco.session.remove()
+
+    # A fila fica gravada no banco; o FTS ainda tem o texto antigo
+    assert _pendentes(banco) == ids
+    assert _busca("DECANTADOR") == set()
+
+    # Fora do lote, as edições voltam a ser refletidas imediatamente
+    from models import Produto
+    kl = banco.session.get(Produto, kl_id)
+    kl.nome = "PASTILHA CERAMICA"
+    banco.session.commit()
+    assert _busca("CERAMICA") == {kl_id}
+    assert _pendentes(banco) == ids
+
+    # A próxima inicialização processa as pendências
+    assert init_fts(app)
+    assert _pendentes(banco) == set()
+    assert _busca("DECANTADOR") | _busca("CABINE") == ids
+    for produto_id in ids | {kl_id}:
+        assert len(_documento(banco, produto_id)) == 1
@@ -0,0 +1,226 @@
+"""Paginação por cursor: core_utils.paginate_keyset e o modo cursor de /api/v1/buscar."""
+
+import base64
+import json
+
+import pytest
+
+from core_utils import (
+    CursorInvalido,
+    _codificar_cursor,
+    _colunas_ordenacao_busca,
+    _decodificar_cursor,
+    paginate_keyset,
+)
+
+
+@pytest.fixture
+def catalogo(criar_produto):
+    """Produtos com empates no nome e no código."""
+    especificacoes = [
+        ("AL-1084", "FILTRO DE OLEO"),
+        ("AL-1084", "FILTRO DE OLEO"),
+        ("AL-1084", "FILTRO DE AR"),
+        ("WO-350", "FILTRO DE OLEO"),
+        ("WO-350", "FILTRO DE OLEO"),
+        ("KL-9900", "PASTILHA DE FREIO"),
+        ("PSL-612", "FILTRO DE OLEO"),
+        ("AB-0001", "FILTRO DE AR"),
+        ("ZZ-9999", "FILTRO DE OLEO"),
+    ]
+    return [criar_produto(codigo, nome=nome).id for codigo, nome in especificacoes]
+
+
+def _todas_as_paginas(query, colunas, limit, descendente=False, chave="teste"):
+    paginas = []
+    cursor = None
+    while True:
+        itens, cursor = paginate_keyset(
+            query, colunas, limit, cursor=cursor, descendente=descendente, chave=chave
+        )
+        paginas.append([p.id for p in itens])
+        if cursor is None:
+            return paginas
+        assert len(paginas) < 100
+
+
+def _esperado(banco, colunas, descendente=False):
+    from models import Produto
+
+    ordem = [c.desc() if descendente else c.asc() for c in colunas]
+    return [p.id for p in Produto.query.order_by(*ordem)]
+
+
+# --- Cursor ---
+
+def test_cursor_ida_e_volta():
+    cursor = _codificar_cursor("buscar:nome:asc:False", ["FILTRO DE ÓLEO", 7])
+    assert "=" not in cursor
+    assert _decodificar_cursor(cursor, "buscar:nome:asc:False", 2) == ["FILTRO DE ÓLEO", 7]
+
+
+@pytest.mark.parametrize("cursor", [
+    "nao-e-base64!!",
+    base64.urlsafe_b64encode(b"nao e json").decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'{"o": "teste"}').decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_cursor_malformado(cursor):
+    with pytest.raises(CursorInvalido):
+        _decodificar_cursor(cursor, "teste", 2)
+
+
+def test_cursor_de_outra_ordenacao_ou_tamanho():
+    cursor = _codificar_cursor("buscar:nome:asc:False", ["A", 1])
+    with pytest.raises(CursorInvalido):
+        _decodificar_cursor(cursor, "buscar:codigo:asc:False", 2)
+    with pytest.raises(CursorInvalido):
+        _decodificar_cursor(cursor, "buscar:nome:asc:False", 3)
+    adulterado = base64.urlsafe_b64encode(
+        json.dumps({"o": "buscar:nome:asc:False", "k": "A"}).encode()
+    ).decode()
+    with pytest.raises(CursorInvalido):
+        _decodificar_cursor(adulterado, "buscar:nome:asc:False", 1)
+
+
+# --- paginate_keyset ---
+
+@pytest.mark.parametrize("sort_by", ["codigo", "nome"])
+@pytest.mark.parametrize("sort_dir", ["asc", "desc"])
+@pytest.mark.parametrize("limit", [1, 2, 4, 20])
+def test_paginas_cobrem_a_ordem_completa(banco, catalogo, sort_by, sort_dir, limit):
+    from models import Produto
+
+    colunas, descendente = _colunas_ordenacao_busca(sort_by, sort_dir)
+    paginas = _todas_as_paginas(Produto.query, colunas, limit, descendente)
+
+    assert all(len(pagina) == limit for pagina in paginas[:-1])
+    assert 0 < len(paginas[-1]) <= limit
+    # Empates no nome/código não repetem nem pulam itens
+    assert [i for pagina in paginas for i in pagina] == _esperado(banco, colunas, descendente)
+
+
+def test_ultima_pagina_exata_nao_tem_cursor(banco, catalogo):
+    from models import Produto
+
+    colunas, _ = _colunas_ordenacao_busca("codigo", "asc")
+    itens, cursor = paginate_keyset(Produto.query, colunas, len(catalogo))
+    assert len(itens) == len(catalogo)
+    assert cursor is None
+
+
+def test_filtro_preservado_entre_paginas(banco, catalogo):
+    from models import Produto
+
+    colunas, _ = _colunas_ordenacao_busca("nome", "asc")
+    query = Produto.query.filter(Produto.nome == "FILTRO DE OLEO")
+    paginas = _todas_as_paginas(query, colunas, 2)
+    ids = [i for pagina in paginas for i in pagina]
+    assert len(ids) == 6
+    assert ids == sorted(ids)
+
+
+def test_cursor_de_outra_chave_e_recusado(banco, catalogo):
+    from models import Produto
+
+    colunas, _ = _colunas_ordenacao_busca("codigo", "asc")
+    _, cursor = paginate_keyset(Produto.query, colunas, 2, chave="buscar:codigo:asc:False")
+    with pytest.raises(CursorInvalido):
+        paginate_keyset(Produto.query, colunas, 2, cursor=cursor, chave="buscar:nome:asc:False")
+
+
+# --- /api/v1/buscar?cursor= ---
+
+def _paginas_api(cliente, **params):
+    paginas = []
+    params = {"cursor": "", **params}
+    while True:
+        resposta = cliente.get("/api/v1/buscar", query_string=params)
+        assert resposta.status_code == 200, resposta.get_json()
+        dados = resposta.get_json()["data"]
+        paginas.append([p["id"] for p in dados["produtos"]])
+        if not dados["pagination"]["has_next"]:
+            return paginas, dados
+        params["cursor"] = dados["pagination"]["next_cursor"]
+        assert len(paginas) < 100
+
+
+@pytest.mark.parametrize("sort_dir", ["asc", "desc"])
+def test_api_cursor_por_codigo(cliente, catalogo, sort_dir):
+    paginas, _ = _paginas_api(cliente, sort_by="codigo", sort_dir=sort_dir, limit=2)
+    ids = [i for pagina in paginas for i in pagina]
+
+    from app import db
+    colunas, descendente = _colunas_ordenacao_busca("codigo", sort_dir)
+    assert ids == _esperado(db, colunas, descendente)
+
+
+def test_api_cursor_por_relevancia(cliente, catalogo):
+    paginas, _ = _paginas_api(cliente, q="FILTRO OLEO", limit=2)
+    ids = [i for pagina in paginas for i in pagina]
+
+    resposta = cliente.get("/api/v1/buscar", query_string={"q": "FILTRO OLEO", "per_page": 50})
+    por_pagina = [p["id"] for p in resposta.get_json()["data"]["produtos"]]
+    assert len(ids) == len(set(ids)) == 6
+    # Mesma ordem (BM25, código, id) do modo por página
+    assert ids == por_pagina
+
+
+def test_api_cursor_com_total(cliente, catalogo):
+    resposta = cliente.get(
+        "/api/v1/buscar", query_string={"cursor": "", "limit": 3, "include_total": "1"}
+    )
+    assert resposta.get_json()["data"]["pagination"]["total"] == len(catalogo)
+
+
+@pytest.mark.parametrize("cursor", [
+    "lixo",
+    "%%%",
+    base64.urlsafe_b64encode(b'{"o": "buscar:codigo:asc:False", "k": [1]}').decode(),
+    base64.urlsafe_b64encode(b'{"o": "outra", "k": ["A", 1]}').decode(),
+    base64.urlsafe_b64encode(b"\x80\x81").decode(),
+])
+def test_api_cursor_adulterado_retorna_400(cliente, catalogo, cursor):
+    resposta = cliente.get(
+        "/api/v1/buscar", query_string={"sort_by": "codigo", "cursor": cursor, "limit": 2}
+    )
+    assert resposta.status_code == 400
+    assert resposta.get_json()["status"] == "error"
+
+
+def test_api_cursor_de_outra_ordenacao_retorna_400(cliente, catalogo):
+    resposta = cliente.get("/api/v1/buscar", query_string={"sort_by": "nome", "cursor": "", "limit": 2})
+    cursor = resposta.get_json()["data"]["pagination"]["next_cursor"]
+    resposta = cliente.get("/api/v1/buscar", query_string={"sort_by": "codigo", "cursor": cursor, "limit": 2})
+    assert resposta.status_code == 400
+
+
+# --- Falha do FTS5 no modo cursor ---
+
+@pytest.fixture
+def match_invalido(monkeypatch):
+    """Faz o MATCH da busca falhar no SQLite (erro de sintaxe do FTS5)."""
+    from utils.fts_search import get_fts_manager
+
+    fts_manager = get_fts_manager()
+    assert fts_manager.is_ready()
+    monkeypatch.setattr(fts_manager, "build_match_query", lambda termo: 'filtro AND')
+
+
+@pytest.mark.parametrize("params", [
+    {"q": "FILTRO OLEO", "cursor": "", "limit": 4, "include_total": "1"},
+    {"q": "FILTRO OLEO", "page": 1, "per_page": 4},
+])
+def test_api_refaz_pelo_sql_quando_o_fts_falha(cliente, catalogo, match_invalido, params):
+    resposta = cliente.get("/api/v1/buscar", query_string=params)
+    assert resposta.status_code == 200, resposta.get_json()
+    dados = resposta.get_json()["data"]
+    assert dados["pagination"]["total"] == 6
+    assert len(dados["produtos"]) == 4
+
+
+def test_api_cursor_pelo_sql_percorre_todas_as_paginas(cliente, catalogo, match_invalido):
+    paginas, _ = _paginas_api(cliente, q="FILTRO OLEO", limit=4)
+    ids = [i for pagina in paginas for i in pagina]
+    assert len(ids) == len(set(ids)) == 6
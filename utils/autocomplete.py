@@ -0,0 +1,511 @@
+"""
+Autocompletar em memória para o campo de busca.
+
+Mantém, para códigos, nomes, fornecedores, veículos e montadoras:
+- uma lista ordenada de chaves normalizadas (busca por prefixo com bisect),
+  com uma chave a partir de cada palavra do texto ("oleo" acha "FILTRO DE ÓLEO");
+- postings de n-gramas (trigramas) sobre o texto compacto, para achar trechos
+  no meio de códigos ("1084" acha "AL-1084").
+
+O índice é construído a partir do banco em segundo plano ao subir o servidor,
+atualizado incrementalmente pelos eventos do ORM (aplicados no commit) e
+limitado a `AUTOCOMPLETE_MAX_ENTRADAS` sugestões. O ranking considera o tipo
+de casamento, a popularidade (visualizações e buscas) e a quantidade de
+produtos/aplicações que usam o texto.
+"""
+
+import bisect
+import heapq
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app import db, get_logger
+
+logger = get_logger('autocomplete')
+
+# Tipos de sugestão, na ordem de preferência ao cortar pelo limite de memória.
+TIPOS_SUGESTAO = ("montadora", "veiculo", "nome", "fornecedor", "codigo")
+# Quantidade máxima de sugestões mantidas em memória (padrão).
+AUTOCOMPLETE_MAX_ENTRADAS = 100000
+# Tamanho dos n-gramas usados na busca por trecho.
+TAMANHO_NGRAMA = 3
+# Limites de candidatos examinados por consulta (mantém o tempo constante).
+MAX_CANDIDATOS_PREFIXO = 2000
+MAX_CANDIDATOS_NGRAMA = 2000
+# Intervalo mínimo (s) entre tentativas de construção após uma falha.
+INTERVALO_NOVA_TENTATIVA = 30
+
+# Classes de casamento (menor = melhor).
+_CASA_EXATA = 0
+_CASA_INICIO = 1
+_CASA_PALAVRA = 2
+_CASA_TRECHO = 3
+
+_SQL_CONSTRUCAO = {
+    "codigo": "SELECT codigo, COUNT(*) FROM produto WHERE codigo <> '' GROUP BY codigo",
+    "nome": "SELECT nome, COUNT(*) FROM produto WHERE nome <> '' GROUP BY nome",
+    "fornecedor": "SELECT fornecedor, COUNT(*) FROM produto WHERE fornecedor <> '' GROUP BY fornecedor",
+    "veiculo": "SELECT veiculo, COUNT(*) FROM aplicacao WHERE veiculo <> '' GROUP BY veiculo",
+    "montadora": "SELECT montadora, COUNT(*) FROM aplicacao WHERE montadora <> '' GROUP BY montadora",
+}
+_SQL_POPULARIDADE = (
+    "SELECT p.codigo, p.nome, COUNT(*) FROM historico_visualizacao h "
+    "JOIN produto p ON p.id = h.produto_id GROUP BY p.id"
+)
+
+
+def _compactar(texto) -> str:
+    from core_utils import _normalize_code_for_search
+    return _normalize_code_for_search(texto)
+
+
+def _palavras(texto) -> list:
+    from core_utils import _tokenizar_aplicacao
+    return _tokenizar_aplicacao(texto)
+
+
+class _Sugestao:
+    __slots__ = ("id", "texto", "tipo", "compacto", "palavras", "chaves", "referencias", "popularidade")
+
+    def __init__(self, sugestao_id, texto, tipo, referencias=0, popularidade=0.0):
+        self.id = sugestao_id
+        self.texto = texto.strip()
+        self.tipo = tipo
+        self.palavras = tuple(_palavras(self.texto))
+        self.compacto = "".join(self.palavras)
+        # Uma chave a partir de cada palavra: "filtrodeoleo", "deoleo", "oleo".
+        self.chaves = tuple(dict.fromkeys(
+            "".join(self.palavras[i:]) for i in range(len(self.palavras))
+        ))
+        self.referencias = referencias
+        self.popularidade = popularidade
+
+    @property
+    def peso(self) -> float:
+        return self.popularidade + math.log1p(max(self.referencias, 0))
+
+
+class AutocompleteIndex:
+    """Índice de sugestões em memória (thread-safe)."""
+
+    def __init__(self, max_entradas: int = AUTOCOMPLETE_MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._lock = threading.RLock()
+        self._app = None
+        self._limpar()
+        self._pronto = False
+        self._construindo = False
+        self._ultima_tentativa = 0.0
+        # Alterações recebidas durante uma construção (reaplicadas ao final).
+        self._alteracoes_durante_construcao = None
+        self._stats = {
+            'consultas': 0,
+            'tempo_total_us': 0.0,
+            'descartadas': 0,
+            'construido_em': None,
+            'duracao_construcao_ms': None,
+        }
+
+    def _limpar(self):
+        self._sugestoes: Dict[int, _Sugestao] = {}
+        self._por_identidade: Dict[tuple, int] = {}
+        self._chaves: List[tuple] = []
+        self._ngramas: Dict[str, set] = {}
+        self._proximo_id = 1
+
+    # --- Estrutura ---
+
+    def _adicionar(self, texto, tipo, referencias=1, popularidade=0.0) -> Optional[_Sugestao]:
+        """Cria a sugestão e indexa suas chaves (chamar com o lock)."""
+        sugestao = _Sugestao(self._proximo_id, texto, tipo, referencias, popularidade)
+        if not sugestao.compacto:
+            return None
+        self._proximo_id += 1
+        self._sugestoes[sugestao.id] = sugestao
+        self._por_identidade[(tipo, sugestao.compacto)] = sugestao.id
+        for chave in sugestao.chaves:
+            bisect.insort(self._chaves, (chave, sugestao.id))
+        for ngrama in self._ngramas_de(sugestao.compacto):
+            self._ngramas.setdefault(ngrama, set()).add(sugestao.id)
+        return sugestao
+
+    def _remover(self, sugestao: _Sugestao):
+        """Remove a sugestão e suas chaves (chamar com o lock)."""
+        self._sugestoes.pop(sugestao.id, None)
+        self._por_identidade.pop((sugestao.tipo, sugestao.compacto), None)
+        for chave in sugestao.chaves:
+            posicao = bisect.bisect_left(self._chaves, (chave, sugestao.id))
+            if posicao < len(self._chaves) and self._chaves[posicao] == (chave, sugestao.id):
+                del self._chaves[posicao]
+        for ngrama in self._ngramas_de(sugestao.compacto):
+            ids = self._ngramas.get(ngrama)
+            if ids is not None:
+                ids.discard(sugestao.id)
+                if not ids:
+                    del self._ngramas[ngrama]
+
+    @staticmethod
+    def _ngramas_de(compacto: str):
+        return {compacto[i:i + TAMANHO_NGRAMA] for i in range(len(compacto) - TAMANHO_NGRAMA + 1)}
+
+    def _varrer_prefixo(self, prefixo: str):
+        """Ids das chaves que começam com `prefixo` (limitado)."""
+        posicao = bisect.bisect_left(self._chaves, (prefixo, -1))
+        fim = min(len(self._chaves), posicao + MAX_CANDIDATOS_PREFIXO)
+        while posicao < fim:
+            chave, sugestao_id = self._chaves[posicao]
+            if not chave.startswith(prefixo):
+                break
+            yield chave, sugestao_id
+            posicao += 1
+
+    # --- Construção e atualização ---
+
+    def construir(self, app=None) -> bool:
+        """Reconstrói o índice a partir do banco (pode levar alguns segundos)."""
+        app = app or self._app
+        with self._lock:
+            if self._construindo:
+                return False
+            self._construindo = True
+            self._ultima_tentativa = time.time()
+            self._alteracoes_durante_construcao = []
+        inicio = time.perf_counter()
+        try:
+            with app.app_context():
+                itens, popularidade = self._carregar_do_banco()
+            novo = AutocompleteIndex(self.max_entradas)
+            descartadas = novo._montar(itens, popularidade)
+            with self._lock:
+                # Preserva a popularidade acumulada em memória (buscas, acessos anônimos)
+                for identidade, sugestao_id in novo._por_identidade.items():
+                    anterior = self._por_identidade.get(identidade)
+                    if anterior is not None:
+                        sugestao = novo._sugestoes[sugestao_id]
+                        sugestao.popularidade = max(sugestao.popularidade, self._sugestoes[anterior].popularidade)
+                self._sugestoes = novo._sugestoes
+                self._por_identidade = novo._por_identidade
+                self._chaves = novo._chaves
+                self._ngramas = novo._ngramas
+                self._proximo_id = novo._proximo_id
+                pendentes = self._alteracoes_durante_construcao or []
+                self._alteracoes_durante_construcao = None
+                self._pronto = True
+                self._aplicar_sem_lock(pendentes)
+                duracao = (time.perf_counter() - inicio) * 1000
+                self._stats['descartadas'] = descartadas
+                self._stats['construido_em'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                self._stats['duracao_construcao_ms'] = round(duracao, 1)
+            logger.info(
+                f"Autocompletar construído: {len(self._sugestoes)} sugestões, "
+                f"{len(self._chaves)} chaves em {duracao:.0f} ms"
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Não foi possível construir o autocompletar: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._construindo = False
+                self._alteracoes_durante_construcao = None
+
+    def construir_em_segundo_plano(self, app=None):
+        """Dispara `construir` em uma thread daemon."""
+        self._app = app or self._app
+        if self._app is None:
+            return
+        threading.Thread(target=self.construir, name="autocomplete-build", daemon=True).start()
+
+    def _carregar_do_banco(self):
+        itens = []
+        for tipo, sql in _SQL_CONSTRUCAO.items():
+            for texto, quantidade in db.session.execute(db.text(sql)):
+                if texto and texto.strip():
+                    itens.append((tipo, texto, quantidade))
+        popularidade = {}
+        try:
+            for codigo, nome, visualizacoes in db.session.execute(db.text(_SQL_POPULARIDADE)):
+                for tipo, texto in (("codigo", codigo), ("nome", nome)):
+                    chave = (tipo, _compactar(texto))
+                    popularidade[chave] = popularidade.get(chave, 0) + visualizacoes
+        except Exception:
+            # Banco sem histórico de visualizações: ranking só por referências
+            db.session.rollback()
+        db.session.remove()
+        return itens, popularidade
+
+    def _montar(self, itens, popularidade) -> int:
+        """Monta a estrutura a partir de (tipo, texto, referências); retorna descartadas."""
+        agrupados = {}
+        for tipo, texto, quantidade in itens:
+            identidade = (tipo, _compactar(texto))
+            if not identidade[1]:
+                continue
+            if identidade in agrupados:
+                agrupados[identidade][1] += quantidade
+            else:
+                agrupados[identidade] = [texto, quantidade]
+
+        prioridade_tipo = {tipo: i for i, tipo in enumerate(TIPOS_SUGESTAO)}
+        ordenados = sorted(
+            agrupados.items(),
+            key=lambda item: (
+                prioridade_tipo[item[0][0]],
+                -(popularidade.get(item[0], 0) + math.log1p(item[1][1])),
+            ),
+        )
+        mantidos = ordenados[:self.max_entradas]
+
+        # Monta a lista de chaves de uma vez (ordenar no fim é mais barato que insort).
+        chaves = []
+        for (tipo, _), (texto, quantidade) in mantidos:
+            sugestao = _Sugestao(self._proximo_id, texto, tipo, quantidade, popularidade.get((tipo, _compactar(texto)), 0))
+            self._proximo_id += 1
+            self._sugestoes[sugestao.id] = sugestao
+            self._por_identidade[(tipo, sugestao.compacto)] = sugestao.id
+            chaves.extend((chave, sugestao.id) for chave in sugestao.chaves)
+            for ngrama in self._ngramas_de(sugestao.compacto):
+                self._ngramas.setdefault(ngrama, set()).add(sugestao.id)
+        chaves.sort()
+        self._chaves = chaves
+        return len(ordenados) - len(mantidos)
+
+    def aplicar(self, alteracoes):
+        """Aplica alterações [(tipo, texto, +1/-1)] confirmadas no banco."""
+        with self._lock:
+            if self._alteracoes_durante_construcao is not None:
+                self._alteracoes_durante_construcao.extend(alteracoes)
+            if self._pronto:
+                self._aplicar_sem_lock(alteracoes)
+
+    def _aplicar_sem_lock(self, alteracoes):
+        for tipo, texto, delta in alteracoes:
+            compacto = _compactar(texto)
+            if not compacto:
+                continue
+            sugestao_id = self._por_identidade.get((tipo, compacto))
+            if sugestao_id is not None:
+                sugestao = self._sugestoes[sugestao_id]
+                sugestao.referencias += delta
+                if sugestao.referencias <= 0:
+                    self._remover(sugestao)
+            elif delta > 0:
+                if len(self._sugestoes) >= self.max_entradas:
+                    self._stats['descartadas'] += 1
+                    continue
+                self._adicionar(texto, tipo, referencias=delta)
+
+    def registrar_uso(self, tipo: str, texto, peso: float = 1.0):
+        """Aumenta a popularidade de uma sugestão (ex: produto visualizado)."""
+        compacto = _compactar(texto)
+        with self._lock:
+            sugestao_id = self._por_identidade.get((tipo, compacto))
+            if sugestao_id is not None:
+                self._sugestoes[sugestao_id].popularidade += peso
+
+    def registrar_busca(self, termo: str):
+        """Aumenta a popularidade das sugestões iguais ao termo pesquisado."""
+        compacto = _compactar(termo)
+        if not compacto:
+            return
+        with self._lock:
+            for tipo in TIPOS_SUGESTAO:
+                sugestao_id = self._por_identidade.get((tipo, compacto))
+                if sugestao_id is not None:
+                    self._sugestoes[sugestao_id].popularidade += 1
+
+    # --- Consulta ---
+
+    def is_ready(self) -> bool:
+        return self._pronto
+
+    def sugerir(self, consulta: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """
+        Top-k sugestões para o texto digitado: primeiro a igual a ele, as que começam com ele,
+        depois as que têm palavras começando com cada palavra digitada e, por
+        fim, as que contêm o trecho (n-gramas); em cada grupo, as mais populares.
+        """
+        inicio = time.perf_counter()
+        compacto = _compactar(consulta)
+        if len(compacto) < 2:
+            return []
+        palavras = _palavras(consulta)
+
+        with self._lock:
+            candidatos = {}
+            for chave, sugestao_id in self._varrer_prefixo(compacto):
+                if chave != self._sugestoes[sugestao_id].compacto:
+                    classe = _CASA_PALAVRA
+                else:
+                    classe = _CASA_EXATA if chave == compacto else _CASA_INICIO
+                if classe < candidatos.get(sugestao_id, _CASA_TRECHO + 1):
+                    candidatos[sugestao_id] = classe
+
+            if len(palavras) > 1:
+                # Várias palavras: procura pela mais longa e confere as demais.
+                for _, sugestao_id in self._varrer_prefixo(max(palavras, key=len)):
+                    if sugestao_id in candidatos:
+                        continue
+                    palavras_sugestao = self._sugestoes[sugestao_id].palavras
+                    if all(any(p.startswith(q) for p in palavras_sugestao) for q in palavras):
+                        candidatos[sugestao_id] = _CASA_PALAVRA
+
+            if len(candidatos) < limit and len(compacto) >= TAMANHO_NGRAMA:
+                postings = [self._ngramas.get(n) for n in self._ngramas_de(compacto)]
+                if all(postings):
+                    postings.sort(key=len)
+                    examinados = 0
+                    for sugestao_id in postings[0]:
+                        if examinados >= MAX_CANDIDATOS_NGRAMA:
+                            break
+                        examinados += 1
+                        if sugestao_id in candidatos:
+                            continue
+                        if all(sugestao_id in p for p in postings[1:]) and \
+                                compacto in self._sugestoes[sugestao_id].compacto:
+                            candidatos[sugestao_id] = _CASA_TRECHO
+
+            def ordem(item):
+                sugestao = self._sugestoes[item[0]]
+                return (item[1], -sugestao.peso, len(sugestao.texto), sugestao.texto)
+
+            melhores = heapq.nsmallest(limit, candidatos.items(), key=ordem)
+            resultado = [
+                {
+                    'texto': self._sugestoes[sugestao_id].texto,
+                    'tipo': self._sugestoes[sugestao_id].tipo,
+                    'peso': round(self._sugestoes[sugestao_id].peso, 3),
+                }
+                for sugestao_id, _ in melhores
+            ]
+            self._stats['consultas'] += 1
+            self._stats['tempo_total_us'] += (time.perf_counter() - inicio) * 1_000_000
+        return resultado
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self._stats['consultas']
+            return {
+                'pronto': self._pronto,
+                'construindo': self._construindo,
+                'sugestoes': len(self._sugestoes),
+                'chaves': len(self._chaves),
+                'ngramas': len(self._ngramas),
+                'max_entradas': self.max_entradas,
+                'descartadas': self._stats['descartadas'],
+                'construido_em': self._stats['construido_em'],
+                'duracao_construcao_ms': self._stats['duracao_construcao_ms'],
+                'consultas': consultas,
+                'tempo_medio_us': round(self._stats['tempo_total_us'] / consultas, 1) if consultas else 0.0,
+            }
+
+
+# Instância global (lazy loading)
+_autocomplete = None
+_autocomplete_lock = threading.Lock()
+_eventos_registrados = False
+
+
+def get_autocomplete() -> AutocompleteIndex:
+    """Obtém a instância global do índice de autocompletar."""
+    global _autocomplete
+    if _autocomplete is None:
+        with _autocomplete_lock:
+            if _autocomplete is None:
+                _autocomplete = AutocompleteIndex()
+    return _autocomplete
+
+
+def sugerir_autocomplete(consulta: str, limit: int = 8) -> List[Dict[str, Any]]:
+    """
+    Sugestões para o campo de busca. Enquanto o índice não está pronto, usa as
+    sugestões do FTS (LIKE no banco) e dispara a construção em segundo plano.
+    """
+    indice = get_autocomplete()
+    if indice.is_ready():
+        return indice.sugerir(consulta, limit)
+
+    if not indice._construindo and time.time() - indice._ultima_tentativa > INTERVALO_NOVA_TENTATIVA:
+        indice.construir_em_segundo_plano()
+    from core_utils import get_fts_suggestions
+    return [{'texto': texto, 'tipo': None, 'peso': 0.0} for texto in get_fts_suggestions(consulta, limit)]
+
+
+def _registrar_eventos():
+    """Eventos do ORM que mantêm o índice atualizado após cada commit."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session, object_session
+    from models import Aplicacao, Produto
+
+    campos = {
+        Produto: (("codigo", "codigo"), ("nome", "nome"), ("fornecedor", "fornecedor")),
+        Aplicacao: (("veiculo", "veiculo"), ("montadora", "montadora")),
+    }
+
+    def _pendentes(target):
+        session = object_session(target)
+        if session is None:
+            return None
+        return session.info.setdefault('autocomplete_pendentes', [])
+
+    def _ao_inserir(mapper, connection, target):
+        pendentes = _pendentes(target)
+        if pendentes is not None:
+            for tipo, atributo in campos[mapper.class_]:
+                pendentes.append((tipo, getattr(target, atributo), 1))
+
+    def _ao_atualizar(mapper, connection, target):
+        pendentes = _pendentes(target)
+        if pendentes is None:
+            return
+        estado = inspect(target)
+        for tipo, atributo in campos[mapper.class_]:
+            historico = estado.attrs[atributo].history
+            if historico.has_changes():
+                pendentes.extend((tipo, valor, -1) for valor in historico.deleted)
+                pendentes.extend((tipo, valor, 1) for valor in historico.added)
+
+    def _ao_excluir(mapper, connection, target):
+        pendentes = _pendentes(target)
+        if pendentes is not None:
+            for tipo, atributo in campos[mapper.class_]:
+                pendentes.append((tipo, getattr(target, atributo), -1))
+
+    for modelo in campos:
+        event.listen(modelo, "after_insert", _ao_inserir)
+        event.listen(modelo, "after_update", _ao_atualizar)
+        event.listen(modelo, "after_delete", _ao_excluir)
+
+    @event.listens_for(Session, "after_commit")
+    def _aplicar_no_commit(session):
+        pendentes = session.info.pop('autocomplete_pendentes', None)
+        if pendentes:
+            get_autocomplete().aplicar(pendentes)
+
+    @event.listens_for(Session, "after_rollback")
+    def _descartar_no_rollback(session):
+        session.info.pop('autocomplete_pendentes', None)
+
+    _eventos_registrados = True
+
+
+def init_autocomplete(app):
+    """Configura o índice e registra os eventos do ORM (não acessa o banco)."""
+    indice = get_autocomplete()
+    indice.max_entradas = app.config.get('AUTOCOMPLETE_MAX_ENTRADAS', AUTOCOMPLETE_MAX_ENTRADAS)
+    indice._app = app
+    _registrar_eventos()
+
+
+def precarregar_autocomplete(app):
+    """
+    Constrói o índice em segundo plano. Chamado ao subir o servidor, depois de
+    `inicializar_banco`; sem isso, a construção ocorre na primeira consulta.
+    """
+    if app.config.get('AUTOCOMPLETE_PRECARREGAR', True):
+        get_autocomplete().construir_em_segundo_plano(app)
@@ -3,12 +3,15 @@ Sistema de Cache em Memória para CGI
 Implementa cache inteligente para otimizar performance de consultas e operações
 """
 
+import sys
 import time
 import hashlib
 import json
+from collections import OrderedDict
 from functools import wraps
+from itertools import islice
 from typing import Any, Dict, List, Optional, Union
-from threading import RLock
+from threading import Lock
 from datetime import datetime, timedelta
 
 from flask import current_app, request
@@ -16,26 +19,265 @@ from app import get_logger
 
 logger = get_logger('cache')
 
+# Partições (cada uma com sua trava, LRU e orçamentos) por cache
+MAX_PARTICOES = 8
+# Entradas mínimas por partição: caches pequenos ficam com uma só
+ITENS_MIN_POR_PARTICAO = 64
+
+# Roda de temporizadores: NIVEIS_RODA níveis de SLOTS_RODA posições, com
+# resolução de RESOLUCAO_RODA s (64**4 s ≈ 194 dias até o último nível)
+RESOLUCAO_RODA = 1.0
+BITS_RODA = 6
+SLOTS_RODA = 1 << BITS_RODA
+NIVEIS_RODA = 4
+# Com o cache parado por mais que isso, a roda é refeita de uma vez
+ATRASO_MAX_RODA = SLOTS_RODA * SLOTS_RODA
+
+# Tamanho aproximado: contêineres grandes são medidos por amostra
+AMOSTRA_TAMANHO = 20
+PROFUNDIDADE_TAMANHO = 6
+
+# Causas de remoção contadas em get_stats()['remocoes']
+CAUSAS_REMOCAO = ('expiradas', 'capacidade', 'memoria', 'tamanho')
+
+
+_ESCALARES = (str, bytes, bytearray, int, float, bool, type(None))
+
+
+def _tamanho_itens(itens, profundidade: int, vistos: set) -> int:
+    total = 0
+    for item in itens:
+        if isinstance(item, _ESCALARES):
+            total += sys.getsizeof(item)
+        else:
+            total += tamanho_aproximado(item, profundidade, vistos)
+    return total
+
+
+def tamanho_aproximado(valor: Any, _profundidade: int = PROFUNDIDADE_TAMANHO, _vistos=None) -> int:
+    """
+    Estimativa, em bytes, da memória ocupada por `valor` e pelo que ele
+    contém (sys.getsizeof recursivo). Listas e dicts grandes são medidos
+    pelos primeiros AMOSTRA_TAMANHO itens e extrapolados; as chaves dos
+    dicts (em geral strings compartilhadas entre as linhas) não entram.
+    """
+    if isinstance(valor, _ESCALARES):
+        return sys.getsizeof(valor)
+    if _vistos is None:
+        _vistos = set()
+    elif id(valor) in _vistos:
+        return 0
+    _vistos.add(id(valor))
+    tamanho = sys.getsizeof(valor, 64)
+    if _profundidade <= 0:
+        return tamanho
+    _profundidade -= 1
+
+    if isinstance(valor, dict):
+        amostra = list(islice(valor.values(), AMOSTRA_TAMANHO))
+    elif isinstance(valor, (list, tuple, set, frozenset)):
+        amostra = list(islice(valor, AMOSTRA_TAMANHO))
+    elif hasattr(valor, '__dict__'):
+        return tamanho + tamanho_aproximado(vars(valor), _profundidade, _vistos)
+    else:
+        return tamanho
+
+    if not amostra:
+        return tamanho
+    return tamanho + _tamanho_itens(amostra, _profundidade, _vistos) * len(valor) // len(amostra)
+
+
+class _RodaTemporizadores:
+    """
+    Roda de temporizadores hierárquica: agenda e cancela em O(1) e, ao
+    avançar, só visita as posições dos ticks que passaram. O nível n guarda
+    os vencimentos até SLOTS_RODA**(n+1) ticks à frente; ao chegar a vez de
+    uma posição de nível alto, suas chaves descem para os níveis de baixo.
+    Não é thread-safe (usada sob a trava da partição).
+    """
+
+    def __init__(self, agora: float):
+        # Próximo tick a processar
+        self._tick = int(agora / RESOLUCAO_RODA)
+        self._niveis = [[set() for _ in range(SLOTS_RODA)] for _ in range(NIVEIS_RODA)]
+        self._excedentes = set()
+        # chave -> (nível, posição, tick de vencimento); nível -1 = excedente
+        self._posicoes: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self._posicoes)
+
+    def agendar(self, chave: str, vence_em: float):
+        self.cancelar(chave)
+        # Tick seguinte ao vencimento: a chave nunca sai antes de `vence_em`
+        # (o atraso de até um tick é coberto pela verificação em get)
+        self._inserir(chave, int(vence_em / RESOLUCAO_RODA) + 1)
+
+    def cancelar(self, chave: str):
+        posicao = self._posicoes.pop(chave, None)
+        if posicao is None:
+            return
+        nivel, slot, _ = posicao
+        if nivel < 0:
+            self._excedentes.discard(chave)
+        else:
+            self._niveis[nivel][slot].discard(chave)
+
+    def limpar(self):
+        for nivel in self._niveis:
+            for slot in nivel:
+                slot.clear()
+        self._excedentes.clear()
+        self._posicoes.clear()
+
+    def avancar(self, agora: float) -> List[str]:
+        """Processa os ticks até `agora`; retorna as chaves vencidas."""
+        alvo = int(agora / RESOLUCAO_RODA)
+        if alvo < self._tick:
+            return []
+        if not self._posicoes:
+            self._tick = alvo + 1
+            return []
+        if alvo - self._tick > ATRASO_MAX_RODA:
+            return self._refazer(alvo)
+
+        vencidas = []
+        while self._tick <= alvo:
+            tick = self._tick
+            # Desce as posições de nível alto que começam neste tick (de cima para baixo)
+            for nivel in range(NIVEIS_RODA - 1, 0, -1):
+                if tick & ((1 << (BITS_RODA * nivel)) - 1) == 0:
+                    if nivel == NIVEIS_RODA - 1 and self._excedentes:
+                        self._redistribuir(list(self._excedentes))
+                    slot = self._niveis[nivel][(tick >> (BITS_RODA * nivel)) & (SLOTS_RODA - 1)]
+                    if slot:
+                        self._redistribuir(list(slot))
+            slot = self._niveis[0][tick & (SLOTS_RODA - 1)]
+            if slot:
+                for chave in slot:
+                    del self._posicoes[chave]
+                vencidas.extend(slot)
+                slot.clear()
+            self._tick += 1
+        return vencidas
+
+    def _inserir(self, chave: str, vence: int):
+        vence = max(vence, self._tick)
+        for nivel in range(NIVEIS_RODA):
+            deslocamento = BITS_RODA * nivel
+            if (vence >> deslocamento) - (self._tick >> deslocamento) < SLOTS_RODA:
+                slot = (vence >> deslocamento) & (SLOTS_RODA - 1)
+                self._niveis[nivel][slot].add(chave)
+                self._posicoes[chave] = (nivel, slot, vence)
+                return
+        self._excedentes.add(chave)
+        self._posicoes[chave] = (-1, None, vence)
+
+    def _redistribuir(self, chaves: List[str]):
+        for chave in chaves:
+            vence = self._posicoes[chave][2]
+            self.cancelar(chave)
+            self._inserir(chave, vence)
+
+    def _refazer(self, alvo: int) -> List[str]:
+        """Depois de muito tempo parado: O(n), uma vez."""
+        vencimentos = {chave: posicao[2] for chave, posicao in self._posicoes.items()}
+        self.limpar()
+        self._tick = alvo + 1
+        vencidas = []
+        for chave, vence in vencimentos.items():
+            if vence <= alvo:
+                vencidas.append(chave)
+            else:
+                self._inserir(chave, vence)
+        return vencidas
+
+
+class _Entrada:
+    __slots__ = ('valor', 'expira_em', 'tamanho')
+
+    def __init__(self, valor: Any, expira_em: Optional[float], tamanho: int):
+        self.valor = valor
+        self.expira_em = expira_em
+        self.tamanho = tamanho
+
+
+class _Particao:
+    """Parte das chaves de um cache: LRU em OrderedDict, roda de expiração e orçamentos."""
+
+    def __init__(self, max_itens: int, max_bytes: Optional[int]):
+        self.lock = Lock()
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.entradas: 'OrderedDict[str, _Entrada]' = OrderedDict()
+        self.bytes = 0
+        self.roda = _RodaTemporizadores(time.monotonic())
+        self.acertos = 0
+        self.falhas = 0
+        self.remocoes = dict.fromkeys(CAUSAS_REMOCAO, 0)
+
+    def remover(self, chave: str, causa: Optional[str] = None) -> bool:
+        entrada = self.entradas.pop(chave, None)
+        if entrada is None:
+            return False
+        self.bytes -= entrada.tamanho
+        if entrada.expira_em is not None:
+            self.roda.cancelar(chave)
+        if causa:
+            self.remocoes[causa] += 1
+        return True
+
+    def remover_expiradas(self, agora: float) -> int:
+        vencidas = self.roda.avancar(agora)
+        for chave in vencidas:
+            entrada = self.entradas.pop(chave, None)
+            if entrada is not None:
+                self.bytes -= entrada.tamanho
+                self.remocoes['expiradas'] += 1
+        return len(vencidas)
+
+    def respeitar_orcamentos(self):
+        while len(self.entradas) > self.max_itens:
+            self.remover(next(iter(self.entradas)), 'capacidade')
+        if self.max_bytes is not None:
+            while self.bytes > self.max_bytes and self.entradas:
+                self.remover(next(iter(self.entradas)), 'memoria')
+
+
 class InMemoryCache:
     """
     Cache em memória thread-safe com TTL (Time To Live)
+
+    As chaves são divididas em partições, cada uma com sua trava: um
+    OrderedDict em ordem de uso (LRU em O(1)), uma roda de temporizadores
+    para as expirações e sua fatia dos limites de entradas e de bytes
+    (tamanho aproximado de cada valor). A ordem LRU é por partição.
     """
     
-    def __init__(self, default_ttl: int = 300, max_size: int = 1000):
+    def __init__(self, default_ttl: int = 300, max_size: int = 1000, max_bytes: Optional[int] = None):
         """
         Inicializa o cache
         
         Args:
             default_ttl: Tempo de vida padrão em segundos (5 min default)
             max_size: Tamanho máximo do cache (número de entradas)
+            max_bytes: Memória máxima aproximada dos valores (None = sem limite)
         """
         self.default_ttl = default_ttl
         self.max_size = max_size
-        self._cache: Dict[str, Dict] = {}
-        self._lock = RLock()
-        self._hit_count = 0
-        self._miss_count = 0
-        logger.info(f"Cache inicializado com TTL={default_ttl}s, max_size={max_size}")
+        self.max_bytes = max_bytes
+        n = max(1, min(MAX_PARTICOES, max_size // ITENS_MIN_POR_PARTICAO))
+        self._particoes = [
+            _Particao(
+                max(1, max_size // n),
+                max_bytes // n if max_bytes is not None else None,
+            )
+            for _ in range(n)
+        ]
+        logger.info(
+            f"Cache inicializado com TTL={default_ttl}s, max_size={max_size}, "
+            f"max_bytes={max_bytes}, partições={n}"
+        )
     
     def _generate_key(self, key_data: Union[str, Dict, List]) -> str:
         """Gera chave única para os dados"""
@@ -45,137 +287,128 @@ class InMemoryCache:
         # Para dicts/lists, cria hash dos dados
         key_str = json.dumps(key_data, sort_keys=True, default=str)
         return hashlib.md5(key_str.encode()).hexdigest()
-    
-    def _is_expired(self, cache_entry: Dict) -> bool:
-        """Verifica se uma entrada do cache expirou"""
-        if cache_entry.get('ttl') == -1:  # Cache permanente
-            return False
-        return time.time() > cache_entry['expires_at']
-    
-    def _evict_expired(self):
-        """Remove entradas expiradas (sem lock - deve ser chamado dentro de with self._lock)"""
-        current_time = time.time()
-        expired_keys = []
-        
-        for key, entry in self._cache.items():
-            if entry.get('ttl') != -1 and current_time > entry['expires_at']:
-                expired_keys.append(key)
-        
-        for key in expired_keys:
-            del self._cache[key]
-        
-        if expired_keys:
-            logger.debug(f"Cache: removidas {len(expired_keys)} entradas expiradas")
-    
-    def _evict_lru(self):
-        """Remove entrada menos recentemente usada se cache estiver cheio"""
-        if len(self._cache) >= self.max_size:
-            # Encontra entrada menos recentemente acessada
-            oldest_key = min(self._cache.keys(), 
-                           key=lambda k: self._cache[k]['last_access'])
-            del self._cache[oldest_key]
-            logger.debug(f"Cache: removida entrada LRU '{oldest_key}' (cache cheio)")
+
+    def _particao(self, cache_key: str) -> _Particao:
+        return self._particoes[hash(cache_key) % len(self._particoes)]
     
     def get(self, key: Union[str, Dict, List]) -> Optional[Any]:
         """Recupera valor do cache"""
         cache_key = self._generate_key(key)
+        particao = self._particao(cache_key)
         
-        with self._lock:
-            if cache_key not in self._cache:
-                self._miss_count += 1
-                logger.debug(f"Cache MISS: {cache_key}")
+        with particao.lock:
+            entrada = particao.entradas.get(cache_key)
+            if entrada is None:
+                particao.falhas += 1
                 return None
             
-            entry = self._cache[cache_key]
-            
             # Verifica expiração
-            if self._is_expired(entry):
-                del self._cache[cache_key]
-                self._miss_count += 1
-                logger.debug(f"Cache EXPIRED: {cache_key}")
+            if entrada.expira_em is not None and time.monotonic() > entrada.expira_em:
+                particao.remover(cache_key, 'expiradas')
+                particao.falhas += 1
                 return None
             
-            # Atualiza último acesso
-            entry['last_access'] = time.time()
-            self._hit_count += 1
-            logger.debug(f"Cache HIT: {cache_key}")
-            return entry['value']
+            # Marca como usada mais recentemente
+            particao.entradas.move_to_end(cache_key)
+            particao.acertos += 1
+            return entrada.valor
     
     def set(self, key: Union[str, Dict, List], value: Any, ttl: Optional[int] = None):
         """Armazena valor no cache"""
         cache_key = self._generate_key(key)
         ttl = ttl if ttl is not None else self.default_ttl
+        particao = self._particao(cache_key)
+        # Medido fora da trava
+        tamanho = tamanho_aproximado(value) if particao.max_bytes is not None else 0
+        agora = time.monotonic()
         
-        with self._lock:
-            # Remove expirados antes de adicionar novo
-            self._evict_expired()
-            
-            # Remove LRU se necessário
-            self._evict_lru()
-            
-            # Calcula tempo de expiração
-            if ttl == -1:  # Cache permanente
-                expires_at = float('inf')
-            else:
-                expires_at = time.time() + ttl
+        with particao.lock:
+            # Remove só as entradas cujo tempo já passou (posições da roda)
+            particao.remover_expiradas(agora)
+            particao.remover(cache_key)
+
+            if particao.max_bytes is not None and tamanho > particao.max_bytes:
+                particao.remocoes['tamanho'] += 1
+                logger.debug(f"Cache: valor de ~{tamanho} bytes não armazenado em '{cache_key}'")
+                return
             
-            # Armazena entrada
-            self._cache[cache_key] = {
-                'value': value,
-                'ttl': ttl,
-                'expires_at': expires_at,
-                'last_access': time.time(),
-                'created_at': time.time()
-            }
+            # Calcula tempo de expiração (-1 = cache permanente)
+            expira_em = None if ttl == -1 else agora + ttl
+            particao.entradas[cache_key] = _Entrada(value, expira_em, tamanho)
+            particao.bytes += tamanho
+            if expira_em is not None:
+                particao.roda.agendar(cache_key, expira_em)
             
-            logger.debug(f"Cache SET: {cache_key} (TTL: {ttl}s)")
+            particao.respeitar_orcamentos()
     
     def delete(self, key: Union[str, Dict, List]):
         """Remove entrada específica do cache"""
         cache_key = self._generate_key(key)
+        particao = self._particao(cache_key)
         
-        with self._lock:
-            if cache_key in self._cache:
-                del self._cache[cache_key]
-                logger.debug(f"Cache DELETE: {cache_key}")
+        with particao.lock:
+            particao.remover(cache_key)
     
     def clear(self):
         """Limpa todo o cache"""
-        with self._lock:
-            count = len(self._cache)
-            self._cache.clear()
-            self._hit_count = 0
-            self._miss_count = 0
-            logger.info(f"Cache limpo: {count} entradas removidas")
+        count = 0
+        for particao in self._particoes:
+            with particao.lock:
+                count += len(particao.entradas)
+                particao.entradas.clear()
+                particao.roda.limpar()
+                particao.bytes = 0
+                particao.acertos = 0
+                particao.falhas = 0
+                particao.remocoes = dict.fromkeys(CAUSAS_REMOCAO, 0)
+        logger.info(f"Cache limpo: {count} entradas removidas")
     
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas do cache"""
-        with self._lock:
-            total_requests = self._hit_count + self._miss_count
-            hit_rate = (self._hit_count / total_requests * 100) if total_requests > 0 else 0
-            
-            return {
-                'size': len(self._cache),
-                'max_size': self.max_size,
-                'hit_count': self._hit_count,
-                'miss_count': self._miss_count,
-                'hit_rate': round(hit_rate, 2),
-                'default_ttl': self.default_ttl
-            }
+        size = bytes_usados = hit_count = miss_count = 0
+        remocoes = dict.fromkeys(CAUSAS_REMOCAO, 0)
+        for particao in self._particoes:
+            with particao.lock:
+                size += len(particao.entradas)
+                bytes_usados += particao.bytes
+                hit_count += particao.acertos
+                miss_count += particao.falhas
+                for causa, total in particao.remocoes.items():
+                    remocoes[causa] += total
+        total_requests = hit_count + miss_count
+        hit_rate = (hit_count / total_requests * 100) if total_requests > 0 else 0
+        
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'bytes': bytes_usados,
+            'max_bytes': self.max_bytes,
+            'particoes': len(self._particoes),
+            'hit_count': hit_count,
+            'miss_count': miss_count,
+            'hit_rate': round(hit_rate, 2),
+            'remocoes': remocoes,
+            'default_ttl': self.default_ttl
+        }
     
     def cleanup(self):
         """Força limpeza de entradas expiradas"""
-        with self._lock:
-            self._evict_expired()
+        agora = time.monotonic()
+        removidas = 0
+        for particao in self._particoes:
+            with particao.lock:
+                removidas += particao.remover_expiradas(agora)
+        if removidas:
+            logger.debug(f"Cache: removidas {removidas} entradas expiradas")
 
 # Instância global do cache
-app_cache = InMemoryCache(default_ttl=300, max_size=1000)
+app_cache = InMemoryCache(default_ttl=300, max_size=10000, max_bytes=64 * 1024 * 1024)
 
-# Cache específico para consultas de busca
-search_cache = InMemoryCache(default_ttl=120, max_size=500)
+# Cache específico para consultas de busca (listas de linhas do FTS: limite por memória)
+search_cache = InMemoryCache(default_ttl=120, max_size=5000, max_bytes=64 * 1024 * 1024)
 
 # Cache para dados estáticos (montadoras, grupos, etc.)
-static_cache = InMemoryCache(default_ttl=3600, max_size=100)  # 1 hora
+static_cache = InMemoryCache(default_ttl=3600, max_size=1000, max_bytes=16 * 1024 * 1024)  # 1 hora
 
 def cached(ttl: int = None, cache_instance: InMemoryCache = None):
     """
@@ -12,9 +12,11 @@ def get_cart_items():
     Retorna a lista de itens no carrinho com detalhes dos produtos.
     
     Returns:
-        list: Lista de dicionários com informações do produto e quantidade
+        list: Lista de dicionários com informações do produto, quantidade e
+        peças intercambiáveis (`equivalentes`)
     """
     from models import Produto  # Importação tardia para evitar import circular
+    from utils.equivalencias import equivalentes_por_produto
     
     cart = session.get('cart', [])
     items = []
@@ -28,6 +30,11 @@ def get_cart_items():
                 'observacoes': item.get('observacoes', '')
             })
     
+    # Intercambiáveis de todos os itens em uma única consulta pela classe
+    equivalentes = equivalentes_por_produto([item['produto'] for item in items])
+    for item in items:
+        item['equivalentes'] = equivalentes.get(item['produto'].id, [])
+    
     return items
 
 
@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+Migrações incrementais de schema para bancos SQLite já existentes.
+
+`db.create_all()` cria tabelas novas, mas não adiciona colunas a tabelas que já
+existem. Este módulo aplica, de forma idempotente, as alterações necessárias
+(colunas, índices e preenchimento de dados derivados) para que bancos antigos
+acompanhem os modelos atuais. É executado em `inicializar_banco` e pelo comando
+`run.py migrate-db`.
+"""
+
+from app import db, get_logger
+
+logger = get_logger('migrations')
+
+# Quantidade de linhas processadas por lote nos preenchimentos (backfill).
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _colunas_existentes(connection, tabela: str) -> set:
+    """Retorna o conjunto de nomes de colunas de uma tabela."""
+    rows = connection.execute(db.text(f"PRAGMA table_info({tabela});")).fetchall()
+    return {row[1] for row in rows}
+
+
+def _garantir_coluna(connection, tabela: str, coluna: str, definicao: str) -> bool:
+    """Adiciona a coluna à tabela se ela ainda não existir. Retorna True se criou."""
+    if coluna in _colunas_existentes(connection, tabela):
+        return False
+    connection.execute(db.text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao};"))
+    logger.info(f"Coluna {tabela}.{coluna} adicionada")
+    return True
+
+
+def _criar_tabela_schema_versao(connection):
+    """Tabela que registra os preenchimentos (backfills) já concluídos."""
+    connection.execute(
+        db.text(
+            "CREATE TABLE IF NOT EXISTS schema_versao ("
+            "nome VARCHAR(100) PRIMARY KEY, concluido_em DATETIME NOT NULL);"
+        )
+    )
+
+
+def _executar_preenchimento(connection, nome: str, preencher, forcar: bool = False) -> int:
+    """
+    Executa o preenchimento `preencher(connection)` só enquanto ele não estiver
+    registrado como concluído em `schema_versao`. Depois da primeira execução
+    completa, os dados derivados são mantidos pelos eventos do ORM e pelos
+    gatilhos, e a varredura deixa de rodar a cada inicialização; `forcar`
+    refaz a varredura (linhas gravadas por SQL direto).
+    """
+    if not forcar and connection.execute(
+        db.text("SELECT 1 FROM schema_versao WHERE nome = :nome;"), {"nome": nome}
+    ).first():
+        return 0
+    total = preencher(connection)
+    connection.execute(
+        db.text(
+            "INSERT OR REPLACE INTO schema_versao (nome, concluido_em) "
+            "VALUES (:nome, CURRENT_TIMESTAMP);"
+        ),
+        {"nome": nome},
+    )
+    return total
+
+
+def _migrar_colunas_normalizadas_produto(connection):
+    """Colunas `codigo_norm`/`conversoes_norm` usadas pela busca por código."""
+    _garantir_coluna(connection, "produto", "codigo_norm", "VARCHAR(50)")
+    _garantir_coluna(connection, "produto", "conversoes_norm", "TEXT")
+    connection.execute(
+        db.text("CREATE INDEX IF NOT EXISTS ix_produto_codigo_norm ON produto(codigo_norm);")
+    )
+
+
+def preencher_codigos_normalizados(connection) -> int:
+    """
+    Preenche `codigo_norm`/`conversoes_norm` dos produtos que ainda não os têm.
+
+    A normalização é feita em Python (mesma função usada pelos eventos do ORM),
+    em lotes, para não depender de cadeias de replace() no SQL.
+    """
+    from core_utils import _normalize_code_for_search, _normalize_conversoes
+
+    total = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT id, codigo, conversoes FROM produto "
+                "WHERE codigo_norm IS NULL LIMIT :limite;"
+            ),
+            {"limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        connection.execute(
+            db.text(
+                "UPDATE produto SET codigo_norm = :codigo_norm, "
+                "conversoes_norm = :conversoes_norm WHERE id = :id;"
+            ),
+            [
+                {
+                    "id": row[0],
+                    "codigo_norm": _normalize_code_for_search(row[1]),
+                    "conversoes_norm": _normalize_conversoes(row[2]),
+                }
+                for row in rows
+            ],
+        )
+        total += len(rows)
+    if total:
+        logger.info(f"Códigos normalizados preenchidos para {total} produtos")
+    return total
+
+
+def preencher_produto_conversao(connection) -> int:
+    """
+    Popula `produto_conversao` para produtos com conversões que ainda não
+    possuem linhas na tabela (bancos anteriores à criação do índice invertido).
+    """
+    total = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT p.id, p.conversoes_norm FROM produto p "
+                "WHERE p.conversoes_norm <> '' AND NOT EXISTS ("
+                "    SELECT 1 FROM produto_conversao pc WHERE pc.produto_id = p.id"
+                ") LIMIT :limite;"
+            ),
+            {"limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        linhas = [
+            {"produto_id": row[0], "codigo_norm": codigo}
+            for row in rows
+            for codigo in dict.fromkeys(row[1].split(","))
+            if codigo
+        ]
+        connection.execute(
+            db.text(
+                "INSERT OR IGNORE INTO produto_conversao (produto_id, codigo_norm) "
+                "VALUES (:produto_id, :codigo_norm);"
+            ),
+            linhas,
+        )
+        total += len(rows)
+    if total:
+        logger.info(f"Índice de conversões preenchido para {total} produtos")
+    return total
+
+
+def preencher_produto_medida(connection) -> int:
+    """
+    Popula `produto_medida` para produtos com medidas que ainda não possuem
+    linhas na tabela. Percorre por faixa de id, pois produtos cujas medidas não
+    têm valor numérico nunca recebem linhas.
+    """
+    from core_utils import _extrair_medidas_numericas
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT p.id, p.medidas FROM produto p "
+                "WHERE p.id > :ultimo_id AND p.medidas <> '' AND NOT EXISTS ("
+                "    SELECT 1 FROM produto_medida pm WHERE pm.produto_id = p.id"
+                ") ORDER BY p.id LIMIT :limite;"
+            ),
+            {"ultimo_id": ultimo_id, "limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+        linhas = [
+            {"produto_id": row[0], "tipo": tipo, "valor_mm": valor}
+            for row in rows
+            for tipo, valor in _extrair_medidas_numericas(row[1]).items()
+        ]
+        if linhas:
+            connection.execute(
+                db.text(
+                    "INSERT OR IGNORE INTO produto_medida (produto_id, tipo, valor_mm) "
+                    "VALUES (:produto_id, :tipo, :valor_mm);"
+                ),
+                linhas,
+            )
+            total += len({linha["produto_id"] for linha in linhas})
+    if total:
+        logger.info(f"Medidas numéricas preenchidas para {total} produtos")
+    return total
+
+
+def _migrar_intervalo_anos_aplicacao(connection):
+    """Colunas `ano_inicio`/`ano_fim` e o índice (veiculo, ano_inicio, ano_fim)."""
+    _garantir_coluna(connection, "aplicacao", "ano_inicio", "INTEGER")
+    _garantir_coluna(connection, "aplicacao", "ano_fim", "INTEGER")
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_aplicacao_veiculo_ano "
+            "ON aplicacao(veiculo, ano_inicio, ano_fim);"
+        )
+    )
+
+
+def preencher_intervalo_anos(connection) -> int:
+    """
+    Preenche `ano_inicio`/`ano_fim` das aplicações com `ano` informado e ainda
+    sem intervalo. Percorre por faixa de id, pois anos não reconhecidos
+    continuam nulos.
+    """
+    from core_utils import _intervalo_anos_aplicacao
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT id, ano FROM aplicacao "
+                "WHERE id > :ultimo_id AND ano_inicio IS NULL AND ano <> '' "
+                "ORDER BY id LIMIT :limite;"
+            ),
+            {"ultimo_id": ultimo_id, "limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+        linhas = []
+        for row in rows:
+            ano_inicio, ano_fim = _intervalo_anos_aplicacao(row[1])
+            if ano_inicio is not None:
+                linhas.append({"id": row[0], "ano_inicio": ano_inicio, "ano_fim": ano_fim})
+        if linhas:
+            connection.execute(
+                db.text(
+                    "UPDATE aplicacao SET ano_inicio = :ano_inicio, ano_fim = :ano_fim "
+                    "WHERE id = :id;"
+                ),
+                linhas,
+            )
+            total += len(linhas)
+    if total:
+        logger.info(f"Intervalos de anos preenchidos para {total} aplicações")
+    return total
+
+
+def _migrar_montadora_norm(connection):
+    """Coluna `aplicacao.montadora_norm` e o índice (montadora_norm, produto_id)."""
+    _garantir_coluna(connection, "aplicacao", "montadora_norm", "VARCHAR(100)")
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_aplicacao_montadora_norm "
+            "ON aplicacao(montadora_norm, produto_id);"
+        )
+    )
+
+
+def preencher_montadora_norm(connection) -> int:
+    """
+    Preenche `montadora_norm` das aplicações com montadora informada e ainda
+    sem o valor normalizado (a normalização de acentos é feita em Python).
+    """
+    from core_utils import _normalize_for_search
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT id, montadora FROM aplicacao "
+                "WHERE id > :ultimo_id AND montadora_norm IS NULL AND montadora <> '' "
+                "ORDER BY id LIMIT :limite;"
+            ),
+            {"ultimo_id": ultimo_id, "limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+        linhas = [
+            {"id": row[0], "montadora_norm": _normalize_for_search(row[1])}
+            for row in rows
+            if _normalize_for_search(row[1])
+        ]
+        if linhas:
+            connection.execute(
+                db.text("UPDATE aplicacao SET montadora_norm = :montadora_norm WHERE id = :id;"),
+                linhas,
+            )
+            total += len(linhas)
+    if total:
+        logger.info(f"Montadora normalizada preenchida para {total} aplicações")
+    return total
+
+
+def _migrar_classe_equivalencia(connection):
+    """Coluna `produto.classe_equivalencia` e índices usados no seu cálculo."""
+    _garantir_coluna(connection, "produto", "classe_equivalencia", "INTEGER")
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_produto_classe_equivalencia "
+            "ON produto(classe_equivalencia);"
+        )
+    )
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_similares_association_similar_id "
+            "ON similares_association(similar_id, produto_id);"
+        )
+    )
+
+
+def _migrar_indice_historico_visualizacao(connection):
+    """
+    Índices do histórico de visualizações: poda por usuário e produto e
+    janela de sessão das recomendações (por usuário e data).
+    """
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_historico_visualizacao_usuario_produto "
+            "ON historico_visualizacao(user_id, produto_id, visualizado_em);"
+        )
+    )
+    connection.execute(
+        db.text(
+            "CREATE INDEX IF NOT EXISTS ix_historico_visualizacao_usuario_data "
+            "ON historico_visualizacao(user_id, visualizado_em, produto_id);"
+        )
+    )
+
+
+def _migrar_autoincremento(connection, modelo) -> bool:
+    """
+    Recria a tabela de `modelo` com AUTOINCREMENT, copiando as linhas, para
+    que ids apagados não sejam reaproveitados (o recomendador lê as linhas
+    novas por id). A sequência começa no maior id já visto: o da tabela ou a
+    marca d'água do recomendador, que pode ser de uma linha já apagada.
+    Retorna True se recriou.
+    """
+    tabela = modelo.__tablename__
+    sql = connection.execute(
+        db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :tabela;"),
+        {"tabela": tabela},
+    ).scalar()
+    if sql is None or "AUTOINCREMENT" in sql.upper():
+        return False
+
+    antiga = f"{tabela}_antiga"
+    colunas_antigas = _colunas_existentes(connection, tabela)
+    indices = connection.execute(
+        db.text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' "
+            "AND tbl_name = :tabela AND sql IS NOT NULL;"
+        ),
+        {"tabela": tabela},
+    ).scalars().all()
+    for indice in indices:
+        connection.execute(db.text(f"DROP INDEX {indice};"))
+    connection.execute(db.text(f"ALTER TABLE {tabela} RENAME TO {antiga};"))
+    modelo.__table__.create(connection)
+    colunas = ", ".join(c.name for c in modelo.__table__.columns if c.name in colunas_antigas)
+    connection.execute(
+        db.text(f"INSERT INTO {tabela} ({colunas}) SELECT {colunas} FROM {antiga};")
+    )
+    connection.execute(db.text(f"DROP TABLE {antiga};"))
+
+    maior_id = max(
+        connection.execute(db.text(f"SELECT COALESCE(MAX(id), 0) FROM {tabela};")).scalar(),
+        connection.execute(
+            db.text("SELECT COALESCE(MAX(valor), 0) FROM recomendador_estado WHERE chave = :tabela;"),
+            {"tabela": tabela},
+        ).scalar(),
+    )
+    connection.execute(db.text("DELETE FROM sqlite_sequence WHERE name = :tabela;"), {"tabela": tabela})
+    connection.execute(
+        db.text("INSERT INTO sqlite_sequence (name, seq) VALUES (:tabela, :seq);"),
+        {"tabela": tabela, "seq": maior_id},
+    )
+    logger.info(f"Tabela {tabela} recriada com AUTOINCREMENT")
+    return True
+
+
+def preencher_classe_equivalencia(connection) -> int:
+    """
+    Calcula as classes de equivalência quando há produtos ainda sem classe
+    (banco recém-migrado ou produtos gravados por SQL direto).
+    """
+    from utils.equivalencias import reconstruir_classes_equivalencia
+
+    pendente = connection.execute(
+        db.text("SELECT 1 FROM produto WHERE classe_equivalencia IS NULL LIMIT 1;")
+    ).first()
+    if not pendente:
+        return 0
+    return reconstruir_classes_equivalencia(connection)["alterados"]
+
+
+def preencher_produto_sugestao(connection) -> int:
+    """
+    Coloca todos os produtos na fila de sugestões quando a tabela
+    `produto_sugestao` ainda está vazia; o cálculo é feito em segundo plano
+    (utils/sugestoes_produto.py), sem atrasar a inicialização.
+    """
+    vazia = connection.execute(
+        db.text(
+            "SELECT NOT EXISTS (SELECT 1 FROM produto_sugestao) "
+            "AND NOT EXISTS (SELECT 1 FROM produto_sugestao_pendente);"
+        )
+    ).scalar()
+    if not vazia:
+        return 0
+    total = connection.execute(
+        db.text("INSERT INTO produto_sugestao_pendente (produto_id) SELECT id FROM produto;")
+    ).rowcount
+    if total:
+        logger.info(f"{total} produtos colocados na fila de cálculo de sugestões")
+    return total
+
+
+def _criar_gatilho_aplicacao_token(connection):
+    """
+    Gatilho que remove os tokens de uma aplicação excluída. Fica no SQL (e não
+    em evento do ORM) para cobrir também `Query.delete()` em massa, usado pelo
+    importador de peças.
+    """
+    connection.execute(
+        db.text(
+            "CREATE TRIGGER IF NOT EXISTS aplicacao_token_ad AFTER DELETE ON aplicacao "
+            "BEGIN DELETE FROM aplicacao_token WHERE aplicacao_id = OLD.id; END;"
+        )
+    )
+
+
+def preencher_aplicacao_token(connection) -> int:
+    """
+    Popula `aplicacao_token` para aplicações que ainda não têm tokens.
+
+    Percorre a tabela por faixa de id (aplicações sem nenhuma palavra nunca
+    recebem linhas, então não servem de critério de parada).
+    """
+    from core_utils import _tokenizar_aplicacao
+    from models import CAMPOS_APLICACAO_TOKEN
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        rows = connection.execute(
+            db.text(
+                "SELECT a.id, a.veiculo, a.motor, a.conf_mtr FROM aplicacao a "
+                "WHERE a.id > :ultimo_id AND NOT EXISTS ("
+                "    SELECT 1 FROM aplicacao_token t WHERE t.aplicacao_id = a.id"
+                ") ORDER BY a.id LIMIT :limite;"
+            ),
+            {"ultimo_id": ultimo_id, "limite": BACKFILL_BATCH_SIZE},
+        ).fetchall()
+        if not rows:
+            break
+        ultimo_id = rows[-1][0]
+        linhas = [
+            {"token": token, "aplicacao_id": row[0], "campo": campo}
+            for row in rows
+            for campo, valor in zip(CAMPOS_APLICACAO_TOKEN, row[1:])
+            for token in _tokenizar_aplicacao(valor)
+        ]
+        if linhas:
+            connection.execute(
+                db.text(
+                    "INSERT OR IGNORE INTO aplicacao_token (token, aplicacao_id, campo) "
+                    "VALUES (:token, :aplicacao_id, :campo);"
+                ),
+                linhas,
+            )
+            total += len(rows)
+    if total:
+        logger.info(f"Índice de palavras preenchido para {total} aplicações")
+    return total
+
+
+def aplicar_migracoes(forcar_preenchimentos: bool = False) -> bool:
+    """
+    Aplica todas as migrações pendentes. Deve ser chamada dentro de um
+    contexto de aplicação, depois de `db.create_all()`.
+
+    `forcar_preenchimentos` refaz os preenchimentos já registrados em
+    `schema_versao` (após inserções por SQL direto, como no gerador de
+    catálogos dos benchmarks).
+    """
+    try:
+        with db.engine.begin() as connection:
+            _criar_tabela_schema_versao(connection)
+            _migrar_colunas_normalizadas_produto(connection)
+            preencher_codigos_normalizados(connection)
+            preencher_produto_conversao(connection)
+            _executar_preenchimento(
+                connection, "produto_medida", preencher_produto_medida, forcar_preenchimentos
+            )
+            _migrar_intervalo_anos_aplicacao(connection)
+            _executar_preenchimento(
+                connection, "intervalo_anos", preencher_intervalo_anos, forcar_preenchimentos
+            )
+            _criar_gatilho_aplicacao_token(connection)
+            _executar_preenchimento(
+                connection, "aplicacao_token", preencher_aplicacao_token, forcar_preenchimentos
+            )
+            _migrar_montadora_norm(connection)
+            _executar_preenchimento(
+                connection, "montadora_norm", preencher_montadora_norm, forcar_preenchimentos
+            )
+            _migrar_classe_equivalencia(connection)
+            preencher_classe_equivalencia(connection)
+            preencher_produto_sugestao(connection)
+            _migrar_indice_historico_visualizacao(connection)
+            from models_favoritos import HistoricoVisualizacao, ItemListaFavoritos
+            _migrar_autoincremento(connection, HistoricoVisualizacao)
+            _migrar_autoincremento(connection, ItemListaFavoritos)
+        # Schema alterado: o FTS volta a verificar as suas tabelas (o índice
+        # trigram depende de `codigo_norm`, que pode ter acabado de ser criada)
+        from utils.fts_search import get_fts_manager
+        get_fts_manager().redefinir_estado()
+        return True
+    except Exception as e:
+        logger.error(f"Falha ao aplicar migrações de schema: {e}")
+        return False
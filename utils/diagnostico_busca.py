@@ -0,0 +1,195 @@
+"""
+Diagnóstico da busca (/debug_busca).
+
+Executa a própria view de `/buscar` com os parâmetros recebidos e registra,
+sem alterar o caminho normal da requisição:
+- cada instrução SQL emitida nesta thread (texto, parâmetros e tempo), com a
+  fase a que pertence (consulta principal, que inclui o MATCH do FTS quando
+  usado; selectinload; agrupamento; carga tardia durante o template);
+- o tempo de renderização do template e o restante (ORM/Python);
+- o `EXPLAIN QUERY PLAN` de cada SELECT, marcando varreduras completas.
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, List
+
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+
+from app import db, get_logger
+
+logger = get_logger('diagnostico_busca')
+
+# Carga em lote do selectinload: "SELECT <tabela>.produto_id, ..."
+_RE_SELECTIN = re.compile(r"SELECT (\w+)\.produto_id,")
+
+
+class _ColetorConsultas:
+    """Registra as instruções SQL e a renderização do template desta thread."""
+
+    def __init__(self, engine, app):
+        self.engine = engine
+        self.app = app
+        self.thread = threading.get_ident()
+        self.consultas: List[Dict[str, Any]] = []
+        self.renderizando = False
+        self.render_ms = 0.0
+        self.contexto_template: Dict[str, Any] = {}
+        self._inicio_render = None
+
+    def _antes(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread:
+            conn.info.setdefault('diagnostico_inicio', []).append(time.perf_counter())
+
+    def _depois(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() != self.thread:
+            return
+        inicio = conn.info['diagnostico_inicio'].pop()
+        self.consultas.append({
+            'sql': statement,
+            'parametros': parameters,
+            'ms': (time.perf_counter() - inicio) * 1000,
+            'durante_template': self.renderizando,
+        })
+
+    def _antes_render(self, sender, template, context, **extra):
+        if threading.get_ident() == self.thread:
+            self.renderizando = True
+            self._inicio_render = time.perf_counter()
+
+    def _depois_render(self, sender, template, context, **extra):
+        if threading.get_ident() == self.thread and self._inicio_render is not None:
+            self.renderizando = False
+            self.render_ms += (time.perf_counter() - self._inicio_render) * 1000
+            self.contexto_template = context
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._antes)
+        event.listen(self.engine, "after_cursor_execute", self._depois)
+        before_render_template.connect(self._antes_render, self.app)
+        template_rendered.connect(self._depois_render, self.app)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._antes)
+        event.remove(self.engine, "after_cursor_execute", self._depois)
+        before_render_template.disconnect(self._antes_render, self.app)
+        template_rendered.disconnect(self._depois_render, self.app)
+        return False
+
+
+def _fase(consulta: Dict[str, Any], principal: bool) -> str:
+    sql = consulta['sql'].lstrip()
+    if consulta['durante_template']:
+        return 'carga tardia (template)'
+    if principal:
+        return 'principal (ids + total)'
+    selectin = _RE_SELECTIN.match(sql)
+    if selectin:
+        return f'selectinload {selectin.group(1)}'
+    if sql.startswith('SELECT aplicacao.id AS'):
+        return 'agrupamento (aplicações relevantes)'
+    return 'outra'
+
+
+def _caminho(sql_principal: str) -> str:
+    if 'produtos_fts' in sql_principal and 'MATCH' in sql_principal.upper():
+        return 'FTS5 (BM25)'
+    if 'produtos_codigo_fts' in sql_principal:
+        return 'SQL com índice trigram de códigos'
+    if 'LIKE' in sql_principal.upper():
+        return 'SQL (fallback com LIKE)'
+    return 'SQL (colunas/índices normalizados)'
+
+
+def _plano(sql: str, parametros) -> List[str]:
+    """`EXPLAIN QUERY PLAN` da instrução, uma linha por nó (indentado)."""
+    linhas = db.session.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + sql, parametros
+    ).fetchall()
+    profundidade = {0: -1}
+    plano = []
+    for no_id, pai, _, detalhe in linhas:
+        nivel = profundidade.get(pai, -1) + 1
+        profundidade[no_id] = nivel
+        plano.append("  " * nivel + detalhe)
+    return plano
+
+
+def _varredura_completa(plano: List[str]) -> bool:
+    """
+    SCAN de tabela sem índice. Não contam tabelas virtuais FTS (usam o próprio
+    índice) nem a leitura de subconsultas/CTEs já materializadas.
+    """
+    for linha in plano:
+        detalhe = linha.strip()
+        if (detalhe.startswith("SCAN ") and "USING" not in detalhe
+                and "VIRTUAL TABLE" not in detalhe
+                and not detalhe.startswith(("SCAN (subquery", "SCAN CONSTANT ROW", "SCAN anon_"))):
+            return True
+    return False
+
+
+def diagnosticar_busca(view, app) -> Dict[str, Any]:
+    """
+    Executa `view` (a função de /buscar) no contexto da requisição atual e
+    devolve o diagnóstico: caminho escolhido, instruções SQL com fase, tempo
+    e plano, e o tempo por etapa.
+    """
+    from utils.cache_system import search_cache
+
+    inicio = time.perf_counter()
+    with _ColetorConsultas(db.engine, app) as coletor:
+        view()
+    total_ms = (time.perf_counter() - inicio) * 1000
+
+    indice_principal = next(
+        (i for i, c in enumerate(coletor.consultas) if 'OVER ()' in c['sql']), None
+    )
+    sql_principal = coletor.consultas[indice_principal]['sql'] if indice_principal is not None else ''
+
+    consultas = []
+    sql_por_fase: Dict[str, float] = {}
+    for i, consulta in enumerate(coletor.consultas):
+        fase = _fase(consulta, i == indice_principal)
+        sql_por_fase[fase] = sql_por_fase.get(fase, 0.0) + consulta['ms']
+        item = {
+            'fase': fase,
+            'ms': round(consulta['ms'], 3),
+            'sql': consulta['sql'],
+            'parametros': [str(p) for p in (consulta['parametros'] or ())],
+        }
+        if consulta['sql'].lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                item['plano'] = _plano(consulta['sql'], consulta['parametros'])
+                item['varredura_completa'] = _varredura_completa(item['plano'])
+            except Exception as e:
+                item['plano'] = [f"(não foi possível obter o plano: {e})"]
+        consultas.append(item)
+
+    sql_ms = sum(c['ms'] for c in coletor.consultas)
+    sql_template_ms = sum(c['ms'] for c in coletor.consultas if c['durante_template'])
+    pagination = coletor.contexto_template.get('pagination')
+
+    return {
+        'caminho': _caminho(sql_principal),
+        'cache': {
+            # A página de resultados não usa cache de resultados; só as estatísticas.
+            'resultado_em_cache': False,
+            'search_cache': search_cache.get_stats(),
+        },
+        'resultados': getattr(pagination, 'total', None),
+        'sugestoes_codigo': len(coletor.contexto_template.get('sugestoes_codigo') or []),
+        'tempos_ms': {
+            'total': round(total_ms, 2),
+            'sql': round(sql_ms, 2),
+            'sql_por_fase': {fase: round(ms, 2) for fase, ms in sql_por_fase.items()},
+            'render_template': round(coletor.render_ms - sql_template_ms, 2),
+            'orm_e_python': round(total_ms - sql_ms - (coletor.render_ms - sql_template_ms), 2),
+        },
+        'instrucoes_sql': len(coletor.consultas),
+        'varreduras_completas': sum(1 for c in consultas if c.get('varredura_completa')),
+        'consultas': consultas,
+    }
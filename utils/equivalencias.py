@@ -0,0 +1,259 @@
+"""
+Classes de equivalência (peças intercambiáveis).
+
+Cada produto guarda em `Produto.classe_equivalencia` o menor id do seu grupo
+de peças intercambiáveis: os componentes conexos (union-find) do grafo
+formado por
+- vínculos de similares (`similares_association`, em qualquer direção);
+- conversões que citam exatamente o código de outro produto
+  (`produto_conversao.codigo_norm = produto.codigo_norm`).
+
+Assim, "todas as peças intercambiáveis com X" é uma consulta indexada por
+`classe_equivalencia`. As classes são recalculadas a cada flush que altera
+similares, código ou conversões (apenas os componentes afetados) e podem ser
+reconstruídas por completo com `python run.py rebuild-equivalencias`.
+"""
+
+from itertools import chain
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import bindparam, inspect
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import db, get_logger
+
+logger = get_logger('equivalencias')
+
+# Quantidade de ids por instrução nas consultas com IN
+TAMANHO_LOTE_IDS = 500
+# Atributos de Produto que alteram as arestas do grafo
+ATRIBUTOS_ARESTAS = ("similares", "similar_to", "codigo_norm", "conversoes_norm")
+
+_SQL_ARESTAS_SIMILARES = db.text(
+    "SELECT produto_id, similar_id FROM similares_association WHERE produto_id IN :ids "
+    "UNION ALL "
+    "SELECT produto_id, similar_id FROM similares_association WHERE similar_id IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+_SQL_ARESTAS_CONVERSAO = db.text(
+    "SELECT c.produto_id, p.id FROM produto_conversao c "
+    "JOIN produto p ON p.codigo_norm = c.codigo_norm "
+    "WHERE c.produto_id IN :ids AND p.id <> c.produto_id "
+    "UNION ALL "
+    "SELECT c.produto_id, p.id FROM produto p "
+    "JOIN produto_conversao c ON c.codigo_norm = p.codigo_norm "
+    "WHERE p.id IN :ids AND p.id <> c.produto_id"
+).bindparams(bindparam("ids", expanding=True))
+
+
+class _UniaoBusca:
+    """Union-find cuja raiz de cada conjunto é sempre o menor id."""
+
+    def __init__(self):
+        self.pai: Dict[int, int] = {}
+
+    def achar(self, x: int) -> int:
+        pai = self.pai
+        pai.setdefault(x, x)
+        while pai[x] != x:
+            pai[x] = pai[pai[x]]
+            x = pai[x]
+        return x
+
+    def unir(self, a: int, b: int):
+        raiz_a, raiz_b = self.achar(a), self.achar(b)
+        if raiz_a != raiz_b:
+            menor, maior = sorted((raiz_a, raiz_b))
+            self.pai[maior] = menor
+
+
+def _lotes(ids: Iterable[int]):
+    ids = list(ids)
+    for i in range(0, len(ids), TAMANHO_LOTE_IDS):
+        yield ids[i:i + TAMANHO_LOTE_IDS]
+
+
+def _arestas(connection, ids) -> List[tuple]:
+    """Arestas (similares e conversões) que tocam algum dos `ids`."""
+    arestas = []
+    for lote in _lotes(ids):
+        arestas.extend(connection.execute(_SQL_ARESTAS_SIMILARES, {"ids": lote}).fetchall())
+        arestas.extend(connection.execute(_SQL_ARESTAS_CONVERSAO, {"ids": lote}).fetchall())
+    return arestas
+
+
+def _gravar_classes(connection, classes: Dict[int, int]) -> Dict[int, int]:
+    """Grava apenas as classes que mudaram; retorna {produto_id: classe} alterados."""
+    alterados = {}
+    for lote in _lotes(classes):
+        atuais = connection.execute(
+            db.text("SELECT id, classe_equivalencia FROM produto WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": lote},
+        ).fetchall()
+        alterados.update(
+            (produto_id, classes[produto_id])
+            for produto_id, classe in atuais
+            if classe != classes[produto_id]
+        )
+    if alterados:
+        connection.execute(
+            db.text("UPDATE produto SET classe_equivalencia = :classe WHERE id = :id"),
+            [{"id": produto_id, "classe": classe} for produto_id, classe in alterados.items()],
+        )
+    return alterados
+
+
+def recalcular_classes(connection, sementes: Iterable[int], classes_antigas: Iterable[int] = ()) -> Dict[int, int]:
+    """
+    Recalcula as classes dos componentes que contêm `sementes` e dos antigos
+    membros de `classes_antigas` (necessário quando um vínculo removido divide
+    uma classe). Percorre o grafo a partir desses produtos, em lotes.
+
+    Returns:
+        {produto_id: classe} de todos os produtos dos componentes percorridos
+        (só os que mudaram de classe são gravados).
+    """
+    visitados = set(sementes)
+    classes_antigas = {c for c in classes_antigas if c is not None}
+    for lote in _lotes(classes_antigas):
+        visitados.update(
+            row[0] for row in connection.execute(
+                db.text("SELECT id FROM produto WHERE classe_equivalencia IN :classes")
+                .bindparams(bindparam("classes", expanding=True)),
+                {"classes": lote},
+            )
+        )
+
+    uniao = _UniaoBusca()
+    fronteira = set(visitados)
+    while fronteira:
+        vizinhos = set()
+        for a, b in _arestas(connection, fronteira):
+            uniao.unir(a, b)
+            vizinhos.add(a)
+            vizinhos.add(b)
+        fronteira = vizinhos - visitados
+        visitados |= fronteira
+
+    classes = {produto_id: uniao.achar(produto_id) for produto_id in visitados}
+    _gravar_classes(connection, classes)
+    return classes
+
+
+def reconstruir_classes_equivalencia(connection) -> Dict[str, int]:
+    """Recalcula todas as classes a partir das tabelas de vínculos."""
+    uniao = _UniaoBusca()
+    for a, b in connection.execute(db.text("SELECT produto_id, similar_id FROM similares_association")):
+        uniao.unir(a, b)
+    for a, b in connection.execute(db.text(
+        "SELECT c.produto_id, p.id FROM produto_conversao c "
+        "JOIN produto p ON p.codigo_norm = c.codigo_norm WHERE p.id <> c.produto_id"
+    )):
+        uniao.unir(a, b)
+
+    ids = [row[0] for row in connection.execute(db.text("SELECT id FROM produto"))]
+    classes = {produto_id: uniao.achar(produto_id) for produto_id in ids}
+    alterados = len(_gravar_classes(connection, classes))
+
+    tamanhos: Dict[int, int] = {}
+    for classe in classes.values():
+        tamanhos[classe] = tamanhos.get(classe, 0) + 1
+    estatisticas = {
+        'produtos': len(ids),
+        'classes': len(tamanhos),
+        'classes_com_mais_de_um': sum(1 for t in tamanhos.values() if t > 1),
+        'maior_classe': max(tamanhos.values(), default=0),
+        'alterados': alterados,
+    }
+    logger.info(
+        f"Classes de equivalência reconstruídas: {estatisticas['produtos']} produtos, "
+        f"{estatisticas['classes_com_mais_de_um']} classes com mais de um produto "
+        f"(maior: {estatisticas['maior_classe']}), {alterados} alterados"
+    )
+    return estatisticas
+
+
+def atualizar_classes_apos_flush(session) -> Set[int]:
+    """
+    Chamado no `after_flush`: recalcula as classes dos produtos novos,
+    excluídos ou com similares/código/conversões alterados. Lê apenas o que já
+    está carregado (histórico dos atributos), sem disparar consultas do ORM.
+
+    Returns:
+        ids de todos os produtos dos componentes recalculados.
+    """
+    from models import Produto
+
+    sementes = set()
+    classes_antigas = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Produto):
+            continue
+        estado = inspect(obj)
+        historicos = [estado.attrs[atributo].history for atributo in ATRIBUTOS_ARESTAS]
+        if obj not in session.new and obj not in session.deleted and not any(
+            historico.has_changes() for historico in historicos
+        ):
+            continue
+        if obj.id is not None:
+            sementes.add(obj.id)
+        classes_antigas.add(estado.dict.get("classe_equivalencia"))
+        for historico in historicos[:2]:
+            for outro in chain(historico.added or (), historico.deleted or ()):
+                outro_id = inspect(outro).dict.get("id")
+                if outro_id is not None:
+                    sementes.add(outro_id)
+                classes_antigas.add(inspect(outro).dict.get("classe_equivalencia"))
+
+    if not sementes:
+        return set()
+    classes = recalcular_classes(session.connection(), sementes, classes_antigas)
+
+    # Mantém os objetos já carregados na sessão coerentes com o banco
+    for produto_id, classe in classes.items():
+        obj = session.identity_map.get(session.identity_key(Produto, produto_id))
+        if obj is not None and obj not in session.deleted:
+            set_committed_value(obj, "classe_equivalencia", classe)
+    return set(classes)
+
+
+def produtos_equivalentes(produto, incluir_proprio: bool = False):
+    """Query dos produtos da mesma classe de equivalência de `produto`."""
+    from models import Produto
+
+    query = Produto.query.filter(Produto.classe_equivalencia == produto.classe_equivalencia)
+    if produto.classe_equivalencia is None:
+        query = Produto.query.filter(db.false())
+    if not incluir_proprio:
+        query = query.filter(Produto.id != produto.id)
+    return query
+
+
+def equivalentes_por_produto(produtos, limite_por_classe: int = 20) -> Dict[int, list]:
+    """
+    {produto_id: [produtos equivalentes]} para vários produtos, em uma consulta
+    (até `limite_por_classe` membros de cada classe, por ordem de código).
+    """
+    from models import Produto
+
+    classes = {p.classe_equivalencia for p in produtos if p.classe_equivalencia is not None}
+    if not classes:
+        return {p.id: [] for p in produtos}
+    # +1 porque o próprio produto pode estar entre os membros lidos
+    posicao = db.func.row_number().over(
+        partition_by=Produto.classe_equivalencia, order_by=Produto.codigo
+    ).label("posicao")
+    membros = (
+        db.select(Produto.id, posicao)
+        .where(Produto.classe_equivalencia.in_(classes))
+        .subquery()
+    )
+    ids = db.select(membros.c.id).where(membros.c.posicao <= limite_por_classe + 1)
+    por_classe: Dict[int, list] = {}
+    for membro in Produto.query.filter(Produto.id.in_(ids)).order_by(Produto.codigo):
+        por_classe.setdefault(membro.classe_equivalencia, []).append(membro)
+    return {
+        p.id: [m for m in por_classe.get(p.classe_equivalencia, []) if m.id != p.id][:limite_por_classe]
+        for p in produtos
+    }
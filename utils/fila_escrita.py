@@ -0,0 +1,336 @@
+"""
+Fila única de escrita no SQLite.
+
+O SQLite aceita um escritor por vez; com cada requisição abrindo a própria
+transação, escritas simultâneas disputam a trava e terminam em espera ou em
+"database is locked". Aqui uma thread dedicada consome uma fila limitada de
+tarefas de escrita e executa várias delas na mesma transação (commit em
+grupo), com a trava pedida de uma vez por `BEGIN IMMEDIATE`.
+
+Uma tarefa é uma função sem argumentos que usa `db.session` normalmente
+(consultas, `add`, `delete`, `flush`), mas NÃO faz commit: o commit é da
+fila. Tarefas devem gravar só no banco, porque podem ser repetidas: se uma
+falha, o lote é desfeito e as demais são executadas de novo sem ela. Como a
+tarefa roda em outra sessão, ela deve receber ids (não objetos do ORM da
+requisição) e devolver valores simples.
+
+- `executar_escrita(tarefa)`: espera o commit e devolve o resultado da
+  tarefa (ou propaga a exceção) — para rotas interativas;
+- `enviar_escrita(tarefa)`: não espera; com a fila cheia, a escrita é
+  descartada e contada — para telemetria (histórico de visualizações etc.).
+
+Sem a thread (CLI, testes ou `FILA_ESCRITA_ATIVA=False`), a tarefa é
+executada na hora, na sessão de quem chamou, seguida de commit.
+"""
+
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from app import db, get_logger
+
+logger = get_logger('fila_escrita')
+
+TAMANHO_FILA_PADRAO = 1000
+# Tarefas por transação
+TAMANHO_MAX_LOTE = 100
+# Tempo padrão (s) que `executar_escrita` espera pelo commit
+TIMEOUT_PADRAO = 30
+# Tentativas de obter a trava de escrita (cada uma espera o busy_timeout)
+TENTATIVAS_TRAVA = 3
+# Amostras guardadas para as métricas de tempo
+AMOSTRAS_METRICAS = 1000
+
+
+class FilaEscritaCheia(RuntimeError):
+    """A fila de escrita não aceitou a tarefa dentro do tempo de espera."""
+
+
+class _Tarefa:
+    __slots__ = ("funcao", "futuro", "enfileirada_em")
+
+    def __init__(self, funcao: Callable[[], Any]):
+        self.funcao = funcao
+        self.futuro: Future = Future()
+        self.enfileirada_em = time.perf_counter()
+
+
+_FIM = object()
+
+
+def _resumo_ms(amostras) -> Dict[str, float]:
+    if not amostras:
+        return {'media': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordenadas = sorted(amostras)
+    return {
+        'media': round(sum(ordenadas) / len(ordenadas), 2),
+        'p95': round(ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * 0.95))], 2),
+        'max': round(ordenadas[-1], 2),
+    }
+
+
+class FilaEscrita:
+    """Thread escritora única com fila limitada e commit em grupo."""
+
+    def __init__(self, app, tamanho: int = TAMANHO_FILA_PADRAO):
+        self.app = app
+        self.tamanho = tamanho
+        self._fila: queue.Queue = queue.Queue(maxsize=tamanho)
+        self._thread = threading.Thread(target=self._executar, name="fila-escrita", daemon=True)
+        self._lock = threading.Lock()
+        self._stats = {
+            'enfileiradas': 0,
+            'executadas': 0,
+            'falhas': 0,
+            'descartadas': 0,
+            'lotes': 0,
+            'maior_lote': 0,
+            'bloqueios': 0,
+        }
+        self._espera_fila_ms = deque(maxlen=AMOSTRAS_METRICAS)
+        self._espera_trava_ms = deque(maxlen=AMOSTRAS_METRICAS)
+        self._transacao_ms = deque(maxlen=AMOSTRAS_METRICAS)
+
+    # ----- API -----
+
+    def iniciar(self):
+        self._thread.start()
+
+    def ativa(self) -> bool:
+        return self._thread.is_alive()
+
+    def na_thread_escritora(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def enfileirar(self, funcao: Callable[[], Any], bloquear: bool = True,
+                   timeout: Optional[float] = TIMEOUT_PADRAO) -> Optional[Future]:
+        """
+        Coloca a tarefa na fila. Com `bloquear`, espera vaga até `timeout` e
+        levanta FilaEscritaCheia; sem, descarta a tarefa se a fila estiver
+        cheia e retorna None.
+        """
+        tarefa = _Tarefa(funcao)
+        try:
+            self._fila.put(tarefa, block=bloquear, timeout=timeout if bloquear else None)
+        except queue.Full:
+            if bloquear:
+                raise FilaEscritaCheia(f"Fila de escrita cheia ({self.tamanho} tarefas)")
+            with self._lock:
+                self._stats['descartadas'] += 1
+            return None
+        with self._lock:
+            self._stats['enfileiradas'] += 1
+        return tarefa.futuro
+
+    def parar(self, timeout: float = 10):
+        """Executa o que já está na fila e encerra a thread."""
+        if not self.ativa():
+            return
+        try:
+            self._fila.put(_FIM, timeout=timeout)
+        except queue.Full:
+            logger.warning("Fila de escrita cheia ao encerrar; tarefas pendentes serão perdidas")
+            return
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'ativa': self.ativa(),
+                'na_fila': self._fila.qsize(),
+                'capacidade': self.tamanho,
+                'tamanho_medio_lote': round(stats['executadas'] / stats['lotes'], 1) if stats['lotes'] else 0.0,
+                'espera_fila_ms': _resumo_ms(self._espera_fila_ms),
+                'espera_trava_ms': _resumo_ms(self._espera_trava_ms),
+                'transacao_ms': _resumo_ms(self._transacao_ms),
+            })
+        return stats
+
+    # ----- Thread escritora -----
+
+    def _executar(self):
+        encerrar = False
+        while not encerrar:
+            item = self._fila.get()
+            lote = []
+            while True:
+                if item is _FIM:
+                    encerrar = True
+                    break
+                lote.append(item)
+                if len(lote) >= TAMANHO_MAX_LOTE:
+                    break
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+            if lote:
+                try:
+                    with self.app.app_context():
+                        self._processar_lote(lote)
+                except Exception as e:
+                    logger.error(f"Erro inesperado na fila de escrita: {e}")
+                    for tarefa in lote:
+                        if not tarefa.futuro.done():
+                            tarefa.futuro.set_exception(e)
+
+    def _iniciar_transacao(self) -> float:
+        """`BEGIN IMMEDIATE` com novas tentativas; retorna a espera pela trava (ms)."""
+        for tentativa in range(1, TENTATIVAS_TRAVA + 1):
+            inicio = time.perf_counter()
+            try:
+                db.session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                return (time.perf_counter() - inicio) * 1000
+            except OperationalError as e:
+                db.session.rollback()
+                with self._lock:
+                    self._stats['bloqueios'] += 1
+                if tentativa == TENTATIVAS_TRAVA:
+                    raise
+                logger.warning(f"Trava de escrita ocupada (tentativa {tentativa}): {e}")
+                time.sleep(0.1 * tentativa)
+
+    def _processar_lote(self, lote):
+        """Executa o lote em uma transação; uma tarefa com erro sai e o resto é refeito."""
+        inicio_lote = time.perf_counter()
+        with self._lock:
+            self._espera_fila_ms.extend((inicio_lote - t.enfileirada_em) * 1000 for t in lote)
+
+        pendentes = list(lote)
+        while pendentes:
+            try:
+                espera_trava = self._iniciar_transacao()
+            except OperationalError as e:
+                for tarefa in pendentes:
+                    tarefa.futuro.set_exception(e)
+                with self._lock:
+                    self._stats['falhas'] += len(pendentes)
+                logger.error(f"Fila de escrita: trava indisponível, {len(pendentes)} tarefas falharam: {e}")
+                return
+
+            inicio = time.perf_counter()
+            resultados = []
+            falha = None
+            for indice, tarefa in enumerate(pendentes):
+                try:
+                    resultados.append(tarefa.funcao())
+                    db.session.flush()
+                except Exception as e:
+                    falha = (indice, e)
+                    break
+            if falha is None:
+                try:
+                    db.session.commit()
+                except Exception as e:
+                    # Erro no commit não é atribuível a uma tarefa
+                    db.session.rollback()
+                    for tarefa in pendentes:
+                        tarefa.futuro.set_exception(e)
+                    with self._lock:
+                        self._stats['falhas'] += len(pendentes)
+                    logger.error(f"Fila de escrita: erro no commit do lote: {e}")
+                    return
+                with self._lock:
+                    self._stats['lotes'] += 1
+                    self._stats['executadas'] += len(pendentes)
+                    self._stats['maior_lote'] = max(self._stats['maior_lote'], len(pendentes))
+                    self._espera_trava_ms.append(espera_trava)
+                    self._transacao_ms.append((time.perf_counter() - inicio) * 1000)
+                for tarefa, resultado in zip(pendentes, resultados):
+                    tarefa.futuro.set_result(resultado)
+                return
+
+            db.session.rollback()
+            indice, erro = falha
+            tarefa = pendentes.pop(indice)
+            tarefa.futuro.set_exception(erro)
+            with self._lock:
+                self._stats['falhas'] += 1
+            logger.warning(f"Fila de escrita: tarefa falhou ({erro}); refazendo as outras {len(pendentes)}")
+
+
+_fila: Optional[FilaEscrita] = None
+_fila_lock = threading.Lock()
+
+
+def get_fila_escrita() -> Optional[FilaEscrita]:
+    """A fila global, ou None se não foi iniciada."""
+    return _fila
+
+
+def _executar_direto(tarefa: Callable[[], Any]):
+    """Sem a thread escritora: executa e faz commit na sessão de quem chamou."""
+    try:
+        resultado = tarefa()
+        db.session.commit()
+        return resultado
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def executar_escrita(tarefa: Callable[[], Any], timeout: Optional[float] = TIMEOUT_PADRAO):
+    """
+    Executa `tarefa` pela fila e espera o commit. Retorna o resultado da
+    tarefa ou propaga a exceção dela; FilaEscritaCheia se não houver vaga e
+    `concurrent.futures.TimeoutError` se o commit não vier em `timeout`
+    segundos (a tarefa ainda pode ser executada depois).
+    """
+    fila = _fila
+    if fila is None or not fila.ativa() or fila.na_thread_escritora():
+        return _executar_direto(tarefa)
+    return fila.enfileirar(tarefa, bloquear=True, timeout=timeout).result(timeout)
+
+
+def enviar_escrita(tarefa: Callable[[], Any]) -> Optional[Future]:
+    """
+    Enfileira `tarefa` sem esperar. Erros são só registrados no log; com a
+    fila cheia a escrita é descartada (retorna None).
+    """
+    fila = _fila
+    if fila is None or not fila.ativa() or fila.na_thread_escritora():
+        try:
+            _executar_direto(tarefa)
+        except Exception as e:
+            logger.warning(f"Escrita em segundo plano falhou: {e}")
+        return None
+    futuro = fila.enfileirar(tarefa, bloquear=False)
+    if futuro is not None:
+        futuro.add_done_callback(_registrar_falha)
+    return futuro
+
+
+def _registrar_falha(futuro: Future):
+    erro = futuro.exception()
+    if erro is not None:
+        logger.warning(f"Escrita em segundo plano falhou: {erro}")
+
+
+def get_fila_escrita_stats() -> Dict[str, Any]:
+    """Métricas da fila (ou só `ativa: False` sem a thread)."""
+    fila = _fila
+    if fila is None:
+        return {'ativa': False}
+    return fila.get_stats()
+
+
+def iniciar_fila_escrita(app):
+    """
+    Inicia a thread escritora. Chamado ao subir o servidor, depois de
+    `inicializar_banco`; a fila é esvaziada ao encerrar o processo.
+    """
+    global _fila
+    if not app.config.get('FILA_ESCRITA_ATIVA', True):
+        return
+    with _fila_lock:
+        if _fila is None:
+            _fila = FilaEscrita(app, app.config.get('FILA_ESCRITA_TAMANHO', TAMANHO_FILA_PADRAO))
+            _fila.iniciar()
+            atexit.register(_fila.parar)
@@ -3,15 +3,42 @@ Sistema de Full-Text Search com SQLite FTS5 para CGI
 Implementa busca avançada por relevância com suporte a português
 """
 
+import atexit
 import sqlite3
+from contextlib import contextmanager
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from typing import Callable, List, Dict, Any, Optional
 from flask import current_app
 from app import db, get_logger
 from models import Produto
 
 logger = get_logger('fts')
 
+# PRAGMAs aplicados a cada conexão persistente do FTS (por thread).
+FTS_CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 15000;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA cache_size = -8000;",        # ~8 MB de cache de páginas
+    "PRAGMA mmap_size = 67108864;",      # 64 MB de leitura via mmap
+    "PRAGMA synchronous = NORMAL;",      # seguro com journal_mode=WAL
+)
+# Quantidade de instruções preparadas mantidas em cache por conexão.
+FTS_CACHED_STATEMENTS = 256
+# Versão dos triggers/tabelas auxiliares; ao mudar, os triggers são recriados.
+FTS_SCHEMA_VERSION = 3
+# Banco em memória anexado (ATTACH) às conexões de uma thread em modo lote;
+# os triggers verificam se ele está na lista de bancos da própria conexão.
+FTS_LOTE_BANCO = 'fts_lote'
+# Produtos copiados por transação ao reconstruir o índice na tabela sombra
+FTS_LOTE_RECONSTRUCAO = 2000
+
+
+def _fts_string(texto: str) -> str:
+    """Texto como string FTS5 (entre aspas, com aspas internas duplicadas)."""
+    return '"' + texto.replace('"', '""') + '"'
+
+
 class FullTextSearch:
     """Classe para gerenciar Full-Text Search com SQLite FTS5"""
     
@@ -27,13 +54,91 @@ class FullTextSearch:
                 import os
                 self.db_path = os.path.join(APP_DATA_PATH, 'catalogo.db')
         self.fts_table = 'produtos_fts'
+        # Conexões persistentes por thread (ver `_get_connection`)
+        self._local = threading.local()
+        self._conn_lock = threading.Lock()
+        # Conexão -> thread dona (as de threads encerradas são fechadas)
+        self._connections: Dict[sqlite3.Connection, threading.Thread] = {}
+        self._conn_stats = {'conexoes_abertas': 0, 'conexoes_fechadas': 0, 'reutilizacoes': 0}
+        # None = ainda não verificado; True/False = tabela FTS pronta para MATCH
+        self._ready: Optional[bool] = None
+        # Tabela FTS já vista na conexão das buscas (ver `_build_fts_match`)
+        self._tabela_conferida = False
+        # Índice trigram (substrings) dos códigos normalizados
+        self.codigo_fts_table = 'produtos_codigo_fts'
+        self._codigo_ready: Optional[bool] = None
+        # Uma reconstrução por vez; progresso da atual (None = nenhuma)
+        self._reconstrucao_lock = threading.Lock()
+        self._reconstrucao: Optional[Dict[str, Any]] = None
+        # Threads em modo lote (ident -> blocos `modo_lote_fts` aninhados)
+        self._threads_lote: Dict[int, int] = {}
         
     def _get_connection(self) -> sqlite3.Connection:
-        """Obtém conexão direta com SQLite para operações FTS5"""
-        conn = sqlite3.connect(self.db_path)
+        """
+        Obtém a conexão SQLite persistente da thread atual para operações FTS5.
+
+        Cada thread (ex: workers do waitress) mantém a sua conexão aberta, com
+        PRAGMAs ajustados e cache de instruções preparadas, evitando reabrir o
+        arquivo e reler o schema a cada busca. `with conn:` continua apenas
+        controlando a transação (commit/rollback), sem fechar a conexão. Ao
+        abrir uma conexão nova, as de threads que já terminaram são fechadas.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.db_path == self.db_path:
+            with self._conn_lock:
+                self._conn_stats['reutilizacoes'] += 1
+            return conn
+
+        if conn is not None:
+            # Caminho do banco mudou (ex: testes/restauração): descarta a antiga.
+            self._close_connection(conn)
+        with self._conn_lock:
+            orfas = [c for c, thread in self._connections.items() if not thread.is_alive()]
+        for orfa in orfas:
+            self._close_connection(orfa)
+
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=15,
+            cached_statements=FTS_CACHED_STATEMENTS,
+            check_same_thread=False,  # permite fechar no shutdown a partir de outra thread
+        )
         conn.row_factory = sqlite3.Row  # Permite acesso por nome da coluna
+        for pragma in FTS_CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+
+        self._local.conn = conn
+        self._local.db_path = self.db_path
+        with self._conn_lock:
+            self._connections[conn] = threading.current_thread()
+            self._conn_stats['conexoes_abertas'] += 1
         return conn
 
+    def _close_connection(self, conn: sqlite3.Connection) -> None:
+        with self._conn_lock:
+            if self._connections.pop(conn, None) is None:
+                return
+            self._conn_stats['conexoes_fechadas'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_connections(self) -> None:
+        """Fecha todas as conexões persistentes (chamado no encerramento do processo)."""
+        with self._conn_lock:
+            conexoes = list(self._connections)
+        for conn in conexoes:
+            self._close_connection(conn)
+        self._local = threading.local()
+
+    def get_connection_stats(self) -> Dict[str, int]:
+        """Contadores de abertura/reuso das conexões persistentes do FTS."""
+        with self._conn_lock:
+            stats = dict(self._conn_stats)
+            stats['conexoes_ativas'] = len(self._connections)
+        return stats
+
     def _get_existing_table_sql(self, conn: sqlite3.Connection) -> Optional[str]:
         """Retorna o SQL usado para criar a tabela FTS atual, se existir."""
         cursor = conn.execute(
@@ -73,8 +178,55 @@ class FullTextSearch:
                     conn.execute(f"DROP TABLE IF EXISTS {self.fts_table};")
                 
                 # Cria tabela FTS5
-                create_sql = f"""
-                CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5(
+                conn.execute(self._create_table_sql(self.fts_table))
+                
+                # Tabelas auxiliares do modo lote (ver `modo_lote_fts`)
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fts_pendente (produto_id INTEGER PRIMARY KEY);"
+                )
+                # Marcador global das versões anteriores: um token esquecido
+                # por uma importação interrompida adiava o FTS de todo o banco.
+                conn.execute("DROP TABLE IF EXISTS fts_modo_lote;")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS fts_meta (chave TEXT PRIMARY KEY, valor TEXT);"
+                )
+
+                # Triggers de versões anteriores não são alterados por
+                # CREATE TRIGGER IF NOT EXISTS: recria e repopula (rowid = produto.id).
+                versao = self._get_schema_version(conn)
+                # Desde a versão 2 o rowid do FTS é o produto.id
+                precisa_repopular = existing_table_sql is not None and versao < 2
+                if versao < FTS_SCHEMA_VERSION:
+                    for (nome_trigger,) in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type='trigger' "
+                        "AND name LIKE 'produtos\\_fts\\_%' ESCAPE '\\';"
+                    ).fetchall():
+                        conn.execute(f"DROP TRIGGER IF EXISTS {nome_trigger};")
+
+                for trigger_sql in self._trigger_definitions():
+                    conn.execute(trigger_sql)
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO fts_meta (chave, valor) VALUES ('schema_version', ?);",
+                    (str(FTS_SCHEMA_VERSION),),
+                )
+                if precisa_repopular:
+                    logger.info("Atualizando triggers do FTS5; repopulando índice")
+                    self.populate_fts_table()
+                
+                conn.commit()
+                self._ready = True
+                logger.info(f"Tabela FTS5 '{self.fts_table}' criada com sucesso")
+                return True
+                
+        except Exception as e:
+            logger.error(f"Erro ao criar tabela FTS5: {str(e)}")
+            return False
+    
+    def _create_table_sql(self, nome: str) -> str:
+        """CREATE da tabela FTS5 de produtos (a principal ou a sombra da reconstrução)."""
+        return f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {nome} USING fts5(
                     produto_id UNINDEXED,
                     codigo,
                     nome,
@@ -87,53 +239,30 @@ class FullTextSearch:
                     tokenize='porter ascii'
                 );
                 """
-                conn.execute(create_sql)
-                
-                # Cria trigger para manter sincronizado com a tabela principal
-                trigger_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_insert 
-                AFTER INSERT ON produto BEGIN
-                    INSERT INTO {self.fts_table}(
-                        produto_id, codigo, nome, fornecedor, grupos, 
-                        conversoes, aplicacoes, medidas, observacoes
-                    ) VALUES (
-                        NEW.id, NEW.codigo, NEW.nome, NEW.fornecedor, NEW.grupo,
-                        NEW.conversoes, '', NEW.medidas, NEW.observacoes
-                    );
-                END;
-                """
-                conn.execute(trigger_sql)
-                
-                trigger_update_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_update 
-                AFTER UPDATE ON produto BEGIN
-                    UPDATE {self.fts_table} SET
-                        codigo = NEW.codigo,
-                        nome = NEW.nome,
-                        fornecedor = NEW.fornecedor,
-                        grupos = NEW.grupo,
-                        conversoes = NEW.conversoes,
-                        medidas = NEW.medidas,
-                        observacoes = NEW.observacoes
-                    WHERE produto_id = NEW.id;
-                END;
-                """
-                conn.execute(trigger_update_sql)
-                
-                trigger_delete_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_delete 
-                AFTER DELETE ON produto BEGIN
-                    DELETE FROM {self.fts_table} WHERE produto_id = OLD.id;
-                END;
-                """
-                conn.execute(trigger_delete_sql)
-
-                # Mantém o texto consolidado de aplicações sincronizado no FTS
-                trigger_aplicacao_insert_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_insert
-                AFTER INSERT ON aplicacao BEGIN
-                    UPDATE {self.fts_table}
-                    SET aplicacoes = (
+
+    def _get_schema_version(self, conn: sqlite3.Connection) -> int:
+        """Versão dos triggers/tabelas auxiliares do FTS gravada em `fts_meta`."""
+        row = conn.execute(
+            "SELECT valor FROM fts_meta WHERE chave = 'schema_version';"
+        ).fetchone()
+        return int(row['valor']) if row else 0
+
+    def _trigger_definitions(self) -> List[str]:
+        """
+        Triggers de sincronização de `produtos_fts` com `produto` e `aplicacao`.
+
+        O rowid do FTS é o próprio produto.id, então as atualizações são feitas
+        por rowid (sem varrer o índice). Nas conexões em modo lote (com o banco
+        `FTS_LOTE_BANCO` anexado), os triggers só enfileiram o produto em
+        `fts_pendente`; a atualização é feita uma vez, em lote, no final. As
+        demais conexões continuam atualizando o FTS a cada alteração.
+        """
+        conexao_em_lote = (
+            f"EXISTS (SELECT 1 FROM pragma_database_list WHERE name = '{FTS_LOTE_BANCO}')"
+        )
+        fora_do_lote = f"WHEN NOT {conexao_em_lote}"
+        em_lote = f"WHEN {conexao_em_lote}"
+        aplicacoes_sql = """(
                         SELECT GROUP_CONCAT(
                             COALESCE(a.montadora, '') || ' ' ||
                             COALESCE(a.veiculo, '') || ' ' ||
@@ -142,89 +271,207 @@ class FullTextSearch:
                             ' | '
                         )
                         FROM aplicacao a
-                        WHERE a.produto_id = NEW.produto_id
-                    )
-                    WHERE produto_id = NEW.produto_id;
+                        WHERE a.produto_id = {ref}
+                    )"""
+        return [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_insert
+            AFTER INSERT ON produto {fora_do_lote} BEGIN
+                INSERT INTO {self.fts_table}(
+                    rowid, produto_id, codigo, nome, fornecedor, grupos,
+                    conversoes, aplicacoes, medidas, observacoes
+                ) VALUES (
+                    NEW.id, NEW.id, NEW.codigo, NEW.nome, NEW.fornecedor, NEW.grupo,
+                    NEW.conversoes, '', NEW.medidas, NEW.observacoes
+                );
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_update
+            AFTER UPDATE ON produto {fora_do_lote} BEGIN
+                UPDATE {self.fts_table} SET
+                    codigo = NEW.codigo,
+                    nome = NEW.nome,
+                    fornecedor = NEW.fornecedor,
+                    grupos = NEW.grupo,
+                    conversoes = NEW.conversoes,
+                    medidas = NEW.medidas,
+                    observacoes = NEW.observacoes
+                WHERE rowid = NEW.id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_delete
+            AFTER DELETE ON produto BEGIN
+                DELETE FROM {self.fts_table} WHERE rowid = OLD.id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_insert
+            AFTER INSERT ON aplicacao {fora_do_lote} BEGIN
+                UPDATE {self.fts_table}
+                SET aplicacoes = {aplicacoes_sql.format(ref='NEW.produto_id')}
+                WHERE rowid = NEW.produto_id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_update
+            AFTER UPDATE ON aplicacao {fora_do_lote} BEGIN
+                UPDATE {self.fts_table}
+                SET aplicacoes = {aplicacoes_sql.format(ref='NEW.produto_id')}
+                WHERE rowid = NEW.produto_id;
+
+                UPDATE {self.fts_table}
+                SET aplicacoes = {aplicacoes_sql.format(ref='OLD.produto_id')}
+                WHERE rowid = OLD.produto_id AND OLD.produto_id <> NEW.produto_id;
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_delete
+            AFTER DELETE ON aplicacao {fora_do_lote} BEGIN
+                UPDATE {self.fts_table}
+                SET aplicacoes = {aplicacoes_sql.format(ref='OLD.produto_id')}
+                WHERE rowid = OLD.produto_id;
+            END;
+            """,
+            # --- Modo lote: apenas enfileiram o produto ---
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_lote_insert
+            AFTER INSERT ON produto {em_lote} BEGIN
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (NEW.id);
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_lote_update
+            AFTER UPDATE ON produto {em_lote} BEGIN
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (NEW.id);
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_lote_aplicacao_insert
+            AFTER INSERT ON aplicacao {em_lote} BEGIN
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (NEW.produto_id);
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_lote_aplicacao_update
+            AFTER UPDATE ON aplicacao {em_lote} BEGIN
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (NEW.produto_id);
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (OLD.produto_id);
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_lote_aplicacao_delete
+            AFTER DELETE ON aplicacao {em_lote} BEGIN
+                INSERT OR IGNORE INTO fts_pendente (produto_id) VALUES (OLD.produto_id);
+            END;
+            """,
+        ]
+
+    def _captura_trigger_definitions(self) -> List[str]:
+        """
+        Triggers que, durante uma reconstrução, anotam em
+        `fts_reconstrucao_pendente` os produtos alterados depois de copiados
+        para a tabela sombra. Removidos na troca.
+        """
+        eventos = (
+            ('produto_insert', 'INSERT ON produto', ('NEW.id',)),
+            ('produto_update', 'UPDATE ON produto', ('NEW.id',)),
+            ('produto_delete', 'DELETE ON produto', ('OLD.id',)),
+            ('aplicacao_insert', 'INSERT ON aplicacao', ('NEW.produto_id',)),
+            ('aplicacao_update', 'UPDATE ON aplicacao', ('NEW.produto_id', 'OLD.produto_id')),
+            ('aplicacao_delete', 'DELETE ON aplicacao', ('OLD.produto_id',)),
+        )
+        return [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS produtos_fts_captura_{nome}
+            AFTER {evento} BEGIN
+                INSERT OR IGNORE INTO fts_reconstrucao_pendente (produto_id)
+                VALUES {', '.join(f'({ref})' for ref in refs)};
+            END;
+            """
+            for nome, evento, refs in eventos
+        ]
+
+    def create_codigo_fts_table(self) -> bool:
+        """
+        Cria o índice FTS5 com tokenizer `trigram` sobre `produto.codigo_norm` e
+        `produto.conversoes_norm`, usado para busca de substrings de código
+        (ex: "1084" dentro de "SK91005B1084").
+
+        É uma tabela de conteúdo externo (content='produto', rowid = produto.id):
+        não duplica o texto e permite juntar pelo rowid. Os triggers seguem o
+        mesmo padrão de `produtos_fts`.
+        """
+        try:
+            with self._get_connection() as conn:
+                colunas = {row['name'] for row in conn.execute("PRAGMA table_info(produto);")}
+                if 'codigo_norm' not in colunas:
+                    # Banco ainda não migrado; será criado após `aplicar_migracoes`.
+                    logger.info("Colunas normalizadas ausentes; índice trigram adiado")
+                    return False
+
+                existia = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;",
+                    (self.codigo_fts_table,),
+                ).fetchone() is not None
+
+                conn.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {self.codigo_fts_table} USING fts5(
+                    codigo_norm,
+                    conversoes_norm,
+                    content='produto',
+                    content_rowid='id',
+                    tokenize='trigram'
+                );
+                """)
+
+                conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS produtos_codigo_fts_sync_insert
+                AFTER INSERT ON produto BEGIN
+                    INSERT INTO {self.codigo_fts_table}(rowid, codigo_norm, conversoes_norm)
+                    VALUES (NEW.id, NEW.codigo_norm, NEW.conversoes_norm);
                 END;
-                """
-                conn.execute(trigger_aplicacao_insert_sql)
+                """)
 
-                trigger_aplicacao_update_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_update
-                AFTER UPDATE ON aplicacao BEGIN
-                    UPDATE {self.fts_table}
-                    SET aplicacoes = (
-                        SELECT GROUP_CONCAT(
-                            COALESCE(a.montadora, '') || ' ' ||
-                            COALESCE(a.veiculo, '') || ' ' ||
-                            COALESCE(a.motor, '') || ' ' ||
-                            COALESCE(a.ano, ''),
-                            ' | '
-                        )
-                        FROM aplicacao a
-                        WHERE a.produto_id = NEW.produto_id
-                    )
-                    WHERE produto_id = NEW.produto_id;
+                conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS produtos_codigo_fts_sync_update
+                AFTER UPDATE OF codigo_norm, conversoes_norm ON produto BEGIN
+                    INSERT INTO {self.codigo_fts_table}({self.codigo_fts_table}, rowid, codigo_norm, conversoes_norm)
+                    VALUES ('delete', OLD.id, OLD.codigo_norm, OLD.conversoes_norm);
+                    INSERT INTO {self.codigo_fts_table}(rowid, codigo_norm, conversoes_norm)
+                    VALUES (NEW.id, NEW.codigo_norm, NEW.conversoes_norm);
+                END;
+                """)
 
-                    UPDATE {self.fts_table}
-                    SET aplicacoes = (
-                        SELECT GROUP_CONCAT(
-                            COALESCE(a.montadora, '') || ' ' ||
-                            COALESCE(a.veiculo, '') || ' ' ||
-                            COALESCE(a.motor, '') || ' ' ||
-                            COALESCE(a.ano, ''),
-                            ' | '
-                        )
-                        FROM aplicacao a
-                        WHERE a.produto_id = OLD.produto_id
-                    )
-                    WHERE produto_id = OLD.produto_id;
+                conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS produtos_codigo_fts_sync_delete
+                AFTER DELETE ON produto BEGIN
+                    INSERT INTO {self.codigo_fts_table}({self.codigo_fts_table}, rowid, codigo_norm, conversoes_norm)
+                    VALUES ('delete', OLD.id, OLD.codigo_norm, OLD.conversoes_norm);
                 END;
-                """
-                conn.execute(trigger_aplicacao_update_sql)
+                """)
 
-                trigger_aplicacao_delete_sql = f"""
-                CREATE TRIGGER IF NOT EXISTS produtos_fts_sync_aplicacao_delete
-                AFTER DELETE ON aplicacao BEGIN
-                    UPDATE {self.fts_table}
-                    SET aplicacoes = (
-                        SELECT GROUP_CONCAT(
-                            COALESCE(a.montadora, '') || ' ' ||
-                            COALESCE(a.veiculo, '') || ' ' ||
-                            COALESCE(a.motor, '') || ' ' ||
-                            COALESCE(a.ano, ''),
-                            ' | '
-                        )
-                        FROM aplicacao a
-                        WHERE a.produto_id = OLD.produto_id
+                if not existia:
+                    conn.execute(
+                        f"INSERT INTO {self.codigo_fts_table}({self.codigo_fts_table}) VALUES ('rebuild');"
                     )
-                    WHERE produto_id = OLD.produto_id;
-                END;
-                """
-                conn.execute(trigger_aplicacao_delete_sql)
-                
+                    logger.info(f"Índice trigram '{self.codigo_fts_table}' criado e populado")
+
                 conn.commit()
-                logger.info(f"Tabela FTS5 '{self.fts_table}' criada com sucesso")
+                self._codigo_ready = True
                 return True
-                
+
         except Exception as e:
-            logger.error(f"Erro ao criar tabela FTS5: {str(e)}")
+            logger.error(f"Erro ao criar índice trigram de códigos: {str(e)}")
+            self._codigo_ready = False
             return False
-    
-    def populate_fts_table(self) -> bool:
-        """Popula a tabela FTS5 com dados existentes"""
-        try:
-            with self._get_connection() as conn:
-                # Limpa dados existentes
-                conn.execute(f"DELETE FROM {self.fts_table};")
-                
-                # Insere todos os produtos existentes
-                insert_sql = f"""
-                INSERT INTO {self.fts_table}(
-                    produto_id, codigo, nome, fornecedor, grupos, 
-                    conversoes, aplicacoes, medidas, observacoes
-                )
+
+    def _select_documentos_sql(self, filtro: str = "") -> str:
+        """SELECT que monta os documentos do FTS a partir de produto + aplicacao."""
+        return f"""
                 SELECT 
+                    p.id,
                     p.id,
                     p.codigo,
                     p.nome,
@@ -232,19 +479,108 @@ class FullTextSearch:
                     p.grupo,
                     p.conversoes,
                     GROUP_CONCAT(
-                        a.montadora || ' ' || a.veiculo || ' ' || 
-                        COALESCE(a.motor, '') || ' ' || COALESCE(a.ano, ''), ' | '
+                        COALESCE(a.montadora, '') || ' ' ||
+                        COALESCE(a.veiculo, '') || ' ' ||
+                        COALESCE(a.motor, '') || ' ' ||
+                        COALESCE(a.ano, ''),
+                        ' | '
                     ) as aplicacoes,
                     p.medidas,
                     p.observacoes
                 FROM produto p
                 LEFT JOIN aplicacao a ON p.id = a.produto_id
-                GROUP BY p.id, p.codigo, p.nome, p.fornecedor, p.grupo, 
-                         p.conversoes, p.medidas, p.observacoes;
+                {filtro}"""
+
+    def iniciar_modo_lote(self) -> None:
+        """
+        Ativa o modo lote na thread atual: as conexões do SQLAlchemy que ela
+        obtiver do pool (ver `registrar_engine`) são marcadas, e nelas os
+        triggers passam a apenas enfileirar os produtos alterados em
+        `fts_pendente`. Edições feitas por outras conexões não são afetadas.
+        """
+        ident = threading.get_ident()
+        with self._conn_lock:
+            self._threads_lote[ident] = self._threads_lote.get(ident, 0) + 1
+
+    def finalizar_modo_lote(self) -> int:
+        """Desativa o modo lote da thread atual e processa as pendências."""
+        ident = threading.get_ident()
+        with self._conn_lock:
+            restantes = self._threads_lote.get(ident, 0) - 1
+            if restantes > 0:
+                self._threads_lote[ident] = restantes
+                return 0
+            self._threads_lote.pop(ident, None)
+        return self.processar_pendentes()
+
+    def em_modo_lote(self) -> bool:
+        """Indica se a thread atual está em modo lote."""
+        return threading.get_ident() in self._threads_lote
+
+    def registrar_engine(self, engine) -> None:
+        """
+        Marca, ao sair do pool, as conexões de `engine` obtidas por threads em
+        modo lote (anexando o banco `FTS_LOTE_BANCO`) e desfaz a marcação ao
+        devolvê-las. Como a marca é da conexão, um processo encerrado no meio
+        de uma importação não deixa o FTS adiado.
+        """
+        from sqlalchemy import event
+
+        if not event.contains(engine, 'checkout', _marcar_conexao_lote):
+            event.listen(engine, 'checkout', _marcar_conexao_lote)
+            event.listen(engine, 'checkin', _desmarcar_conexao_lote)
+
+    def processar_pendentes(self) -> int:
+        """
+        Atualiza, de uma vez, as linhas do FTS dos produtos em `fts_pendente`:
+        remove os documentos antigos por rowid e reinsere os atuais com um único
+        INSERT ... SELECT agrupado. Retorna a quantidade de produtos processados.
+        """
+        try:
+            with self._get_connection() as conn:
+                total = conn.execute("SELECT COUNT(*) FROM fts_pendente;").fetchone()[0]
+                if not total:
+                    return 0
+                conn.execute(
+                    f"DELETE FROM {self.fts_table} "
+                    f"WHERE rowid IN (SELECT produto_id FROM fts_pendente);"
+                )
+                conn.execute(f"""
+                INSERT INTO {self.fts_table}(
+                    rowid, produto_id, codigo, nome, fornecedor, grupos,
+                    conversoes, aplicacoes, medidas, observacoes
+                )
+                {self._select_documentos_sql("JOIN fts_pendente f ON f.produto_id = p.id")}
+                GROUP BY p.id;
+                """)
+                conn.execute("DELETE FROM fts_pendente;")
+            logger.info(f"FTS5 atualizado em lote para {total} produtos")
+            return total
+        except Exception as e:
+            logger.error(f"Erro ao processar pendências do FTS5: {str(e)}")
+            return 0
+
+    def populate_fts_table(self) -> bool:
+        """Popula a tabela FTS5 com dados existentes"""
+        try:
+            with self._get_connection() as conn:
+                # Limpa dados existentes
+                conn.execute(f"DELETE FROM {self.fts_table};")
+                
+                # Insere todos os produtos existentes (rowid = produto.id)
+                insert_sql = f"""
+                INSERT INTO {self.fts_table}(
+                    rowid, produto_id, codigo, nome, fornecedor, grupos, 
+                    conversoes, aplicacoes, medidas, observacoes
+                )
+                {self._select_documentos_sql()}
+                GROUP BY p.id;
                 """
                 
                 result = conn.execute(insert_sql)
                 count = result.rowcount
+                # Pendências do modo lote ficam cobertas pela carga completa
+                conn.execute("DELETE FROM fts_pendente;")
                 conn.commit()
                 
                 logger.info(f"Tabela FTS5 populada com {count} registros")
@@ -259,7 +595,6 @@ class FullTextSearch:
         query: str,
         limit: int = 50,
         offset: int = 0,
-        _allow_repair: bool = True,
     ) -> List[Dict[str, Any]]:
         """
         Realiza busca full-text e retorna resultados ordenados por relevância
@@ -320,10 +655,9 @@ class FullTextSearch:
 
                 if results and all(result['produto_id'] is None for result in results):
                     logger.warning(
-                        "Busca FTS retornou registros sem produto_id; tentando reconstruir índice"
+                        "Busca FTS retornou registros sem produto_id; reconstruindo índice em segundo plano"
                     )
-                    if _allow_repair and self.rebuild_index():
-                        return self.search(query, limit=limit, offset=offset, _allow_repair=False)
+                    self.agendar_reconstrucao()
                     return []
                 
                 logger.debug(f"Busca FTS5 '{query}' retornou {len(results)} resultados")
@@ -331,62 +665,110 @@ class FullTextSearch:
                 
         except Exception as e:
             logger.error(f"Erro na busca FTS5: {str(e)}")
+            if isinstance(e, sqlite3.OperationalError):
+                self.registrar_falha(e)
             return []
-    
+
+    def registrar_falha(self, erro) -> bool:
+        """
+        Trata um erro de uma consulta que usa o FTS5 (aqui ou no MATCH da busca
+        paginada).
+
+        Returns:
+            True se o erro é do FTS5 (o chamador refaz a consulta pelo SQL).
+        """
+        mensagem = str(erro)
+        if 'no such table' in mensagem and self.codigo_fts_table in mensagem:
+            self.marcar_indisponivel(codigo=True)
+        elif 'no such table' in mensagem and self.fts_table in mensagem:
+            self.marcar_indisponivel()
+        elif 'fts5' not in mensagem:
+            return False
+        elif 'syntax error' in mensagem:
+            logger.warning(f"Expressão MATCH inválida: {mensagem}")
+        else:
+            logger.warning(f"Erro no índice FTS5: {mensagem}")
+            self.agendar_reconstrucao()
+        return True
+
+    def marcar_indisponivel(self, codigo: bool = False) -> None:
+        """
+        Tabela do FTS5 (ou do índice de códigos) removida por fora: as buscas
+        usam o SQL até a reconstrução, agendada em segundo plano.
+        """
+        if codigo:
+            self._codigo_ready = False
+        else:
+            self._ready = False
+            self._tabela_conferida = False
+        logger.warning("Tabela do FTS5 ausente; reconstruindo o índice em segundo plano")
+        self.agendar_reconstrucao()
+
+    def is_ready(self) -> bool:
+        """Indica se a tabela FTS5 existe e pode ser usada em consultas MATCH."""
+        if self._ready is None:
+            self._ready = self.get_stats()['exists']
+        return self._ready
+
+    def redefinir_estado(self) -> None:
+        """
+        Esquece a verificação das tabelas (ex: depois de migrações de schema):
+        `is_ready`/`is_codigo_ready` voltam a consultar o banco.
+        """
+        self._ready = None
+        self._tabela_conferida = False
+        self._codigo_ready = None
+
+    def tabela_conferida(self) -> bool:
+        """Indica se a tabela FTS já foi conferida na conexão das buscas."""
+        return self._tabela_conferida
+
+    def registrar_tabela_conferida(self) -> None:
+        """Dispensa novas conferências até a próxima mudança de estado."""
+        self._tabela_conferida = True
+
+    def is_codigo_ready(self) -> bool:
+        """Indica se o índice trigram de códigos está disponível."""
+        if self._codigo_ready is None:
+            self._codigo_ready = self.get_stats()['codigo_table_exists']
+        return self._codigo_ready
+
+    def build_match_query(self, query: str) -> str:
+        """
+        Retorna a expressão MATCH do FTS5 para o termo, para uso em consultas
+        que fazem JOIN de `produtos_fts` com `produto` na conexão do SQLAlchemy.
+        """
+        if not query or not query.strip():
+            return ''
+        return self._clean_fts_query(query.strip())
+
     def _clean_fts_query(self, query: str) -> str:
         """
-        Limpa e prepara query para FTS5
-        Remove caracteres especiais que podem causar erro de sintaxe
+        Limpa e prepara query para FTS5.
+
+        Cada termo vira uma string FTS5 entre aspas, então palavras como AND,
+        OR e NOT e caracteres como `*`, `+` e `"` digitados pelo usuário são
+        texto e não operadores (sem erro de sintaxe no MATCH).
         """
         import re
-        
-        # Para códigos com pontos, tenta diferentes estratégias
-        original_query = query.strip()
-        
-        # Se contém hífen ou barra, converte para espaços (FTS5 não funciona bem com esses separadores)
-        if '-' in original_query or '/' in original_query:
-            # Substitui hífen e barra por espaço para que FTS5 trate como múltiplos termos
-            original_query = original_query.replace('-', ' ').replace('/', ' ')
-            # Remove múltiplos espaços
-            original_query = re.sub(r'\s+', ' ', original_query).strip()
-        
-        # Se contém pontos, tenta diferentes estratégias
-        if '.' in original_query:
-            # Versão com aspas para busca exata
-            quoted_version = f'"{original_query}"'
-            # Versão sem pontos para busca flexível  
-            no_dots_version = original_query.replace('.', ' ')
-            # Remove múltiplos espaços
-            no_dots_version = re.sub(r'\s+', ' ', no_dots_version).strip()
-            terms_no_dots = [term.strip() for term in no_dots_version.split() if term.strip()]
-            
-            if terms_no_dots:
-                wildcard_terms = ' OR '.join([f'{term}*' for term in terms_no_dots])
-                return f'{quoted_version} OR ({wildcard_terms})'
-            else:
-                return quoted_version
-        
-        # Para queries normais (sem pontos), usa lógica original
-        # Remove caracteres especiais do FTS5, exceto pontos que já foram tratados
-        query = re.sub(r'[^\w\s\*\-\+]', ' ', query)
-        
-        # Divide em termos individuais
-        terms = [term.strip() for term in query.split() if term.strip()]
-        
+
+        # Hífen, barra e pontos separam termos (ex: "AL-1084", "1.5"), assim
+        # como qualquer outro caractere que não seja letra ou dígito.
+        terms = re.findall(r'[^\W_]+', query)
         if not terms:
             return ''
-        
-        # Para busca mais flexível, adiciona * ao final de cada termo.
-        # Múltiplos termos usam AND para que o documento precise conter TODOS os
-        # termos (ex: "homocinetica celta" não deve retornar todas as homociné-
-        # ticas, apenas as compatíveis com Celta).
+
+        exact_phrase = _fts_string(' '.join(terms))
         if len(terms) == 1:
-            return f'"{terms[0]}" OR {terms[0]}*'
-        else:
-            # Frase exata OU todos os termos presentes (AND entre wildcards)
-            exact_phrase = '"' + ' '.join(terms) + '"'
-            wildcard_terms = ' AND '.join([f'{term}*' for term in terms])
-            return f'{exact_phrase} OR ({wildcard_terms})'
+            return f'{exact_phrase} OR {exact_phrase}*'
+
+        # Frase exata OU termos por prefixo. Com pontos (códigos/medidas),
+        # basta um dos termos; nos demais casos o documento precisa conter
+        # TODOS os termos (ex: "homocinetica celta" não deve retornar todas as
+        # homocinéticas, apenas as compatíveis com Celta).
+        conector = ' OR ' if '.' in query else ' AND '
+        wildcard_terms = conector.join(f'{_fts_string(term)}*' for term in terms)
+        return f'{exact_phrase} OR ({wildcard_terms})'
     
     def get_search_suggestions(self, query: str, limit: int = 5) -> List[str]:
         """
@@ -427,23 +809,162 @@ class FullTextSearch:
             logger.error(f"Erro ao buscar sugestões: {str(e)}")
             return []
     
-    def rebuild_index(self) -> bool:
-        """Reconstrói completamente o índice FTS5"""
+    def _informar_progresso(self, progresso, etapa: str, feitos: int, total: int) -> None:
+        self._reconstrucao = {'etapa': etapa, 'feitos': feitos, 'total': total}
+        if progresso:
+            progresso(etapa, feitos, total)
+
+    def rebuild_index(self, progresso: Optional[Callable[[str, int, int], None]] = None) -> bool:
+        """
+        Reconstrói o índice FTS5 sem tirá-lo do ar.
+
+        Os documentos são copiados em lotes para a tabela sombra
+        `<fts_table>_novo`, enquanto as buscas continuam na atual. Produtos
+        alterados durante a cópia são anotados por triggers de captura e
+        reindexados na troca, que acontece em uma única transação: remove a
+        tabela antiga, renomeia a sombra e recria os triggers. Depois, o
+        índice trigram de códigos é refeito (comando 'rebuild', também
+        atômico).
+
+        Demorado: deve rodar fora das requisições (CLI `rebuild-fts`, tarefa
+        administrativa ou `agendar_reconstrucao`). `progresso(etapa, feitos,
+        total)` é chamado a cada lote. Retorna False se outra reconstrução já
+        estiver em andamento ou em caso de erro.
+        """
+        if not self._reconstrucao_lock.acquire(blocking=False):
+            logger.info("Reconstrução do índice FTS5 já em andamento")
+            return False
+        sombra = f"{self.fts_table}_novo"
+        # Conexão própria, em autocommit: cada lote é uma transação curta
+        conn = sqlite3.connect(self.db_path, timeout=15, isolation_level=None)
         try:
-            with self._get_connection() as conn:
-                # Remove tabela existente
-                conn.execute(f"DROP TABLE IF EXISTS {self.fts_table};")
-                
-                # Recria e popula
-                if self.create_fts_table():
-                    return self.populate_fts_table()
-                
-                return False
-                
+            for pragma in FTS_CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+
+            self._informar_progresso(progresso, 'preparando', 0, 0)
+            conn.execute("BEGIN IMMEDIATE;")
+            conn.execute(f"DROP TABLE IF EXISTS {sombra};")
+            conn.execute(self._create_table_sql(sombra))
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS fts_reconstrucao_pendente (produto_id INTEGER PRIMARY KEY);"
+            )
+            conn.execute("DELETE FROM fts_reconstrucao_pendente;")
+            for trigger_sql in self._captura_trigger_definitions():
+                conn.execute(trigger_sql)
+            conn.execute("COMMIT;")
+
+            total = conn.execute("SELECT COUNT(*) FROM produto;").fetchone()[0]
+            insert_sql = f"""
+                INSERT INTO {sombra}(
+                    rowid, produto_id, codigo, nome, fornecedor, grupos,
+                    conversoes, aplicacoes, medidas, observacoes
+                )
+                {self._select_documentos_sql("WHERE p.id BETWEEN ? AND ?")}
+                GROUP BY p.id;
+                """
+            feitos, ultimo_id = 0, 0
+            self._informar_progresso(progresso, 'documentos', feitos, total)
+            while True:
+                ids = [row[0] for row in conn.execute(
+                    "SELECT id FROM produto WHERE id > ? ORDER BY id LIMIT ?;",
+                    (ultimo_id, FTS_LOTE_RECONSTRUCAO),
+                )]
+                if not ids:
+                    break
+                conn.execute("BEGIN IMMEDIATE;")
+                conn.execute(insert_sql, (ids[0], ids[-1]))
+                conn.execute("COMMIT;")
+                feitos += len(ids)
+                ultimo_id = ids[-1]
+                self._informar_progresso(progresso, 'documentos', feitos, total)
+
+            conn.execute("BEGIN IMMEDIATE;")
+            alterados = conn.execute("SELECT COUNT(*) FROM fts_reconstrucao_pendente;").fetchone()[0]
+            self._informar_progresso(progresso, 'troca', 0, alterados)
+            conn.execute(
+                f"DELETE FROM {sombra} WHERE rowid IN (SELECT produto_id FROM fts_reconstrucao_pendente);"
+            )
+            conn.execute(f"""
+                INSERT INTO {sombra}(
+                    rowid, produto_id, codigo, nome, fornecedor, grupos,
+                    conversoes, aplicacoes, medidas, observacoes
+                )
+                {self._select_documentos_sql("JOIN fts_reconstrucao_pendente f ON f.produto_id = p.id")}
+                GROUP BY p.id;
+                """)
+            # Os triggers citam a tabela pelo nome: o RENAME os apontaria
+            # para a tabela errada, então são removidos e recriados
+            for (nome_trigger,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='trigger' "
+                "AND name LIKE 'produtos\\_fts\\_%' ESCAPE '\\';"
+            ).fetchall():
+                conn.execute(f"DROP TRIGGER IF EXISTS {nome_trigger};")
+            conn.execute(f"DROP TABLE IF EXISTS {self.fts_table};")
+            conn.execute(f"ALTER TABLE {sombra} RENAME TO {self.fts_table};")
+            for trigger_sql in self._trigger_definitions():
+                conn.execute(trigger_sql)
+            conn.execute("DELETE FROM fts_reconstrucao_pendente;")
+            conn.execute(
+                "INSERT OR REPLACE INTO fts_meta (chave, valor) VALUES ('schema_version', ?);",
+                (str(FTS_SCHEMA_VERSION),),
+            )
+            conn.execute("COMMIT;")
+            self._ready = True
+            self._informar_progresso(progresso, 'troca', alterados, alterados)
+            logger.info(
+                f"Índice FTS5 reconstruído com {feitos} documentos "
+                f"({alterados} alterados durante a cópia)"
+            )
+
+            self._informar_progresso(progresso, 'codigos', 0, 1)
+            self.rebuild_codigo_index()
+            self._informar_progresso(progresso, 'codigos', 1, 1)
+            return True
+
         except Exception as e:
             logger.error(f"Erro ao reconstruir índice FTS5: {str(e)}")
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK;")
+                for (nome_trigger,) in conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type='trigger' "
+                    "AND name LIKE 'produtos\\_fts\\_captura\\_%' ESCAPE '\\';"
+                ).fetchall():
+                    conn.execute(f"DROP TRIGGER IF EXISTS {nome_trigger};")
+                conn.execute(f"DROP TABLE IF EXISTS {sombra};")
+            except Exception as erro_limpeza:
+                logger.warning(f"Falha ao limpar a reconstrução do FTS5: {erro_limpeza}")
             return False
-    
+        finally:
+            conn.close()
+            self._reconstrucao = None
+            self._reconstrucao_lock.release()
+
+    def agendar_reconstrucao(self) -> bool:
+        """
+        Reconstrói o índice em uma thread à parte (para quem está dentro de
+        uma requisição). Retorna False se já houver uma em andamento.
+        """
+        if self._reconstrucao_lock.locked():
+            return False
+        threading.Thread(target=self.rebuild_index, name="fts-reconstrucao", daemon=True).start()
+        return True
+
+    def rebuild_codigo_index(self) -> bool:
+        """Repopula o índice trigram de códigos a partir da tabela produto."""
+        try:
+            if not self.create_codigo_fts_table():
+                return False
+            with self._get_connection() as conn:
+                conn.execute(
+                    f"INSERT INTO {self.codigo_fts_table}({self.codigo_fts_table}) VALUES ('rebuild');"
+                )
+                conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir índice trigram de códigos: {str(e)}")
+            return False
+
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas da tabela FTS5"""
         try:
@@ -455,6 +976,11 @@ class FullTextSearch:
                 """, (self.fts_table,))
                 
                 exists = cursor.fetchone() is not None
+
+                codigo_table_exists = conn.execute("""
+                    SELECT name FROM sqlite_master
+                    WHERE type='table' AND name=?;
+                """, (self.codigo_fts_table,)).fetchone() is not None
                 
                 total = 0
                 if exists:
@@ -464,34 +990,99 @@ class FullTextSearch:
                 return {
                     'exists': exists,
                     'total_records': total,
-                    'table_name': self.fts_table
+                    'table_name': self.fts_table,
+                    'codigo_table_exists': codigo_table_exists,
+                    'codigo_table_name': self.codigo_fts_table,
+                    'conexoes': self.get_connection_stats(),
+                    'reconstrucao': self._reconstrucao,
                 }
                 
         except Exception as e:
             logger.error(f"Erro ao obter estatísticas FTS5: {str(e)}")
-            return {'exists': False, 'total_records': 0, 'table_name': self.fts_table}
+            return {
+                'exists': False,
+                'total_records': 0,
+                'table_name': self.fts_table,
+                'codigo_table_exists': False,
+                'codigo_table_name': self.codigo_fts_table
+            }
 
 # Instância global (lazy loading)
 _fts_manager = None
+_fts_manager_lock = threading.Lock()
 
 def get_fts_manager() -> FullTextSearch:
     """Obtém a instância global do FTS manager (lazy loading)"""
     global _fts_manager
     if _fts_manager is None:
-        _fts_manager = FullTextSearch()
+        with _fts_manager_lock:
+            if _fts_manager is None:
+                _fts_manager = FullTextSearch()
+                atexit.register(_fts_manager.close_connections)
     return _fts_manager
 
+def _marcar_conexao_lote(conexao_dbapi, registro, proxy):
+    """Evento `checkout`: anexa `FTS_LOTE_BANCO` se a thread está em modo lote."""
+    if registro.info.get('fts_lote') or not get_fts_manager().em_modo_lote():
+        return
+    conexao_dbapi.execute(f"ATTACH DATABASE ':memory:' AS {FTS_LOTE_BANCO};")
+    registro.info['fts_lote'] = True
+
+
+def _desmarcar_conexao_lote(conexao_dbapi, registro):
+    """Evento `checkin`: a conexão volta ao pool sem a marca do modo lote."""
+    if conexao_dbapi is None or not registro.info.pop('fts_lote', False):
+        return
+    try:
+        conexao_dbapi.execute(f"DETACH DATABASE {FTS_LOTE_BANCO};")
+    except sqlite3.Error as e:
+        logger.warning(f"Falha ao desmarcar conexão do modo lote: {str(e)}")
+        registro.invalidate(e)
+
+
+@contextmanager
+def modo_lote_fts():
+    """
+    Context manager para escritas em massa (importações de CSV).
+
+    Dentro do bloco, nas conexões do SQLAlchemy usadas pela thread atual, os
+    triggers de `aplicacao`/`produto` deixam de reescrever
+    a linha do FTS a cada alteração e só registram o produto em `fts_pendente`;
+    ao sair, cada produto alterado é reindexado uma única vez. Fora do bloco, e
+    nas demais conexões, as edições continuam sendo refletidas imediatamente.
+    """
+    fts_manager = get_fts_manager()
+    ativo = False
+    try:
+        if fts_manager.is_ready():
+            fts_manager.registrar_engine(db.engine)
+            fts_manager.iniciar_modo_lote()
+            ativo = True
+    except Exception as e:
+        logger.error(f"Não foi possível ativar o modo lote do FTS5: {str(e)}")
+    try:
+        yield fts_manager
+    finally:
+        if ativo:
+            fts_manager.finalizar_modo_lote()
+
+
 def init_fts(app):
     """Inicializa o sistema FTS5 com a aplicação Flask"""
     with app.app_context():
         try:
             fts_manager = get_fts_manager()
+            fts_manager.registrar_engine(db.engine)
             if fts_manager.create_fts_table():
                 # Verifica se precisamos popular a tabela
                 stats = fts_manager.get_stats()
                 if stats['exists'] and stats['total_records'] == 0:
                     fts_manager.populate_fts_table()
                     logger.info("Sistema FTS5 inicializado com sucesso")
+                # Índice trigram de códigos (depende das colunas normalizadas)
+                fts_manager.create_codigo_fts_table()
+                # Pendências de um modo lote interrompido (ex: processo encerrado)
+                fts_manager.processar_pendentes()
                 return True
         except Exception as e:
             logger.error(f"Erro ao inicializar FTS5: {str(e)}")
@@ -0,0 +1,438 @@
+"""
+Índice aproximado de códigos ("você quis dizer").
+
+Indexa `Produto.codigo_norm` e os códigos de conversão (`conversoes_norm`) com
+a técnica de deleção simétrica: código e consulta geram as variantes do seu
+prefixo com até DISTANCIA_MAXIMA letras removidas e cada coincidência vira
+candidato, confirmado pela distância de edição (com transposição) sobre o
+código inteiro. O custo da consulta depende do tamanho do código digitado e é
+limitado por MAX_CANDIDATOS, não pelo tamanho do catálogo (com 500 mil códigos
+sintéticos: ~650 MB, p50 ~1,5 ms).
+
+Antes de indexar, caracteres que costumam ser trocados na digitação são
+unificados (O/0, I/L/1), de modo que "AL1O84" encontra "AL-1084" com
+distância zero.
+
+O índice é construído em segundo plano ao subir o servidor e mantido pelos
+eventos do ORM (aplicados no commit), como o autocompletar.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app import db, get_logger
+
+logger = get_logger('fuzzy_codigos')
+
+# Caracteres unificados antes de indexar/consultar.
+_CONFUSOES = str.maketrans({"o": "0", "i": "1", "l": "1"})
+# Só o início do código gera variantes (limita memória e custo da consulta).
+TAMANHO_PREFIXO = 7
+# Distância máxima aceita: 1 para códigos curtos, 2 para os demais.
+DISTANCIA_MAXIMA = 2
+TAMANHO_MINIMO_DISTANCIA_2 = 5
+TAMANHO_MINIMO_CONSULTA = 3
+# Máximo de candidatos verificados por consulta (latência previsível).
+MAX_CANDIDATOS = 1000
+# Itens guardados em tupla antes de virar conjunto (ver `_incluir`).
+MAX_ITENS_TUPLA = 8
+INTERVALO_NOVA_TENTATIVA = 30
+
+
+def _dobrar(codigo_norm: str) -> str:
+    """Código normalizado com os caracteres confundíveis unificados."""
+    return (codigo_norm or "").translate(_CONFUSOES)
+
+
+def _niveis_delecao(texto: str, maximo: int) -> list:
+    """Variantes de `texto` por nível: [{texto}, {1 remoção}, ..., {`maximo` remoções}]."""
+    niveis = [{texto}]
+    for _ in range(maximo):
+        proxima = set()
+        for item in niveis[-1]:
+            for i in range(len(item)):
+                proxima.add(item[:i] + item[i + 1:])
+        niveis.append(proxima - set().union(*niveis))
+    return niveis
+
+
+def _delecoes(texto: str, maximo: int) -> set:
+    """Variantes de `texto` com até `maximo` caracteres removidos (inclui o próprio)."""
+    return set().union(*_niveis_delecao(texto, maximo))
+
+
+def _delecoes_indexadas(codigo: str) -> set:
+    """
+    Variantes indexadas de um código: o prefixo com até DISTANCIA_MAXIMA
+    remoções. Duas remoções só em prefixos de TAMANHO_MINIMO_DISTANCIA_2+
+    caracteres: variantes menores nunca coincidem com as de uma consulta que
+    aceita distância 2.
+    """
+    prefixo = codigo[:TAMANHO_PREFIXO]
+    maximo = DISTANCIA_MAXIMA if len(prefixo) >= TAMANHO_MINIMO_DISTANCIA_2 else 1
+    return _delecoes(prefixo, maximo)
+
+
+def _itens(valor) -> tuple:
+    """Conteúdo de um valor compacto (item único ou conjunto)."""
+    if valor is None:
+        return ()
+    if isinstance(valor, (set, tuple)):
+        return valor
+    return (valor,)
+
+
+def _incluir(mapa: dict, chave, item):
+    """
+    Adiciona `item` em `mapa[chave]`: item puro enquanto for único, tupla até
+    MAX_ITENS_TUPLA itens (bem menor que um conjunto) e conjunto depois disso.
+    """
+    atual = mapa.get(chave)
+    if atual is None:
+        mapa[chave] = item
+    elif isinstance(atual, set):
+        atual.add(item)
+    elif isinstance(atual, tuple):
+        if item not in atual:
+            mapa[chave] = atual + (item,) if len(atual) < MAX_ITENS_TUPLA else {*atual, item}
+    elif atual != item:
+        mapa[chave] = (atual, item)
+
+
+def _excluir(mapa: dict, chave, item) -> bool:
+    """Remove `item` de `mapa[chave]`; retorna True se a chave ficou vazia."""
+    atual = mapa.get(chave)
+    if atual is None:
+        return False
+    if isinstance(atual, set):
+        atual.discard(item)
+        if len(atual) == 1:
+            mapa[chave] = next(iter(atual))
+        return False
+    if isinstance(atual, tuple):
+        restantes = tuple(i for i in atual if i != item)
+        mapa[chave] = restantes[0] if len(restantes) == 1 else restantes
+        return False
+    if atual == item:
+        del mapa[chave]
+        return True
+    return False
+
+
+def distancia_edicao(a: str, b: str, limite: int) -> int:
+    """
+    Distância de Damerau-Levenshtein (transposições adjacentes contam 1).
+    Retorna `limite + 1` assim que a distância certamente ultrapassa o limite.
+    """
+    if abs(len(a) - len(b)) > limite:
+        return limite + 1
+    anterior2 = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        atual = [i] + [0] * len(b)
+        menor = atual[0]
+        for j in range(1, len(b) + 1):
+            custo = 0 if a[i - 1] == b[j - 1] else 1
+            valor = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if (anterior2 is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                valor = min(valor, anterior2[j - 2] + 1)
+            atual[j] = valor
+            menor = min(menor, valor)
+        if menor > limite:
+            return limite + 1
+        anterior2, anterior = anterior, atual
+    return anterior[len(b)]
+
+
+class IndiceCodigosAproximados:
+    """Índice de deleção simétrica sobre os códigos dos produtos (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._app = None
+        # Valores compactos: item único, tupla ou conjunto (a maioria tem um só)
+        self._produtos_por_codigo: Dict[str, Any] = {}
+        self._codigos_por_produto: Dict[int, Any] = {}
+        # Variante do prefixo -> código ou conjunto de códigos
+        self._variantes: Dict[str, Any] = {}
+        self._pronto = False
+        self._construindo = False
+        self._ultima_tentativa = 0.0
+        self._alteracoes_durante_construcao = None
+        self._stats = {
+            'consultas': 0,
+            'tempo_total_us': 0.0,
+            'construido_em': None,
+            'duracao_construcao_ms': None,
+        }
+
+    # --- Estrutura ---
+
+    @staticmethod
+    def _codigos_do_produto(codigo_norm, conversoes_norm) -> tuple:
+        codigos = [codigo_norm] + (conversoes_norm or "").split(",")
+        return tuple(dict.fromkeys(
+            _dobrar(c) for c in codigos if c and len(c) >= TAMANHO_MINIMO_CONSULTA
+        ))
+
+    def _definir_produto(self, produto_id: int, codigos: Optional[tuple]):
+        """Troca os códigos de um produto (None remove o produto)."""
+        for codigo in _itens(self._codigos_por_produto.pop(produto_id, None)):
+            if _excluir(self._produtos_por_codigo, codigo, produto_id):
+                for variante in _delecoes_indexadas(codigo):
+                    _excluir(self._variantes, variante, codigo)
+        if not codigos:
+            return
+        self._codigos_por_produto[produto_id] = codigos[0] if len(codigos) == 1 else codigos
+        for codigo in codigos:
+            if codigo not in self._produtos_por_codigo:
+                for variante in _delecoes_indexadas(codigo):
+                    _incluir(self._variantes, variante, codigo)
+            _incluir(self._produtos_por_codigo, codigo, produto_id)
+
+    # --- Construção e atualização ---
+
+    def construir(self, app=None) -> bool:
+        """Reconstrói o índice a partir do banco."""
+        app = app or self._app
+        with self._lock:
+            if self._construindo:
+                return False
+            self._construindo = True
+            self._ultima_tentativa = time.time()
+            self._alteracoes_durante_construcao = []
+        inicio = time.perf_counter()
+        try:
+            novo = IndiceCodigosAproximados()
+            with app.app_context():
+                linhas = db.session.execute(
+                    db.text("SELECT id, codigo_norm, conversoes_norm FROM produto")
+                )
+                for produto_id, codigo_norm, conversoes_norm in linhas:
+                    novo._definir_produto(produto_id, self._codigos_do_produto(codigo_norm, conversoes_norm))
+                db.session.remove()
+            with self._lock:
+                self._produtos_por_codigo = novo._produtos_por_codigo
+                self._codigos_por_produto = novo._codigos_por_produto
+                self._variantes = novo._variantes
+                for produto_id, codigos in self._alteracoes_durante_construcao or []:
+                    self._definir_produto(produto_id, codigos)
+                self._alteracoes_durante_construcao = None
+                self._pronto = True
+                duracao = (time.perf_counter() - inicio) * 1000
+                self._stats['construido_em'] = time.strftime('%Y-%m-%d %H:%M:%S')
+                self._stats['duracao_construcao_ms'] = round(duracao, 1)
+            logger.info(
+                f"Índice aproximado de códigos construído: {len(self._produtos_por_codigo)} códigos, "
+                f"{len(self._variantes)} variantes em {duracao:.0f} ms"
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Não foi possível construir o índice aproximado de códigos: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._construindo = False
+                self._alteracoes_durante_construcao = None
+
+    def construir_em_segundo_plano(self, app=None):
+        """Dispara `construir` em uma thread daemon."""
+        self._app = app or self._app
+        if self._app is None:
+            return
+        threading.Thread(target=self.construir, name="fuzzy-codigos-build", daemon=True).start()
+
+    def aplicar(self, alteracoes):
+        """Aplica alterações [(produto_id, códigos ou None)] confirmadas no banco."""
+        with self._lock:
+            if self._alteracoes_durante_construcao is not None:
+                self._alteracoes_durante_construcao.extend(alteracoes)
+            if self._pronto:
+                for produto_id, codigos in alteracoes:
+                    self._definir_produto(produto_id, codigos)
+
+    # --- Consulta ---
+
+    def is_ready(self) -> bool:
+        return self._pronto
+
+    def candidatos(self, texto: str, limit: int = 5) -> List[tuple]:
+        """
+        Produtos com código a até DISTANCIA_MAXIMA edições de `texto`:
+        lista de (distância, código dobrado, produto_id), mais próximos primeiro.
+        """
+        from core_utils import _normalize_code_for_search
+
+        inicio = time.perf_counter()
+        consulta = _dobrar(_normalize_code_for_search(texto))
+        if len(consulta) < TAMANHO_MINIMO_CONSULTA:
+            return []
+        limite = DISTANCIA_MAXIMA if len(consulta) >= TAMANHO_MINIMO_DISTANCIA_2 else 1
+
+        with self._lock:
+            # Menos remoções na consulta primeiro: se já houver resultados
+            # suficientes, os níveis seguintes (mais distantes) nem são
+            # consultados. Dentro do nível, os candidatos são ordenados (menos
+            # remoções no código, tamanho mais próximo) antes do corte em
+            # MAX_CANDIDATOS, para que o corte descarte os menos prováveis.
+            resultado = []
+            verificados = set()
+            for nivel in _niveis_delecao(consulta[:TAMANHO_PREFIXO], limite):
+                do_nivel = {}
+                for variante in nivel:
+                    for codigo in _itens(self._variantes.get(variante)):
+                        if codigo in verificados:
+                            continue
+                        remocoes = len(codigo[:TAMANHO_PREFIXO]) - len(variante)
+                        if remocoes < do_nivel.get(codigo, remocoes + 1):
+                            do_nivel[codigo] = remocoes
+                ordem = sorted(
+                    do_nivel,
+                    key=lambda c: (do_nivel[c], abs(len(c) - len(consulta)), c),
+                )
+                for codigo in ordem[:MAX_CANDIDATOS - len(verificados)]:
+                    verificados.add(codigo)
+                    distancia = distancia_edicao(consulta, codigo, limite)
+                    if distancia <= limite:
+                        for produto_id in _itens(self._produtos_por_codigo.get(codigo)):
+                            resultado.append((distancia, codigo, produto_id))
+                if len(resultado) >= limit or len(verificados) >= MAX_CANDIDATOS:
+                    break
+            resultado.sort()
+
+            self._stats['consultas'] += 1
+            self._stats['tempo_total_us'] += (time.perf_counter() - inicio) * 1_000_000
+        return resultado[:limit]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self._stats['consultas']
+            return {
+                'pronto': self._pronto,
+                'construindo': self._construindo,
+                'codigos': len(self._produtos_por_codigo),
+                'produtos': len(self._codigos_por_produto),
+                'variantes': len(self._variantes),
+                'construido_em': self._stats['construido_em'],
+                'duracao_construcao_ms': self._stats['duracao_construcao_ms'],
+                'consultas': consultas,
+                'tempo_medio_us': round(self._stats['tempo_total_us'] / consultas, 1) if consultas else 0.0,
+            }
+
+
+# Instância global (lazy loading)
+_indice = None
+_indice_lock = threading.Lock()
+_eventos_registrados = False
+
+
+def get_indice_codigos() -> IndiceCodigosAproximados:
+    """Obtém a instância global do índice aproximado de códigos."""
+    global _indice
+    if _indice is None:
+        with _indice_lock:
+            if _indice is None:
+                _indice = IndiceCodigosAproximados()
+    return _indice
+
+
+def sugerir_codigos(texto: str, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    "Você quis dizer": produtos cujo código (ou conversão) está a poucas
+    edições de `texto`. Vazio enquanto o índice não está pronto (a construção
+    é disparada em segundo plano).
+    """
+    indice = get_indice_codigos()
+    if not indice.is_ready():
+        if not indice._construindo and time.time() - indice._ultima_tentativa > INTERVALO_NOVA_TENTATIVA:
+            indice.construir_em_segundo_plano()
+        return []
+
+    # Busca alguns a mais para preferir, na mesma distância, o código do próprio produto
+    candidatos = indice.candidatos(texto, limit * 3)
+    if not candidatos:
+        return []
+
+    from models import Produto
+    produtos = {
+        p.id: p for p in Produto.query.filter(Produto.id.in_([c[2] for c in candidatos]))
+    }
+    sugestoes = []
+    for distancia, codigo, produto_id in candidatos:
+        produto = produtos.get(produto_id)
+        if produto is None:
+            continue
+        sugestoes.append({
+            'produto_id': produto.id,
+            'codigo': produto.codigo,
+            'nome': produto.nome,
+            'distancia': distancia,
+            'via_conversao': _dobrar(produto.codigo_norm) != codigo,
+        })
+    sugestoes.sort(key=lambda s: (s['distancia'], s['via_conversao']))
+    return sugestoes[:limit]
+
+
+def _registrar_eventos():
+    """Eventos do ORM que mantêm o índice atualizado após cada commit."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    from sqlalchemy import event, inspect
+    from sqlalchemy.orm import Session, object_session
+    from models import Produto
+
+    def _pendentes(target):
+        session = object_session(target)
+        if session is None:
+            return None
+        return session.info.setdefault('fuzzy_codigos_pendentes', [])
+
+    def _ao_inserir(mapper, connection, target):
+        pendentes = _pendentes(target)
+        if pendentes is not None:
+            pendentes.append((
+                target.id,
+                IndiceCodigosAproximados._codigos_do_produto(target.codigo_norm, target.conversoes_norm),
+            ))
+
+    def _ao_atualizar(mapper, connection, target):
+        estado = inspect(target)
+        if (estado.attrs.codigo_norm.history.has_changes()
+                or estado.attrs.conversoes_norm.history.has_changes()):
+            _ao_inserir(mapper, connection, target)
+
+    def _ao_excluir(mapper, connection, target):
+        pendentes = _pendentes(target)
+        if pendentes is not None:
+            pendentes.append((target.id, None))
+
+    event.listen(Produto, "after_insert", _ao_inserir)
+    event.listen(Produto, "after_update", _ao_atualizar)
+    event.listen(Produto, "after_delete", _ao_excluir)
+
+    @event.listens_for(Session, "after_commit")
+    def _aplicar_no_commit(session):
+        pendentes = session.info.pop('fuzzy_codigos_pendentes', None)
+        if pendentes:
+            get_indice_codigos().aplicar(pendentes)
+
+    @event.listens_for(Session, "after_rollback")
+    def _descartar_no_rollback(session):
+        session.info.pop('fuzzy_codigos_pendentes', None)
+
+    _eventos_registrados = True
+
+
+def init_fuzzy_codigos(app):
+    """Registra os eventos do ORM (não acessa o banco)."""
+    get_indice_codigos()._app = app
+    _registrar_eventos()
+
+
+def precarregar_fuzzy_codigos(app):
+    """Constrói o índice em segundo plano ao subir o servidor."""
+    if app.config.get('FUZZY_CODIGOS_PRECARREGAR', True):
+        get_indice_codigos().construir_em_segundo_plano(app)
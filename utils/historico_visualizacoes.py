@@ -0,0 +1,201 @@
+"""
+Histórico de visualizações com gravação adiada (write-behind).
+
+A página de detalhes só registra o evento em um buffer na memória; uma
+thread grava o buffer a cada INTERVALO_GRAVACAO segundos ou assim que ele
+chega a TAMANHO_LOTE eventos, pela fila de escrita (utils/fila_escrita.py):
+um INSERT com todas as linhas e um único DELETE que mantém só as
+VISUALIZACOES_MANTIDAS mais recentes de cada par usuário/produto gravado.
+O buffer é esvaziado ao encerrar o processo.
+
+Sem a thread (CLI, testes), cada evento é gravado na hora.
+"""
+
+import atexit
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from app import db, get_logger
+
+logger = get_logger('historico_visualizacoes')
+
+# Segundos entre gravações / eventos que disparam uma gravação antecipada
+INTERVALO_GRAVACAO = 5
+TAMANHO_LOTE = 200
+# Eventos guardados no máximo; acima disso os mais antigos são descartados
+LIMITE_BUFFER = 10000
+VISUALIZACOES_MANTIDAS = 5
+
+
+def gravar_visualizacoes(eventos: List[Dict[str, Any]]) -> int:
+    """
+    Insere os eventos e poda o histórico dos pares usuário/produto tocados.
+    Usa a sessão atual sem commit (tarefa da fila de escrita).
+    """
+    from models_favoritos import HistoricoVisualizacao
+
+    if not eventos:
+        return 0
+    tabela = HistoricoVisualizacao.__table__
+    conexao = db.session.connection()
+    conexao.execute(insert(tabela), eventos)
+
+    pares = list({(e['user_id'], e['produto_id']) for e in eventos})
+    # Junção com uma lista VALUES (e não `(user_id, produto_id) IN (...)` nem
+    # um OR por par, que estoura a profundidade de expressão do SQLite): o
+    # SQLite busca cada par no índice em vez de percorrer a tabela
+    valores = ", ".join(f"(:u{i}, :p{i})" for i in range(len(pares)))
+    parametros = {"manter": VISUALIZACOES_MANTIDAS}
+    for i, (user_id, produto_id) in enumerate(pares):
+        parametros[f"u{i}"] = user_id
+        parametros[f"p{i}"] = produto_id
+    conexao.execute(
+        db.text(f"""
+            DELETE FROM historico_visualizacao WHERE id IN (
+                SELECT id FROM (
+                    SELECT h.id, ROW_NUMBER() OVER (
+                        PARTITION BY h.user_id, h.produto_id
+                        ORDER BY h.visualizado_em DESC, h.id DESC
+                    ) AS posicao
+                    FROM (VALUES {valores}) AS pares
+                    JOIN historico_visualizacao h
+                        ON h.user_id = pares.column1 AND h.produto_id = pares.column2
+                )
+                WHERE posicao > :manter
+            )
+        """),
+        parametros,
+    )
+    return len(eventos)
+
+
+class BufferVisualizacoes:
+    """Buffer de eventos de visualização com thread de gravação periódica."""
+
+    def __init__(self, app, intervalo: float = INTERVALO_GRAVACAO, tamanho_lote: int = TAMANHO_LOTE):
+        self.app = app
+        self.intervalo = intervalo
+        self.tamanho_lote = tamanho_lote
+        self._eventos: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._aviso = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="historico-visualizacoes", daemon=True)
+        self._stats = {'registradas': 0, 'gravadas': 0, 'gravacoes': 0, 'descartadas': 0}
+
+    def iniciar(self):
+        self._thread.start()
+
+    def ativo(self) -> bool:
+        return self._thread.is_alive()
+
+    def registrar(self, user_id: int, produto_id: int, origem: str = 'web'):
+        """Guarda o evento; não acessa o banco."""
+        evento = {
+            'user_id': user_id,
+            'produto_id': produto_id,
+            'origem': origem,
+            'visualizado_em': datetime.utcnow(),
+        }
+        with self._lock:
+            self._eventos.append(evento)
+            self._stats['registradas'] += 1
+            excesso = len(self._eventos) - LIMITE_BUFFER
+            if excesso > 0:
+                del self._eventos[:excesso]
+                self._stats['descartadas'] += excesso
+            cheio = len(self._eventos) >= self.tamanho_lote
+        if cheio:
+            self._aviso.set()
+
+    def gravar(self) -> int:
+        """Grava tudo o que está no buffer; retorna quantos eventos gravou."""
+        from utils.fila_escrita import executar_escrita
+
+        with self._lock:
+            eventos, self._eventos = self._eventos, []
+        total = 0
+        for i in range(0, len(eventos), self.tamanho_lote):
+            lote = eventos[i:i + self.tamanho_lote]
+            try:
+                with self.app.app_context():
+                    total += executar_escrita(lambda lote=lote: gravar_visualizacoes(lote))
+            except Exception as e:
+                logger.warning(f"Falha ao gravar {len(lote)} visualizações: {e}")
+                with self._lock:
+                    self._stats['descartadas'] += len(lote)
+        if total:
+            with self._lock:
+                self._stats['gravadas'] += total
+                self._stats['gravacoes'] += 1
+        return total
+
+    def parar(self, timeout: float = 10):
+        """Encerra a thread gravando o que restou no buffer."""
+        if not self.ativo():
+            return
+        self._parar.set()
+        self._aviso.set()
+        self._thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'ativo': self.ativo(), 'no_buffer': len(self._eventos)})
+        return stats
+
+    def _executar(self):
+        while not self._parar.is_set():
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            self.gravar()
+        self.gravar()
+
+
+_buffer: Optional[BufferVisualizacoes] = None
+_buffer_lock = threading.Lock()
+
+
+def registrar_visualizacao_produto(user_id: int, produto_id: int, origem: str = 'web'):
+    """Registra uma visualização: no buffer, ou direto no banco sem a thread."""
+    buffer = _buffer
+    if buffer is not None and buffer.ativo():
+        buffer.registrar(user_id, produto_id, origem)
+        return
+    from utils.fila_escrita import enviar_escrita
+
+    evento = {
+        'user_id': user_id,
+        'produto_id': produto_id,
+        'origem': origem,
+        'visualizado_em': datetime.utcnow(),
+    }
+    enviar_escrita(lambda: gravar_visualizacoes([evento]))
+
+
+def get_historico_visualizacoes_stats() -> Dict[str, Any]:
+    buffer = _buffer
+    if buffer is None:
+        return {'ativo': False}
+    return buffer.get_stats()
+
+
+def iniciar_historico_visualizacoes(app):
+    """
+    Inicia a thread de gravação. Chamado ao subir o servidor, depois de
+    `iniciar_fila_escrita` (o buffer é esvaziado antes de a fila parar).
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = BufferVisualizacoes(
+                app,
+                intervalo=app.config.get('HISTORICO_INTERVALO_GRAVACAO', INTERVALO_GRAVACAO),
+                tamanho_lote=app.config.get('HISTORICO_TAMANHO_LOTE', TAMANHO_LOTE),
+            )
+            _buffer.iniciar()
+            # atexit executa em ordem inversa: este roda antes do parar() da fila
+            atexit.register(_buffer.parar)
@@ -7,6 +7,7 @@ from core_utils import _normalize_for_search
 
 from ..app import db
 from ..models import Aplicacao, Produto
+from .fts_search import modo_lote_fts
 
 
 def _parse_e_salvar_aplicacoes(
@@ -78,7 +79,7 @@ def _parse_e_salvar_aplicacoes(
 
 def importar_csv_logic(app, filepath):
     """Lógica principal para importar produtos de um arquivo CSV."""
-    with app.app_context():
+    with app.app_context(), modo_lote_fts():
         produtos_adicionados = 0
         produtos_atualizados = 0
         print(f"Iniciando importação de '{filepath}'...")
@@ -0,0 +1,542 @@
+"""
+Manutenção periódica do banco SQLite.
+
+Tarefas (na ordem em que rodam):
+
+- `retencao`: apaga em lotes o histórico de visualizações e as
+  recomendações expiradas mais antigos que MANUTENCAO_RETENCAO_DIAS, e o
+  próprio registro de manutenção antigo;
+- `fts`: liga o automerge e funde os segmentos dos índices FTS5 aos poucos
+  (comando `merge`), até não sobrar trabalho ou acabar o orçamento;
+- `analyze`: `ANALYZE` com `analysis_limit` (estatísticas para o planejador);
+- `optimize`: `PRAGMA optimize`;
+- `incremental_vacuum`: devolve ao sistema as páginas livres (só com
+  `auto_vacuum=INCREMENTAL`; converter com `run.py maintain --vacuum`);
+- `wal_checkpoint`: copia o WAL para o banco e o trunca.
+
+No servidor, uma thread verifica a cada VERIFICACAO segundos quais tarefas
+venceram (intervalos em MANUTENCAO_INTERVALOS) e só as executa com o servidor
+ocioso: nenhuma requisição em andamento e nenhuma nos últimos
+MANUTENCAO_OCIOSO_SEGUNDOS. Uma tarefa atrasada mais de ATRASO_MAXIMO vezes o
+intervalo roda mesmo assim. Cada tarefa tem um orçamento de tempo
+(MANUTENCAO_ORCAMENTO_SEGUNDOS); as que trabalham em lotes param ao
+estourá-lo ("parcial") e continuam na próxima janela ociosa.
+
+As escritas passam pela fila de escrita (utils/fila_escrita.py), um lote por
+transação, para não segurar a trava do banco. Cada execução é gravada em
+`manutencao_execucao` com a duração e os bytes liberados.
+"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from app import db, get_logger
+
+logger = get_logger('manutencao')
+
+TAREFAS = ('retencao', 'fts', 'analyze', 'optimize', 'incremental_vacuum', 'wal_checkpoint')
+
+# Intervalo padrão (s) entre execuções de cada tarefa; 0 desliga
+INTERVALOS_PADRAO = {
+    'retencao': 6 * 3600,
+    'fts': 6 * 3600,
+    'analyze': 24 * 3600,
+    'optimize': 3600,
+    'incremental_vacuum': 24 * 3600,
+    'wal_checkpoint': 15 * 60,
+}
+OCIOSO_PADRAO = 60
+ORCAMENTO_PADRAO = 5
+RETENCAO_DIAS_PADRAO = 90
+# Segundos entre verificações da thread
+VERIFICACAO = 30
+ATRASO_MAXIMO = 3
+
+LOTE_RETENCAO = 2000
+PAGINAS_MERGE_FTS = 200
+PAGINAS_VACUUM = 1000
+# Linhas amostradas por índice no ANALYZE (PRAGMA analysis_limit)
+LIMITE_ANALISE = 1000
+
+TABELAS_FTS = ('produtos_fts', 'produtos_codigo_fts')
+
+# (tabela, condição) apagadas pela retenção; `:limite` é a data de corte
+_RETENCAO = (
+    ('historico_visualizacao', 'visualizado_em < :limite'),
+    ('produto_recomendado', 'expirado = 1 OR criado_em < :limite'),
+    ('manutencao_execucao', 'iniciado_em < :limite'),
+)
+
+
+# ----- Atividade do servidor -----
+
+class _Atividade:
+    """Conta requisições em andamento e a hora da última."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_andamento = 0
+        self._ultima = time.monotonic()
+
+    def inicio(self):
+        with self._lock:
+            self._em_andamento += 1
+
+    def fim(self):
+        with self._lock:
+            self._em_andamento = max(0, self._em_andamento - 1)
+            self._ultima = time.monotonic()
+
+    def ocioso(self, segundos: float) -> bool:
+        with self._lock:
+            return self._em_andamento == 0 and time.monotonic() - self._ultima >= segundos
+
+
+_atividade = _Atividade()
+
+
+def init_manutencao(app):
+    """Registra os ganchos que medem a atividade do servidor."""
+    from flask import g
+
+    @app.before_request
+    def _marcar_inicio_requisicao():
+        g._manutencao_contada = True
+        _atividade.inicio()
+
+    @app.teardown_request
+    def _marcar_fim_requisicao(exc):
+        if g.pop('_manutencao_contada', False):
+            _atividade.fim()
+
+
+# ----- Auxiliares -----
+
+def _caminho_banco() -> Optional[str]:
+    return db.engine.url.database
+
+
+def _tamanho_arquivo(caminho: Optional[str]) -> int:
+    try:
+        return os.path.getsize(caminho) if caminho else 0
+    except OSError:
+        return 0
+
+
+def _pragma(nome: str):
+    with db.engine.connect() as conexao:
+        return conexao.exec_driver_sql(f"PRAGMA {nome}").scalar()
+
+
+def _bytes_livres() -> int:
+    """Bytes em páginas livres dentro do arquivo."""
+    return (_pragma('freelist_count') or 0) * (_pragma('page_size') or 0)
+
+
+def _tabela_existe(nome: str) -> bool:
+    with db.engine.connect() as conexao:
+        return conexao.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (nome,)
+        ).first() is not None
+
+
+def _resultado(status: str = 'ok', bytes_recuperados: int = 0, **detalhes) -> Dict[str, Any]:
+    return {'status': status, 'bytes_recuperados': max(0, int(bytes_recuperados)), 'detalhes': detalhes}
+
+
+class _Orcamento:
+    def __init__(self, segundos: Optional[float]):
+        self.segundos = segundos
+        self._inicio = time.perf_counter()
+
+    def esgotado(self) -> bool:
+        return self.segundos is not None and time.perf_counter() - self._inicio >= self.segundos
+
+
+# ----- Tarefas -----
+
+def _tarefa_retencao(orcamento: _Orcamento, ocioso: bool, retencao_dias: int = RETENCAO_DIAS_PADRAO):
+    from utils.fila_escrita import executar_escrita
+
+    # Mesmo formato em que o SQLAlchemy grava DateTime no SQLite
+    limite = (datetime.utcnow() - timedelta(days=retencao_dias)).strftime('%Y-%m-%d %H:%M:%S.%f')
+    livres_antes = _bytes_livres()
+    apagadas = {}
+    completo = True
+    for tabela, condicao in _RETENCAO:
+        if not _tabela_existe(tabela):
+            continue
+        # Em ordem de id: as linhas antigas ficam no começo da tabela, então
+        # cada lote para de ler logo depois das linhas que apaga
+        sql = db.text(
+            f"DELETE FROM {tabela} WHERE id IN ("
+            f" SELECT id FROM {tabela} WHERE {condicao} ORDER BY id LIMIT :lote)"
+        )
+        total = 0
+        while True:
+            if orcamento.esgotado():
+                completo = False
+                break
+            removidas = executar_escrita(
+                lambda: db.session.execute(sql, {'limite': limite, 'lote': LOTE_RETENCAO}).rowcount
+            )
+            total += removidas
+            if removidas < LOTE_RETENCAO:
+                break
+        apagadas[tabela] = total
+        if not completo:
+            break
+    return _resultado(
+        'ok' if completo else 'parcial',
+        _bytes_livres() - livres_antes,
+        dias=retencao_dias,
+        apagadas=apagadas,
+    )
+
+
+def _fundir_segmentos_fts(tabela: str) -> int:
+    """Um passo do `merge`; retorna quantas linhas mudaram (< 2: nada a fundir)."""
+    conexao = db.session.connection()
+    antes = conexao.exec_driver_sql("SELECT total_changes()").scalar()
+    conexao.exec_driver_sql(
+        f"INSERT INTO {tabela}({tabela}, rank) VALUES ('merge', ?)", (-PAGINAS_MERGE_FTS,)
+    )
+    return conexao.exec_driver_sql("SELECT total_changes()").scalar() - antes
+
+
+def _tarefa_fts(orcamento: _Orcamento, ocioso: bool, **_):
+    from utils.fila_escrita import executar_escrita
+
+    livres_antes = _bytes_livres()
+    passos = {}
+    completo = True
+    for tabela in TABELAS_FTS:
+        if not _tabela_existe(tabela):
+            continue
+        # Automerge padrão do FTS5; gravado na tabela, vale para as próximas escritas
+        executar_escrita(lambda: db.session.connection().exec_driver_sql(
+            f"INSERT INTO {tabela}({tabela}, rank) VALUES ('automerge', 8)"
+        ))
+        n = 0
+        while True:
+            if orcamento.esgotado():
+                completo = False
+                break
+            n += 1
+            if executar_escrita(lambda: _fundir_segmentos_fts(tabela)) < 2:
+                break
+        passos[tabela] = n
+        if not completo:
+            break
+    return _resultado('ok' if completo else 'parcial', _bytes_livres() - livres_antes, passos_merge=passos)
+
+
+def _tarefa_analyze(orcamento: _Orcamento, ocioso: bool, **_):
+    from utils.fila_escrita import executar_escrita
+
+    def analisar():
+        conexao = db.session.connection()
+        conexao.exec_driver_sql(f"PRAGMA analysis_limit = {LIMITE_ANALISE}")
+        conexao.exec_driver_sql("ANALYZE")
+        return conexao.exec_driver_sql("SELECT COUNT(DISTINCT tbl) FROM sqlite_stat1").scalar()
+
+    return _resultado(tabelas=executar_escrita(analisar))
+
+
+def _tarefa_optimize(orcamento: _Orcamento, ocioso: bool, **_):
+    from utils.fila_escrita import executar_escrita
+
+    def otimizar():
+        conexao = db.session.connection()
+        conexao.exec_driver_sql(f"PRAGMA analysis_limit = {LIMITE_ANALISE}")
+        conexao.exec_driver_sql("PRAGMA optimize")
+
+    executar_escrita(otimizar)
+    return _resultado()
+
+
+def _liberar_paginas():
+    # O pragma libera uma página por linha lida do resultado (linhas sem
+    # colunas, que o SQLAlchemy não entrega): lê pelo cursor do driver
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA incremental_vacuum({PAGINAS_VACUUM})")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def _tarefa_incremental_vacuum(orcamento: _Orcamento, ocioso: bool, **_):
+    from utils.fila_escrita import executar_escrita
+
+    modo = _pragma('auto_vacuum')
+    if modo != 2:
+        return _resultado('ignorada', auto_vacuum=modo, paginas_livres=_pragma('freelist_count'))
+    livres_antes = _bytes_livres()
+    completo = True
+    while _pragma('freelist_count'):
+        if orcamento.esgotado():
+            completo = False
+            break
+        executar_escrita(_liberar_paginas)
+    return _resultado('ok' if completo else 'parcial', livres_antes - _bytes_livres())
+
+
+def _tarefa_wal_checkpoint(orcamento: _Orcamento, ocioso: bool, **_):
+    if str(_pragma('journal_mode')).lower() != 'wal':
+        return _resultado('ignorada', journal_mode=_pragma('journal_mode'))
+    wal = f"{_caminho_banco()}-wal"
+    tamanho_antes = _tamanho_arquivo(wal)
+    # TRUNCATE espera leitores e escritores; com o servidor em uso, só PASSIVE
+    modo = 'TRUNCATE' if ocioso else 'PASSIVE'
+    with db.engine.connect() as conexao:
+        ocupado, paginas_wal, copiadas = conexao.exec_driver_sql(f"PRAGMA wal_checkpoint({modo})").one()
+    return _resultado(
+        'ok' if not ocupado else 'parcial',
+        tamanho_antes - _tamanho_arquivo(wal),
+        modo=modo,
+        paginas_wal=paginas_wal,
+        paginas_copiadas=copiadas,
+    )
+
+
+_FUNCOES = {
+    'retencao': _tarefa_retencao,
+    'fts': _tarefa_fts,
+    'analyze': _tarefa_analyze,
+    'optimize': _tarefa_optimize,
+    'incremental_vacuum': _tarefa_incremental_vacuum,
+    'wal_checkpoint': _tarefa_wal_checkpoint,
+}
+
+
+# ----- Execução e registro -----
+
+def _registrar(tarefa: str, iniciado_em: datetime, duracao_ms: int, resultado: Dict[str, Any]):
+    import json
+
+    from models import ManutencaoExecucao
+    from utils.fila_escrita import executar_escrita
+
+    registro = dict(
+        tarefa=tarefa,
+        iniciado_em=iniciado_em,
+        duracao_ms=duracao_ms,
+        bytes_recuperados=resultado['bytes_recuperados'],
+        status=resultado['status'],
+        detalhes=json.dumps(resultado['detalhes'], ensure_ascii=False, default=str),
+    )
+    try:
+        executar_escrita(lambda: db.session.add(ManutencaoExecucao(**registro)))
+    except Exception as e:
+        logger.warning(f"Não foi possível registrar a manutenção '{tarefa}': {e}")
+
+
+def executar_tarefa(tarefa: str, orcamento: Optional[float] = ORCAMENTO_PADRAO, ocioso: bool = True,
+                    retencao_dias: int = RETENCAO_DIAS_PADRAO) -> Dict[str, Any]:
+    """
+    Executa uma tarefa e grava a execução. `orcamento` em segundos (None =
+    sem limite); `ocioso=False` evita operações que esperam pelos leitores.
+    """
+    if tarefa not in _FUNCOES:
+        raise ValueError(f"Tarefa de manutenção desconhecida: {tarefa}")
+    iniciado_em = datetime.utcnow()
+    inicio = time.perf_counter()
+    try:
+        resultado = _FUNCOES[tarefa](_Orcamento(orcamento), ocioso, retencao_dias=retencao_dias)
+    except Exception as e:
+        logger.error(f"Erro na manutenção '{tarefa}': {e}")
+        resultado = _resultado('erro', erro=str(e))
+    duracao_ms = int((time.perf_counter() - inicio) * 1000)
+    _registrar(tarefa, iniciado_em, duracao_ms, resultado)
+    logger.info(
+        f"Manutenção '{tarefa}': {resultado['status']} em {duracao_ms} ms, "
+        f"{resultado['bytes_recuperados']} bytes liberados"
+    )
+    return dict(resultado, tarefa=tarefa, duracao_ms=duracao_ms)
+
+
+def executar_manutencao(tarefas: Optional[Iterable[str]] = None, orcamento: Optional[float] = None,
+                        retencao_dias: int = RETENCAO_DIAS_PADRAO) -> List[Dict[str, Any]]:
+    """Executa agora as tarefas pedidas (todas por padrão), na ordem de TAREFAS."""
+    pedidas = set(tarefas or TAREFAS)
+    desconhecidas = pedidas - set(TAREFAS)
+    if desconhecidas:
+        raise ValueError(f"Tarefas de manutenção desconhecidas: {', '.join(sorted(desconhecidas))}")
+    return [
+        executar_tarefa(tarefa, orcamento, retencao_dias=retencao_dias)
+        for tarefa in TAREFAS if tarefa in pedidas
+    ]
+
+
+def converter_para_vacuum_incremental() -> Dict[str, Any]:
+    """
+    Liga `auto_vacuum=INCREMENTAL` e reescreve o banco com VACUUM. Reescreve o
+    arquivo inteiro e bloqueia o banco: só pela linha de comando, com o
+    servidor parado.
+    """
+    caminho = _caminho_banco()
+    tamanho_antes = _tamanho_arquivo(caminho)
+    iniciado_em = datetime.utcnow()
+    inicio = time.perf_counter()
+    with db.engine.connect() as conexao:
+        conexao.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conexao.exec_driver_sql("VACUUM")
+    resultado = _resultado('ok', tamanho_antes - _tamanho_arquivo(caminho), auto_vacuum=_pragma('auto_vacuum'))
+    duracao_ms = int((time.perf_counter() - inicio) * 1000)
+    _registrar('vacuum', iniciado_em, duracao_ms, resultado)
+    return dict(resultado, tarefa='vacuum', duracao_ms=duracao_ms)
+
+
+def get_manutencao_stats() -> Dict[str, Any]:
+    """Última execução de cada tarefa (para o dashboard)."""
+    from models import ManutencaoExecucao
+
+    sub = (
+        db.session.query(ManutencaoExecucao.tarefa, db.func.max(ManutencaoExecucao.id).label('id'))
+        .group_by(ManutencaoExecucao.tarefa)
+        .subquery()
+    )
+    ultimas = (
+        ManutencaoExecucao.query.join(sub, ManutencaoExecucao.id == sub.c.id)
+        .order_by(ManutencaoExecucao.tarefa)
+        .all()
+    )
+    return {
+        'ativa': _agendador is not None and _agendador.ativo(),
+        'ultimas': [
+            {
+                'tarefa': e.tarefa,
+                'iniciado_em': e.iniciado_em,
+                'duracao_ms': e.duracao_ms,
+                'bytes_recuperados': e.bytes_recuperados,
+                'status': e.status,
+            }
+            for e in ultimas
+        ],
+    }
+
+
+# ----- Agendador -----
+
+def _ler_intervalos(texto: str) -> Dict[str, float]:
+    """'tarefa=segundos,...' sobre os intervalos padrão."""
+    intervalos = dict(INTERVALOS_PADRAO)
+    for item in filter(None, (parte.strip() for parte in (texto or '').split(','))):
+        nome, _, valor = item.partition('=')
+        nome = nome.strip()
+        try:
+            if nome not in intervalos:
+                raise ValueError(nome)
+            intervalos[nome] = float(valor)
+        except ValueError:
+            logger.warning(f"MANUTENCAO_INTERVALOS: item inválido ignorado: {item!r}")
+    return intervalos
+
+
+class AgendadorManutencao:
+    """Thread que executa as tarefas vencidas nas janelas ociosas."""
+
+    def __init__(self, app, intervalos: Dict[str, float], ocioso: float = OCIOSO_PADRAO,
+                 orcamento: float = ORCAMENTO_PADRAO, retencao_dias: int = RETENCAO_DIAS_PADRAO):
+        self.app = app
+        self.intervalos = intervalos
+        self.ocioso = ocioso
+        self.orcamento = orcamento
+        self.retencao_dias = retencao_dias
+        # Hora (epoch) da última execução de cada tarefa
+        self._ultima: Dict[str, float] = {}
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="manutencao", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def ativo(self) -> bool:
+        return self._thread.is_alive()
+
+    def parar(self, timeout: float = 10):
+        if not self.ativo():
+            return
+        self._parar.set()
+        self._thread.join(timeout)
+
+    def _carregar_ultimas(self):
+        """Retoma o calendário a partir das execuções já gravadas."""
+        from models import ManutencaoExecucao
+
+        linhas = (
+            db.session.query(ManutencaoExecucao.tarefa, db.func.max(ManutencaoExecucao.iniciado_em))
+            .filter(ManutencaoExecucao.status != 'parcial')
+            .group_by(ManutencaoExecucao.tarefa)
+            .all()
+        )
+        self._ultima = {
+            tarefa: quando.replace(tzinfo=timezone.utc).timestamp()
+            for tarefa, quando in linhas if quando is not None
+        }
+        # Tarefa nunca executada: vencida agora, mas não atrasada (espera ociosidade)
+        agora = time.time()
+        for tarefa, intervalo in self.intervalos.items():
+            if intervalo:
+                self._ultima.setdefault(tarefa, agora - intervalo)
+
+    def executar_pendentes(self):
+        for tarefa in TAREFAS:
+            if self._parar.is_set():
+                return
+            intervalo = self.intervalos.get(tarefa)
+            if not intervalo:
+                continue
+            atraso = time.time() - self._ultima.get(tarefa, 0)
+            if atraso < intervalo:
+                continue
+            ocioso = _atividade.ocioso(self.ocioso)
+            if not ocioso and atraso < intervalo * ATRASO_MAXIMO:
+                continue
+            resultado = executar_tarefa(tarefa, self.orcamento, ocioso, self.retencao_dias)
+            # Parcial: continua na próxima janela ociosa
+            self._ultima[tarefa] = time.time() - (intervalo if resultado['status'] == 'parcial' else 0)
+
+    def _executar(self):
+        try:
+            with self.app.app_context():
+                self._carregar_ultimas()
+        except Exception as e:
+            logger.warning(f"Não foi possível ler o histórico de manutenção: {e}")
+        while not self._parar.wait(VERIFICACAO):
+            try:
+                with self.app.app_context():
+                    self.executar_pendentes()
+            except Exception as e:
+                logger.error(f"Erro no agendador de manutenção: {e}")
+
+
+_agendador: Optional[AgendadorManutencao] = None
+_agendador_lock = threading.Lock()
+
+
+def iniciar_manutencao(app):
+    """
+    Inicia o agendador (config `MANUTENCAO_ATIVA`). Chamado ao subir o
+    servidor, depois de `iniciar_fila_escrita`.
+    """
+    global _agendador
+    if not app.config.get('MANUTENCAO_ATIVA', True):
+        return
+    with _agendador_lock:
+        if _agendador is None:
+            _agendador = AgendadorManutencao(
+                app,
+                _ler_intervalos(app.config.get('MANUTENCAO_INTERVALOS', '')),
+                ocioso=app.config.get('MANUTENCAO_OCIOSO_SEGUNDOS', OCIOSO_PADRAO),
+                orcamento=app.config.get('MANUTENCAO_ORCAMENTO_SEGUNDOS', ORCAMENTO_PADRAO),
+                retencao_dias=app.config.get('MANUTENCAO_RETENCAO_DIAS', RETENCAO_DIAS_PADRAO),
+            )
+            _agendador.iniciar()
+            # atexit executa em ordem inversa: este para antes da fila de escrita
+            atexit.register(_agendador.parar)
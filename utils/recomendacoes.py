@@ -0,0 +1,327 @@
+"""
+Recomendações item a item por coocorrência ("quem viu isto também viu").
+
+Fora das requisições, `atualizar_recomendacoes` lê o que entrou desde a
+última execução em `historico_visualizacao` e `item_lista_favoritos` e soma
+à matriz esparsa `produto_coocorrencia` (a soma é agregada no próprio SQLite,
+sem trazer os pares para o Python):
+- duas visualizações do mesmo usuário com até JANELA_SESSAO_HORAS de diferença
+  contam PESO_VISUALIZACAO para o par;
+- dois produtos na mesma lista de favoritos contam PESO_FAVORITO.
+Depois recalcula, só para os produtos cuja linha mudou, os
+VIZINHOS_POR_PRODUTO vizinhos de maior similaridade de cosseno
+(c_ab / sqrt(c_aa * c_bb)) em `produto_vizinho`.
+
+Na requisição, `recomendar_para_usuario` só lê os vizinhos dos produtos
+vistos e favoritados pelo usuário e combina as listas.
+"""
+
+import heapq
+import math
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam
+
+from app import db, get_logger
+
+logger = get_logger('recomendacoes')
+
+JANELA_SESSAO_HORAS = 2
+PESO_VISUALIZACAO = 1.0
+PESO_FAVORITO = 2.0
+VIZINHOS_POR_PRODUTO = 20
+# Linhas novas de histórico (ou de listas) lidas por transação
+TAMANHO_LOTE_FONTE = 5000
+TAMANHO_LOTE_IDS = 200
+# Produtos do usuário usados como sementes na hora de recomendar
+SEMENTES_VISUALIZACAO = 20
+SEMENTES_FAVORITOS = 20
+
+# Índice (user_id, visualizado_em) usado na janela de sessão; sem ANALYZE o
+# SQLite prefere o índice de poda, que não serve para o intervalo de datas
+INDICE_SESSAO = "ix_historico_visualizacao_usuario_data"
+
+_FONTES = {
+    # chave da marca d'água: (tabela, SQL dos pares novos, peso)
+    'historico_visualizacao': (
+        "historico_visualizacao",
+        f"""
+        SELECT n.produto_id, o.produto_id
+        FROM historico_visualizacao n
+        JOIN historico_visualizacao o INDEXED BY {INDICE_SESSAO}
+            ON o.user_id = n.user_id
+           AND o.visualizado_em >= datetime(n.visualizado_em, '-{JANELA_SESSAO_HORAS} hours')
+           AND o.visualizado_em <= datetime(n.visualizado_em, '+{JANELA_SESSAO_HORAS} hours')
+           AND o.id < n.id AND o.produto_id <> n.produto_id
+        WHERE n.id > :desde AND n.id <= :ate
+        GROUP BY n.id, o.produto_id
+        """,
+        PESO_VISUALIZACAO,
+    ),
+    'item_lista_favoritos': (
+        "item_lista_favoritos",
+        """
+        SELECT n.produto_id, o.produto_id
+        FROM item_lista_favoritos n
+        JOIN item_lista_favoritos o
+            ON o.lista_id = n.lista_id AND o.id < n.id AND o.produto_id <> n.produto_id
+        WHERE n.id > :desde AND n.id <= :ate
+        """,
+        PESO_FAVORITO,
+    ),
+}
+
+# Soma os pares do lote à matriz: cada par conta nos dois sentidos e na
+# diagonal dos dois produtos. O `WHERE true` evita a ambiguidade do
+# INSERT ... SELECT com ON CONFLICT no SQLite.
+_SQL_SOMAR = db.text("""
+    INSERT INTO produto_coocorrencia (produto_id, vizinho_id, peso)
+    SELECT a, b, COUNT(*) * :peso FROM (
+        SELECT a, b FROM temp.pares_recomendacao
+        UNION ALL SELECT b, a FROM temp.pares_recomendacao
+        UNION ALL SELECT a, a FROM temp.pares_recomendacao
+        UNION ALL SELECT b, b FROM temp.pares_recomendacao
+    )
+    WHERE true
+    GROUP BY a, b
+    ON CONFLICT (produto_id, vizinho_id) DO UPDATE SET peso = peso + excluded.peso
+""")
+
+# Os k vizinhos de maior cosseno. Para um produto fixo, c_ab / sqrt(c_aa * c_bb)
+# tem a mesma ordem que c_ab² / c_bb, que não depende de sqrt no SQLite; o
+# score em si é calculado só para as linhas escolhidas.
+_SQL_MELHORES_VIZINHOS = db.text("""
+    SELECT produto_id, vizinho_id, peso, peso_produto, peso_vizinho FROM (
+        SELECT c.produto_id, c.vizinho_id, c.peso, da.peso AS peso_produto, dv.peso AS peso_vizinho,
+               ROW_NUMBER() OVER (
+                   PARTITION BY c.produto_id
+                   ORDER BY c.peso * c.peso / dv.peso DESC, c.vizinho_id
+               ) AS posicao
+        FROM produto_coocorrencia c
+        JOIN produto_coocorrencia da ON da.produto_id = c.produto_id AND da.vizinho_id = c.produto_id
+        JOIN produto_coocorrencia dv ON dv.produto_id = c.vizinho_id AND dv.vizinho_id = c.vizinho_id
+        WHERE c.produto_id IN :ids AND c.vizinho_id <> c.produto_id
+    )
+    WHERE posicao <= :k
+""").bindparams(bindparam("ids", expanding=True))
+
+
+def _lotes(ids: Iterable[int], tamanho: int = TAMANHO_LOTE_IDS):
+    ids = list(ids)
+    for i in range(0, len(ids), tamanho):
+        yield ids[i:i + tamanho]
+
+
+def _marca(connection, chave: str) -> int:
+    valor = connection.execute(
+        db.text("SELECT valor FROM recomendador_estado WHERE chave = :chave"), {"chave": chave}
+    ).scalar()
+    return valor or 0
+
+
+def _gravar_marca(connection, chave: str, valor: int):
+    connection.execute(
+        db.text(
+            "INSERT INTO recomendador_estado (chave, valor) VALUES (:chave, :valor) "
+            "ON CONFLICT (chave) DO UPDATE SET valor = excluded.valor"
+        ),
+        {"chave": chave, "valor": valor},
+    )
+
+
+def _somar_coocorrencias(chave: str) -> set:
+    """
+    Soma à matriz os pares das linhas novas da fonte `chave`, em lotes de
+    TAMANHO_LOTE_FONTE linhas (cada lote grava a marca d'água na mesma
+    transação). Retorna os produtos cujas linhas mudaram.
+    """
+    tabela, sql_pares, peso = _FONTES[chave]
+    alterados = set()
+    while True:
+        with db.engine.begin() as connection:
+            desde = _marca(connection, chave)
+            ate = connection.execute(
+                db.text(f"SELECT MAX(id) FROM (SELECT id FROM {tabela} WHERE id > :desde ORDER BY id LIMIT :n)"),
+                {"desde": desde, "n": TAMANHO_LOTE_FONTE},
+            ).scalar()
+            if ate is None:
+                return alterados
+
+            connection.execute(db.text("CREATE TEMP TABLE IF NOT EXISTS pares_recomendacao (a INTEGER, b INTEGER)"))
+            connection.execute(db.text("DELETE FROM temp.pares_recomendacao"))
+            connection.execute(
+                db.text(f"INSERT INTO temp.pares_recomendacao (a, b) {sql_pares}"),
+                {"desde": desde, "ate": ate},
+            )
+            connection.execute(_SQL_SOMAR, {"peso": peso})
+            alterados.update(
+                row[0] for row in connection.execute(
+                    db.text("SELECT a FROM temp.pares_recomendacao UNION SELECT b FROM temp.pares_recomendacao")
+                )
+            )
+            connection.execute(db.text("DELETE FROM temp.pares_recomendacao"))
+            _gravar_marca(connection, chave, ate)
+
+
+def recalcular_vizinhos(connection, ids: Iterable[int], k: int = VIZINHOS_POR_PRODUTO) -> int:
+    """Regrava os `k` vizinhos mais próximos de cada produto de `ids`."""
+    total = 0
+    for lote in _lotes(ids):
+        novas = [
+            {"p": produto_id, "v": vizinho_id, "s": round(peso / math.sqrt(peso_produto * peso_vizinho), 6)}
+            for produto_id, vizinho_id, peso, peso_produto, peso_vizinho
+            in connection.execute(_SQL_MELHORES_VIZINHOS, {"ids": lote, "k": k})
+        ]
+        connection.execute(
+            db.text("DELETE FROM produto_vizinho WHERE produto_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": lote},
+        )
+        if novas:
+            connection.execute(
+                db.text("INSERT INTO produto_vizinho (produto_id, vizinho_id, score) VALUES (:p, :v, :s)"),
+                novas,
+            )
+        total += len(novas)
+    return total
+
+
+def atualizar_recomendacoes() -> Dict[str, int]:
+    """
+    Processa o histórico e as listas novos desde a última execução. Deve ser
+    chamada dentro de um contexto de aplicação, fora das requisições.
+    """
+    alterados = set()
+    for chave in _FONTES:
+        alterados |= _somar_coocorrencias(chave)
+    vizinhos = 0
+    for lote in _lotes(sorted(alterados)):
+        with db.engine.begin() as connection:
+            vizinhos += recalcular_vizinhos(connection, lote)
+    if alterados:
+        logger.info(f"Recomendações: vizinhos recalculados para {len(alterados)} produtos")
+    return {'produtos': len(alterados), 'vizinhos': vizinhos}
+
+
+def reconstruir_recomendacoes() -> Dict[str, int]:
+    """Apaga a matriz e processa todo o histórico e todas as listas de novo."""
+    with db.engine.begin() as connection:
+        connection.execute(db.text("DELETE FROM produto_coocorrencia"))
+        connection.execute(db.text("DELETE FROM produto_vizinho"))
+        connection.execute(db.text("DELETE FROM recomendador_estado"))
+    return atualizar_recomendacoes()
+
+
+def recomendar_para_usuario(user_id: int, limite: int = 20) -> List[Dict[str, Any]]:
+    """
+    Recomendações para o usuário a partir dos vizinhos pré-calculados dos
+    produtos que ele viu (os mais recentes pesam mais) e favoritou. Só leitura.
+
+    Returns:
+        [{'id', 'produto', 'score', 'algoritmo', 'motivo'}], no formato de
+        ProdutoRecomendado usado pelos templates.
+    """
+    from models import Produto
+    from models_favoritos import HistoricoVisualizacao, ItemListaFavoritos, ListaFavoritos
+
+    vistos = [
+        row[0] for row in db.session.query(HistoricoVisualizacao.produto_id)
+        .filter(HistoricoVisualizacao.user_id == user_id)
+        .group_by(HistoricoVisualizacao.produto_id)
+        .order_by(db.func.max(HistoricoVisualizacao.visualizado_em).desc())
+        .limit(SEMENTES_VISUALIZACAO)
+    ]
+    favoritos = [
+        row[0] for row in db.session.query(ItemListaFavoritos.produto_id)
+        .join(ListaFavoritos, ListaFavoritos.id == ItemListaFavoritos.lista_id)
+        .filter(ListaFavoritos.user_id == user_id)
+        .distinct()
+        .limit(SEMENTES_FAVORITOS)
+    ]
+    sementes: Dict[int, float] = {}
+    for posicao, produto_id in enumerate(vistos):
+        sementes[produto_id] = 1.0 / (1 + 0.1 * posicao)
+    for produto_id in favoritos:
+        sementes[produto_id] = max(sementes.get(produto_id, 0.0), 1.0)
+    if not sementes:
+        return []
+
+    pontuacao: Dict[int, float] = defaultdict(float)
+    origem: Dict[int, tuple] = {}
+    vizinhos = db.session.execute(
+        db.text("SELECT produto_id, vizinho_id, score FROM produto_vizinho WHERE produto_id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(sementes)},
+    )
+    for produto_id, vizinho_id, score in vizinhos:
+        if vizinho_id in sementes:
+            continue
+        contribuicao = score * sementes[produto_id]
+        pontuacao[vizinho_id] += contribuicao
+        if contribuicao > origem.get(vizinho_id, (0.0, None))[0]:
+            origem[vizinho_id] = (contribuicao, produto_id)
+    if not pontuacao:
+        return []
+
+    # Média ponderada pelas sementes: fica entre 0 e 1, como os demais scores
+    peso_total = sum(sementes.values())
+    melhores = heapq.nlargest(limite, pontuacao.items(), key=lambda item: (item[1], -item[0]))
+    ids = [produto_id for produto_id, _ in melhores] + [origem[p][1] for p, _ in melhores]
+    produtos = {p.id: p for p in Produto.query.filter(Produto.id.in_(set(ids)))}
+    recomendacoes = []
+    for produto_id, score in melhores:
+        produto = produtos.get(produto_id)
+        if produto is None:
+            continue
+        semente = produtos.get(origem[produto_id][1])
+        recomendacoes.append({
+            'id': produto_id,
+            'produto': produto,
+            'score': min(score / peso_total, 1.0),
+            'algoritmo': 'collaborative',
+            'motivo': f'Visto junto com {semente.codigo}' if semente else None,
+        })
+    return recomendacoes
+
+
+class _Trabalhador:
+    """Thread que atualiza as recomendações periodicamente."""
+
+    def __init__(self, app, intervalo: float):
+        self.app = app
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="recomendacoes", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def _executar(self):
+        while not self._parar.is_set():
+            try:
+                with self.app.app_context():
+                    atualizar_recomendacoes()
+            except Exception as e:
+                logger.error(f"Erro ao atualizar recomendações: {e}")
+            self._parar.wait(self.intervalo)
+
+
+_trabalhador: Optional[_Trabalhador] = None
+_trabalhador_lock = threading.Lock()
+
+
+def iniciar_recomendacoes_em_segundo_plano(app):
+    """
+    Inicia a atualização periódica (config `RECOMENDACOES_INTERVALO`, em
+    segundos; 0 desliga). Chamado ao subir o servidor.
+    """
+    global _trabalhador
+    intervalo = app.config.get('RECOMENDACOES_INTERVALO', 3600)
+    if not intervalo:
+        return
+    with _trabalhador_lock:
+        if _trabalhador is None:
+            _trabalhador = _Trabalhador(app, intervalo)
+            _trabalhador.iniciar()
@@ -0,0 +1,174 @@
+"""
+Perfis de conexão SQLite e pool de conexões somente leitura.
+
+O perfil (config `SQLITE_PERFIL`) define os PRAGMAs aplicados a cada conexão
+nova, pelo evento `connect` do SQLAlchemy:
+- "padrao": só `busy_timeout` (comportamento anterior);
+- "otimizado": `mmap_size`, cache maior, `temp_store=MEMORY`, WAL e, com
+  WAL, `synchronous=NORMAL`;
+- "baixa_memoria": como o otimizado, mas sem mmap e com cache pequeno.
+
+Com `SQLITE_POOL_LEITURA`, um segundo engine abre o mesmo arquivo com
+`mode=ro`. Nas requisições GET das rotas de leitura (busca, detalhes,
+autocompletar e leituras da API) a sessão envia os SELECTs a esse pool; o
+flush, qualquer outra instrução e tudo o que vier depois de uma escrita na
+mesma sessão continuam no engine principal.
+
+Este módulo não importa `app`, porque a classe de sessão é usada na criação
+de `db`.
+"""
+
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session as _SessaoFlask
+from sqlalchemy import event
+
+from utils.logging_config import get_logger
+
+logger = get_logger('sqlite_perfis')
+
+CHAVE_LEITURA = "leitura"
+# Marcas em `session.info`
+_INFO_SOMENTE_LEITURA = "somente_leitura"
+_INFO_ESCREVEU = "escreveu"
+
+PERFIS = {
+    "padrao": {
+        "busy_timeout": 15000,
+    },
+    "otimizado": {
+        "busy_timeout": 15000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64000,  # KiB (64 MB)
+        "temp_store": "MEMORY",
+        "journal_mode": "WAL",
+        "synchronous_wal": "NORMAL",
+    },
+    "baixa_memoria": {
+        "busy_timeout": 15000,
+        "mmap_size": 0,
+        "cache_size": -8000,  # KiB (8 MB)
+        "temp_store": "MEMORY",
+        "journal_mode": "WAL",
+        "synchronous_wal": "NORMAL",
+    },
+}
+PERFIL_PADRAO = "otimizado"
+
+# Rotas (endpoint) cujas requisições GET leem do pool somente leitura, além
+# de todas as da API (`api.`).
+ENDPOINTS_LEITURA = {
+    "main.index",
+    "main.buscar",
+    "main.detalhe_peca",
+    "main.autocomplete",
+}
+
+
+def obter_perfil(nome):
+    """PRAGMAs do perfil `nome` (perfil padrão se o nome não existir)."""
+    if nome not in PERFIS:
+        logger.warning(f"Perfil SQLite desconhecido '{nome}', usando '{PERFIL_PADRAO}'")
+        nome = PERFIL_PADRAO
+    return PERFIS[nome]
+
+
+def aplicar_pragmas(conexao_dbapi, perfil: dict, somente_leitura: bool = False):
+    """Aplica os PRAGMAs do perfil a uma conexão sqlite3 recém-aberta."""
+    cursor = conexao_dbapi.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(perfil['busy_timeout'])}")
+        if "mmap_size" in perfil:
+            cursor.execute(f"PRAGMA mmap_size = {int(perfil['mmap_size'])}")
+        if "cache_size" in perfil:
+            cursor.execute(f"PRAGMA cache_size = {int(perfil['cache_size'])}")
+        if "temp_store" in perfil:
+            cursor.execute(f"PRAGMA temp_store = {perfil['temp_store']}")
+        if "journal_mode" in perfil and not somente_leitura:
+            # Persistente no arquivo; só tem efeito na primeira conexão de um banco novo
+            cursor.execute(f"PRAGMA journal_mode = {perfil['journal_mode']}")
+        if "synchronous_wal" in perfil and not somente_leitura:
+            # NORMAL só é seguro contra corrupção com WAL
+            modo = cursor.execute("PRAGMA journal_mode").fetchone()
+            if modo and str(modo[0]).lower() == "wal":
+                cursor.execute(f"PRAGMA synchronous = {perfil['synchronous_wal']}")
+    finally:
+        cursor.close()
+
+
+def opcoes_engine(app, caminho_banco: str):
+    """
+    Preenche `SQLALCHEMY_ENGINE_OPTIONS` e, com o pool de leitura ativo,
+    `SQLALCHEMY_BINDS[CHAVE_LEITURA]`. Chamado antes de `db.init_app`.
+    """
+    perfil = obter_perfil(app.config.get("SQLITE_PERFIL", PERFIL_PADRAO))
+    timeout = perfil["busy_timeout"] / 1000
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "connect_args": {"timeout": timeout},
+        "pool_pre_ping": True,
+    }
+    if app.config.get("SQLITE_POOL_LEITURA", True):
+        url = "sqlite:///file:" + caminho_banco.replace("\\", "/") + "?mode=ro&uri=true"
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds[CHAVE_LEITURA] = {
+            "url": url,
+            "connect_args": {"timeout": timeout},
+            "pool_pre_ping": True,
+        }
+        app.config["SQLALCHEMY_BINDS"] = binds
+
+
+def init_perfis_sqlite(app, db):
+    """
+    Registra os PRAGMAs do perfil nos engines e a marcação das requisições
+    de leitura. Chamado depois de `db.init_app`.
+    """
+    perfil = obter_perfil(app.config.get("SQLITE_PERFIL", PERFIL_PADRAO))
+    with app.app_context():
+        engines = db.engines
+
+    for chave, engine in engines.items():
+        somente_leitura = chave == CHAVE_LEITURA
+
+        def _ao_conectar(conexao_dbapi, registro, somente_leitura=somente_leitura):
+            aplicar_pragmas(conexao_dbapi, perfil, somente_leitura)
+
+        event.listen(engine, "connect", _ao_conectar)
+
+    if CHAVE_LEITURA not in engines:
+        return
+
+    from flask import request
+
+    @app.before_request
+    def _marcar_requisicao_leitura():
+        if request.method in ("GET", "HEAD") and (
+            request.endpoint in ENDPOINTS_LEITURA
+            or (request.endpoint or "").startswith("api.")
+        ):
+            db.session.info[_INFO_SOMENTE_LEITURA] = True
+
+
+class SessaoRoteada(_SessaoFlask):
+    """
+    Sessão que envia SELECTs ao engine somente leitura quando a requisição foi
+    marcada como de leitura e a sessão ainda não escreveu nada.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get(_INFO_SOMENTE_LEITURA)
+            and not self.info.get(_INFO_ESCREVEU)
+            and not self._flushing
+            and isinstance(clause, (sa.Select, sa.CompoundSelect))
+        ):
+            engine = self._db.engines.get(CHAVE_LEITURA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(SessaoRoteada, "after_flush")
+def _marcar_escrita(session, flush_context):
+    """Depois de uma escrita, a sessão lê do engine principal (vê o que gravou)."""
+    session.info[_INFO_ESCREVEU] = True
@@ -0,0 +1,302 @@
+"""
+Sugestões de similares pré-calculadas (tabela `produto_sugestao`).
+
+A página de detalhes lê as sugestões de um produto com uma única consulta
+indexada, em vez de calculá-las a cada visita. Cada produto recebe até
+SUGESTOES_POR_PRODUTO sugestões, que não incluem os similares já vinculados:
+- "equivalencia": mesma classe de equivalência (utils/equivalencias.py),
+  score 1.0;
+- "aplicacao": mesmo grupo e aplicação no mesmo veículo com intervalo de anos
+  sobreposto; score = 0.9 x fração dos veículos do produto em comum.
+
+Os eventos do ORM (após o flush, na mesma transação) marcam em
+`produto_sugestao_pendente` os produtos afetados por uma edição ou
+importação. Uma thread em segundo plano consome essa fila e recalcula, além
+dos marcados, os produtos que os sugeriam por aplicação e os que passam a
+ser candidatos a eles (a relação é simétrica).
+"""
+
+import threading
+from itertools import chain
+from typing import Iterable, Set
+
+from sqlalchemy import bindparam, inspect
+
+from app import db, get_logger
+
+logger = get_logger('sugestoes_produto')
+
+SUGESTOES_POR_PRODUTO = 30
+# Produtos lidos da fila por vez / recalculados por transação
+TAMANHO_LOTE = 200
+TAMANHO_LOTE_ESCRITA = 50
+# Intervalo (s) entre verificações da fila quando não há aviso de commit
+# (pega pendências gravadas por outros processos, como o import-csv)
+INTERVALO_VERIFICACAO = 60
+# Atributos de Aplicacao que alteram os candidatos por aplicação
+ATRIBUTOS_APLICACAO = ("produto_id", "veiculo", "ano_inicio", "ano_fim")
+
+_SQL_CANDIDATOS_APLICACAO = """
+    SELECT a1.produto_id AS produto_id, a2.produto_id AS sugestao_id,
+           COUNT(DISTINCT a1.veiculo) AS veiculos
+    FROM aplicacao a1
+    JOIN produto p ON p.id = a1.produto_id
+    JOIN aplicacao a2 ON a2.veiculo = a1.veiculo
+        AND a2.ano_inicio <= a1.ano_fim AND a1.ano_inicio <= a2.ano_fim
+    JOIN produto q ON q.id = a2.produto_id
+    WHERE a1.produto_id IN :ids AND a1.veiculo <> ''
+      AND a2.produto_id <> a1.produto_id
+      AND p.grupo <> '' AND q.grupo = p.grupo
+    GROUP BY a1.produto_id, a2.produto_id
+"""
+
+_SQL_INSERIR_SUGESTOES = db.text(f"""
+    INSERT INTO produto_sugestao (produto_id, sugestao_id, motivo, score)
+    SELECT produto_id, sugestao_id, motivo, score FROM (
+        SELECT produto_id, sugestao_id, motivo, score,
+               ROW_NUMBER() OVER (
+                   PARTITION BY produto_id ORDER BY score DESC, sugestao_id
+               ) AS posicao
+        FROM (
+            -- MAX(score) com coluna solta: o SQLite devolve o motivo da linha
+            -- de maior score (equivalência prevalece sobre aplicação)
+            SELECT produto_id, sugestao_id, motivo, MAX(score) AS score
+            FROM (
+                SELECT p.id AS produto_id, q.id AS sugestao_id,
+                       'equivalencia' AS motivo, 1.0 AS score
+                FROM produto p
+                JOIN produto q ON q.id IN (
+                    -- Limite por produto já aqui: classes grandes não
+                    -- geram n² linhas
+                    SELECT e.id FROM produto e
+                    WHERE e.classe_equivalencia = p.classe_equivalencia AND e.id <> p.id
+                    ORDER BY e.id LIMIT :limite_equivalentes
+                )
+                WHERE p.id IN :ids
+                UNION ALL
+                SELECT c.produto_id, c.sugestao_id, 'aplicacao',
+                       0.9 * c.veiculos / v.total
+                FROM ({_SQL_CANDIDATOS_APLICACAO}) c
+                JOIN (
+                    SELECT produto_id, COUNT(DISTINCT veiculo) AS total
+                    FROM aplicacao WHERE produto_id IN :ids AND veiculo <> ''
+                    GROUP BY produto_id
+                ) v ON v.produto_id = c.produto_id
+            ) candidatos
+            WHERE NOT EXISTS (
+                SELECT 1 FROM similares_association s
+                WHERE s.produto_id = candidatos.produto_id AND s.similar_id = candidatos.sugestao_id
+            ) AND NOT EXISTS (
+                SELECT 1 FROM similares_association s
+                WHERE s.produto_id = candidatos.sugestao_id AND s.similar_id = candidatos.produto_id
+            )
+            GROUP BY produto_id, sugestao_id
+        )
+    )
+    WHERE posicao <= :limite
+""").bindparams(bindparam("ids", expanding=True))
+
+# Mudanças de classe já marcam o componente inteiro (e a exclusão marca quem
+# sugeria o produto), então só as sugestões por aplicação precisam ser seguidas.
+_SQL_AFETADOS = db.text(f"""
+    SELECT produto_id FROM produto_sugestao
+    WHERE sugestao_id IN :ids AND motivo = 'aplicacao'
+    UNION
+    SELECT sugestao_id FROM ({_SQL_CANDIDATOS_APLICACAO})
+""").bindparams(bindparam("ids", expanding=True))
+
+
+def _lotes(ids: Iterable[int], tamanho: int = TAMANHO_LOTE):
+    ids = list(ids)
+    for i in range(0, len(ids), tamanho):
+        yield ids[i:i + tamanho]
+
+
+def marcar_pendentes(connection, ids: Iterable[int]):
+    """Coloca produtos na fila de recálculo."""
+    linhas = [{"id": produto_id} for produto_id in set(ids) if produto_id is not None]
+    if linhas:
+        connection.execute(
+            db.text("INSERT OR IGNORE INTO produto_sugestao_pendente (produto_id) VALUES (:id)"),
+            linhas,
+        )
+
+
+def marcar_sugestoes_apos_flush(session, componentes: Set[int] = frozenset()):
+    """
+    Chamado no `after_flush`: marca os produtos novos, excluídos, com grupo
+    alterado ou com aplicações (veículo/anos) alteradas, além dos
+    `componentes` cuja classe de equivalência foi recalculada.
+    """
+    from models import Aplicacao, Produto
+
+    ids = set(componentes)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Produto):
+            if (obj in session.new or obj in session.deleted
+                    or inspect(obj).attrs.grupo.history.has_changes()):
+                ids.add(obj.id)
+        elif isinstance(obj, Aplicacao):
+            estado = inspect(obj)
+            if obj in session.new or obj in session.deleted:
+                ids.add(obj.produto_id)
+                continue
+            for atributo in ATRIBUTOS_APLICACAO:
+                historico = estado.attrs[atributo].history
+                if historico.has_changes():
+                    ids.add(obj.produto_id)
+                    if atributo == "produto_id":
+                        ids.update(historico.deleted or ())
+
+    ids.discard(None)
+    if ids:
+        marcar_pendentes(session.connection(), ids)
+        session.info['sugestoes_pendentes'] = True
+
+
+def recalcular_sugestoes(connection, ids: Iterable[int]) -> int:
+    """Regrava as sugestões dos produtos `ids`; retorna quantas linhas gravou."""
+    total = 0
+    for lote in _lotes(ids):
+        connection.execute(
+            db.text("DELETE FROM produto_sugestao WHERE produto_id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": lote},
+        )
+        resultado = connection.execute(
+            _SQL_INSERIR_SUGESTOES,
+            {
+                "ids": lote,
+                "limite": SUGESTOES_POR_PRODUTO,
+                # +similares diretos, que são descartados depois
+                "limite_equivalentes": SUGESTOES_POR_PRODUTO * 2,
+            },
+        )
+        total += max(resultado.rowcount or 0, 0)
+    return total
+
+
+def _expandir_afetados(connection, ids: Set[int]) -> Set[int]:
+    """
+    Os marcados, os produtos que hoje os sugerem por aplicação e os que têm
+    aplicação em comum com eles (para quem eles passam a ser candidatos).
+    """
+    afetados = set(ids)
+    for lote in _lotes(ids):
+        afetados.update(row[0] for row in connection.execute(_SQL_AFETADOS, {"ids": lote}))
+    return afetados
+
+
+def processar_pendentes(limite: int = TAMANHO_LOTE) -> int:
+    """
+    Consome a fila, `limite` produtos marcados por vez. O recálculo é feito
+    em transações curtas de TAMANHO_LOTE_ESCRITA produtos, para não segurar a
+    trava de escrita do SQLite; os marcados ficam para o fim, de modo que uma
+    interrupção não perde o que ainda falta. Deve ser chamada dentro de um
+    contexto de aplicação. Retorna quantos produtos foram recalculados.
+    """
+    processados = 0
+    while True:
+        with db.engine.connect() as connection:
+            ids = {
+                row[0] for row in connection.execute(
+                    db.text("SELECT produto_id FROM produto_sugestao_pendente LIMIT :limite"),
+                    {"limite": limite},
+                )
+            }
+            if not ids:
+                break
+            afetados = _expandir_afetados(connection, ids)
+
+        ordem = sorted(afetados - ids) + sorted(ids)
+        for lote in _lotes(ordem, TAMANHO_LOTE_ESCRITA):
+            with db.engine.begin() as connection:
+                recalcular_sugestoes(connection, lote)
+                connection.execute(
+                    db.text("DELETE FROM produto_sugestao_pendente WHERE produto_id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"ids": lote},
+                )
+        processados += len(afetados)
+    if processados:
+        logger.info(f"Sugestões recalculadas para {processados} produtos")
+    return processados
+
+
+def reconstruir_sugestoes(connection) -> int:
+    """Recalcula as sugestões de todos os produtos; retorna quantas linhas gravou."""
+    connection.execute(db.text("DELETE FROM produto_sugestao"))
+    ids = [row[0] for row in connection.execute(db.text("SELECT id FROM produto"))]
+    total = recalcular_sugestoes(connection, ids)
+    connection.execute(db.text("DELETE FROM produto_sugestao_pendente"))
+    logger.info(f"Sugestões reconstruídas: {total} para {len(ids)} produtos")
+    return total
+
+
+class _Trabalhador:
+    """Thread que consome a fila de sugestões pendentes."""
+
+    def __init__(self, app):
+        self.app = app
+        self._aviso = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="sugestoes-produto", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+
+    def notificar(self):
+        self._aviso.set()
+
+    def _executar(self):
+        while True:
+            self._aviso.clear()
+            try:
+                with self.app.app_context():
+                    processar_pendentes()
+            except Exception as e:
+                logger.error(f"Erro ao recalcular sugestões: {e}")
+            self._aviso.wait(INTERVALO_VERIFICACAO)
+
+
+_trabalhador = None
+_trabalhador_lock = threading.Lock()
+_eventos_registrados = False
+
+
+def _registrar_eventos():
+    """Avisa o trabalhador a cada commit que marcou produtos na fila."""
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "after_commit")
+    def _avisar_no_commit(session):
+        if session.info.pop('sugestoes_pendentes', None) and _trabalhador is not None:
+            _trabalhador.notificar()
+
+    @event.listens_for(Session, "after_rollback")
+    def _descartar_no_rollback(session):
+        session.info.pop('sugestoes_pendentes', None)
+
+    _eventos_registrados = True
+
+
+def init_sugestoes_produto(app):
+    """Registra os eventos do ORM (não acessa o banco)."""
+    _registrar_eventos()
+
+
+def iniciar_sugestoes_em_segundo_plano(app):
+    """
+    Inicia a thread que recalcula as sugestões pendentes. Chamado ao subir o
+    servidor, depois de `inicializar_banco`.
+    """
+    global _trabalhador
+    if not app.config.get('SUGESTOES_EM_SEGUNDO_PLANO', True):
+        return
+    with _trabalhador_lock:
+        if _trabalhador is None:
+            _trabalhador = _Trabalhador(app)
+            _trabalhador.iniciar()